@@ -12,14 +12,20 @@ from datetime import datetime
 from html import escape as html_escape
 
 # Imports de módulos propios
-from src.utils import load_and_validate_csv
+from src.utils import (
+    iter_csv_chunks, sniff_csv_format, load_and_validate_parquet, save_analysis_parquet,
+    load_parquet, list_analysis_runs, to_columnar, frame_fingerprint, run_fingerprint
+)
 from src.gemini_client import AgroSentimentAnalyzer
 from src.firebase_manager import save_analysis_results, fetch_history
 from src.cache_manager import CacheManager
+from src.rate_limiter import get_rate_limiter
 from src.geo_mapper import NewsGeoMapper
 from src.chatbot_rag import AgriNewsBot
 from src.trend_analyzer import TrendAnalyzer
+from src.sentiment_rollups import get_rollup_store
 from src.alert_system import AlertSystem
+from src.alert_rules import save_user_rules
 from src.export_manager import ReportExporter
 from src.auth_manager import (
     register_user, authenticate_user, get_current_user,
@@ -1067,6 +1073,12 @@ def render_sidebar(use_cache=True, use_smart_batch=False):
         else:
             st.info("📦 Caché vacío")
     
+    # Cupo de Gemini: solo se muestran los modelos en enfriamiento por 429
+    quota = get_rate_limiter().headroom()
+    for model_name, model_quota in quota.items():
+        if model_quota['cooldown_seconds'] > 0:
+            st.caption(f"⏳ {model_name}: sin cupo ({model_quota['cooldown_seconds']}s) · {model_quota['rpm_available']} RPM libres")
+    
     st.markdown("---")
     
     # Opciones de configuración
@@ -1089,6 +1101,92 @@ def render_sidebar(use_cache=True, use_smart_batch=False):
     
     return use_cache, use_smart_batch
 
+def store_analysis(key, df, fingerprint=None):
+    """Guarda la corrida en la sesión con su huella, calculada una sola vez al ingerirla"""
+    st.session_state[key] = df
+    st.session_state[f'{key}_fingerprint'] = fingerprint or frame_fingerprint(df)
+    return st.session_state[f'{key}_fingerprint']
+
+def archive_analysis_run(df, rollups=True, fingerprint=None):
+    """Archiva la corrida analizada en Parquet; un fallo no interrumpe el análisis"""
+    try:
+        path = save_analysis_parquet(df, fingerprint=fingerprint)
+        st.caption(f"📦 Corrida archivada en {path}")
+    except Exception as e:
+        st.caption(f"⚠️ No se pudo archivar la corrida en Parquet: {str(e)}")
+    if rollups:
+        update_rollups(df)
+
+def upload_csv_format(uploaded_file):
+    """
+    Codificación y separador del CSV subido, detectados una sola vez por archivo
+
+    La detección decodifica el archivo completo; guardarla en la sesión evita
+    repetirla en cada rerun (vista previa) y en el análisis posterior.
+    """
+    key = (getattr(uploaded_file, 'file_id', None) or uploaded_file.name, getattr(uploaded_file, 'size', None))
+    cached = st.session_state.get('csv_format')
+    if cached is None or cached[0] != key:
+        try:
+            csv_format = sniff_csv_format(uploaded_file)
+        except Exception:
+            return None  # iter_csv_chunks vuelve a intentarlo y reporta el error
+        cached = (key, csv_format)
+        st.session_state['csv_format'] = cached
+    return cached[1]
+
+class _ChunkProgress:
+    """Tramo [start, end] de la barra de progreso asignado a un bloque del CSV"""
+
+    def __init__(self, bar, start, end):
+        self.bar = bar
+        self.start = start
+        self.end = end
+
+    def progress(self, value):
+        self.bar.progress(min(1.0, self.start + (self.end - self.start) * value))
+
+def analyze_csv_stream(uploaded_file, analyzer, progress_bar, use_smart_batch, csv_format=None):
+    """
+    Analiza el CSV bloque a bloque: cada bloque se envía al modelo y se suma a los
+    agregados de tendencia en cuanto se lee, sin cargar antes el archivo completo
+
+    Returns:
+        (DataFrame analizado, None) o (None, mensaje de error)
+    """
+    stream, error = iter_csv_chunks(uploaded_file, csv_format=csv_format)
+    if error:
+        return None, error
+
+    total_bytes = getattr(uploaded_file, 'size', None)
+    analyzed = []
+    start = 0.0
+    for chunk in stream:
+        # Avance estimado por bytes leídos: el número total de filas no se conoce de antemano
+        try:
+            end = min(1.0, uploaded_file.tell() / total_bytes) if total_bytes else start
+        except Exception:
+            end = start
+        sents, expls = analyzer.analyze_batch(chunk, _ChunkProgress(progress_bar, start, end),
+                                              use_smart_batch=use_smart_batch)
+        chunk['sentimiento_ia'] = sents
+        chunk['explicacion_ia'] = expls
+        update_rollups(chunk)
+        analyzed.append(chunk)
+        start = end
+    progress_bar.progress(1.0)
+
+    if not analyzed:
+        return None, "Error: El archivo está vacío o no se pudo leer correctamente."
+    return pd.concat(analyzed, ignore_index=True), None
+
+def update_rollups(df):
+    """Suma la corrida a los agregados históricos de sentimiento (sin contar dos veces)"""
+    try:
+        get_rollup_store().ingest(df)
+    except Exception as e:
+        st.caption(f"⚠️ No se pudieron actualizar los agregados de tendencia: {str(e)}")
+
 def main():
     # Inicializar estado de sesión
     if 'show_login' not in st.session_state:
@@ -1153,13 +1251,16 @@ def main():
     analyzer = AgroSentimentAnalyzer()
     geo_mapper = NewsGeoMapper()
     trend_analyzer = TrendAnalyzer()
-    alert_system = AlertSystem()
+    alert_system = AlertSystem.for_user(st.session_state.get('user'))
     exporter = ReportExporter()
     
     # Inicializar chatbot si hay API key
     chatbot = None
     if analyzer.api_key:
         chatbot = AgriNewsBot(analyzer.api_key)
+        # El historial vive en la sesión: el bot se recrea en cada rerun
+        chatbot.conversation_history = st.session_state.setdefault('chat_history', [])
+        chatbot.conversation_summary = st.session_state.setdefault('chat_summary', {'text': ''})
     
     # TAB 1: ANÁLISIS CSV (OPTIMIZADO)
     with tabs[0]:
@@ -1170,8 +1271,8 @@ def main():
         with col_upload:
             uploaded_file = st.file_uploader(
                 "Sube tu dataset de noticias",
-                type=["csv"],
-                help="Archivo CSV con columnas: Titular, Cuerpo, Fecha"
+                type=["csv", "parquet"],
+                help="Archivo CSV o Parquet con columnas: Titular, Cuerpo, Fecha"
             )
         
         with col_info:
@@ -1183,12 +1284,23 @@ def main():
             """)
         
         if uploaded_file:
-            df, error = load_and_validate_csv(uploaded_file)
+            is_csv = not uploaded_file.name.lower().endswith('.parquet')
+            if is_csv:
+                # Solo el primer bloque para validar y previsualizar; el análisis lee el resto por bloques
+                stream, error = iter_csv_chunks(uploaded_file, chunksize=10,
+                                                csv_format=upload_csv_format(uploaded_file))
+                df = next(iter(stream)) if stream is not None else None
+            else:
+                df, error = load_and_validate_parquet(uploaded_file)
             
             if error:
                 st.error(error)
             else:
-                st.success(f"✅ Archivo cargado: {len(df)} noticias")
+                if is_csv:
+                    encoding_info = f" (codificación: {stream.encoding})" if stream.encoding else ""
+                    st.success(f"✅ Archivo CSV válido{encoding_info}: se analizará por bloques")
+                else:
+                    st.success(f"✅ Archivo cargado: {len(df)} noticias")
                 
                 # Vista previa - Mostrar automáticamente usando st.table que es más confiable
                 st.markdown("**👁️ Vista Previa de Datos**")
@@ -1244,7 +1356,31 @@ def main():
                     with col_stat2:
                         hit_rate = cache_stats_temp.get('cache_hit_rate', '0%')
                         st.metric("Hit Rate", hit_rate if isinstance(hit_rate, str) else f"{hit_rate}%")
-                    
+
+                    tiers = cache_stats_temp.get('tiers', {})
+                    if tiers:
+                        memory_tier = tiers.get('memory', {})
+                        sqlite_tier = tiers.get('sqlite', {})
+                        st.caption(
+                            f"🧠 Memoria: {memory_tier.get('hits', 0)} hits / {memory_tier.get('misses', 0)} misses "
+                            f"({memory_tier.get('hit_rate', '0%')}, {memory_tier.get('entries', 0)} entradas) · "
+                            f"💾 SQLite: {sqlite_tier.get('hits', 0)} hits / {sqlite_tier.get('misses', 0)} misses "
+                            f"({sqlite_tier.get('hit_rate', '0%')})"
+                        )
+                        near_tier = tiers.get('near_duplicate', {})
+                        if near_tier.get('hits'):
+                            st.caption(
+                                f"♻️ Casi duplicados: {near_tier['hits']} reutilizados "
+                                f"(similitud media {near_tier.get('avg_similarity', 0):.2f})"
+                            )
+
+                    eviction = cache_stats_temp.get('eviction', {})
+                    if eviction:
+                        st.caption(
+                            f"🧹 {eviction.get('expired', 0)} expiradas · {eviction.get('evicted', 0)} desalojadas · "
+                            f"{eviction.get('db_bytes', 0) / (1024 * 1024):.1f} MB en disco"
+                        )
+
                     if cache_stats_temp.get('distribution'):
                         st.markdown("---")
                         st.markdown("**📊 Distribución por Sentimiento:**")
@@ -1258,21 +1394,30 @@ def main():
                             progress = st.progress(0)
                             status_text = st.empty()
                             
-                            sents, expls = analyzer.analyze_batch(df, progress, use_smart_batch=use_cache)
-                            
-                            df['sentimiento_ia'] = sents
-                            df['explicacion_ia'] = expls
-                            
-                            st.session_state['last_analysis'] = df
+                            if is_csv:
+                                df, stream_error = analyze_csv_stream(uploaded_file, analyzer, progress, use_cache,
+                                                                      upload_csv_format(uploaded_file))
+                            else:
+                                sents, expls = analyzer.analyze_batch(df, progress, use_smart_batch=use_cache)
+                                df['sentimiento_ia'] = sents
+                                df['explicacion_ia'] = expls
+                                stream_error = None
                             
-                            # Mostrar estadísticas de optimización
-                            cache_hits = sum(1 for e in expls if 'cache' in str(e).lower())
-                            st.success(f"""
-                            ✅ **Análisis completado!**
-                            - 📊 {len(df)} noticias procesadas
-                            - 🚀 {cache_hits} del caché ({cache_hits/len(df)*100:.1f}%)
-                            - 💰 Ahorro estimado: {cache_hits * 0.002:.4f} USD
-                            """)
+                            if stream_error:
+                                st.error(stream_error)
+                            else:
+                                fingerprint = store_analysis('last_analysis', df)
+                                # Los bloques del CSV ya se sumaron a los agregados al analizarse
+                                archive_analysis_run(df, rollups=not is_csv, fingerprint=fingerprint)
+                                
+                                # Mostrar estadísticas de optimización
+                                cache_hits = sum(1 for e in df['explicacion_ia'] if 'cache' in str(e).lower())
+                                st.success(f"""
+                                ✅ **Análisis completado!**
+                                - 📊 {len(df)} noticias procesadas
+                                - 🚀 {cache_hits} del caché ({cache_hits/len(df)*100:.1f}%)
+                                - 💰 Ahorro estimado: {cache_hits * 0.002:.4f} USD
+                                """)
                     else:
                         st.error("⚠️ API Key de Gemini no configurada")
                 
@@ -1280,13 +1425,21 @@ def main():
                 if batch_btn:
                     with st.spinner('⚡ Análisis batch rápido...'):
                         progress = st.progress(0)
-                        sents, expls = analyzer.analyze_batch(df, progress, use_smart_batch=True)
-                        
-                        df['sentimiento_ia'] = sents
-                        df['explicacion_ia'] = expls
+                        if is_csv:
+                            df, stream_error = analyze_csv_stream(uploaded_file, analyzer, progress, True,
+                                                                  upload_csv_format(uploaded_file))
+                        else:
+                            sents, expls = analyzer.analyze_batch(df, progress, use_smart_batch=True)
+                            df['sentimiento_ia'] = sents
+                            df['explicacion_ia'] = expls
+                            stream_error = None
                         
-                        st.session_state['last_analysis'] = df
-                        st.success(f"⚡ Análisis batch completado!")
+                        if stream_error:
+                            st.error(stream_error)
+                        else:
+                            fingerprint = store_analysis('last_analysis', df)
+                            archive_analysis_run(df, rollups=not is_csv, fingerprint=fingerprint)
+                            st.success(f"⚡ Análisis batch completado!")
         
         # Mostrar resultados si existen
         if 'last_analysis' in st.session_state:
@@ -1386,8 +1539,18 @@ def main():
                 
                 if web_results:
                     df_web = pd.DataFrame(web_results)
-                    st.session_state['web_analysis'] = df_web
+                    store_analysis('web_analysis', df_web)
+                    update_rollups(df_web)
                     st.success(f"✅ {len(df_web)} noticias encontradas y analizadas")
+                    
+                    # Alertas continuas: solo se procesan las noticias nuevas del radar
+                    stream = st.session_state.get('alert_stream')
+                    if stream is None or stream.rules_spec != alert_system.rules_spec():
+                        stream = alert_system.create_stream()
+                        st.session_state['alert_stream'] = stream
+                    for alert in stream.process(df_web):
+                        prefix = "⬆️ Escalada: " if alert['status'] == 'escalated' else ""
+                        st.warning(f"{prefix}{alert['title']} — {alert['message']}")
                 else:
                     st.warning("No se encontraron noticias")
         
@@ -1411,6 +1574,13 @@ def main():
                 </div>
                 """, unsafe_allow_html=True)
             
+            stream = st.session_state.get('alert_stream')
+            active_alerts = stream.active_alerts() if stream is not None else []
+            if active_alerts:
+                with st.expander(f"🔔 Alertas activas del radar ({len(active_alerts)})"):
+                    for alert in active_alerts:
+                        st.markdown(f"**{alert['title']}** — {alert['message']}")
+            
             if st.button("💾 Guardar Noticias Web"):
                 success, msg = save_analysis_results(df_web, collection_name="noticias_web")
                 st.success(msg) if success else st.error(msg)
@@ -1529,29 +1699,25 @@ def main():
                         st.success("Conversación reiniciada")
                 
                 if send_btn and user_input:
-                    with st.spinner("🤖 Pensando..."):
-                        response = chatbot.chat(user_input)
-                        
-                        # Mensaje del usuario
-                        st.markdown(f"""
-                        <div class="chat-message user-message">
-                            <b>👤 Tú:</b> {user_input}
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Respuesta del bot
-                        st.markdown(f"""
-                        <div class="chat-message bot-message">
-                            <b>🤖 Asistente:</b><br>{response['response']}
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Noticias relevantes
-                        if response['relevant_news']:
-                            with st.expander(f"📰 {len(response['relevant_news'])} Noticias Relevantes"):
-                                for news in response['relevant_news']:
-                                    st.markdown(f"**{news['titular']}** ({news['sentimiento']})")
-                                    st.caption(f"Similitud: {news['similarity']:.2%}")
+                    # Mensaje del usuario
+                    with st.chat_message("user", avatar="👤"):
+                        st.markdown(user_input)
+                    
+                    # Respuesta del bot: la recuperación y el empaquetado van con spinner;
+                    # el texto se pinta dentro de la misma burbuja a medida que llega
+                    with st.chat_message("assistant", avatar="🤖"):
+                        with st.spinner("🔍 Buscando noticias relevantes..."):
+                            response = chatbot.chat(user_input, stream=True)
+                        st.write_stream(response['response'])
+                        if response.get('from_cache'):
+                            st.caption("⚡ Respuesta reutilizada del caché (sin consumo de tokens)")
+
+                    # Noticias relevantes
+                    if response['relevant_news']:
+                        with st.expander(f"📰 {len(response['relevant_news'])} Noticias Relevantes"):
+                            for news in response['relevant_news']:
+                                st.markdown(f"**{news['titular']}** ({news['sentimiento']})")
+                                st.caption(f"Similitud: {news['similarity']:.2%}")
             else:
                 st.warning("⬅️ Primero carga noticias para interactuar con el chatbot")
     
@@ -1560,12 +1726,11 @@ def main():
         st.header("📈 Análisis de Tendencias y Predicciones")
         
         # CORREGIDO: DataFrame no puede usar 'or' directamente
-        data_source = st.session_state.get('last_analysis')
-        if data_source is None:
-            data_source = st.session_state.get('web_analysis')
+        data_key = 'last_analysis' if st.session_state.get('last_analysis') is not None else 'web_analysis'
+        data_source = st.session_state.get(data_key)
         
         if data_source is not None:
-            trend_analyzer.load_data(data_source)
+            trend_analyzer.load_data(data_source, st.session_state.get(f'{data_key}_fingerprint'))
             
             # Resumen ejecutivo - Compacto
             st.markdown("### 📋 Resumen Ejecutivo")
@@ -1596,31 +1761,40 @@ def main():
             # Análisis de tendencias más completo - Compacto
             st.markdown("### 📊 Análisis Detallado")
             
-            # Gráfico de evolución temporal si hay fechas
+            # Gráfico de evolución temporal si hay fechas (lee los agregados por periodo)
             if 'fecha' in data_source.columns:
                 try:
-                    data_source['fecha_parsed'] = pd.to_datetime(data_source['fecha'], errors='coerce')
-                    df_with_dates = data_source[data_source['fecha_parsed'].notna()].copy()
+                    col_gran, col_hist = st.columns([2, 1])
+                    with col_gran:
+                        granularity_label = st.radio(
+                            "Agrupar por", ["Diario", "Semanal", "Mensual"],
+                            horizontal=True, key="trend_granularity"
+                        )
+                    with col_hist:
+                        include_history = st.checkbox(
+                            "📚 Incluir análisis anteriores", value=False, key="trend_history",
+                            help="Usa los agregados acumulados de todas las corridas"
+                        )
+                    if include_history:
+                        trend_analyzer.rollup_store = get_rollup_store()
+                    granularity = {"Diario": "D", "Semanal": "W", "Mensual": "M"}[granularity_label]
+                    trend_over_time = trend_analyzer.get_sentiment_trend_over_time(granularity)
                     
-                    if len(df_with_dates) > 0:
-                        df_with_dates['fecha_only'] = df_with_dates['fecha_parsed'].dt.date
-                        trend_over_time = df_with_dates.groupby(['fecha_only', 'sentimiento_ia']).size().unstack(fill_value=0)
-                        
-                        if len(trend_over_time) > 0:
-                            st.markdown("#### 📅 Evolución Temporal del Sentimiento")
-                            fig_trend = px.line(
-                                trend_over_time.reset_index(),
-                                x='fecha_only',
-                                y=['Positivo', 'Negativo', 'Neutro'],
-                                title="Tendencia del Sentimiento en el Tiempo",
-                                labels={'fecha_only': 'Fecha', 'value': 'Cantidad de Noticias'},
-                                color_discrete_map={'Positivo': '#2ecc71', 'Negativo': '#e74c3c', 'Neutro': '#95a5a6'}
-                            )
-                            fig_trend.update_layout(
-                                height=350,
-                                margin=dict(l=50, r=20, t=50, b=40)
-                            )
-                            st.plotly_chart(fig_trend, use_container_width=True)
+                    if trend_over_time is not None and len(trend_over_time) > 0:
+                        st.markdown("#### 📅 Evolución Temporal del Sentimiento")
+                        fig_trend = px.line(
+                            trend_over_time.reset_index(),
+                            x='periodo',
+                            y=['Positivo', 'Negativo', 'Neutro'],
+                            title="Tendencia del Sentimiento en el Tiempo",
+                            labels={'periodo': 'Fecha', 'value': 'Cantidad de Noticias'},
+                            color_discrete_map={'Positivo': '#2ecc71', 'Negativo': '#e74c3c', 'Neutro': '#95a5a6'}
+                        )
+                        fig_trend.update_layout(
+                            height=350,
+                            margin=dict(l=50, r=20, t=50, b=40)
+                        )
+                        st.plotly_chart(fig_trend, use_container_width=True)
                 except Exception as e:
                     st.caption(f"⚠️ No se pudo generar gráfico temporal: {e}")
             
@@ -1685,6 +1859,45 @@ def main():
             prediction = trend_analyzer.predict_sentiment_trend()
             if "No hay" not in prediction and "suficientes" not in prediction:
                 st.success(prediction)
+                
+                forecast = trend_analyzer.forecast_sentiment(horizon=7)
+                if forecast is not None:
+                    history = forecast['history'].tail(60)
+                    projected = forecast['forecast']
+                    fig_forecast = go.Figure()
+                    fig_forecast.add_trace(go.Scatter(
+                        x=list(projected.index) + list(projected.index[::-1]),
+                        y=list(projected['riesgo_sup']) + list(projected['riesgo_inf'][::-1]),
+                        fill='toself', fillcolor='rgba(231, 76, 60, 0.15)', line=dict(width=0),
+                        name='Intervalo 95%', hoverinfo='skip'
+                    ))
+                    fig_forecast.add_trace(go.Scatter(
+                        x=history.index, y=history['riesgo'], mode='lines+markers',
+                        name='Riesgo observado', line=dict(color='#95a5a6')
+                    ))
+                    fig_forecast.add_trace(go.Scatter(
+                        x=projected.index, y=projected['riesgo'], mode='lines',
+                        name='Riesgo pronosticado', line=dict(color='#e74c3c', dash='dash')
+                    ))
+                    fig_forecast.update_layout(
+                        title="Índice de Riesgo: Observado y Pronóstico a 7 días",
+                        yaxis=dict(title='% noticias negativas', range=[0, 100]),
+                        height=350,
+                        margin=dict(l=50, r=20, t=50, b=40)
+                    )
+                    st.plotly_chart(fig_forecast, use_container_width=True)
+                
+                # Pronóstico por fuente (ajuste en lote de todas las series)
+                if 'fuente' in data_source.columns:
+                    by_source = trend_analyzer.forecast_by('fuente', horizon=7)
+                    if len(by_source) > 1:
+                        source_risk = pd.DataFrame([
+                            {'Fuente': name, 'Riesgo histórico (%)': f['baseline_risk'],
+                             'Riesgo proyectado (%)': f['forecast_risk'], 'Cambio (pts)': f['risk_change']}
+                            for name, f in by_source.items()
+                        ]).sort_values('Riesgo proyectado (%)', ascending=False)
+                        st.caption("Riesgo proyectado por fuente")
+                        st.dataframe(source_risk.head(10), use_container_width=True, hide_index=True)
             else:
                 st.info(prediction)
             
@@ -1701,7 +1914,7 @@ def main():
             if st.button("🔍 Generar Clusters Temáticos", type="primary", key="btn_generate_clusters"):
                 with st.spinner("Agrupando noticias por similitud temática..."):
                     try:
-                        df_clustered, themes = trend_analyzer.cluster_news(n_clusters=3)
+                        df_clustered, themes = trend_analyzer.cluster_news(n_clusters=None)
                         st.session_state['clusters_generated'] = True
                         st.session_state['df_clustered'] = df_clustered
                         st.session_state['themes'] = themes
@@ -1758,6 +1971,22 @@ def main():
         - Concentración geográfica de riesgos en zonas específicas
         """)
         
+        with st.expander("⚙️ Reglas personalizadas (YAML/JSON)"):
+            st.caption("Las reglas del archivo reemplazan o amplían las reglas por defecto "
+                       "(tipos: ratio, keywords, concentration, rate).")
+            rules_file = st.file_uploader("Archivo de reglas", type=['yaml', 'yml', 'json'],
+                                          key='alert_rules_file')
+            if rules_file is not None and st.button("💾 Guardar reglas"):
+                try:
+                    content = rules_file.getvalue().decode('utf-8')
+                    ext = rules_file.name.rsplit('.', 1)[-1]
+                    save_user_rules(st.session_state.get('user'), content, ext)
+                    st.success("✅ Reglas guardadas")
+                    st.session_state.pop('alerts', None)
+                    st.rerun()
+                except (ValueError, UnicodeDecodeError) as e:
+                    st.error(f"❌ Reglas inválidas: {e}")
+        
         st.markdown("---")
         
         data_source = st.session_state.get('last_analysis')
@@ -2023,6 +2252,20 @@ def main():
                 st.caption(f"✅ CSV listo: {len(data_source)} filas, {len(data_source.columns)} columnas")
             except Exception as e:
                 st.error(f"❌ Error generando CSV: {str(e)}")
+            
+            # Exportación Parquet (columnar, sentimiento categórico)
+            try:
+                parquet_bytes = to_columnar(data_source).to_parquet(index=False, engine='pyarrow', compression='zstd')
+                st.download_button(
+                    label="⬇️ Descargar Parquet",
+                    data=parquet_bytes,
+                    file_name=f"analisis_sava_{fecha_str}.parquet",
+                    mime="application/octet-stream",
+                    width='stretch',
+                    key="dl_parquet"
+                )
+            except Exception as e:
+                st.caption(f"⚠️ Parquet no disponible: {str(e)}")
         else:
             st.info("""
             ⬅️ **Primero realiza un análisis**
@@ -2037,6 +2280,27 @@ def main():
     with tabs[8]:
         st.header("🗄️ Historial de Análisis")
         
+        # Corridas archivadas localmente en Parquet (carga con memory-map)
+        local_runs = list_analysis_runs()
+        if local_runs:
+            st.subheader("📦 Corridas locales (Parquet)")
+            col_run, col_run_btn = st.columns([3, 1])
+            with col_run:
+                selected_run = st.selectbox(
+                    "Corrida archivada",
+                    local_runs,
+                    format_func=lambda path: path.replace('\\', '/').split('/')[-1],
+                    key="local_run"
+                )
+            with col_run_btn:
+                if st.button("📂 Abrir", key="btn_load_local_run"):
+                    try:
+                        store_analysis('last_analysis', load_parquet(selected_run), run_fingerprint(selected_run))
+                        st.success(f"✅ {len(st.session_state['last_analysis'])} noticias cargadas en las demás pestañas")
+                    except Exception as e:
+                        st.error(f"Error al abrir la corrida: {str(e)}")
+            st.markdown("---")
+        
         # Guardar historial en session state para que persista
         if 'historial_loaded' not in st.session_state:
             st.session_state['historial_loaded'] = False
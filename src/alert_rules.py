@@ -0,0 +1,561 @@
+"""
+Motor de reglas de alertas declarativo
+Las reglas (proporciones, palabras clave, concentración por grupo y tasas en
+ventana) se compilan en un plan que calcula una sola vez las columnas
+compartidas y evalúa cada regla sobre ellas sin volver a recorrer el DataFrame
+"""
+import copy
+import json
+import logging
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from src.sentiment_rollups import parse_dates
+from src.term_matcher import TermHits, TermMatcher, corpus_texts, register_terms, shared_matcher
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+RULE_TYPES = ('ratio', 'keywords', 'concentration', 'rate')
+
+SEVERITY_ORDER = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
+
+# Carpeta de reglas por usuario (un archivo YAML o JSON por usuario)
+USER_RULES_DIR = "data/alert_rules"
+
+_OPERATORS = {
+    '>=': np.greater_equal,
+    '>': np.greater,
+    '<=': np.less_equal,
+    '<': np.less,
+}
+
+# Textos por defecto de cada tipo; las reglas pueden reemplazarlos (str.format con los valores calculados)
+_DEFAULT_TEXTS = {
+    'ratio': {
+        'title': '🔔 ALERTA: {name}',
+        'message': '{pct:.1f}% ({count}/{total}) de las noticias son {sentiment}, umbral {op} {threshold_pct:.0f}%.',
+        'recommendation': 'Revisar las noticias involucradas.',
+    },
+    'keywords': {
+        'title': '⚠️ ALERTA: {name}',
+        'message': 'Se encontraron menciones de: {matches}',
+        'recommendation': 'Evaluar impacto potencial de estos eventos en las operaciones.',
+    },
+    'concentration': {
+        'title': '📍 ALERTA: {name}',
+        'message': 'Concentración detectada en: {matches}',
+        'recommendation': 'Investigar situación específica en estos grupos.',
+    },
+    'rate': {
+        'title': '⏱️ ALERTA: {name}',
+        'message': 'En los últimos {window_days} días, {pct:.1f}% ({count}/{total}) de las noticias son {sentiment}.',
+        'recommendation': 'Revisar la evolución reciente de las noticias.',
+    },
+}
+
+# Valores de ejemplo de cada tipo para validar los textos de las reglas: son los
+# que reciben los textos al evaluar en lote (el flujo continuo entrega los mismos o más)
+_SAMPLE_VALUES = {
+    'ratio': {'pct': 50.0, 'ratio': 0.5, 'count': 1, 'total': 2, 'threshold': 0.5, 'threshold_pct': 50.0,
+              'op': '>='},
+    'keywords': {'matches': "'sequía' (1 veces)", 'count': 1},
+    'concentration': {'matches': 'Cali (3 noticias)', 'count': 1, 'threshold': 3},
+    'rate': {'pct': 50.0, 'ratio': 0.5, 'count': 1, 'total': 2, 'threshold': 0.5, 'threshold_pct': 50.0,
+             'op': '>=', 'window_days': 7},
+}
+
+DEFAULT_RULES = {
+    'high_negative_ratio': {
+        'type': 'ratio',
+        'name': 'Alta proporción de noticias negativas',
+        'sentiment': 'Negativo',
+        'op': '>=',
+        'threshold': 0.4,  # 40%
+        'severity': 'critical',
+        'enabled': True,
+        'title': '🚨 ALERTA CRÍTICA: Alta Concentración de Noticias Negativas',
+        'message': 'Se detectó que {pct:.1f}% ({count}/{total}) de las noticias son negativas, '
+                   'superando el umbral del {threshold_pct:.0f}%.',
+        'recommendation': 'Revisar inmediatamente las noticias negativas para identificar amenazas críticas al sector.',
+    },
+    'critical_keywords': {
+        'type': 'keywords',
+        'name': 'Palabras clave críticas detectadas',
+        'keywords': ['sequía', 'plaga', 'crisis', 'pérdida', 'conflicto', 'paro', 'bloqueo'],
+        'sentiment': 'Negativo',
+        'severity': 'high',
+        'enabled': True,
+        'title': '⚠️ ALERTA: Palabras Clave Críticas Detectadas',
+    },
+    'low_positive_trend': {
+        'type': 'ratio',
+        'name': 'Tendencia negativa persistente',
+        'sentiment': 'Positivo',
+        'op': '<',
+        'threshold': 0.15,  # Menos de 15% positivas
+        'severity': 'medium',
+        'enabled': True,
+        'title': '📉 ALERTA: Baja Proporción de Noticias Positivas',
+        'message': 'Solo {pct:.1f}% ({count}/{total}) de las noticias son positivas, '
+                   'por debajo del {threshold_pct:.0f}%.',
+        'recommendation': 'Considerar estrategias para identificar y aprovechar oportunidades en el sector.',
+    },
+    'geographic_concentration': {
+        'type': 'concentration',
+        'name': 'Concentración de noticias negativas en una zona',
+        'by': 'ubicaciones',
+        'sentiment': 'Negativo',
+        'threshold': 3,  # 3 o más noticias negativas de la misma ubicación
+        'severity': 'high',
+        'enabled': True,
+        'title': '📍 ALERTA: Zona de Riesgo Concentrado',
+        'message': 'Múltiples noticias negativas detectadas en: {matches}',
+        'recommendation': 'Investigar situación específica en estas zonas y considerar medidas preventivas.',
+    },
+    'negative_rate_7d': {
+        'type': 'rate',
+        'name': 'Aumento reciente de noticias negativas',
+        'sentiment': 'Negativo',
+        'window_days': 7,
+        'op': '>=',
+        'threshold': 0.5,
+        'min_count': 3,
+        'severity': 'high',
+        'enabled': False,
+    },
+}
+
+
+def validate_rule(rule_id, rule):
+    """
+    Verifica una regla y completa valores por defecto
+
+    Raises:
+        ValueError: Si el tipo, el operador o los campos requeridos no son válidos
+    """
+    rule = dict(rule)
+    rule_type = rule.get('type')
+    if rule_type not in RULE_TYPES:
+        raise ValueError(f"Regla '{rule_id}': tipo '{rule_type}' no soportado (use uno de {RULE_TYPES})")
+    rule.setdefault('name', rule_id)
+    rule.setdefault('severity', 'medium')
+    rule.setdefault('enabled', True)
+    if rule['severity'] not in SEVERITY_ORDER:
+        raise ValueError(f"Regla '{rule_id}': severidad '{rule['severity']}' no válida")
+
+    if rule_type in ('ratio', 'rate'):
+        rule.setdefault('op', '>=')
+        if rule['op'] not in _OPERATORS:
+            raise ValueError(f"Regla '{rule_id}': operador '{rule['op']}' no válido (use {list(_OPERATORS)})")
+        if 'threshold' not in rule or 'sentiment' not in rule:
+            raise ValueError(f"Regla '{rule_id}': requiere 'sentiment' y 'threshold'")
+    if rule_type == 'rate':
+        rule.setdefault('window_days', 7)
+        rule.setdefault('min_count', 1)
+    if rule_type == 'keywords':
+        if not rule.get('keywords'):
+            raise ValueError(f"Regla '{rule_id}': requiere una lista 'keywords'")
+        rule.setdefault('min_count', 1)
+    if rule_type == 'concentration':
+        if not rule.get('by') or 'threshold' not in rule:
+            raise ValueError(f"Regla '{rule_id}': requiere 'by' y 'threshold'")
+
+    # Los números pueden venir como texto desde YAML/JSON: se convierten aquí para
+    # que la evaluación (en lote y en flujo) compare siempre números
+    counts = ('window_days', 'min_count') + (('threshold',) if rule_type == 'concentration' else ())
+    for field in ('threshold', 'window_days', 'min_count'):
+        if field not in rule:
+            continue
+        try:
+            value = float(rule[field])
+        except (TypeError, ValueError):
+            raise ValueError(f"Regla '{rule_id}': '{field}' debe ser numérico")
+        if field in counts:
+            if not value.is_integer():
+                raise ValueError(f"Regla '{rule_id}': '{field}' debe ser un número entero")
+            value = int(value)
+        rule[field] = value
+    _validate_texts(rule_id, rule)
+    return rule
+
+
+def _validate_texts(rule_id, rule):
+    """
+    Verifica que los textos de la regla solo usen los valores de su tipo
+
+    Raises:
+        ValueError: Si un texto usa un campo desconocido o un formato inválido
+    """
+    sample = {'name': rule['name'], 'sentiment': 'negativo', **_SAMPLE_VALUES[rule['type']]}
+    for field in ('title', 'message', 'recommendation'):
+        if field not in rule:
+            continue
+        try:
+            str(rule[field]).format(**sample)
+        except KeyError as e:
+            raise ValueError(f"Regla '{rule_id}': '{field}' usa {{{e.args[0]}}}, no disponible en reglas "
+                             f"'{rule['type']}' (use {sorted(sample)})")
+        except (IndexError, ValueError, AttributeError, TypeError) as e:
+            raise ValueError(f"Regla '{rule_id}': formato inválido en '{field}': {e}")
+
+
+def parse_rules(text, fmt='json'):
+    """
+    Lee un conjunto de reglas desde texto YAML o JSON
+
+    Acepta un dict id -> regla o una lista de reglas con campo 'id'.
+
+    Returns:
+        dict id -> regla (sin validar)
+    """
+    if fmt in ('yaml', 'yml'):
+        if yaml is None:
+            raise ValueError("Se requiere PyYAML para leer reglas en YAML (pip install pyyaml)")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ValueError(f"YAML de reglas inválido: {e}")
+    else:
+        data = json.loads(text)
+
+    if isinstance(data, dict) and 'rules' in data:
+        data = data['rules']
+    if isinstance(data, list):
+        if not all(isinstance(item, dict) and 'id' in item for item in data):
+            raise ValueError("Cada regla de la lista debe tener un campo 'id'")
+        data = {item['id']: {k: v for k, v in item.items() if k != 'id'} for item in data}
+    if not isinstance(data, dict):
+        raise ValueError("El archivo de reglas debe ser un diccionario o una lista de reglas")
+    return data
+
+
+def load_rules(path):
+    """Lee reglas de un archivo .json, .yaml o .yml"""
+    fmt = os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_rules(f.read(), fmt)
+
+
+def merge_rules(base, overrides):
+    """
+    Combina reglas: las de overrides reemplazan campo a campo las de igual id
+    y las nuevas se agregan (una regla nueva debe declarar su tipo)
+    """
+    merged = copy.deepcopy(base)
+    for rule_id, rule in (overrides or {}).items():
+        merged[rule_id] = {**merged.get(rule_id, {}), **rule}
+    return merged
+
+
+def user_rules_path(user, directory=USER_RULES_DIR):
+    """Ruta del archivo de reglas de un usuario (id o email saneado), o None sin usuario"""
+    if not user:
+        return None
+    key = user.get('id') or user.get('email') or user.get('username')
+    if not key:
+        return None
+    slug = re.sub(r'[^A-Za-z0-9_.@-]', '_', str(key))
+    for ext in ('yaml', 'yml', 'json'):
+        path = os.path.join(directory, f"{slug}.{ext}")
+        if os.path.exists(path):
+            return path
+    return os.path.join(directory, f"{slug}.yaml")
+
+
+def save_user_rules(user, text, fmt, directory=USER_RULES_DIR):
+    """
+    Valida y guarda el archivo de reglas de un usuario (escritura atómica)
+
+    Returns:
+        Ruta escrita
+
+    Raises:
+        ValueError: Si el contenido no es válido o no hay usuario
+    """
+    fmt = fmt.lower().lstrip('.')
+    rules = parse_rules(text, fmt)
+    # Valida antes de escribir, sin compilar (no registra términos en el matcher compartido)
+    for rule_id, rule in merge_rules(DEFAULT_RULES, rules).items():
+        validate_rule(rule_id, rule)
+
+    path = user_rules_path(user, directory)
+    if path is None:
+        raise ValueError("Se requiere un usuario para guardar reglas")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.splitext(path)[0] + ('.json' if fmt == 'json' else '.yaml')
+    # Un solo archivo por usuario: se eliminan los de otro formato
+    for ext in ('yaml', 'yml', 'json'):
+        other = os.path.splitext(path)[0] + f'.{ext}'
+        if other != path and os.path.exists(other):
+            os.remove(other)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return path
+
+
+class _Columns:
+    """Columnas compartidas por todas las reglas, calculadas una sola vez por evaluación"""
+
+    def __init__(self, df, needs_terms, needs_dates, group_columns, matcher=None):
+        self.total = len(df)
+        if 'sentimiento_ia' in df.columns:
+            codes, self.sentiments = pd.factorize(df['sentimiento_ia'].astype(object))
+        else:
+            codes, self.sentiments = np.full(len(df), -1), pd.Index([])
+        self.sentiment_codes = np.asarray(codes)
+        self.sentiment_counts = np.bincount(self.sentiment_codes[self.sentiment_codes >= 0],
+                                            minlength=len(self.sentiments))
+        self._masks = {}
+        self.titulares = (df['titular'].to_numpy(dtype=object) if 'titular' in df.columns
+                          else np.full(len(df), 'Sin titular', dtype=object))
+
+        # Matriz de términos: la compartida (palabras por defecto y ubicaciones en un solo
+        # recorrido) más la del motor si tiene palabras propias
+        parts = []
+        if needs_terms or matcher is not None:
+            texts = corpus_texts(df)
+            if needs_terms:
+                parts.append(shared_matcher().matrix(texts))
+            if matcher is not None:
+                parts.append(matcher.matrix(texts))
+        self.hits = TermHits.stack(parts) if parts else None
+        self._hits_csc = self.hits.matrix.tocsc() if parts else None
+
+        self.dates = None
+        if needs_dates and ('fecha_parsed' in df.columns or 'fecha' in df.columns):
+            self.dates = parse_dates(df).to_numpy(dtype='datetime64[ns]')
+
+        self.groups = {}
+        for column in group_columns:
+            if column in df.columns:
+                self.groups[column] = pd.factorize(df[column].astype(object))
+
+    def count(self, sentiment):
+        """Noticias con un sentimiento (o todas si sentiment es None)"""
+        if sentiment is None:
+            return self.total
+        position = self.sentiments.get_indexer([sentiment])[0]
+        return int(self.sentiment_counts[position]) if position >= 0 else 0
+
+    def mask(self, sentiment):
+        """Máscara booleana por sentimiento (cacheada), o None para todas"""
+        if sentiment is None:
+            return None
+        if sentiment not in self._masks:
+            position = self.sentiments.get_indexer([sentiment])[0]
+            self._masks[sentiment] = (self.sentiment_codes == position) if position >= 0 \
+                else np.zeros(self.total, dtype=bool)
+        return self._masks[sentiment]
+
+    def term_rows(self, group, mask):
+        """dict término -> posiciones de noticias (filtradas por mask) de un grupo de la matriz"""
+        result = {}
+        csc = self._hits_csc
+        for column, (label, name) in enumerate(zip(self.hits.labels, self.hits.groups)):
+            if name != group:
+                continue
+            rows = csc.indices[csc.indptr[column]:csc.indptr[column + 1]]
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if len(rows):
+                result[label] = np.sort(rows)
+        return result
+
+
+class RuleEngine:
+    """
+    Plan de evaluación de un conjunto de reglas
+
+    Al compilar se registran las palabras clave por defecto en el matcher
+    compartido; las que el usuario cambia van a un matcher propio del motor, así
+    motores de distintos usuarios no se pisan ni agrandan el registro global. Se
+    decide además qué columnas hacen falta (términos, fechas, agrupaciones); evaluar
+    calcula esas columnas una vez y cada regla es una operación sobre ellas.
+    """
+
+    def __init__(self, rules):
+        """
+        Args:
+            rules: dict id -> regla (se validan; las deshabilitadas se ignoran)
+        """
+        self.rules = {rule_id: validate_rule(rule_id, rule) for rule_id, rule in rules.items()}
+        self.enabled = {rule_id: rule for rule_id, rule in self.rules.items() if rule['enabled']}
+        self._compile()
+
+    def _compile(self):
+        self.needs_terms = False
+        self.needs_dates = False
+        self.group_columns = set()
+        self.term_groups = set()
+        own_terms = {}
+
+        for rule_id, rule in self.enabled.items():
+            if rule['type'] == 'keywords':
+                rule['_group'] = f"alertas:{rule_id}"
+                default = DEFAULT_RULES.get(rule_id, {})
+                if default.get('type') == 'keywords' and list(rule['keywords']) == default['keywords']:
+                    register_terms(rule['_group'], rule['keywords'])
+                    self.needs_terms = True
+                else:
+                    own_terms[rule['_group']] = list(rule['keywords'])
+            elif rule['type'] == 'concentration':
+                self.group_columns.add(rule['by'])
+                self.term_groups.add(rule['by'])
+            elif rule['type'] == 'rate':
+                self.needs_dates = True
+
+        if self.term_groups:
+            # Las ubicaciones las registra el mapa; sin folium/geopy se agrupa solo por columnas
+            try:
+                import src.geo_mapper  # Registra las ubicaciones
+            except Exception as e:
+                logger.warning(f"Ubicaciones no disponibles para alertas: {e}")
+            self.needs_terms = True
+        self.matcher = TermMatcher.from_groups(own_terms) if own_terms else None
+
+        # Reglas de proporción: una sola comparación vectorizada
+        ratio_rules = [(rule_id, rule) for rule_id, rule in self.enabled.items() if rule['type'] == 'ratio']
+        self._ratio_ids = [rule_id for rule_id, _ in ratio_rules]
+        self._ratio_sentiments = [rule['sentiment'] for _, rule in ratio_rules]
+        self._ratio_thresholds = np.array([float(rule['threshold']) for _, rule in ratio_rules])
+        self._ratio_ops = [rule['op'] for _, rule in ratio_rules]
+
+    def evaluate(self, df, now=None):
+        """
+        Evalúa todas las reglas habilitadas
+
+        Args:
+            df: DataFrame con noticias analizadas
+            now: Fecha de referencia de las ventanas (None = última fecha de los datos)
+
+        Returns:
+            Lista de alertas ordenadas por severidad
+        """
+        if df is None or len(df) == 0:
+            return []
+
+        columns = _Columns(df, self.needs_terms, self.needs_dates, self.group_columns, self.matcher)
+        alerts = []
+        alerts.extend(self._evaluate_ratios(columns))
+
+        for rule_id, rule in self.enabled.items():
+            if rule['type'] == 'keywords':
+                alert = self._evaluate_keywords(rule_id, rule, columns)
+            elif rule['type'] == 'concentration':
+                alert = self._evaluate_concentration(rule_id, rule, columns)
+            elif rule['type'] == 'rate':
+                alert = self._evaluate_rate(rule_id, rule, columns, now)
+            else:
+                continue
+            if alert:
+                alerts.append(alert)
+
+        alerts.sort(key=lambda a: SEVERITY_ORDER.get(a['severity'], 3))
+        return alerts
+
+    def _alert(self, rule_id, rule, values, details=None):
+        """Construye la alerta con los textos de la regla (o los del tipo)"""
+        values = {'name': rule['name'], 'sentiment': str(rule.get('sentiment', '')).lower(), **values}
+        texts = _DEFAULT_TEXTS[rule['type']]
+        alert = {
+            'type': rule_id,
+            'severity': rule['severity'],
+            'title': rule.get('title', texts['title']).format(**values),
+            'message': rule.get('message', texts['message']).format(**values),
+            'recommendation': rule.get('recommendation', texts['recommendation']).format(**values),
+        }
+        if details is not None:
+            alert['details'] = details
+        alert['timestamp'] = datetime.now().isoformat()
+        return alert
+
+    def _evaluate_ratios(self, columns):
+        if not self._ratio_ids:
+            return []
+        counts = np.array([columns.count(s) for s in self._ratio_sentiments], dtype=np.float64)
+        ratios = counts / columns.total if columns.total else np.zeros(len(counts))
+        fired = np.zeros(len(counts), dtype=bool)
+        for op in set(self._ratio_ops):
+            selected = np.array([o == op for o in self._ratio_ops])
+            fired[selected] = _OPERATORS[op](ratios[selected], self._ratio_thresholds[selected])
+
+        alerts = []
+        for i in np.flatnonzero(fired):
+            rule_id = self._ratio_ids[i]
+            rule = self.enabled[rule_id]
+            alerts.append(self._alert(rule_id, rule, {
+                'pct': ratios[i] * 100, 'ratio': ratios[i], 'count': int(counts[i]), 'total': columns.total,
+                'threshold': self._ratio_thresholds[i], 'threshold_pct': self._ratio_thresholds[i] * 100,
+                'op': rule['op'],
+            }))
+        return alerts
+
+    def _evaluate_keywords(self, rule_id, rule, columns):
+        rows_by_term = columns.term_rows(rule['_group'], columns.mask(rule.get('sentiment')))
+        detected = {term: columns.titulares[rows].tolist()
+                    for term, rows in rows_by_term.items() if len(rows) >= rule['min_count']}
+        if not detected:
+            return None
+        matches = ', '.join(f"'{k}' ({len(v)} veces)" for k, v in detected.items())
+        return self._alert(rule_id, rule, {'matches': matches, 'count': len(detected)}, detected)
+
+    def _evaluate_concentration(self, rule_id, rule, columns):
+        mask = columns.mask(rule.get('sentiment'))
+        threshold = rule['threshold']
+        by = rule['by']
+
+        if by in columns.groups:
+            # Agrupación por columna: bincount sobre los códigos factorizados
+            codes, uniques = columns.groups[by]
+            selected = codes if mask is None else codes[mask]
+            counts = np.bincount(selected[selected >= 0], minlength=len(uniques))
+            hot = np.flatnonzero(counts >= threshold)
+            rows_all = np.arange(columns.total) if mask is None else np.flatnonzero(mask)
+            details = {str(uniques[g]): columns.titulares[rows_all[selected == g]].tolist() for g in hot}
+        elif columns.hits is not None:
+            details = {term: columns.titulares[rows].tolist()
+                       for term, rows in columns.term_rows(by, mask).items() if len(rows) >= threshold}
+        else:
+            return None
+
+        if not details:
+            return None
+        matches = ', '.join(f"{k} ({len(v)} noticias)" for k, v in details.items())
+        return self._alert(rule_id, rule, {'matches': matches, 'count': len(details), 'threshold': threshold},
+                           details)
+
+    def _evaluate_rate(self, rule_id, rule, columns, now):
+        if columns.dates is None:
+            return None
+        valid = ~np.isnat(columns.dates)
+        if not valid.any():
+            return None
+        end = np.datetime64(pd.Timestamp(now)) if now is not None else columns.dates[valid].max()
+        start = end - np.timedelta64(int(rule['window_days']), 'D')
+        in_window = valid & (columns.dates > start) & (columns.dates <= end)
+
+        total = int(in_window.sum())
+        mask = columns.mask(rule['sentiment'])
+        count = int((in_window & mask).sum()) if mask is not None else total
+        if total == 0 or count < rule['min_count']:
+            return None
+        ratio = count / total
+        if not _OPERATORS[rule['op']](ratio, float(rule['threshold'])):
+            return None
+        return self._alert(rule_id, rule, {
+            'pct': ratio * 100, 'ratio': ratio, 'count': count, 'total': total,
+            'threshold': rule['threshold'], 'threshold_pct': float(rule['threshold']) * 100,
+            'op': rule['op'], 'window_days': rule['window_days'],
+        })
@@ -0,0 +1,399 @@
+"""
+Procesador incremental de alertas sobre un flujo de noticias
+Cada lote nuevo suma a contadores por ventana deslizante (por regla, término,
+ubicación o grupo) y solo se emiten las alertas nuevas o escaladas, con
+enfriamiento y silenciamiento, sin volver a procesar la historia
+"""
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+from src.alert_rules import SEVERITY_ORDER, RuleEngine, _Columns, _OPERATORS
+from src.sentiment_rollups import article_keys
+
+# Ventana por defecto de las reglas sin 'window_days' (proporción, palabras clave, concentración)
+DEFAULT_WINDOW_DAYS = 7
+
+# Tiempo mínimo entre dos emisiones de la misma alerta (salvo escalamiento)
+DEFAULT_COOLDOWN_MINUTES = 360
+
+# Resolución de los contadores: la memoria por clave es ventana / cubeta
+BUCKET_MINUTES = 60
+
+# Crecimiento relativo de la magnitud que cuenta como escalamiento (0.5 = +50%)
+ESCALATION_STEP = 0.5
+
+# Noticias mínimas en la ventana para evaluar proporciones
+MIN_WINDOW_ARTICLES = 5
+
+# Titulares de ejemplo guardados por clave
+_SAMPLE_SIZE = 5
+
+# Cada cuántos lotes se eliminan contadores vacíos y estados vencidos
+_SWEEP_EVERY = 50
+
+_TOTAL = '__total__'
+_MATCH = '__match__'
+
+
+class _WindowCounter:
+    """Suma en una ventana deslizante de cubetas de tiempo (memoria acotada por la ventana)"""
+
+    __slots__ = ('buckets', 'total')
+
+    def __init__(self):
+        self.buckets = deque()  # [cubeta, conteo] en orden creciente
+        self.total = 0
+
+    def add(self, bucket, count):
+        self.total += count
+        if not self.buckets or bucket > self.buckets[-1][0]:
+            self.buckets.append([bucket, count])
+            return
+        # Llegadas tardías: se ubican desde el final (normalmente la última cubeta)
+        for position in range(len(self.buckets) - 1, -1, -1):
+            if self.buckets[position][0] == bucket:
+                self.buckets[position][1] += count
+                return
+            if self.buckets[position][0] < bucket:
+                self.buckets.insert(position + 1, [bucket, count])
+                return
+        self.buckets.appendleft([bucket, count])
+
+    def expire(self, oldest):
+        """Descarta las cubetas anteriores a oldest"""
+        while self.buckets and self.buckets[0][0] < oldest:
+            self.total -= self.buckets.popleft()[1]
+
+
+class AlertStreamProcessor:
+    """
+    Evaluación continua de reglas de alerta sobre lotes de noticias
+
+    Las proporciones y tasas cuentan noticias en la ventana de la regla; las
+    palabras clave y la concentración cuentan por término o grupo. Una alerta
+    se emite al activarse (status 'new') o cuando su magnitud crece en
+    ESCALATION_STEP (status 'escalated'); una alerta que se apaga y vuelve a
+    activarse dentro del enfriamiento no se repite.
+    """
+
+    def __init__(self, rules, window_days=DEFAULT_WINDOW_DAYS, cooldown_minutes=DEFAULT_COOLDOWN_MINUTES,
+                 bucket_minutes=BUCKET_MINUTES, escalation_step=ESCALATION_STEP,
+                 min_window_articles=MIN_WINDOW_ARTICLES, rules_spec=None):
+        """
+        Args:
+            rules: RuleEngine compilado o dict id -> regla
+            window_days: Ventana de las reglas sin 'window_days'
+            cooldown_minutes: Enfriamiento entre emisiones de la misma alerta
+            bucket_minutes: Resolución de los contadores
+            escalation_step: Crecimiento relativo que se notifica como escalamiento
+            min_window_articles: Noticias mínimas en la ventana para las proporciones
+            rules_spec: Huella de las reglas de origen (para detectar cambios)
+        """
+        self.engine = rules if isinstance(rules, RuleEngine) else RuleEngine(rules)
+        self.rules_spec = rules_spec
+        self.window_days = window_days
+        self.cooldown = pd.Timedelta(minutes=cooldown_minutes)
+        self.bucket_seconds = int(bucket_minutes * 60)
+        self.escalation_step = escalation_step
+        self.min_window_articles = min_window_articles
+
+        self._lock = threading.RLock()
+        self._counters = {}
+        self._samples = {}
+        self._states = {}
+        self._suppressed = {}
+        self._seen = OrderedDict()  # clave de noticia -> cubeta en que deja de importar
+        self._batches = 0
+        self.stats = {'articles': 0, 'duplicates': 0, 'emitted': 0, 'suppressed': 0}
+
+    def _window_buckets(self, rule):
+        days = rule.get('window_days', self.window_days)
+        return max(1, int(pd.Timedelta(days=float(days)).total_seconds() // self.bucket_seconds))
+
+    def _bucket(self, timestamp):
+        return int(pd.Timestamp(timestamp).value // 10 ** 9 // self.bucket_seconds)
+
+    def _counter(self, key):
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters[key] = _WindowCounter()
+        return counter
+
+    def _add(self, key, buckets):
+        """Suma las noticias de cada cubeta al contador de la clave"""
+        values, counts = np.unique(buckets, return_counts=True)
+        counter = self._counter(key)
+        for bucket, count in zip(values.tolist(), counts.tolist()):
+            counter.add(bucket, count)
+
+    def _sample(self, key, titulares):
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=_SAMPLE_SIZE)
+        samples.extend(titulares[-_SAMPLE_SIZE:])
+
+    def suppress(self, rule_id, key=None, minutes=None, until=None):
+        """
+        Silencia una regla (o una clave de la regla, p. ej. un término o ubicación)
+
+        Args:
+            rule_id: Id de la regla
+            key: Término/grupo concreto o None para toda la regla
+            minutes: Duración del silencio (o until explícito; sin ambos, indefinido)
+        """
+        if until is None:
+            until = pd.Timestamp.now() + pd.Timedelta(minutes=minutes) if minutes is not None else pd.Timestamp.max
+        with self._lock:
+            self._suppressed[(rule_id, key)] = pd.Timestamp(until)
+
+    def unsuppress(self, rule_id, key=None):
+        with self._lock:
+            self._suppressed.pop((rule_id, key), None)
+
+    def _is_suppressed(self, rule_id, key, now):
+        for target in ((rule_id, key), (rule_id, None)):
+            until = self._suppressed.get(target)
+            if until is not None:
+                if now < until:
+                    return True
+                del self._suppressed[target]
+        return False
+
+    def process(self, df, now=None):
+        """
+        Incorpora un lote de noticias analizadas y evalúa las reglas afectadas
+
+        Args:
+            df: DataFrame con las noticias nuevas (las ya vistas se ignoran)
+            now: Hora de referencia (None = ahora); las noticias sin fecha usan esta hora
+
+        Returns:
+            Lista de alertas nuevas o escaladas, ordenadas por severidad
+        """
+        now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+        if now.tzinfo is not None:
+            now = now.tz_localize(None)
+        now_bucket = self._bucket(now)
+
+        with self._lock:
+            touched = set()
+            if df is not None and len(df):
+                df = self._new_articles(df, now_bucket)
+                if len(df):
+                    touched = self._ingest(df, now, now_bucket)
+
+            alerts = self._evaluate(touched, now, now_bucket)
+            self._batches += 1
+            if self._batches % _SWEEP_EVERY == 0:
+                self._sweep(now, now_bucket)
+
+        alerts.sort(key=lambda a: SEVERITY_ORDER.get(a['severity'], 3))
+        return alerts
+
+    def _new_articles(self, df, now_bucket):
+        """Filtra las noticias ya procesadas (se recuerdan mientras caben en alguna ventana)"""
+        while self._seen and next(iter(self._seen.values())) < now_bucket:
+            self._seen.popitem(last=False)
+
+        keys = article_keys(df)
+        fresh = (~keys.duplicated() & ~keys.isin(self._seen.keys())).to_numpy()
+        self.stats['duplicates'] += int((~fresh).sum())
+
+        horizon = now_bucket + max((self._window_buckets(r) for r in self.engine.enabled.values()), default=1)
+        for key in keys[fresh].tolist():
+            self._seen[key] = horizon
+        self.stats['articles'] += int(fresh.sum())
+        return df[fresh].reset_index(drop=True)
+
+    def _ingest(self, df, now, now_bucket):
+        """Suma el lote a los contadores; devuelve las claves (regla, clave) afectadas"""
+        columns = _Columns(df, self.engine.needs_terms, True, self.engine.group_columns, self.engine.matcher)
+        if columns.dates is None:
+            dates = np.full(len(df), np.datetime64(now), dtype='datetime64[ns]')
+        else:
+            dates = columns.dates.copy()
+            dates[np.isnat(dates)] = np.datetime64(now)
+            dates = np.minimum(dates, np.datetime64(now))
+        buckets = dates.astype('datetime64[s]').astype(np.int64) // self.bucket_seconds
+
+        touched = set()
+        for rule_id, rule in self.engine.enabled.items():
+            in_window = buckets > now_bucket - self._window_buckets(rule)
+            if not in_window.any():
+                continue
+            mask = columns.mask(rule.get('sentiment'))
+
+            if rule['type'] in ('ratio', 'rate'):
+                self._add((rule_id, _TOTAL), buckets[in_window])
+                matching = in_window & mask if mask is not None else in_window
+                if matching.any():
+                    self._add((rule_id, _MATCH), buckets[matching])
+                touched.add((rule_id, None))
+                continue
+
+            if rule['type'] == 'keywords':
+                rows_by_key = columns.term_rows(rule['_group'], mask)
+            elif rule['by'] in columns.groups:
+                codes, uniques = columns.groups[rule['by']]
+                rows = np.flatnonzero((in_window if mask is None else in_window & mask) & (codes >= 0))
+                rows = rows[np.argsort(codes[rows], kind='stable')]
+                present, starts = np.unique(codes[rows], return_index=True)
+                rows_by_key = {str(uniques[code]): part for code, part in zip(present, np.split(rows, starts[1:]))}
+            elif columns.hits is not None:
+                rows_by_key = columns.term_rows(rule['by'], mask)
+            else:
+                continue
+
+            for key, rows in rows_by_key.items():
+                rows = rows[in_window[rows]]
+                if len(rows):
+                    self._add((rule_id, key), buckets[rows])
+                    self._sample((rule_id, key), columns.titulares[rows].tolist())
+                    touched.add((rule_id, key))
+        return touched
+
+    def _measure(self, rule_id, rule, key, now_bucket):
+        """
+        Valores de la regla en la ventana actual
+
+        Returns:
+            (activa, magnitud, valores para los textos, detalles)
+        """
+        oldest = now_bucket - self._window_buckets(rule) + 1
+        window_days = rule.get('window_days', self.window_days)
+
+        if rule['type'] in ('ratio', 'rate'):
+            total_counter = self._counters.get((rule_id, _TOTAL))
+            match_counter = self._counters.get((rule_id, _MATCH))
+            for counter in (total_counter, match_counter):
+                if counter is not None:
+                    counter.expire(oldest)
+            total = total_counter.total if total_counter else 0
+            count = match_counter.total if match_counter else 0
+            threshold = float(rule['threshold'])
+            if total < self.min_window_articles or count < rule.get('min_count', 0):
+                return False, 0.0, None, None
+            ratio = count / total
+            if not _OPERATORS[rule['op']](ratio, threshold):
+                return False, 0.0, None, None
+            if rule['op'] in ('>=', '>'):
+                magnitude = ratio / threshold if threshold > 0 else 1 + ratio
+            else:
+                magnitude = 1 + (threshold - ratio) / threshold if threshold > 0 else 1.0
+            values = {'pct': ratio * 100, 'ratio': ratio, 'count': count, 'total': total,
+                      'threshold': threshold, 'threshold_pct': threshold * 100, 'op': rule['op'],
+                      'window_days': window_days}
+            return True, magnitude, values, None
+
+        counter = self._counters.get((rule_id, key))
+        if counter is None:
+            return False, 0.0, None, None
+        counter.expire(oldest)
+        if rule['type'] == 'keywords':
+            threshold = rule['min_count']
+            matches = f"'{key}' ({counter.total} veces)"
+        else:
+            threshold = rule['threshold']
+            matches = f"{key} ({counter.total} noticias)"
+        if counter.total < threshold:
+            return False, 0.0, None, None
+        values = {'matches': matches, 'count': counter.total, 'threshold': threshold, 'window_days': window_days}
+        details = {key: list(self._samples.get((rule_id, key), ()))}
+        return True, counter.total / max(threshold, 1), values, details
+
+    def _evaluate(self, touched, now, now_bucket):
+        """Evalúa las claves del lote y las alertas activas (que pueden apagarse al vencer la ventana)"""
+        candidates = set(touched)
+        candidates.update(state_key for state_key, state in self._states.items() if state['active'])
+        # Las proporciones dependen de todo el flujo: se revisan en cada lote
+        candidates.update((rule_id, None) for rule_id, rule in self.engine.enabled.items()
+                          if rule['type'] in ('ratio', 'rate'))
+
+        alerts = []
+        for rule_id, key in candidates:
+            rule = self.engine.enabled.get(rule_id)
+            if rule is None:
+                continue
+            firing, magnitude, values, details = self._measure(rule_id, rule, key, now_bucket)
+            alert = self._transition(rule_id, rule, key, firing, magnitude, values, details, now)
+            if alert:
+                alerts.append(alert)
+        return alerts
+
+    def _transition(self, rule_id, rule, key, firing, magnitude, values, details, now):
+        """Aplica activación, escalamiento, enfriamiento y silencio a una clave"""
+        state = self._states.get((rule_id, key))
+        if not firing:
+            if state is not None:
+                state['active'] = False
+            return None
+
+        if state is None:
+            state = self._states[(rule_id, key)] = {'active': False, 'magnitude': 0.0, 'last_emitted': None}
+
+        if state['active']:
+            if magnitude < state['magnitude'] * (1 + self.escalation_step):
+                return None
+            status = 'escalated'
+        else:
+            state['active'] = True
+            recent = state['last_emitted'] is not None and now - state['last_emitted'] < self.cooldown
+            if recent:
+                # Reactivación dentro del enfriamiento: se sigue la magnitud sin repetir la alerta
+                state['magnitude'] = magnitude
+                self.stats['suppressed'] += 1
+                return None
+            status = 'new'
+
+        if self._is_suppressed(rule_id, key, now):
+            state['magnitude'] = magnitude
+            self.stats['suppressed'] += 1
+            return None
+
+        previous = state['magnitude']
+        state.update(magnitude=magnitude, last_emitted=now)
+
+        alert = self.engine._alert(rule_id, rule, values, details)
+        alert.update({
+            'key': key,
+            'status': status,
+            'magnitude': round(magnitude, 3),
+            'timestamp': now.isoformat(),
+        })
+        if status == 'escalated':
+            alert['previous_magnitude'] = round(previous, 3)
+        state['alert'] = alert
+        self.stats['emitted'] += 1
+        return alert
+
+    def active_alerts(self):
+        """Última alerta emitida de cada clave que sigue activa"""
+        with self._lock:
+            alerts = [dict(state['alert']) for state in self._states.values() if state['active'] and 'alert' in state]
+        return sorted(alerts, key=lambda a: SEVERITY_ORDER.get(a['severity'], 3))
+
+    def _sweep(self, now, now_bucket):
+        """Libera contadores vacíos y estados inactivos fuera del enfriamiento"""
+        for (rule_id, key) in list(self._counters):
+            rule = self.engine.enabled.get(rule_id)
+            counter = self._counters[(rule_id, key)]
+            if rule is not None:
+                counter.expire(now_bucket - self._window_buckets(rule) + 1)
+            if rule is None or counter.total == 0:
+                del self._counters[(rule_id, key)]
+                self._samples.pop((rule_id, key), None)
+        for state_key, state in list(self._states.items()):
+            if not state['active'] and (state['last_emitted'] is None or now - state['last_emitted'] >= self.cooldown):
+                del self._states[state_key]
+
+    def reset(self):
+        """Olvida contadores, estados y noticias vistas (mantiene los silencios)"""
+        with self._lock:
+            self._counters.clear()
+            self._samples.clear()
+            self._states.clear()
+            self._seen.clear()
+            self._batches = 0
@@ -0,0 +1,169 @@
+"""
+Motor de ejecución concurrente por lotes para análisis masivo de noticias
+Divide los textos en lotes con presupuesto de tokens y los procesa en paralelo
+"""
+import time
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src.rate_limiter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkedBatchEngine:
+    def __init__(self, max_workers=4, max_input_tokens=12000, max_output_tokens=8000,
+                 output_tokens_per_item=100, prompt_overhead_tokens=600,
+                 max_chars_per_item=500, max_retries=2, retry_backoff=1.0):
+        """
+        Inicializa el motor de ejecución por lotes
+
+        Args:
+            max_workers: Número máximo de lotes procesados en paralelo
+            max_input_tokens: Presupuesto de tokens de entrada por lote (prompt completo)
+            max_output_tokens: Límite de tokens de salida del modelo por llamada
+            output_tokens_per_item: Tokens de salida estimados por noticia
+            prompt_overhead_tokens: Tokens fijos de instrucciones en cada prompt
+            max_chars_per_item: Caracteres de cada noticia que se envían al modelo
+            max_retries: Reintentos por lote fallido (solo se reintenta ese lote)
+            retry_backoff: Espera base en segundos antes de cada reintento
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.output_tokens_per_item = output_tokens_per_item
+        self.prompt_overhead_tokens = prompt_overhead_tokens
+        self.max_chars_per_item = max_chars_per_item
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        # Máximo de noticias que caben en la salida de una sola llamada
+        self.max_items_per_chunk = max(
+            1, (max_output_tokens - 300) // max(1, output_tokens_per_item)
+        )
+
+    # Misma estimación que el limitador de tasa (~4 caracteres por token)
+    estimate_tokens = staticmethod(estimate_tokens)
+
+    def build_chunks(self, texts):
+        """
+        Agrupa los textos en lotes que respetan el presupuesto de tokens
+
+        Args:
+            texts: Lista de textos a analizar
+
+        Returns:
+            Lista de lotes, cada uno es una lista de índices sobre texts
+        """
+        input_budget = max(1, self.max_input_tokens - self.prompt_overhead_tokens)
+
+        chunks = []
+        current = []
+        current_tokens = 0
+
+        for idx, text in enumerate(texts):
+            # +10 tokens por el separador "--- NOTICIA N ---"
+            item_tokens = self.estimate_tokens(text[:self.max_chars_per_item]) + 10
+
+            if current and (current_tokens + item_tokens > input_budget
+                            or len(current) >= self.max_items_per_chunk):
+                chunks.append(current)
+                current = []
+                current_tokens = 0
+
+            current.append(idx)
+            current_tokens += item_tokens
+
+        if current:
+            chunks.append(current)
+
+        return chunks
+
+    def _run_chunk(self, worker, chunk_texts, attempt):
+        """Ejecuta un lote aplicando backoff con jitter si es un reintento"""
+        if attempt > 0:
+            delay = self.retry_backoff * (2 ** (attempt - 1))
+            time.sleep(delay * (0.5 + random.random()))
+        return worker(chunk_texts)
+
+    def run(self, texts, worker, progress_callback=None):
+        """
+        Procesa todos los textos en lotes concurrentes
+
+        Args:
+            texts: Lista de textos a analizar
+            worker: Función que recibe una lista de textos y retorna una lista de
+                    resultados del mismo tamaño. Debe lanzar excepción si el lote falla.
+            progress_callback: Función opcional (procesadas, total) llamada desde
+                               el hilo principal cada vez que termina un lote
+
+        Returns:
+            Tupla (resultados, stats). resultados está alineado con texts y contiene
+            None para los textos cuyo lote falló tras agotar los reintentos.
+        """
+        total = len(texts)
+        results = [None] * total
+        stats = {"chunks": 0, "api_calls": 0, "retries": 0, "failed_items": 0}
+
+        if total == 0:
+            return results, stats
+
+        chunks = self.build_chunks(texts)
+        stats["chunks"] = len(chunks)
+        processed = 0
+
+        logger.info(f"⚙️ {total} noticias divididas en {len(chunks)} lote(s), "
+                    f"hasta {self.max_workers} en paralelo")
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+            pending = {}
+
+            def submit(chunk, attempt):
+                chunk_texts = [texts[i] for i in chunk]
+                future = executor.submit(self._run_chunk, worker, chunk_texts, attempt)
+                pending[future] = (chunk, attempt)
+                stats["api_calls"] += 1
+
+            for chunk in chunks:
+                submit(chunk, 0)
+
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    chunk, attempt = pending.pop(future)
+
+                    try:
+                        chunk_results = future.result()
+                        if chunk_results is None or len(chunk_results) != len(chunk):
+                            raise ValueError(
+                                f"respuesta con {0 if chunk_results is None else len(chunk_results)}"
+                                f"/{len(chunk)} resultados"
+                            )
+                    except Exception as e:
+                        if attempt < self.max_retries:
+                            # Reintentar solo este lote, partido en dos para reducir su tamaño
+                            logger.warning(f"⚠️ Lote de {len(chunk)} noticias falló ({str(e)[:100]}). "
+                                           f"Reintento {attempt + 1}/{self.max_retries}...")
+                            stats["retries"] += 1
+                            half = (len(chunk) + 1) // 2
+                            for sub_chunk in (chunk[:half], chunk[half:]):
+                                if sub_chunk:
+                                    submit(sub_chunk, attempt + 1)
+                        else:
+                            logger.error(f"❌ Lote de {len(chunk)} noticias falló definitivamente: {str(e)[:200]}")
+                            stats["failed_items"] += len(chunk)
+                            processed += len(chunk)
+                            if progress_callback:
+                                progress_callback(processed, total)
+                        continue
+
+                    for i, result in zip(chunk, chunk_results):
+                        results[i] = result
+
+                    processed += len(chunk)
+                    if progress_callback:
+                        progress_callback(processed, total)
+
+        return results, stats
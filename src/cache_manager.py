@@ -5,144 +5,822 @@ Reduce consumo de API hasta en 80%
 import sqlite3
 import hashlib
 import json
+import threading
+import time
+from collections import Counter, OrderedDict
 from datetime import datetime, timedelta
 import os
+import logging
+
+from src.minhash import MinHasher
+from src.text_es import NEGATION_WORDS, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Límite de parámetros por consulta IN (...) compatible con SQLite antiguo (999)
+_SQL_BATCH_SIZE = 500
+
+# Orden de desalojo: primero las entradas con menor puntuación
+_EVICTION_ORDER = {
+    "lru": "last_access ASC",
+    "lfu": "hits ASC, last_access ASC",
+}
+
+# Al superar un límite se desaloja hasta quedar en este porcentaje (evita desalojar en cada escritura)
+_EVICTION_TARGET = 0.9
+
+
+class _MemoryTier:
+    """LRU en memoria con tamaño máximo y TTL, delante de SQLite"""
+
+    def __init__(self, max_entries=5000, ttl_seconds=3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries = OrderedDict()
+
+    def get(self, content_hash):
+        """Retorna la entrada (y la marca como reciente) o None si no existe o expiró"""
+        item = self._entries.get(content_hash)
+        if item is None:
+            return None
+        stored_at, entry = item
+        if self.clock() - stored_at > self.ttl_seconds:
+            del self._entries[content_hash]
+            return None
+        self._entries.move_to_end(content_hash)
+        return entry
+
+    def put(self, content_hash, entry):
+        self._entries[content_hash] = (self.clock(), entry)
+        self._entries.move_to_end(content_hash)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, hashes):
+        for content_hash in hashes:
+            self._entries.pop(content_hash, None)
+
+    def discard_older_than(self, cutoff):
+        """Elimina entradas cuyo timestamp de análisis es anterior a cutoff"""
+        for content_hash in [h for h, (_, e) in self._entries.items() if e["timestamp"] < cutoff]:
+            del self._entries[content_hash]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _SharedConnection:
+    """Conexión SQLite única por archivo, compartida por todas las instancias del proceso"""
+
+    def __init__(self, db_path, memory_max_entries, memory_ttl_seconds):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        # auto_vacuum se fija antes de crear tablas (archivos nuevos). En archivos antiguos
+        # sin él no se ejecuta VACUUM al abrir: reescribiría la base completa en cada arranque
+        self.conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        # WAL: lectores y escritor no se bloquean; NORMAL evita un fsync por commit
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        # Hits acumulados en memoria y escritos en bloque (write-behind)
+        self.pending_hits = Counter()
+        self.last_flush = time.monotonic()
+        # Nivel en memoria compartido por todas las sesiones del servidor
+        self.memory = _MemoryTier(memory_max_entries, memory_ttl_seconds)
+        self.tier_stats = {
+            "memory": {"hits": 0, "misses": 0},
+            "sqlite": {"hits": 0, "misses": 0},
+            "near_duplicate": {"hits": 0, "misses": 0, "score_sum": 0.0},
+        }
+        # Desalojo y compactación programada
+        self.last_compaction = None
+        self.eviction_stats = {"expired": 0, "evicted": 0, "compactions": 0, "last_compaction": None}
+        # Filas en sentiment_cache: se cuenta una vez y se mantiene en cada escritura
+        self.row_count = None
+        # Entradas de otra versión de prompt / familia de modelo
+        self.stale_stats = {"served": 0, "rejected": 0}
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def _get_shared_connection(db_path, memory_max_entries, memory_ttl_seconds):
+    """
+    Obtiene la conexión del pool para db_path (la recrea si el archivo fue borrado).
+    La configuración del nivel en memoria la fija la primera instancia que abre el archivo.
+    """
+    key = os.path.abspath(db_path)
+    with _connections_lock:
+        shared = _connections.get(key)
+        if shared is None or not os.path.exists(key):
+            shared = _SharedConnection(key, memory_max_entries, memory_ttl_seconds)
+            _connections[key] = shared
+        return shared
+
 
 class CacheManager:
-    def __init__(self, db_path="cache/sentiment_cache.db"):
-        """Inicializa base de datos SQLite para caché local"""
+    def __init__(self, db_path="cache/sentiment_cache.db", hits_flush_interval=5.0, hits_flush_size=500,
+                 memory_max_entries=5000, memory_ttl_seconds=3600,
+                 near_duplicate=False, similarity_threshold=0.8,
+                 max_entries=50000, max_bytes=200 * 1024 * 1024, eviction_policy="lru",
+                 max_age_days=90, compaction_interval=3600,
+                 prompt_version=None, model_family=None, accepted_families=None, serve_stale=False):
+        """
+        Inicializa base de datos SQLite para caché local
+
+        Args:
+            db_path: Ruta del archivo SQLite
+            hits_flush_interval: Segundos máximos que los hits esperan en memoria
+            hits_flush_size: Número de hits pendientes que fuerza una escritura
+            memory_max_entries: Tamaño máximo del LRU en memoria
+            memory_ttl_seconds: Segundos que una entrada permanece en el LRU
+            near_duplicate: Si True, los fallos exactos se buscan por similitud (MinHash + LSH)
+            similarity_threshold: Jaccard estimado mínimo para aceptar un casi duplicado
+            max_entries: Máximo de filas en sentiment_cache (None = sin límite)
+            max_bytes: Tamaño máximo de la base de datos en bytes (None = sin límite)
+            eviction_policy: "lru" (último acceso) o "lfu" (menos hits, desempate por último acceso)
+            max_age_days: Las entradas más antiguas se eliminan en cada compactación
+            compaction_interval: Segundos entre compactaciones automáticas tras escrituras
+            prompt_version: Versión del prompt vigente. La clave es solo el texto: la versión
+                            se guarda con cada entrada y se compara al leer
+            model_family: Familia de modelo esperada (p. ej. "gemini-2.0-flash"); también es
+                          la que se guarda cuando set() no recibe la del modelo que respondió
+            accepted_families: Otras familias cuyas entradas siguen vigentes (p. ej. los modelos
+                               de respaldo del enrutador)
+            serve_stale: Si True, las entradas de otra versión/familia se devuelven marcadas
+                         como "stale" en lugar de tratarse como fallo (re-validación perezosa)
+        """
+        if eviction_policy not in _EVICTION_ORDER:
+            raise ValueError(f"eviction_policy debe ser uno de {sorted(_EVICTION_ORDER)}")
         self.db_path = db_path
+        self.hits_flush_interval = hits_flush_interval
+        self.hits_flush_size = hits_flush_size
+        self.near_duplicate = near_duplicate
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.eviction_policy = eviction_policy
+        self.max_age_days = max_age_days
+        self.compaction_interval = compaction_interval
+        self.prompt_version = prompt_version
+        self.model_family = model_family
+        self.accepted_families = set(accepted_families or ())
+        self.serve_stale = serve_stale
+        # Parámetros fijos: las firmas guardadas deben ser comparables entre procesos
+        self.hasher = MinHasher()
         os.makedirs(os.path.dirname(db_path) if os.path.dirname(db_path) else "cache", exist_ok=True)
+        self._shared = _get_shared_connection(db_path, memory_max_entries, memory_ttl_seconds)
         self._init_database()
-    
+
     def _init_database(self):
         """Crea tabla de caché si no existe"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sentiment_cache (
-                content_hash TEXT PRIMARY KEY,
-                titular TEXT,
-                sentimiento TEXT,
-                explicacion TEXT,
-                timestamp DATETIME,
-                hits INTEGER DEFAULT 1
-            )
-        ''')
-        
-        # Índice para búsquedas rápidas
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_timestamp ON sentiment_cache(timestamp)
-        ''')
-        conn.commit()
-        conn.close()
-    
+        with self._shared.lock:
+            conn = self._shared.conn
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sentiment_cache (
+                    content_hash TEXT PRIMARY KEY,
+                    titular TEXT,
+                    sentimiento TEXT,
+                    explicacion TEXT,
+                    timestamp DATETIME,
+                    hits INTEGER DEFAULT 1
+                )
+            ''')
+
+            # Índice para búsquedas rápidas
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_timestamp ON sentiment_cache(timestamp)
+            ''')
+
+            # Firma MinHash y último acceso junto a content_hash (migración de bases existentes)
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(sentiment_cache)')}
+            if 'minhash' not in columns:
+                conn.execute('ALTER TABLE sentiment_cache ADD COLUMN minhash BLOB')
+            if 'last_access' not in columns:
+                conn.execute('ALTER TABLE sentiment_cache ADD COLUMN last_access DATETIME')
+                conn.execute('UPDATE sentiment_cache SET last_access = timestamp')
+            # Versión de prompt y familia de modelo (NULL = anterior al versionado)
+            if 'prompt_version' not in columns:
+                conn.execute('ALTER TABLE sentiment_cache ADD COLUMN prompt_version TEXT')
+            if 'model_family' not in columns:
+                conn.execute('ALTER TABLE sentiment_cache ADD COLUMN model_family TEXT')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_last_access ON sentiment_cache(last_access)
+            ''')
+
+            # Índice LSH: una fila por (banda, entrada)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sentiment_lsh (
+                    bucket TEXT,
+                    content_hash TEXT,
+                    PRIMARY KEY (bucket, content_hash)
+                ) WITHOUT ROWID
+            ''')
+            conn.commit()
+
     def _generate_hash(self, text):
         """Genera hash único para el contenido"""
         return hashlib.md5(text.strip().lower().encode()).hexdigest()
-    
+
+    def _is_current(self, prompt_version, model_family):
+        """True si la entrada corresponde al prompt vigente y a una familia de modelo aceptada"""
+        return ((self.prompt_version is None or prompt_version == self.prompt_version)
+                and (self.model_family is None or model_family == self.model_family
+                     or model_family in self.accepted_families))
+
+    def _flush_hits_locked(self):
+        """Escribe los hits pendientes en una sola transacción. Requiere tener el lock."""
+        shared = self._shared
+        if shared.pending_hits:
+            now = datetime.now().isoformat()
+            shared.conn.executemany(
+                'UPDATE sentiment_cache SET hits = hits + ?, last_access = ? WHERE content_hash = ?',
+                [(count, now, content_hash) for content_hash, count in shared.pending_hits.items()]
+            )
+            shared.conn.commit()
+            shared.pending_hits.clear()
+        shared.last_flush = time.monotonic()
+
+    def _maybe_flush_hits_locked(self):
+        shared = self._shared
+        if (sum(shared.pending_hits.values()) >= self.hits_flush_size
+                or time.monotonic() - shared.last_flush >= self.hits_flush_interval):
+            self._flush_hits_locked()
+
+    def flush_hits(self):
+        """Fuerza la escritura de los contadores de hits pendientes"""
+        with self._shared.lock:
+            self._flush_hits_locked()
+
+    def _row_count_locked(self):
+        """Filas en sentiment_cache sin recorrer la tabla en cada escritura. Requiere tener el lock."""
+        shared = self._shared
+        if shared.row_count is None:
+            shared.row_count = shared.conn.execute('SELECT COUNT(*) FROM sentiment_cache').fetchone()[0]
+        return shared.row_count
+
+    def _existing_hashes_locked(self, hashes):
+        """Subconjunto de hashes que ya tienen fila (búsqueda por clave primaria). Requiere tener el lock."""
+        existing = set()
+        for start in range(0, len(hashes), _SQL_BATCH_SIZE):
+            chunk = hashes[start:start + _SQL_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            existing.update(row[0] for row in self._shared.conn.execute(
+                f'SELECT content_hash FROM sentiment_cache WHERE content_hash IN ({placeholders})', chunk
+            ))
+        return existing
+
+    def _fetch_rows_locked(self, hashes):
+        """Consulta varias entradas con IN (...). Requiere tener el lock."""
+        rows = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), _SQL_BATCH_SIZE):
+            chunk = unique[start:start + _SQL_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            cursor = self._shared.conn.execute(f'''
+                SELECT content_hash, sentimiento, explicacion, timestamp, hits, prompt_version, model_family
+                FROM sentiment_cache
+                WHERE content_hash IN ({placeholders})
+            ''', chunk)
+            for content_hash, *row in cursor:
+                rows[content_hash] = tuple(row)
+        return rows
+
+    def _near_duplicate_lookup_locked(self, texts, cutoff):
+        """
+        Busca casi duplicados por LSH. Requiere tener el lock.
+
+        Returns:
+            Lista alineada con texts: (content_hash, fila, similitud) o None.
+            Se prefieren las entradas vigentes; las de otra versión solo si serve_stale.
+        """
+        conn = self._shared.conn
+        signatures = [self.hasher.signature(text) for text in texts]
+        keys_per_text = [self.hasher.band_keys(sig) for sig in signatures]
+
+        # Candidatos: entradas que comparten al menos una banda
+        bucket_members = {}
+        all_keys = list({key for keys in keys_per_text for key in keys})
+        for start in range(0, len(all_keys), _SQL_BATCH_SIZE):
+            chunk = all_keys[start:start + _SQL_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            for bucket, content_hash in conn.execute(
+                f'SELECT bucket, content_hash FROM sentiment_lsh WHERE bucket IN ({placeholders})', chunk
+            ):
+                bucket_members.setdefault(bucket, set()).add(content_hash)
+
+        candidates_per_text = [
+            set().union(*(bucket_members.get(key, ()) for key in keys)) for keys in keys_per_text
+        ]
+        all_candidates = list(set().union(*candidates_per_text))
+
+        rows = {}
+        for start in range(0, len(all_candidates), _SQL_BATCH_SIZE):
+            chunk = all_candidates[start:start + _SQL_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            for content_hash, sentimiento, explicacion, hits, minhash, prompt_version, model_family in conn.execute(f'''
+                SELECT content_hash, sentimiento, explicacion, hits, minhash, prompt_version, model_family
+                FROM sentiment_cache
+                WHERE content_hash IN ({placeholders}) AND timestamp >= ?
+            ''', chunk + [cutoff.isoformat()]):
+                current = self._is_current(prompt_version, model_family)
+                if minhash is not None and (current or self.serve_stale):
+                    rows[content_hash] = (sentimiento, explicacion, hits, self.hasher.from_bytes(minhash), current)
+
+        matches = []
+        for signature, candidates in zip(signatures, candidates_per_text):
+            best = None
+            for content_hash in candidates:
+                row = rows.get(content_hash)
+                if row is None:
+                    continue
+                score = self.hasher.similarity(signature, row[3])
+                if score >= self.similarity_threshold and (
+                        best is None or (row[4], score) > (best[1][4], best[2])):
+                    best = (content_hash, row, score)
+            matches.append(best)
+        return matches
+
     def get(self, text, max_age_days=30):
         """
         Busca resultado en caché
-        
+
         Args:
             text: Texto de la noticia
             max_age_days: Edad máxima del caché en días
-        
+
         Returns:
             dict o None si no existe o está vencido
         """
-        content_hash = self._generate_hash(text)
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Buscar y verificar edad
-        cursor.execute('''
-            SELECT sentimiento, explicacion, timestamp, hits
-            FROM sentiment_cache
-            WHERE content_hash = ?
-        ''', (content_hash,))
-        
-        result = cursor.fetchone()
-        
-        if result:
-            sentimiento, explicacion, timestamp, hits = result
-            cache_date = datetime.fromisoformat(timestamp)
-            
-            # Verificar si no está vencido
-            if datetime.now() - cache_date <= timedelta(days=max_age_days):
-                # Incrementar contador de hits
-                cursor.execute('''
-                    UPDATE sentiment_cache 
-                    SET hits = hits + 1 
-                    WHERE content_hash = ?
-                ''', (content_hash,))
-                conn.commit()
-                conn.close()
-                
-                return {
-                    "sentimiento": sentimiento,
-                    "explicacion": explicacion,
+        return self.get_many([text], max_age_days=max_age_days)[0]
+
+    def get_many(self, texts, max_age_days=30):
+        """
+        Busca varios textos en caché con una sola consulta
+
+        Args:
+            texts: Lista de textos de noticias
+            max_age_days: Edad máxima del caché en días
+
+        Returns:
+            Lista alineada con texts: dict para cada acierto, None si no existe o está vencido.
+            Con serve_stale, los aciertos de otra versión de prompt/modelo llevan "stale": True
+        """
+        texts = list(texts)
+        hashes = [self._generate_hash(text) for text in texts]
+        cutoff = datetime.now() - timedelta(days=max_age_days)
+        results = []
+
+        with self._shared.lock:
+            memory = self._shared.memory
+            tier_stats = self._shared.tier_stats
+
+            # Nivel 1: LRU en memoria
+            entries = {}
+            for content_hash in set(hashes):
+                entry = memory.get(content_hash)
+                if entry is not None:
+                    entries[content_hash] = entry
+            missing = [h for h in hashes if h not in entries]
+
+            # Nivel 2: SQLite, solo para lo que no estaba en memoria
+            if missing:
+                pending = self._shared.pending_hits
+                for content_hash, row in self._fetch_rows_locked(missing).items():
+                    sentimiento, explicacion, timestamp, hits, prompt_version, model_family = row
+                    entry = {
+                        "sentimiento": sentimiento,
+                        "explicacion": explicacion,
+                        "timestamp": datetime.fromisoformat(timestamp),
+                        "hits": hits + pending[content_hash],
+                        "prompt_version": prompt_version,
+                        "model_family": model_family,
+                    }
+                    memory.put(content_hash, entry)
+                    entries[content_hash] = entry
+            missing = set(missing)
+
+            for content_hash in hashes:
+                entry = entries.get(content_hash)
+                # Verificar si no está vencido
+                valid = entry is not None and entry["timestamp"] >= cutoff
+                stale = valid and not self._is_current(entry["prompt_version"], entry["model_family"])
+                if stale and not self.serve_stale:
+                    self._shared.stale_stats["rejected"] += 1
+                    valid = False
+
+                if content_hash in missing:
+                    tier_stats["memory"]["misses"] += 1
+                    tier_stats["sqlite"]["hits" if valid else "misses"] += 1
+                    if valid:
+                        missing.discard(content_hash)  # repeticiones en el mismo lote ya están en memoria
+                else:
+                    tier_stats["memory"]["hits" if valid else "misses"] += 1
+
+                if not valid:
+                    results.append(None)
+                    continue
+
+                # Incrementar contador de hits (se escribe en bloque más tarde)
+                self._shared.pending_hits[content_hash] += 1
+                entry["hits"] += 1
+                result = {
+                    "sentimiento": entry["sentimiento"],
+                    "explicacion": entry["explicacion"],
                     "from_cache": True,
-                    "cache_hits": hits + 1
+                    "cache_hits": entry["hits"]
                 }
-        
-        conn.close()
-        return None
-    
-    def set(self, text, sentimiento, explicacion):
+                if stale:
+                    self._shared.stale_stats["served"] += 1
+                    result["stale"] = True
+                results.append(result)
+
+            # Nivel 3: casi duplicados (misma noticia con otra firma, fecha o puntuación)
+            misses = [i for i, result in enumerate(results) if result is None]
+            if self.near_duplicate and misses:
+                near_stats = tier_stats["near_duplicate"]
+                matches = self._near_duplicate_lookup_locked([texts[i] for i in misses], cutoff)
+                for i, match in zip(misses, matches):
+                    if match is None:
+                        near_stats["misses"] += 1
+                        continue
+                    content_hash, (sentimiento, explicacion, hits, _, current), score = match
+                    near_stats["hits"] += 1
+                    near_stats["score_sum"] += score
+                    self._shared.pending_hits[content_hash] += 1
+                    results[i] = {
+                        "sentimiento": sentimiento,
+                        "explicacion": explicacion,
+                        "from_cache": True,
+                        "cache_hits": hits + self._shared.pending_hits[content_hash],
+                        "near_duplicate": True,
+                        "similarity": round(score, 3),
+                        "matched_hash": content_hash
+                    }
+                    if not current:
+                        self._shared.stale_stats["served"] += 1
+                        results[i]["stale"] = True
+                    logger.debug(f"♻️ Casi duplicado de {content_hash} (similitud {score:.2f})")
+
+            self._maybe_flush_hits_locked()
+
+        return results
+
+    def set(self, text, sentimiento, explicacion, model_family=None):
         """Guarda resultado en caché"""
-        content_hash = self._generate_hash(text)
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        self.set_many([(text, sentimiento, explicacion, model_family)])
+
+    def set_many(self, rows):
+        """
+        Guarda varios resultados en una sola transacción
+
+        Args:
+            rows: Iterable de tuplas (texto, sentimiento, explicacion[, model_family]).
+                  Sin model_family se usa el de la instancia; la versión de prompt siempre es la vigente
+        """
+        now = datetime.now()
         # Extraer titular (primeras 200 caracteres)
-        titular = text[:200]
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO sentiment_cache 
-            (content_hash, titular, sentimiento, explicacion, timestamp, hits)
-            VALUES (?, ?, ?, ?, ?, 1)
-        ''', (content_hash, titular, sentimiento, explicacion, datetime.now().isoformat()))
-        
-        conn.commit()
-        conn.close()
-    
+        params = [
+            (self._generate_hash(row[0]), row[0][:200], row[1], row[2], now.isoformat(),
+             self.hasher.signature(row[0]), (row[3] if len(row) > 3 else None) or self.model_family)
+            for row in rows
+        ]
+        if not params:
+            return
+
+        with self._shared.lock:
+            conn = self._shared.conn
+            if self._shared.row_count is not None:
+                unique = list(dict.fromkeys(row[0] for row in params))
+                self._shared.row_count += len(unique) - len(self._existing_hashes_locked(unique))
+            for content_hash, _, sentimiento, explicacion, _, _, model_family in params:
+                # La entrada se reemplaza: sus hits pendientes ya no aplican
+                self._shared.pending_hits.pop(content_hash, None)
+                # Write-through: memoria y SQLite quedan consistentes
+                self._shared.memory.put(content_hash, {
+                    "sentimiento": sentimiento,
+                    "explicacion": explicacion,
+                    "timestamp": now,
+                    "hits": 1,
+                    "prompt_version": self.prompt_version,
+                    "model_family": model_family,
+                })
+            conn.executemany('''
+                INSERT OR REPLACE INTO sentiment_cache
+                (content_hash, titular, sentimiento, explicacion, timestamp, hits, minhash, last_access,
+                 prompt_version, model_family)
+                VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?, ?)
+            ''', [row[:5] + (self.hasher.to_bytes(row[5]), row[4], self.prompt_version, row[6]) for row in params])
+            conn.executemany(
+                'INSERT OR IGNORE INTO sentiment_lsh (bucket, content_hash) VALUES (?, ?)',
+                [(key, row[0]) for row in params for key in self.hasher.band_keys(row[5])]
+            )
+            conn.commit()
+
+            self._maybe_compact_locked()
+
     def get_stats(self):
         """Obtiene estadísticas del caché"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT COUNT(*), SUM(hits) FROM sentiment_cache')
-        total_entries, total_hits = cursor.fetchone()
-        
-        cursor.execute('''
-            SELECT sentimiento, COUNT(*) 
-            FROM sentiment_cache 
-            GROUP BY sentimiento
-        ''')
-        distribution = dict(cursor.fetchall())
-        
-        conn.close()
-        
+        with self._shared.lock:
+            self._flush_hits_locked()
+            conn = self._shared.conn
+
+            total_entries, total_hits = conn.execute(
+                'SELECT COUNT(*), SUM(hits) FROM sentiment_cache'
+            ).fetchone()
+
+            distribution = dict(conn.execute('''
+                SELECT sentimiento, COUNT(*)
+                FROM sentiment_cache
+                GROUP BY sentimiento
+            ''').fetchall())
+
+            tiers = {name: dict(counts) for name, counts in self._shared.tier_stats.items()}
+            tiers["memory"]["entries"] = len(self._shared.memory)
+            eviction = dict(self._shared.eviction_stats)
+            eviction["db_bytes"] = self._db_bytes_locked()
+            stale = dict(self._shared.stale_stats)
+
+        for counts in tiers.values():
+            lookups = counts["hits"] + counts["misses"]
+            counts["hit_rate"] = f"{(counts['hits'] / lookups * 100):.1f}%" if lookups else "0%"
+        near_stats = tiers["near_duplicate"]
+        near_stats["avg_similarity"] = round(near_stats.pop("score_sum") / near_stats["hits"], 3) if near_stats["hits"] else 0.0
+
         return {
             "total_entries": total_entries or 0,
             "total_hits": total_hits or 0,
             "distribution": distribution,
-            "cache_hit_rate": f"{((total_hits - total_entries) / total_hits * 100):.1f}%" if total_hits else "0%"
+            "cache_hit_rate": f"{((total_hits - total_entries) / total_hits * 100):.1f}%" if total_hits else "0%",
+            "tiers": tiers,
+            "eviction": eviction,
+            "stale": stale
         }
-    
+
+    def _db_bytes_locked(self):
+        """Bytes ocupados por páginas en uso (sin contar páginas libres)"""
+        conn = self._shared.conn
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return (page_count - freelist) * page_size
+
+    def _delete_hashes_locked(self, hashes):
+        """Elimina entradas de la tabla, el índice LSH y el LRU. Requiere tener el lock."""
+        conn = self._shared.conn
+        deleted = 0
+        for start in range(0, len(hashes), _SQL_BATCH_SIZE):
+            chunk = hashes[start:start + _SQL_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            deleted += conn.execute(f'DELETE FROM sentiment_cache WHERE content_hash IN ({placeholders})', chunk).rowcount
+            conn.execute(f'DELETE FROM sentiment_lsh WHERE content_hash IN ({placeholders})', chunk)
+        self._shared.memory.discard(hashes)
+        for content_hash in hashes:
+            self._shared.pending_hits.pop(content_hash, None)
+        if self._shared.row_count is not None:
+            self._shared.row_count -= deleted
+
+    def _evict_locked(self):
+        """Desaloja por puntuación LRU/LFU hasta respetar max_entries y max_bytes. Requiere tener el lock."""
+        conn = self._shared.conn
+        # La compactación es periódica: se recuenta aquí para corregir escrituras de otros procesos
+        total = self._shared.row_count = conn.execute('SELECT COUNT(*) FROM sentiment_cache').fetchone()[0]
+
+        to_evict = 0
+        if self.max_entries is not None and total > self.max_entries:
+            to_evict = total - int(self.max_entries * _EVICTION_TARGET)
+        if self.max_bytes is not None and total:
+            used = self._db_bytes_locked()
+            if used > self.max_bytes:
+                # Estimación por tamaño medio de fila (incluye índices y LSH)
+                to_evict = max(to_evict, int(total * (1 - self.max_bytes * _EVICTION_TARGET / used)) + 1)
+        if to_evict <= 0:
+            return 0
+
+        victims = [row[0] for row in conn.execute(
+            f'SELECT content_hash FROM sentiment_cache ORDER BY {_EVICTION_ORDER[self.eviction_policy]} LIMIT ?',
+            (min(to_evict, total),)
+        )]
+        self._delete_hashes_locked(victims)
+        return len(victims)
+
+    def compact(self):
+        """
+        Expira entradas antiguas, desaloja por LRU/LFU si se superan los límites
+        y devuelve el espacio al sistema con VACUUM incremental
+
+        Returns:
+            dict con entradas expiradas y desalojadas en esta pasada
+        """
+        with self._shared.lock:
+            return self._compact_locked()
+
+    def _compact_locked(self):
+        shared = self._shared
+        self._flush_hits_locked()
+
+        expired = self._expire_locked(self.max_age_days) if self.max_age_days is not None else 0
+        evicted = self._evict_locked()
+        shared.conn.commit()
+
+        # Devolver páginas libres y truncar el WAL para que el archivo no crezca
+        shared.conn.execute('PRAGMA incremental_vacuum')
+        shared.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+        shared.last_compaction = time.monotonic()
+        stats = shared.eviction_stats
+        stats["expired"] += expired
+        stats["evicted"] += evicted
+        stats["compactions"] += 1
+        stats["last_compaction"] = datetime.now().isoformat()
+        if expired or evicted:
+            logger.info(f"🧹 Caché compactado: {expired} expiradas, {evicted} desalojadas ({self.eviction_policy})")
+        return {"expired": expired, "evicted": evicted}
+
+    def _maybe_compact_locked(self):
+        shared = self._shared
+        over_limit = self.max_entries is not None and self._row_count_locked() > self.max_entries
+        if (over_limit or shared.last_compaction is None
+                or time.monotonic() - shared.last_compaction >= self.compaction_interval):
+            self._compact_locked()
+
+    def _expire_locked(self, max_age_days):
+        cutoff = datetime.now() - timedelta(days=max_age_days)
+        conn = self._shared.conn
+        self._shared.memory.discard_older_than(cutoff)
+        deleted = conn.execute('DELETE FROM sentiment_cache WHERE timestamp < ?', (cutoff.isoformat(),)).rowcount
+        if deleted:
+            if self._shared.row_count is not None:
+                self._shared.row_count -= deleted
+            conn.execute(
+                'DELETE FROM sentiment_lsh WHERE content_hash NOT IN (SELECT content_hash FROM sentiment_cache)'
+            )
+        return deleted
+
     def clear_old_entries(self, max_age_days=90):
         """Limpia entradas antiguas para liberar espacio"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cutoff_date = (datetime.now() - timedelta(days=max_age_days)).isoformat()
-        cursor.execute('DELETE FROM sentiment_cache WHERE timestamp < ?', (cutoff_date,))
-        
-        deleted = cursor.rowcount
-        conn.commit()
-        conn.close()
-        
+        with self._shared.lock:
+            self._flush_hits_locked()
+            deleted = self._expire_locked(max_age_days)
+            self._shared.conn.commit()
+            self._shared.conn.execute('PRAGMA incremental_vacuum')
+
         return deleted
 
+
+class ResponseCache:
+    def __init__(self, db_path="cache/sentiment_cache.db", ttl_seconds=24 * 3600, max_entries=2000,
+                 fuzzy=True, similarity_threshold=0.8, clock=datetime.now):
+        """
+        Caché de respuestas del chatbot, en el mismo SQLite que sentiment_cache
+
+        La clave es la pregunta normalizada (raíces en español sin stopwords) junto con
+        las noticias recuperadas y la huella de la base de conocimiento: la misma
+        pregunta sobre otros datos no reutiliza la respuesta.
+
+        Args:
+            db_path: Ruta del archivo SQLite (compartido con CacheManager)
+            ttl_seconds: Vigencia de una respuesta
+            max_entries: Máximo de respuestas guardadas (desalojo LRU)
+            fuzzy: Si True, acepta preguntas parecidas con el mismo contexto
+            similarity_threshold: Jaccard mínimo entre las raíces de ambas preguntas
+            clock: Fuente de la hora actual (inyectable en tests)
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.fuzzy = fuzzy
+        self.similarity_threshold = similarity_threshold
+        self.clock = clock
+        os.makedirs(os.path.dirname(db_path) if os.path.dirname(db_path) else "cache", exist_ok=True)
+        self._shared = _get_shared_connection(db_path, 5000, 3600)
+        self._init_database()
+
+    def _init_database(self):
+        with self._shared.lock:
+            conn = self._shared.conn
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS chat_response_cache (
+                    response_key TEXT PRIMARY KEY,
+                    context_key TEXT,
+                    question TEXT,
+                    response TEXT,
+                    timestamp DATETIME,
+                    last_access DATETIME,
+                    hits INTEGER DEFAULT 0
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_chat_context ON chat_response_cache(context_key)
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_chat_last_access ON chat_response_cache(last_access)
+            ''')
+            conn.commit()
+
+    @staticmethod
+    def normalize_question(question):
+        """
+        Raíces ordenadas sin stopwords: '¿Qué oportunidades hay?' == 'que oportunidades hay'.
+        Las negaciones se conservan: '¿qué cultivos no crecen?' es otra pregunta
+        """
+        return ' '.join(sorted(set(tokenize(question, keep_negations=True))))
+
+    @staticmethod
+    def _context_key(doc_ids, kb_fingerprint):
+        payload = json.dumps([kb_fingerprint, sorted(str(i) for i in doc_ids)])
+        return hashlib.md5(payload.encode()).hexdigest()
+
+    def _cutoff(self):
+        return (self.clock() - timedelta(seconds=self.ttl_seconds)).isoformat()
+
+    def get(self, question, doc_ids, kb_fingerprint):
+        """
+        Busca una respuesta para la pregunta con el mismo contexto recuperado
+
+        Returns:
+            dict con response, fuzzy y similarity, o None si no hay respuesta vigente
+        """
+        question_norm = self.normalize_question(question)
+        context_key = self._context_key(doc_ids, kb_fingerprint)
+        response_key = hashlib.md5(f"{context_key}:{question_norm}".encode()).hexdigest()
+
+        with self._shared.lock:
+            conn = self._shared.conn
+            cutoff = self._cutoff()
+            row = conn.execute(
+                'SELECT response_key, response FROM chat_response_cache WHERE response_key = ? AND timestamp >= ?',
+                (response_key, cutoff)
+            ).fetchone()
+            similarity = 1.0
+
+            if row is None and self.fuzzy and question_norm:
+                # Pocas respuestas por contexto: se comparan todas las vigentes
+                tokens = set(question_norm.split())
+                negations = tokens & NEGATION_WORDS
+                best = None
+                for key, candidate, response in conn.execute(
+                    'SELECT response_key, question, response FROM chat_response_cache '
+                    'WHERE context_key = ? AND timestamp >= ?',
+                    (context_key, cutoff)
+                ):
+                    candidate_tokens = set(candidate.split())
+                    if candidate_tokens & NEGATION_WORDS != negations:
+                        continue  # Misma pregunta con el sentido invertido
+                    score = len(tokens & candidate_tokens) / len(tokens | candidate_tokens) if candidate_tokens else 0.0
+                    if score >= self.similarity_threshold and (best is None or score > best[0]):
+                        best = (score, key, response)
+                if best is not None:
+                    similarity, row = best[0], (best[1], best[2])
+
+            if row is None:
+                return None
+            conn.execute(
+                'UPDATE chat_response_cache SET hits = hits + 1, last_access = ? WHERE response_key = ?',
+                (self.clock().isoformat(), row[0])
+            )
+            conn.commit()
+
+        return {
+            'response': row[1],
+            'fuzzy': row[0] != response_key,
+            'similarity': similarity,
+        }
+
+    def set(self, question, doc_ids, kb_fingerprint, response):
+        """Guarda la respuesta y desaloja las expiradas o menos usadas si se supera max_entries"""
+        question_norm = self.normalize_question(question)
+        context_key = self._context_key(doc_ids, kb_fingerprint)
+        response_key = hashlib.md5(f"{context_key}:{question_norm}".encode()).hexdigest()
+        now = self.clock().isoformat()
+
+        with self._shared.lock:
+            conn = self._shared.conn
+            conn.execute('''
+                INSERT OR REPLACE INTO chat_response_cache
+                (response_key, context_key, question, response, timestamp, last_access, hits)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+            ''', (response_key, context_key, question_norm, response, now, now))
+
+            total = conn.execute('SELECT COUNT(*) FROM chat_response_cache').fetchone()[0]
+            if self.max_entries is not None and total > self.max_entries:
+                conn.execute('DELETE FROM chat_response_cache WHERE timestamp < ?', (self._cutoff(),))
+                total = conn.execute('SELECT COUNT(*) FROM chat_response_cache').fetchone()[0]
+                to_evict = total - int(self.max_entries * _EVICTION_TARGET)
+                if to_evict > 0:
+                    conn.execute('''
+                        DELETE FROM chat_response_cache WHERE response_key IN (
+                            SELECT response_key FROM chat_response_cache ORDER BY last_access ASC LIMIT ?
+                        )
+                    ''', (to_evict,))
+            conn.commit()
+
+    def get_stats(self):
+        """Respuestas guardadas y veces que se reutilizaron"""
+        with self._shared.lock:
+            total_entries, total_hits = self._shared.conn.execute(
+                'SELECT COUNT(*), SUM(hits) FROM chat_response_cache'
+            ).fetchone()
+        return {"total_entries": total_entries or 0, "total_hits": total_hits or 0}
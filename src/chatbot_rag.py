@@ -4,13 +4,34 @@ Permite interactuar con las noticias analizadas de forma conversacional
 """
 import google.generativeai as genai
 import streamlit as st
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
 import logging
+import threading
+from collections import OrderedDict
+from src.model_router import get_model_router
+from src.cache_manager import ResponseCache
+from src.context_builder import ContextBuilder, truncate_to_tokens
+from src.news_index import get_news_index
+from src.vector_store import load_local_embedder
 
 logger = logging.getLogger(__name__)
 
+# Más creativo para chat
+CHAT_GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "max_output_tokens": 500,
+}
+
+# Resumen de turnos antiguos: corto y estable
+SUMMARY_GENERATION_CONFIG = {
+    "temperature": 0.2,
+    "max_output_tokens": 150,
+}
+
+# Resúmenes ya calculados (resumen previo + turno -> resumen), compartidos entre reruns
+_summary_cache = OrderedDict()
+_summary_lock = threading.Lock()
+_SUMMARY_CACHE_SIZE = 256
+
 class AgriNewsBot:
     def __init__(self, api_key):
         """
@@ -22,44 +43,61 @@ class AgriNewsBot:
         self.api_key = api_key
         genai.configure(api_key=api_key)
         
-        # Usar modelo económico para chat
-        self.chat_model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        # Enrutador compartido con el analizador: elige el modelo sano más rápido
+        # y respeta la cuota común del proceso
+        self.router = get_model_router()
+        self.max_rate_wait = 30  # Segundos máximos esperando cupo
         
-        # Historial de conversación
+        # Historial de conversación: turnos recientes literales + resumen de los anteriores
         self.conversation_history = []
+        self.conversation_summary = {'text': ''}
+        self.recent_turns = 3
+        self._fold_lock = threading.Lock()
+        self._summary_thread = None  # Resumen del modelo en curso (fuera de la respuesta)
+        
+        # Presupuesto de tokens del prompt: se recuperan más candidatas de las que caben
+        self.context_builder = ContextBuilder()
+        self.retrieve_k = 6
+        
+        # Respuestas ya generadas para la misma pregunta y las mismas noticias
+        self.response_cache = ResponseCache()
         
         # Base de conocimiento (noticias cargadas)
         self.knowledge_base = []
-        self.vectorizer = None
-        self.tfidf_matrix = None
+        self.index = get_news_index()  # Índice persistente compartido por todas las sesiones
+        self.index_view = None
+        self._configure_embeddings()
+    
+    def _configure_embeddings(self):
+        """
+        Activa la búsqueda híbrida si secrets.toml define EMBEDDING_MODEL
+        (modelo local de sentence-transformers o "hashing"); si no, solo BM25
+        """
+        try:
+            model_name = st.secrets.get("EMBEDDING_MODEL")
+        except Exception:
+            model_name = None
+        if model_name and self.index.embedder is None:
+            self.index.set_embedder(load_local_embedder(model_name))
     
     def load_news_database(self, df):
         """
         Carga noticias en la base de conocimiento del bot
         
+        El índice compartido reconoce el DataFrame por su huella: en los reruns
+        sin cambios no se reconstruye nada y las filas nuevas se añaden incrementalmente.
+        
         Args:
             df: DataFrame con noticias analizadas
         """
-        self.knowledge_base = []
+        view = self.index.sync(df)
+        if view is self.index_view:
+            return
         
-        for index, row in df.iterrows():
-            news_entry = {
-                'id': index,
-                'titular': str(row.get('titular', '')),
-                'cuerpo': str(row.get('cuerpo', '')),
-                'sentimiento': row.get('sentimiento_ia', 'Neutro'),
-                'explicacion': row.get('explicacion_ia', ''),
-                'fecha': row.get('fecha', ''),
-                'text_full': f"{row.get('titular', '')} {row.get('cuerpo', '')} {row.get('explicacion_ia', '')}"
-            }
-            self.knowledge_base.append(news_entry)
+        self.index_view = view
+        self.knowledge_base = view.records()
         
-        # Crear índice TF-IDF para búsqueda semántica
         if self.knowledge_base:
-            texts = [entry['text_full'] for entry in self.knowledge_base]
-            self.vectorizer = TfidfVectorizer(max_features=500, stop_words='english')
-            self.tfidf_matrix = self.vectorizer.fit_transform(texts)
-            
             logger.info(f"✅ Base de conocimiento cargada: {len(self.knowledge_base)} noticias")
     
     def retrieve_relevant_news(self, query, top_k=3):
@@ -73,59 +111,138 @@ class AgriNewsBot:
         Returns:
             Lista de noticias relevantes
         """
-        if not self.knowledge_base or self.vectorizer is None:
+        if not self.knowledge_base or self.index_view is None:
             return []
         
-        # Vectorizar consulta
-        query_vector = self.vectorizer.transform([query])
-        
-        # Calcular similitud coseno
-        similarities = cosine_similarity(query_vector, self.tfidf_matrix).flatten()
-        
-        # Obtener índices de las más similares
-        top_indices = np.argsort(similarities)[::-1][:top_k]
-        
-        # Filtrar solo las que tienen similitud > 0
+        # BM25 con tokens en español (+ embeddings locales si están activos)
         relevant_news = []
-        for idx in top_indices:
-            if similarities[idx] > 0:
-                news = self.knowledge_base[idx].copy()
-                news['similarity'] = float(similarities[idx])
-                relevant_news.append(news)
+        for idx, similarity in self.index_view.search(query, top_k=top_k):
+            news = self.knowledge_base[idx].copy()
+            news['similarity'] = similarity
+            relevant_news.append(news)
         
         return relevant_news
     
-    def chat(self, user_message):
+    def chat(self, user_message, stream=False):
         """
         Procesa mensaje del usuario y genera respuesta contextual
         
         Args:
             user_message: Mensaje del usuario
+            stream: Si True, 'response' es un generador de fragmentos de texto que se
+                    pueden mostrar a medida que llegan; al agotarse, la respuesta
+                    completa queda en el historial
         
         Returns:
             Respuesta del bot
         """
         if not self.knowledge_base:
+            message = "⚠️ No hay noticias cargadas. Por favor, realiza primero un análisis de noticias."
             return {
-                'response': "⚠️ No hay noticias cargadas. Por favor, realiza primero un análisis de noticias.",
+                'response': iter([message]) if stream else message,
                 'relevant_news': []
             }
         
-        # Recuperar noticias relevantes
-        relevant_news = self.retrieve_relevant_news(user_message, top_k=3)
+        # Recuperar noticias relevantes y quedarse con las que caben en el presupuesto
+        candidates = self.retrieve_relevant_news(user_message, top_k=self.retrieve_k)
+        relevant_news, news_context, _ = self.context_builder.pack_news(candidates)
+        
+        # Pregunta repetida (o casi) sobre las mismas noticias: sin llamada al modelo
+        doc_ids = [news['id'] for news in relevant_news]
+        cached = self.response_cache.get(user_message, doc_ids, self.index_view.fingerprint)
+        if cached is not None:
+            self._remember(user_message, cached['response'])
+            return {
+                'response': iter([cached['response']]) if stream else cached['response'],
+                'relevant_news': relevant_news,
+                'from_cache': True
+            }
+        
+        prompt = self._build_prompt(user_message, news_context)
+        
+        if stream:
+            return {
+                'response': self._stream_response(user_message, prompt, doc_ids),
+                'relevant_news': relevant_news
+            }
+        
+        try:
+            # Generar respuesta
+            model_name, response = self.router.generate(
+                prompt,
+                generation_config=CHAT_GENERATION_CONFIG,
+                max_wait=self.max_rate_wait
+            )
+            
+            if response is None:
+                return {
+                    'response': "⏳ No hay modelos con cupo disponible en este momento. Intenta de nuevo en unos segundos.",
+                    'relevant_news': relevant_news
+                }
+            
+            bot_response = response.text
+            self.response_cache.set(user_message, doc_ids, self.index_view.fingerprint, bot_response)
+            self._remember(user_message, bot_response)
+            
+            return {
+                'response': bot_response,
+                'relevant_news': relevant_news
+            }
+            
+        except Exception as e:
+            logger.error(f"Error en chatbot: {e}")
+            return {
+                'response': f"⚠️ Error al procesar tu pregunta: {str(e)}",
+                'relevant_news': relevant_news
+            }
+    
+    def _stream_response(self, user_message, prompt, doc_ids):
+        """
+        Genera la respuesta con stream=True y entrega cada fragmento al llegar
+        
+        La llamada al modelo ocurre al consumir el generador, así la interfaz
+        muestra el mensaje desde el primer fragmento en lugar de un spinner.
+        """
+        parts = []
+        try:
+            model_name, response = self.router.generate(
+                prompt,
+                generation_config=CHAT_GENERATION_CONFIG,
+                max_wait=self.max_rate_wait,
+                stream=True
+            )
+            
+            if response is None:
+                yield "⏳ No hay modelos con cupo disponible en este momento. Intenta de nuevo en unos segundos."
+                return
+            
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Fragmento sin texto (p. ej. solo metadatos de seguridad)
+                    continue
+                if text:
+                    parts.append(text)
+                    yield text
+        
+        except Exception as e:
+            logger.error(f"Error en chatbot: {e}")
+            yield f"⚠️ Error al procesar tu pregunta: {str(e)}"
+            return
         
+        bot_response = "".join(parts)
+        if bot_response:
+            self.response_cache.set(user_message, doc_ids, self.index_view.fingerprint, bot_response)
+            self._remember(user_message, bot_response)
+    
+    def _build_prompt(self, user_message, news_context):
+        """Prompt con las noticias empaquetadas y el historial acotado"""
+        self._fold_history()
         # Construir contexto para el modelo
         context = "CONTEXTO DE NOTICIAS RELEVANTES:\n\n"
-        if relevant_news:
-            for i, news in enumerate(relevant_news, 1):
-                context += f"""
-Noticia {i}:
-- Titular: {news['titular']}
-- Sentimiento: {news['sentimiento']}
-- Análisis: {news['explicacion']}
-- Fecha: {news['fecha']}
----
-"""
+        if news_context:
+            context += news_context
         else:
             context += "No se encontraron noticias específicamente relevantes. Usa tu conocimiento general.\n"
         
@@ -151,55 +268,116 @@ INSTRUCCIONES:
 
 RESPUESTA:"""
         
+        return prompt
+    
+    def _remember(self, user_message, bot_response):
+        """
+        Guarda la interacción en el historial
+        
+        No llama al modelo: los turnos que salen de la ventana se pliegan al
+        construir el siguiente prompt (nunca si la siguiente respuesta sale del caché)
+        """
+        self.conversation_history.append({
+            'user': user_message,
+            'bot': bot_response
+        })
+    
+    def _fold_history(self):
+        """
+        Incorpora al resumen los turnos que salen de la ventana de turnos recientes
+        
+        No espera al modelo: el resumen extractivo se actualiza al momento y es el
+        que usa el prompt actual; el resumen del modelo se calcula en un hilo y lo
+        reemplaza (para el siguiente prompt) si la conversación no cambió entretanto.
+        """
+        folded = []
+        # En los mismos objetos: pueden vivir en session_state
+        with self._fold_lock:
+            previous = self.conversation_summary['text']
+            while len(self.conversation_history) > self.recent_turns:
+                turn = self.conversation_history.pop(0)
+                folded.append(turn)
+                self.conversation_summary['text'] = self.context_builder.extend_summary(
+                    self.conversation_summary['text'], turn)
+            extractive = self.conversation_summary['text']
+        
+        if folded:
+            thread = threading.Thread(target=self._summarize_folded, args=(previous, folded, extractive),
+                                      daemon=True)
+            self._summary_thread = thread
+            thread.start()
+    
+    def _summarize_folded(self, previous_summary, turns, extractive):
+        """Resume con el modelo los turnos plegados y reemplaza al resumen extractivo"""
+        summary = previous_summary
+        for turn in turns:
+            summary = self._summarize(summary, turn)
+        with self._fold_lock:
+            # Si hubo otro pliegue o un reinicio, este resultado ya no aplica
+            if self.conversation_summary['text'] == extractive:
+                self.conversation_summary['text'] = summary
+    
+    def wait_for_summary(self, timeout=None):
+        """Espera a que termine el resumen en curso, si lo hay"""
+        thread = self._summary_thread
+        if thread is not None:
+            thread.join(timeout)
+    
+    def _summarize(self, previous_summary, turn):
+        """
+        Resumen acumulado de la conversación tras añadir un turno
+        
+        Se pide al modelo una versión breve; si no hay cupo o falla se usa un
+        resumen extractivo. El resultado se guarda para no volver a pagarlo.
+        """
+        key = (previous_summary, turn['user'], turn['bot'])
+        with _summary_lock:
+            if key in _summary_cache:
+                _summary_cache.move_to_end(key)
+                return _summary_cache[key]
+        
+        budget = self.context_builder.max_summary_tokens
+        prompt = f"""Actualiza el resumen de una conversación entre un analista y un asistente de noticias agroindustriales.
+Conserva temas, lugares, cifras y conclusiones; máximo 80 palabras, sin saludos.
+
+RESUMEN PREVIO:
+{previous_summary or "(vacío)"}
+
+NUEVA INTERACCIÓN:
+Usuario: {truncate_to_tokens(turn['user'], budget)}
+Asistente: {truncate_to_tokens(turn['bot'], budget)}
+
+RESUMEN ACTUALIZADO:"""
+        summary = None
         try:
-            # Generar respuesta
-            response = self.chat_model.generate_content(
+            model_name, response = self.router.generate(
                 prompt,
-                generation_config={
-                    "temperature": 0.7,  # Más creativo para chat
-                    "max_output_tokens": 500,
-                }
+                generation_config=SUMMARY_GENERATION_CONFIG,
+                max_wait=5
             )
-            
-            bot_response = response.text
-            
-            # Guardar en historial
-            self.conversation_history.append({
-                'user': user_message,
-                'bot': bot_response
-            })
-            
-            # Limitar historial a últimas 10 interacciones
-            if len(self.conversation_history) > 10:
-                self.conversation_history = self.conversation_history[-10:]
-            
-            return {
-                'response': bot_response,
-                'relevant_news': relevant_news
-            }
-            
+            if response is not None:
+                summary = truncate_to_tokens(response.text.strip(), budget)
         except Exception as e:
-            logger.error(f"Error en chatbot: {e}")
-            return {
-                'response': f"⚠️ Error al procesar tu pregunta: {str(e)}",
-                'relevant_news': relevant_news
-            }
+            logger.warning(f"⚠️ Resumen de conversación no disponible: {e}")
+        if not summary:
+            summary = self.context_builder.extend_summary(previous_summary, turn)
+        
+        with _summary_lock:
+            _summary_cache[key] = summary
+            while len(_summary_cache) > _SUMMARY_CACHE_SIZE:
+                _summary_cache.popitem(last=False)
+        return summary
     
     def _format_history(self):
-        """Formatea historial de conversación"""
-        if not self.conversation_history:
-            return "(Inicio de conversación)"
-        
-        history_text = ""
-        for interaction in self.conversation_history[-3:]:  # Últimas 3 interacciones
-            history_text += f"Usuario: {interaction['user']}\n"
-            history_text += f"Bot: {interaction['bot']}\n\n"
-        
-        return history_text
+        """Formatea historial de conversación (resumen + turnos recientes)"""
+        return self.context_builder.format_history(
+            self.conversation_summary['text'], self.conversation_history
+        )
     
     def reset_conversation(self):
         """Reinicia la conversación"""
-        self.conversation_history = []
+        self.conversation_history.clear()
+        self.conversation_summary['text'] = ''
         logger.info("Conversación reiniciada")
     
     def get_quick_stats(self):
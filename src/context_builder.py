@@ -0,0 +1,123 @@
+"""
+Construcción del contexto del chatbot con presupuesto de tokens
+Empaqueta las noticias más relevantes sin duplicados y resume los turnos
+antiguos de la conversación para que cada prompt tenga un tamaño acotado
+"""
+from src.rate_limiter import estimate_tokens
+from src.text_es import tokenize
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Recorta el texto a max_tokens (estimados) sin partir palabras"""
+    text = text or ""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(' ', 1)[0]
+    return cut.rstrip(' ,;:') + "…"
+
+
+def condense_turn(turn, max_tokens=60):
+    """Resumen extractivo de un turno: la pregunta y la primera frase de la respuesta"""
+    first_sentence = (turn['bot'] or "").strip().split('\n')[0].split('. ')[0]
+    return truncate_to_tokens(f"{turn['user']} → {first_sentence}", max_tokens)
+
+
+class ContextBuilder:
+    def __init__(self, max_news_tokens=900, max_snippet_tokens=250, max_summary_tokens=250,
+                 max_turn_tokens=300, dedup_threshold=0.6, min_snippet_tokens=40):
+        """
+        Inicializa el constructor de contexto
+
+        Args:
+            max_news_tokens: Presupuesto total para las noticias del contexto
+            max_snippet_tokens: Máximo por noticia (el análisis largo se recorta)
+            max_summary_tokens: Máximo del resumen de turnos antiguos
+            max_turn_tokens: Máximo por turno reciente enviado literal
+            dedup_threshold: Jaccard de raíces a partir del cual dos noticias se consideran la misma
+            min_snippet_tokens: No se incluyen noticias recortadas por debajo de este tamaño
+        """
+        self.max_news_tokens = max_news_tokens
+        self.max_snippet_tokens = max_snippet_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.max_turn_tokens = max_turn_tokens
+        self.dedup_threshold = dedup_threshold
+        self.min_snippet_tokens = min_snippet_tokens
+
+    @staticmethod
+    def _format_snippet(i, news, explicacion):
+        return f"""
+Noticia {i}:
+- Titular: {news['titular']}
+- Sentimiento: {news['sentimiento']}
+- Análisis: {explicacion}
+- Fecha: {news['fecha']}
+---
+"""
+
+    def _is_duplicate(self, tokens, kept_tokens):
+        for other in kept_tokens:
+            union = tokens | other
+            if union and len(tokens & other) / len(union) >= self.dedup_threshold:
+                return True
+        return False
+
+    def pack_news(self, relevant_news):
+        """
+        Selecciona noticias en orden de relevancia hasta agotar el presupuesto
+
+        Omite las que repiten a una ya incluida (misma nota en varios medios) y
+        recorta el análisis de cada una a max_snippet_tokens.
+
+        Args:
+            relevant_news: Noticias ordenadas de mayor a menor relevancia
+
+        Returns:
+            Tupla (noticias incluidas, texto del contexto, tokens estimados)
+        """
+        packed, blocks, kept_tokens = [], [], []
+        used = 0
+        for news in relevant_news:
+            tokens = set(tokenize(f"{news['titular']} {news['explicacion']}"))
+            if self._is_duplicate(tokens, kept_tokens):
+                continue
+
+            overhead = estimate_tokens(self._format_snippet(len(packed) + 1, news, ""))
+            room = min(self.max_snippet_tokens, self.max_news_tokens - used) - overhead
+            if room < self.min_snippet_tokens:
+                break
+            block = self._format_snippet(len(packed) + 1, news, truncate_to_tokens(news['explicacion'], room))
+
+            packed.append(news)
+            blocks.append(block)
+            kept_tokens.append(tokens)
+            used += estimate_tokens(block)
+
+        return packed, "".join(blocks), used
+
+    def format_history(self, summary, recent_turns):
+        """
+        Historial para el prompt: resumen de los turnos antiguos y los recientes literales
+
+        Args:
+            summary: Resumen acumulado de los turnos que ya salieron de la ventana
+            recent_turns: Últimas interacciones ({'user', 'bot'})
+        """
+        if not summary and not recent_turns:
+            return "(Inicio de conversación)"
+
+        history_text = ""
+        if summary:
+            history_text += f"Resumen de la conversación anterior:\n{truncate_to_tokens(summary, self.max_summary_tokens)}\n\n"
+        for interaction in recent_turns:
+            history_text += f"Usuario: {truncate_to_tokens(interaction['user'], self.max_turn_tokens)}\n"
+            history_text += f"Bot: {truncate_to_tokens(interaction['bot'], self.max_turn_tokens)}\n\n"
+        return history_text
+
+    def extend_summary(self, summary, turn):
+        """Resumen extractivo acumulado; descarta las líneas más antiguas si excede el presupuesto"""
+        lines = [line for line in (summary or "").split('\n') if line]
+        lines.append(f"- {condense_turn(turn)}")
+        while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > self.max_summary_tokens:
+            lines.pop(0)
+        return '\n'.join(lines)
@@ -14,6 +14,7 @@ import io
 from datetime import datetime
 import xlsxwriter
 import logging
+from src.keyword_engine import top_keywords
 
 logger = logging.getLogger(__name__)
 
@@ -239,17 +240,7 @@ class ReportExporter:
         
         # Hoja 3: Palabras clave (Top 10)
         try:
-            from collections import Counter
-            import re
-            
-            all_words = []
-            stopwords = set(['el', 'la', 'de', 'que', 'y', 'a', 'en', 'un', 'ser', 'se', 'no'])
-            
-            for text in df['titular'].fillna(''):
-                words = re.findall(r'\b[a-záéíóúñ]{4,}\b', text.lower())
-                all_words.extend([w for w in words if w not in stopwords])
-            
-            keywords_df = pd.DataFrame(Counter(all_words).most_common(15), columns=['Palabra', 'Frecuencia'])
+            keywords_df = pd.DataFrame(top_keywords(df['titular'], top_n=15), columns=['Palabra', 'Frecuencia'])
             keywords_df.to_excel(writer, sheet_name='Palabras Clave', index=False)
             
             worksheet_keywords = writer.sheets['Palabras Clave']
@@ -0,0 +1,296 @@
+"""
+Nomenclátor de lugares de Colombia (municipios, corregimientos, veredas)
+Índice SQLite por nombre normalizado y alias, más un caché persistente de
+geocodificaciones remotas para que los mapas no dependan de la red
+"""
+import csv
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from src.term_matcher import normalize_text
+
+# Fuente del nomenclátor incluida con el paquete (CSV: nombre, tipo, departamento, municipio, lat, lon, alias)
+GAZETTEER_CSV = os.path.join(os.path.dirname(__file__), 'data', 'gazetteer_co.csv')
+
+DEFAULT_DEPARTMENT = "Valle del Cauca"
+
+# Prioridad ante nombres repetidos (después del departamento preferido)
+KIND_PRIORITY = {'municipio': 0, 'corregimiento': 1, 'vereda': 2, 'departamento': 3, 'pais': 4}
+
+# Días antes de reintentar en la red un lugar que no se encontró
+MISS_TTL_DAYS = 30
+
+# Límite de parámetros por consulta IN (...) compatible con SQLite antiguo (999)
+_SQL_BATCH_SIZE = 500
+
+
+def place_key(name):
+    """Clave de búsqueda: minúsculas, sin tildes ni puntuación, espacios simples"""
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', normalize_text(name)).split())
+
+
+def _file_checksum(path):
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+class Gazetteer:
+    """
+    Lugares con coordenadas indexados por nombre y alias
+
+    El índice se construye desde el CSV y se reconstruye solo si el CSV
+    cambia; los lugares agregados con add_places y el caché de
+    geocodificaciones remotas se conservan siempre.
+    """
+
+    def __init__(self, db_path=None, csv_path=GAZETTEER_CSV, department=DEFAULT_DEPARTMENT):
+        """
+        Args:
+            db_path: Ruta del archivo SQLite (None = en memoria)
+            csv_path: CSV con los lugares a indexar
+            department: Departamento preferido cuando un nombre se repite
+        """
+        self.db_path = db_path
+        self.csv_path = csv_path
+        self.department = department
+        self._lock = threading.RLock()
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+        else:
+            self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self._init_database()
+        self._load_csv_if_changed()
+
+    def _init_database(self):
+        with self._lock:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS places (
+                    id INTEGER PRIMARY KEY,
+                    nombre TEXT NOT NULL,
+                    tipo TEXT NOT NULL,
+                    departamento TEXT NOT NULL,
+                    municipio TEXT NOT NULL,
+                    lat REAL NOT NULL,
+                    lon REAL NOT NULL,
+                    origen TEXT NOT NULL DEFAULT 'csv'
+                );
+                CREATE TABLE IF NOT EXISTS place_names (
+                    clave TEXT NOT NULL,
+                    place_id INTEGER NOT NULL,
+                    PRIMARY KEY (clave, place_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS geocode_cache (
+                    consulta TEXT PRIMARY KEY,
+                    lat REAL,
+                    lon REAL,
+                    actualizado TEXT NOT NULL
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS gazetteer_meta (
+                    clave TEXT PRIMARY KEY,
+                    valor TEXT NOT NULL
+                ) WITHOUT ROWID;
+            ''')
+            # Bases anteriores no distinguían el origen: sus lugares se tratan como del CSV
+            columns = {row[1] for row in self.conn.execute('PRAGMA table_info(places)')}
+            if 'origen' not in columns:
+                self.conn.execute("ALTER TABLE places ADD COLUMN origen TEXT NOT NULL DEFAULT 'csv'")
+            self.conn.commit()
+
+    def _load_csv_if_changed(self):
+        """Reconstruye el índice de lugares si el CSV no es el ya indexado"""
+        checksum = _file_checksum(self.csv_path)
+        with self._lock:
+            row = self.conn.execute("SELECT valor FROM gazetteer_meta WHERE clave = 'csv_checksum'").fetchone()
+            if row and row[0] == checksum:
+                return
+            # Solo se reemplazan los lugares del CSV; los agregados con add_places se conservan
+            self.conn.execute("DELETE FROM place_names WHERE place_id IN (SELECT id FROM places WHERE origen = 'csv')")
+            self.conn.execute("DELETE FROM places WHERE origen = 'csv'")
+            self._insert_rows_locked(self._read_csv(self.csv_path))
+            self.conn.execute("INSERT OR REPLACE INTO gazetteer_meta (clave, valor) VALUES ('csv_checksum', ?)",
+                              (checksum,))
+            self.conn.commit()
+
+    @staticmethod
+    def _read_csv(path):
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            return list(csv.DictReader(f))
+
+    def _insert_rows_locked(self, rows, origin='csv'):
+        for row in rows:
+            cursor = self.conn.execute(
+                'INSERT INTO places (nombre, tipo, departamento, municipio, lat, lon, origen) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (row['nombre'], row['tipo'], row.get('departamento') or '', row.get('municipio') or '',
+                 float(row['lat']), float(row['lon']), origin)
+            )
+            names = [row['nombre']] + [a for a in (row.get('alias') or '').split('|') if a.strip()]
+            keys = {place_key(name) for name in names} - {''}
+            self.conn.executemany('INSERT OR IGNORE INTO place_names (clave, place_id) VALUES (?, ?)',
+                                  ((key, cursor.lastrowid) for key in keys))
+
+    def add_places(self, rows):
+        """
+        Agrega lugares al índice (p. ej. veredas de un listado externo)
+
+        Se guardan aparte de los del CSV: sobreviven a la reconstrucción del índice.
+
+        Args:
+            rows: Iterable de dicts con nombre, tipo, departamento, municipio, lat, lon y alias opcional
+        """
+        with self._lock:
+            self._insert_rows_locked(rows, origin='extra')
+            self.conn.commit()
+
+    def place_terms(self, department=None):
+        """
+        Vocabulario para buscar los lugares de un departamento en texto
+
+        Args:
+            department: Departamento (None = el preferido del nomenclátor)
+
+        Returns:
+            dict nombre -> claves de búsqueda (nombre y alias normalizados). Municipios
+            primero y el departamento al final, así el lugar más concreto es el principal
+        """
+        department = department or self.department
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT p.nombre, p.tipo, n.clave FROM places p JOIN place_names n ON n.place_id = p.id '
+                'WHERE p.departamento = ? ORDER BY p.id, n.clave', (department,)
+            ).fetchall()
+
+        rows.sort(key=lambda r: KIND_PRIORITY.get(r[1], len(KIND_PRIORITY)))  # estable: conserva el orden del CSV
+        terms = {}
+        for nombre, _, key in rows:
+            aliases = terms.setdefault(nombre, [])
+            if key not in aliases:
+                aliases.append(key)
+        return terms
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM places').fetchone()[0]
+
+    def _rank(self, tipo, departamento, department):
+        return (departamento != department, KIND_PRIORITY.get(tipo, len(KIND_PRIORITY)))
+
+    def lookup_many(self, names, department=None):
+        """
+        Coordenadas de varios nombres en una consulta por lote
+
+        Un nombre puede traer el departamento tras una coma ("La Unión, Nariño").
+
+        Args:
+            names: Iterable de nombres de lugar
+            department: Departamento preferido (None = el del nomenclátor)
+
+        Returns:
+            dict nombre -> (lat, lon) solo con los nombres encontrados
+        """
+        department = department or self.department
+        wanted = {}
+        for name in dict.fromkeys(n for n in names if n):
+            place, _, hint = str(name).partition(',')
+            wanted[name] = (place_key(place), place_key(hint) if hint else None)
+
+        keys = list({key for key, _ in wanted.values() if key})
+        candidates = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH_SIZE):
+                batch = keys[start:start + _SQL_BATCH_SIZE]
+                placeholders = ','.join('?' * len(batch))
+                rows = self.conn.execute(
+                    'SELECT n.clave, p.tipo, p.departamento, p.lat, p.lon FROM place_names n '
+                    f'JOIN places p ON p.id = n.place_id WHERE n.clave IN ({placeholders})', batch
+                ).fetchall()
+                for key, tipo, departamento, lat, lon in rows:
+                    candidates.setdefault(key, []).append((tipo, departamento, lat, lon))
+
+        result = {}
+        for name, (key, hint) in wanted.items():
+            options = candidates.get(key)
+            if not options:
+                continue
+            preferred = department
+            if hint:
+                # La pista puede ser un departamento o simplemente "Colombia"
+                matching = [o for o in options if place_key(o[1]) == hint]
+                if matching:
+                    options, preferred = matching, matching[0][1]
+            tipo, departamento, lat, lon = min(options, key=lambda o: self._rank(o[0], o[1], preferred))
+            result[name] = (lat, lon)
+        return result
+
+    def lookup(self, name, department=None):
+        """Coordenadas (lat, lon) de un lugar del nomenclátor, o None"""
+        return self.lookup_many([name], department).get(name)
+
+    def cached_geocode(self, query):
+        """
+        Resultado guardado de una geocodificación remota
+
+        Returns:
+            (True, (lat, lon)) si se encontró, (True, None) si se sabe que no existe
+            (negativo aún vigente) o (False, None) si nunca se consultó
+        """
+        cached = self.cached_geocodes([query])
+        return query in cached, cached.get(query)
+
+    def cached_geocodes(self, queries):
+        """Resultados guardados de varias consultas: dict consulta -> (lat, lon) o None (negativos vigentes)"""
+        wanted = {place_key(q): q for q in queries if q}
+        keys = list(wanted)
+        limit = (datetime.now() - timedelta(days=MISS_TTL_DAYS)).isoformat()
+        result = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH_SIZE):
+                batch = keys[start:start + _SQL_BATCH_SIZE]
+                placeholders = ','.join('?' * len(batch))
+                rows = self.conn.execute(
+                    f'SELECT consulta, lat, lon, actualizado FROM geocode_cache WHERE consulta IN ({placeholders})',
+                    batch
+                ).fetchall()
+                for key, lat, lon, updated in rows:
+                    if lat is not None:
+                        result[wanted[key]] = (lat, lon)
+                    elif updated >= limit:
+                        result[wanted[key]] = None
+        return result
+
+    def store_geocode(self, query, coords):
+        """Guarda (escritura inmediata) el resultado de una geocodificación remota; None = no encontrado"""
+        lat, lon = coords if coords else (None, None)
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO geocode_cache (consulta, lat, lon, actualizado) VALUES (?, ?, ?, ?)',
+                (place_key(query), lat, lon, datetime.now().isoformat())
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+_shared_gazetteer = None
+_shared_lock = threading.Lock()
+
+
+def get_gazetteer(db_path="cache/gazetteer.db"):
+    """
+    Nomenclátor del proceso, compartido por todas las sesiones y reruns.
+    El caché de geocodificaciones persiste en disco entre reinicios.
+    """
+    global _shared_gazetteer
+    with _shared_lock:
+        if _shared_gazetteer is None:
+            _shared_gazetteer = Gazetteer(db_path)
+        return _shared_gazetteer
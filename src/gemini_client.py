@@ -9,19 +9,42 @@ try:
 except ImportError:
     from duckduckgo_search import DDGS  # Fallback al nombre antiguo
 from src.cache_manager import CacheManager
+from src.batch_engine import ChunkedBatchEngine
+from src.rate_limiter import get_rate_limiter
+from src.model_router import get_model_router, model_family
+from src.revalidator import get_revalidator
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Versión de los prompts de clasificación (analyze_news y _analyze_session_batch).
+# Incrementarla al modificar cualquiera de los dos: el caché servirá la etiqueta anterior
+# y la re-validará en segundo plano en lugar de re-analizar todo de golpe
+PROMPT_VERSION = "sentimiento-v1"
+
+# Sin bloqueos de seguridad: las noticias de crisis/conflictos deben poder analizarse
+SAFETY_SETTINGS = {
+    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+}
+
 class AgroSentimentAnalyzer:
     def __init__(self):
         # INICIALIZACIÓN SEGURA: Definimos atributos por defecto para evitar AttributeError
         self.api_key = None
         self.model = None # Se mantiene por compatibilidad, aunque usamos rotación dinámica
         self.available_models_cache = None  # Cache de modelos disponibles
-        self.cache = CacheManager()  # Sistema de caché para reducir llamadas API
+        # Sistema de caché para reducir llamadas API (incluye casi duplicados y entradas de versiones anteriores)
+        self.cache = CacheManager(near_duplicate=True, prompt_version=PROMPT_VERSION, serve_stale=True)
+        self.revalidator = get_revalidator()  # Re-análisis de fondo con presupuesto acotado
         self.batch_mode = False  # Modo batch para procesar múltiples noticias
+        self.batch_engine = ChunkedBatchEngine()  # Lotes concurrentes con presupuesto de tokens
+        self.rate_limiter = get_rate_limiter()  # Cuota RPM/TPM compartida por todo el proceso
+        self.router = get_model_router()  # Salud de modelos persistente entre reruns y procesos
+        self.max_rate_wait = 15  # Segundos máximos esperando cupo antes de probar otro modelo
         
         try:
             self.api_key = st.secrets.get("GEMINI_API_KEY")
@@ -35,12 +58,18 @@ class AgroSentimentAnalyzer:
             genai.configure(api_key=self.api_key)
             self.model = True # Bandera para indicar que estamos listos
             
-            # Intentar detectar modelos disponibles al inicio (opcional, no crítico)
+            # Detectar modelos disponibles (cacheado por el enrutador, no se repite en cada rerun)
             try:
-                self.available_models_cache = self._list_available_models()
+                self.available_models_cache = self.router.get_available_models(self._list_available_models)
             except Exception:
                 pass  # No crítico si falla, se intentará después
             
+            # Las filas guardan la familia del modelo que respondió: las de cualquier candidato
+            # (incluidos los de respaldo) son vigentes; solo las de modelos retirados quedan obsoletas
+            families = self.router.candidate_families(self.available_models_cache)
+            self.cache.model_family = families[0] if families else None
+            self.cache.accepted_families = set(families)
+            
         except Exception as e:
             st.error(f"🤖 Error Crítico Configuración Gemini: {e}")
 
@@ -137,8 +166,7 @@ class AgroSentimentAnalyzer:
             logger.error(f"Error parseando respuesta: {e}. Respuesta completa: {text_response[:500]}")
             # En caso de error, intentar al menos extraer algo del texto
             if sentimiento is None:
-                sentimiento = "Neutro"
-                explicacion = f"Error al procesar respuesta: {str(e)}"
+                return {"sentimiento": "Neutro", "explicacion": f"Error al procesar respuesta: {str(e)}", "error": True}
 
         # Validación final: asegurar que siempre tenemos un sentimiento válido
         if sentimiento not in ["Positivo", "Negativo", "Neutro"]:
@@ -159,12 +187,13 @@ class AgroSentimentAnalyzer:
             dict con sentimiento y explicación
         """
         if not self.api_key:
-            return {"sentimiento": "Neutro", "explicacion": "Error: Sin API Key"}
+            return {"sentimiento": "Neutro", "explicacion": "Error: Sin API Key", "error": True}
         
         # 🚀 OPTIMIZACIÓN 1: Verificar caché primero
         if use_cache:
             cached_result = self.cache.get(text)
             if cached_result:
+                self._schedule_revalidation([text], [cached_result])
                 logger.info(f"✅ Resultado obtenido del caché (hits: {cached_result.get('cache_hits', 0)})")
                 return cached_result
 
@@ -203,163 +232,69 @@ ARGUMENTO: [Explicación clara de 1-2 frases en español sobre por qué clasific
 
 IMPORTANTE: Responde SOLO con las dos líneas (CLASIFICACIÓN y ARGUMENTO), sin texto adicional."""
 
-        # 🚀 OPTIMIZACIÓN 2: Priorizar modelos FLASH (más rápidos y baratos)
-        # Lista ordenada por COSTO y VELOCIDAD (Flash < Pro)
-        candidates = [
-            "gemini-2.0-flash-exp",    # Experimental pero más barato (prioridad 1)
-            "gemini-2.0-flash",        # Modelo estable y económico (prioridad 2)
-            "gemini-1.5-flash",        # Fallback flash económico
-            "gemini-1.5-flash-latest", # Última versión flash
-        ]
-        
-        # Si tenemos modelos en cache que funcionaron antes, priorizarlos
-        if self.available_models_cache:
-            # Filtrar modelos conocidos que funcionan bien
-            preferred_models = [m for m in self.available_models_cache 
-                               if any(x in m for x in ["gemini-2.5-flash", "gemini-2.0-flash", "gemini-2.5-pro"]) 
-                               and "exp" not in m.lower()]  # Evitar experimentales con problemas de cuota
-            if preferred_models:
-                # Insertar modelos preferidos al inicio
-                candidates = preferred_models[:3] + [c for c in candidates if c not in preferred_models]
-
-        for model_name in candidates:
-            try:
-                # Intentar crear el modelo - si el nombre no existe, generará error
-                model = genai.GenerativeModel(
-                    model_name,
-                    generation_config={
-                        "temperature": 0.1, 
-                        "max_output_tokens": 300,
-                        "top_p": 0.8,
-                        "top_k": 40
-                    },
-                    safety_settings={
-                        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-                    }
-                )
-                
-                response = model.generate_content(prompt)
-                
-                if response.parts and response.text:
-                    resultado = self._parse_text_response(response.text)
-                    
-                    # 🚀 OPTIMIZACIÓN 3: Guardar en caché para futuros usos
-                    if use_cache:
-                        self.cache.set(text, resultado["sentimiento"], resultado["explicacion"])
-                    
-                    # Guardar modelo exitoso en cache para priorizarlo en el futuro
-                    if self.available_models_cache is None:
-                        self.available_models_cache = []
-                    if model_name not in self.available_models_cache:
-                        self.available_models_cache.insert(0, model_name)  # Priorizar al inicio
-                    elif self.available_models_cache.index(model_name) > 0:
-                        # Mover al inicio si ya estaba en la lista
-                        self.available_models_cache.remove(model_name)
-                        self.available_models_cache.insert(0, model_name)
-                    
-                    # Log para debugging (solo en desarrollo, menos verboso)
-                    if resultado["sentimiento"] == "Neutro":
-                        logger.debug(f"Clasificación Neutro detectada. Respuesta Gemini: {response.text[:200]}")
-                    logger.debug(f"✅ Modelo {model_name} funcionó correctamente")
-                    return resultado
-                else:
-                    logger.warning(f"⚠️ Modelo {model_name} no retornó contenido válido")
-                    continue
-                
-            except Exception as e:
-                error_msg = str(e)
-                # Manejo de errores específicos
-                if "404" in error_msg or "not found" in error_msg.lower():
-                    logger.warning(f"⚠️ Modelo {model_name} no encontrado (404). Probando siguiente modelo...")
-                    # Remover modelo inexistente del cache si está ahí
-                    if self.available_models_cache and model_name in self.available_models_cache:
-                        self.available_models_cache.remove(model_name)
-                    continue
-                elif "429" in error_msg or "quota" in error_msg.lower() or "rate limit" in error_msg.lower():
-                    logger.warning(f"⚠️ Cuota agotada en {model_name}. Esperando 10s (reducido)...")
-                    # Remover modelo con problemas de cuota del cache si está ahí
-                    if self.available_models_cache and model_name in self.available_models_cache:
-                        self.available_models_cache.remove(model_name)
-                    time.sleep(10) # 🚀 REDUCIDO de 20s a 10s
-                    continue
-                else:
-                    logger.error(f"❌ Error en {model_name}: {error_msg[:200]}")
-                    continue
-
-        # Si todos los modelos fallaron, intentar usar modelos disponibles detectados automáticamente
-        logger.warning("⚠️ Todos los modelos candidatos fallaron. Intentando detectar modelos disponibles...")
-        
-        # Usar cache si está disponible, sino intentar listar ahora
-        available_models = self.available_models_cache if self.available_models_cache else self._list_available_models()
-        
-        # Filtrar modelos: priorizar estables, evitar experimentales con problemas de cuota
-        if available_models:
-            # Filtrar modelos estables (evitar exp, preview, etc. que pueden tener problemas)
-            stable_models = [m for m in available_models 
-                           if not any(x in m.lower() for x in ["exp", "preview", "experimental"])
-                           and any(x in m for x in ["gemini-2.5", "gemini-2.0", "gemini-pro"])]
+        # 🚀 OPTIMIZACIÓN 2: El enrutador compartido elige el modelo sano más rápido
+        # (los modelos con 404 o sin cuota se saltan sin gastar llamadas)
+        model_name, response = self.router.generate(
+            prompt,
+            generation_config={
+                "temperature": 0.1, 
+                "max_output_tokens": 300,
+                "top_p": 0.8,
+                "top_k": 40
+            },
+            safety_settings=SAFETY_SETTINGS,
+            available_models=self.available_models_cache,
+            max_wait=self.max_rate_wait
+        )
+        
+        if response is not None:
+            resultado = self._parse_text_response(response.text)
             
-            # Si no hay estables, usar los disponibles pero evitar los que sabemos que fallan
-            if not stable_models:
-                stable_models = [m for m in available_models if m not in candidates]  # Evitar los que ya fallaron
+            # 🚀 OPTIMIZACIÓN 3: Guardar en caché para futuros usos (nunca respuestas con error)
+            if use_cache and not resultado.get("error"):
+                self.cache.set(text, resultado["sentimiento"], resultado["explicacion"], model_family=model_family(model_name))
             
-            # Si encontramos modelos disponibles, intentar usarlos
-            if stable_models:
-                logger.debug(f"🔄 Intentando con modelos detectados automáticamente: {', '.join(stable_models[:3])}")
-                for model_name in stable_models[:3]:  # Intentar solo los primeros 3 para no demorar mucho
-                    try:
-                        model = genai.GenerativeModel(
-                            model_name,
-                            generation_config={
-                                "temperature": 0.1, 
-                                "max_output_tokens": 300,
-                                "top_p": 0.8,
-                                "top_k": 40
-                            },
-                            safety_settings={
-                                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                                HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                                HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                                HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-                            }
-                        )
-                        
-                        response = model.generate_content(prompt)
-                        
-                        if response.parts and response.text:
-                            resultado = self._parse_text_response(response.text)
-                            logger.debug(f"✅ Modelo {model_name} funcionó correctamente (detectado automáticamente)")
-                            # Actualizar cache con este modelo que funcionó
-                            if self.available_models_cache is None:
-                                self.available_models_cache = []
-                            if model_name not in self.available_models_cache:
-                                self.available_models_cache.insert(0, model_name)  # Poner al inicio para priorizar
-                            elif self.available_models_cache.index(model_name) > 0:
-                                # Mover al inicio si ya estaba en la lista
-                                self.available_models_cache.remove(model_name)
-                                self.available_models_cache.insert(0, model_name)
-                            return resultado
-                    except Exception as e:
-                        logger.debug(f"Modelo {model_name} falló: {str(e)[:100]}")
-                        continue
+            # Log para debugging (solo en desarrollo, menos verboso)
+            if resultado["sentimiento"] == "Neutro":
+                logger.debug(f"Clasificación Neutro detectada. Respuesta Gemini: {response.text[:200]}")
+            return resultado
         
         # Si llegamos aquí, todos los intentos fallaron
         logger.error("❌ Todos los modelos de Gemini fallaron. No se pudo analizar la noticia.")
-        if available_models:
-            logger.warning(f"💡 Modelos disponibles detectados: {', '.join(available_models[:5])}")
-            logger.warning(f"💡 Los modelos candidatos intentados fueron: {', '.join(candidates)}")
-        else:
-            logger.error("No se pudieron listar modelos disponibles. Verifica tu API key y conexión.")
+        if self.available_models_cache:
+            logger.warning(f"💡 Modelos disponibles detectados: {', '.join(self.available_models_cache[:5])}")
         
-        return {"sentimiento": "Neutro", "explicacion": "Error: Sistema saturado o sin acceso a modelos de IA. Intenta más tarde."}
+        return {"sentimiento": "Neutro", "explicacion": "Error: Sistema saturado o sin acceso a modelos de IA. Intenta más tarde.",
+                "error": True}
+
+    def _schedule_revalidation(self, texts, cached_results):
+        """Programa en segundo plano el re-análisis de las entradas servidas como obsoletas"""
+        stale = [text for text, cached in zip(texts, cached_results) if cached and cached.get("stale")]
+        if stale and self.api_key:
+            self.revalidator.submit(stale, self._revalidate_texts, self._store_revalidated)
+
+    def _revalidate_texts(self, texts):
+        results, _ = self.batch_engine.run(
+            texts, lambda chunk: self._analyze_session_batch(chunk, allow_fallback=False)
+        )
+        return results
+
+    def _store_revalidated(self, rows):
+        self.cache.set_many(self._cache_rows(rows))
+
+    @staticmethod
+    def _cache_rows(pairs):
+        """Filas (texto, sentimiento, explicación, familia) para set_many, sin resultados faltantes ni con error"""
+        return [
+            (text, result["sentimiento"], result["explicacion"], result.get("model_family"))
+            for text, result in pairs
+            if result is not None and not result.get("error")
+        ]
 
     def analyze_batch(self, df, progress_bar=None, use_smart_batch=True):
         """
-        🚀 OPTIMIZADO: Procesa TODAS las noticias en UN SOLO llamado a la API por sesión
-        Máxima optimización: 1 llamada API independientemente del número de noticias
+        🚀 OPTIMIZADO: Procesa las noticias nuevas en lotes con presupuesto de tokens
+        Los lotes se ejecutan en paralelo y solo se reintentan los que fallan
         
         Args:
             df: DataFrame con noticias
@@ -376,13 +311,15 @@ IMPORTANTE: Responde SOLO con las dos líneas (CLASIFICACIÓN y ARGUMENTO), sin
         cached_results = {}
         cache_hits = 0
         
-        for index, row in df.iterrows():
-            titular = str(row.get('titular', ''))
-            cuerpo = str(row.get('cuerpo', ''))
-            text = f"{titular}. {cuerpo}"
-            
-            # Verificar caché primero
-            cached = self.cache.get(text)
+        # Textos por posición (evita iterrows); una sola consulta al caché para todo el lote
+        titulares = df['titular'].astype(str) if 'titular' in df.columns else [''] * total
+        cuerpos = df['cuerpo'].astype(str) if 'cuerpo' in df.columns else [''] * total
+        texts = [f"{titular}. {cuerpo}" for titular, cuerpo in zip(titulares, cuerpos)]
+        
+        cached_list = self.cache.get_many(texts)
+        self._schedule_revalidation(texts, cached_list)
+        
+        for index, (text, cached) in enumerate(zip(texts, cached_list)):
             if cached:
                 cached_results[index] = cached
                 cache_hits += 1
@@ -398,17 +335,22 @@ IMPORTANTE: Responde SOLO con las dos líneas (CLASIFICACIÓN y ARGUMENTO), sin
                 progress_bar.progress(1.0)
             return results_sent, results_expl
         
-        # 🚀 OPTIMIZACIÓN CRÍTICA: UN SOLO LLAMADO para todas las noticias nuevas
-        logger.info(f"📊 Analizando {len(texts_to_analyze)} noticias nuevas en UN SOLO llamado API (sesión única)")
+        # 🚀 OPTIMIZACIÓN CRÍTICA: lotes con presupuesto de tokens procesados en paralelo
+        logger.info(f"📊 Analizando {len(texts_to_analyze)} noticias nuevas en lotes concurrentes")
         
         if progress_bar:
             progress_bar.progress(0.3)  # 30% - preparando
         
-        # Llamar al método de análisis único
-        new_results = self._analyze_session_batch([text for _, text in texts_to_analyze])
+        def update_progress(done, total_new):
+            if progress_bar:
+                progress_bar.progress(0.3 + 0.6 * done / total_new)
         
-        if progress_bar:
-            progress_bar.progress(0.7)  # 70% - procesando
+        # Solo se reintentan los lotes que fallan; el resto se conserva
+        new_results, batch_stats = self.batch_engine.run(
+            [text for _, text in texts_to_analyze],
+            lambda chunk: self._analyze_session_batch(chunk, allow_fallback=False),
+            progress_callback=update_progress
+        )
         
         # Guardar en caché y construir resultados finales
         results_sent = []
@@ -422,42 +364,46 @@ IMPORTANTE: Responde SOLO con las dos líneas (CLASIFICACIÓN y ARGUMENTO), sin
                 results_expl.append(cached_results[i]["explicacion"])
             else:
                 # Del análisis nuevo
-                if result_index < len(new_results):
-                    result = new_results[result_index]
+                result = new_results[result_index] if result_index < len(new_results) else None
+                if result is not None:
                     results_sent.append(result["sentimiento"])
                     results_expl.append(result["explicacion"])
-                    
-                    # Guardar en caché
-                    _, text = texts_to_analyze[result_index]
-                    self.cache.set(text, result["sentimiento"], result["explicacion"])
-                    result_index += 1
                 else:
-                    # Fallback si algo falló
+                    # Fallback si el lote falló tras agotar los reintentos
                     results_sent.append("Neutro")
                     results_expl.append("Error en procesamiento")
+                result_index += 1
+        
+        # Guardar en caché en una sola transacción (los lotes fallidos no se guardan)
+        self.cache.set_many(self._cache_rows(
+            (text, result) for (_, text), result in zip(texts_to_analyze, new_results)
+        ))
         
         if progress_bar:
             progress_bar.progress(1.0)  # 100% - completado
         
         # Log de optimización
-        api_calls = 1 if len(texts_to_analyze) > 0 else 0
+        api_calls = batch_stats["api_calls"]
         logger.info(f"📊 Sesión completada: {cache_hits} del caché, {api_calls} llamada(s) API ({(cache_hits/total*100):.1f}% ahorro por caché, {((total-api_calls)/total*100):.1f}% ahorro total)")
         
         return results_sent, results_expl
     
-    def _analyze_session_batch(self, texts_list):
+    def _analyze_session_batch(self, texts_list, allow_fallback=True):
         """
         🚀 MÁXIMA OPTIMIZACIÓN: Analiza TODAS las noticias en UN SOLO llamado a Gemini
         Reduce consumo de API a 1 llamada independientemente del número de noticias
         
         Args:
             texts_list: Lista de textos a analizar (todas las noticias de la sesión)
+            allow_fallback: Si False, lanza RuntimeError cuando todos los modelos fallan
+                            en lugar de analizar noticia por noticia (lo usa el motor de
+                            lotes para reintentar solo el lote afectado)
         
         Returns:
             Lista de diccionarios con sentimiento y explicación
         """
         if not self.api_key:
-            return [{"sentimiento": "Neutro", "explicacion": "Error: Sin API Key"} for _ in texts_list]
+            return [{"sentimiento": "Neutro", "explicacion": "Error: Sin API Key", "error": True} for _ in texts_list]
         
         if not texts_list:
             return []
@@ -503,73 +449,42 @@ Y Explicación debe ser una frase breve en español explicando por qué.
 
 IMPORTANTE: Responde SOLO con las líneas numeradas, sin texto adicional antes o después."""
         
-        # Intentar con modelos económicos primero
-        candidates = [
-            "gemini-2.0-flash-exp",
-            "gemini-2.0-flash",
-            "gemini-1.5-flash",
-            "gemini-1.5-flash-latest",
-        ]
-        
         # Ajustar tokens según cantidad de noticias
         max_tokens = min(8000, 300 + (total * 100))  # ~100 tokens por noticia + overhead
         
-        for model_name in candidates:
-            try:
-                model = genai.GenerativeModel(
-                    model_name,
-                    generation_config={
-                        "temperature": 0.1,
-                        "max_output_tokens": max_tokens,
-                        "top_p": 0.8,
-                        "top_k": 40
-                    },
-                    safety_settings={
-                        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-                    }
-                )
-                
-                logger.info(f"🔄 Llamando a {model_name} con {total} noticias...")
-                response = model.generate_content(prompt_batch)
-                
-                if response.text:
-                    # Parsear respuesta
-                    batch_results = self._parse_batch_response(response.text, total)
-                    
-                    if len(batch_results) == total:
-                        logger.info(f"✅ Análisis único completado: {total} noticias procesadas en 1 llamada API")
-                        return batch_results
-                    else:
-                        logger.warning(f"⚠️ Respuesta incompleta: {len(batch_results)}/{total} noticias. Reintentando...")
-                        # Continuar al siguiente modelo
-                        continue
-                else:
-                    logger.warning(f"⚠️ Modelo {model_name} no retornó contenido válido")
-                    continue
-                    
-            except Exception as e:
-                error_msg = str(e)
-                if "404" in error_msg or "not found" in error_msg.lower():
-                    logger.warning(f"⚠️ Modelo {model_name} no encontrado. Probando siguiente...")
-                    continue
-                elif "429" in error_msg or "quota" in error_msg.lower() or "rate limit" in error_msg.lower():
-                    logger.warning(f"⚠️ Cuota agotada en {model_name}. Esperando 10s...")
-                    time.sleep(10)
-                    continue
-                else:
-                    logger.error(f"❌ Error en {model_name}: {error_msg[:200]}")
-                    continue
+        # El enrutador compartido elige el modelo sano más rápido
+        logger.info(f"🔄 Llamando al modelo con {total} noticias...")
+        model_name, response = self.router.generate(
+            prompt_batch,
+            generation_config={
+                "temperature": 0.1,
+                "max_output_tokens": max_tokens,
+                "top_p": 0.8,
+                "top_k": 40
+            },
+            safety_settings=SAFETY_SETTINGS,
+            available_models=self.available_models_cache,
+            max_wait=self.max_rate_wait
+        )
+        
+        if response is not None:
+            # En el motor de lotes una respuesta incompleta es un fallo: el lote se parte y se reintenta
+            batch_results = self._parse_batch_response(response.text, total, strict=not allow_fallback)
+            for result in batch_results:
+                result["model_family"] = model_family(model_name)
+            logger.info(f"✅ Análisis único completado con {model_name}: {total} noticias procesadas en 1 llamada API")
+            return batch_results
+        
+        if not allow_fallback:
+            raise RuntimeError(f"Todos los modelos fallaron para el lote de {total} noticias")
         
         # Si todos los modelos fallaron, usar fallback individual (pero esto no debería pasar)
         logger.error(f"❌ Todos los modelos fallaron. Usando fallback individual para {total} noticias.")
         results = []
         for text in texts_list:
+            # El limitador compartido marca el ritmo entre llamadas
             result = self.analyze_news(text, use_cache=False)
             results.append(result)
-            time.sleep(0.5)  # Pequeña pausa entre llamadas
         return results
 
     def analyze_batch_smart(self, texts_list, max_per_batch=5):
@@ -585,7 +500,7 @@ IMPORTANTE: Responde SOLO con las líneas numeradas, sin texto adicional antes o
             Lista de diccionarios con sentimiento y explicación
         """
         if not self.api_key:
-            return [{"sentimiento": "Neutro", "explicacion": "Error: Sin API Key"} for _ in texts_list]
+            return [{"sentimiento": "Neutro", "explicacion": "Error: Sin API Key", "error": True} for _ in texts_list]
         
         results = []
         total = len(texts_list)
@@ -617,40 +532,39 @@ RESPONDE EN ESTE FORMATO EXACTO (una línea por noticia):
 3|Neutro|Razón breve
 ..."""
             
-            # Intentar con modelo más económico primero
-            try:
-                model = genai.GenerativeModel(
-                    "gemini-2.0-flash-exp",  # Más barato para batches
-                    generation_config={
-                        "temperature": 0.1,
-                        "max_output_tokens": 500,  # Suficiente para 5 noticias
-                    }
-                )
-                
-                response = model.generate_content(prompt_batch)
-                
-                if response.text:
-                    # Parsear respuesta multi-línea
-                    batch_results = self._parse_batch_response(response.text, len(batch))
-                    results.extend(batch_results)
-                else:
-                    # Fallback a análisis individual si falla batch
-                    for text in batch:
-                        results.append(self.analyze_news(text))
-                
-                time.sleep(1)  # Espera mínima entre batches
-                
-            except Exception as e:
-                logger.error(f"Error en batch smart: {e}. Usando fallback individual.")
+            # El enrutador compartido elige el modelo sano más rápido
+            model_name, response = self.router.generate(
+                prompt_batch,
+                generation_config={
+                    "temperature": 0.1,
+                    "max_output_tokens": 500,  # Suficiente para 5 noticias
+                },
+                available_models=self.available_models_cache,
+                max_wait=self.max_rate_wait
+            )
+            
+            if response is not None:
+                # Parsear respuesta multi-línea
+                batch_results = self._parse_batch_response(response.text, len(batch))
+                results.extend(batch_results)
+            else:
+                # Fallback a análisis individual si falla batch
+                logger.error("Error en batch smart. Usando fallback individual.")
                 for text in batch:
                     results.append(self.analyze_news(text))
         
         return results
     
-    def _parse_batch_response(self, response_text, expected_count):
+    def _parse_batch_response(self, response_text, expected_count, strict=False):
         """
         Parsea respuesta de batch con formato: N|Sentimiento|Explicacion
         Maneja múltiples formatos para mayor robustez
+        
+        Args:
+            response_text: Texto devuelto por el modelo
+            expected_count: Noticias enviadas en el lote
+            strict: Si True, lanza ValueError cuando falta alguna noticia en lugar de
+                    rellenar con resultados de error
         """
         results = []
         lines = response_text.strip().split('\n')
@@ -734,11 +648,15 @@ RESPONDE EN ESTE FORMATO EXACTO (una línea por noticia):
             if num <= expected_count:
                 results.append(parsed_results[num])
         
-        # Si no parseó bien o faltan resultados, rellenar
+        if strict and set(range(1, expected_count + 1)) - parsed_results.keys():
+            raise ValueError(f"respuesta con {len(results)}/{expected_count} resultados")
+        
+        # Si no parseó bien o faltan resultados, rellenar (marcados como error: no se guardan en caché)
         while len(results) < expected_count:
             results.append({
                 "sentimiento": "Neutro", 
-                "explicacion": "Error en procesamiento batch - respuesta no parseada correctamente"
+                "explicacion": "Error en procesamiento batch - respuesta no parseada correctamente",
+                "error": True
             })
         
         # Limitar a expected_count por si acaso
@@ -760,11 +678,12 @@ RESPONDE EN ESTE FORMATO EXACTO (una línea por noticia):
             cached_analyses = {}
             web_items = []
             
-            for idx, item in enumerate(results):
-                full_text = f"{item.get('title','')}. {item.get('body','')}"
-                
-                # Verificar caché
-                cached = self.cache.get(full_text)
+            full_texts = [f"{item.get('title','')}. {item.get('body','')}" for item in results]
+            
+            # Verificar caché (una sola consulta)
+            cached_list = self.cache.get_many(full_texts)
+            self._schedule_revalidation(full_texts, cached_list)
+            for idx, (item, full_text, cached) in enumerate(zip(results, full_texts, cached_list)):
                 if cached:
                     cached_analyses[idx] = cached
                 else:
@@ -779,8 +698,10 @@ RESPONDE EN ESTE FORMATO EXACTO (una línea por noticia):
                 
                 # Guardar en caché
                 for (idx, text), analysis in zip(texts_to_analyze, new_analyses):
-                    self.cache.set(text, analysis["sentimiento"], analysis["explicacion"])
                     cached_analyses[idx] = analysis
+                self.cache.set_many(self._cache_rows(
+                    (text, analysis) for (_, text), analysis in zip(texts_to_analyze, new_analyses)
+                ))
             
             # Construir resultado final
             analyzed_data = []
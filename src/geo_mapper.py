@@ -6,31 +6,93 @@ import folium
 from folium import plugins
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+import html
+import threading
 import time
 import logging
 import re
 
+import numpy as np
+import pandas as pd
+
+from src.gazetteer import Gazetteer, get_gazetteer
+from src.rate_limiter import TokenBucket
+from src.term_matcher import TermMatcher, corpus_texts, register_terms, shared_hits
+
 logger = logging.getLogger(__name__)
 
+# Política de uso de Nominatim: como máximo una consulta por segundo (compartida por el proceso)
+NOMINATIM_REQUESTS_PER_SECOND = 1.0
+_nominatim_bucket = TokenBucket(1, NOMINATIM_REQUESTS_PER_SECOND)
+_nominatim_lock = threading.Lock()
+
+# Titulares listados en el popup de cada marcador agregado
+POPUP_HEADLINES = 5
+
+SENTIMENT_STYLES = {
+    "Positivo": ("green", "arrow-up", "Noticias Positivas"),
+    "Negativo": ("red", "arrow-down", "Noticias Negativas"),
+    "Neutro": ("gray", "info-sign", "Noticias Neutras"),
+}
+
+# Nombres del nomenclátor que en las noticias suelen ser otra cosa (palabras
+# comunes, apellidos, otros lugares): se geocodifican, pero no se buscan en el texto
+AMBIGUOUS_PLACE_NAMES = {
+    'argelia', 'bolivar', 'el cairo', 'la union', 'la victoria', 'los andes',
+    'navarro', 'obando', 'restrepo', 'toro', 'trujillo', 'versalles',
+}
+
+_locations_lock = threading.Lock()
+
+
+def location_terms(gazetteer):
+    """
+    Ubicaciones a buscar en las noticias: municipios, corregimientos y veredas
+    del departamento preferido (con sus alias) y el departamento al final
+    """
+    terms = {}
+    for label, aliases in gazetteer.place_terms().items():
+        aliases = [alias for alias in aliases if alias not in AMBIGUOUS_PLACE_NAMES]
+        if aliases:
+            terms[label] = aliases
+    return terms
+
+
+def register_locations(gazetteer):
+    """Registra (o actualiza si cambió el nomenclátor) las ubicaciones del matcher compartido"""
+    global VALLE_LOCATIONS, LOCATION_MATCHER
+    terms = location_terms(gazetteer)
+    with _locations_lock:
+        if terms != VALLE_LOCATIONS:
+            VALLE_LOCATIONS = terms
+            LOCATION_MATCHER = TermMatcher(terms)
+            register_terms('ubicaciones', terms)
+
+
+VALLE_LOCATIONS = {}
+LOCATION_MATCHER = None
+# Al importar basta el CSV incluido (índice en memoria); cada mapeador suma los lugares agregados
+register_locations(Gazetteer())
+
+
 class NewsGeoMapper:
-    def __init__(self):
-        """Inicializa el mapeador con geocodificador"""
-        self.geolocator = Nominatim(user_agent="sava_agro_insight")
-        
-        # Caché de ubicaciones para evitar múltiples consultas
-        self.location_cache = {
-            # Principales ciudades del Valle del Cauca
-            "cali": (3.4516, -76.5320),
-            "palmira": (3.5394, -76.3036),
-            "buenaventura": (3.8801, -77.0314),
-            "tulua": (4.0840, -76.1952),
-            "cartago": (4.7467, -75.9114),
-            "buga": (3.9000, -76.3000),
-            "jamundi": (3.2644, -76.5411),
-            "yumbo": (3.5883, -76.4986),
-            "valle del cauca": (3.8008, -76.6413),
-            "colombia": (4.5709, -74.2973)
-        }
+    def __init__(self, gazetteer=None, geolocator=None, sleep=time.sleep):
+        """
+        Inicializa el mapeador con geocodificador
+        
+        Args:
+            gazetteer: Nomenclátor con caché persistente (default: el compartido en cache/gazetteer.db)
+            geolocator: Geocodificador remoto (default: Nominatim público)
+            sleep: Función de espera entre consultas remotas (inyectable para tests)
+        """
+        self.geolocator = geolocator or Nominatim(user_agent="sava_agro_insight")
+        self.gazetteer = gazetteer if gazetteer is not None else get_gazetteer()
+        register_locations(self.gazetteer)
+        
+        # Memoria local de la instancia delante del nomenclátor (nombre -> coordenadas)
+        self.location_cache = {}
+        self.remote_lookups = 0
+        self._sleep = sleep
     
     def extract_locations_from_text(self, text):
         """
@@ -42,25 +104,17 @@ class NewsGeoMapper:
         Returns:
             Lista de ubicaciones detectadas
         """
-        text_lower = text.lower()
-        detected_locations = []
-        
-        # Buscar ciudades conocidas del Valle del Cauca
-        cities = [
-            "Cali", "Palmira", "Buenaventura", "Tuluá", "Cartago", "Buga",
-            "Jamundí", "Yumbo", "Candelaria", "Florida", "Pradera", 
-            "Ginebra", "Guacarí", "Sevilla", "Dagua", "La Cumbre"
-        ]
-        
-        for city in cities:
-            if city.lower() in text_lower:
-                detected_locations.append(city)
-        
-        # Buscar "Valle del Cauca"
-        if "valle del cauca" in text_lower or "valle" in text_lower:
-            detected_locations.append("Valle del Cauca")
+        # Municipios y corregimientos primero, "Valle del Cauca" al final (sin tildes ni mayúsculas)
+        return LOCATION_MATCHER.find(text)
+    
+    def location_hits(self, df):
+        """
+        Matriz dispersa noticia x ubicación del DataFrame (compartida con las alertas)
         
-        return list(set(detected_locations))  # Eliminar duplicados
+        Returns:
+            TermHits sobre titular + cuerpo
+        """
+        return shared_hits(corpus_texts(df), 'ubicaciones')
     
     def geocode_location(self, location_name):
         """
@@ -72,29 +126,87 @@ class NewsGeoMapper:
         Returns:
             Tupla (lat, lon) o None si no se encuentra
         """
-        location_lower = location_name.lower().strip()
+        return self.geocode_locations([location_name]).get(location_name)
+    
+    def geocode_locations(self, location_names):
+        """
+        Coordenadas de varias ubicaciones, resolviendo cada nombre distinto una vez
         
-        # Verificar caché primero
-        if location_lower in self.location_cache:
-            return self.location_cache[location_lower]
+        Orden: memoria de la instancia, nomenclátor (una consulta por lote),
+        geocodificaciones remotas guardadas y, solo para lo que falte, Nominatim.
         
-        # Intentar geocodificar
-        try:
-            # Agregar "Colombia" al final para mejorar precisión
-            search_query = f"{location_name}, Valle del Cauca, Colombia"
-            location = self.geolocator.geocode(search_query, timeout=5)
-            
-            if location:
-                coords = (location.latitude, location.longitude)
-                self.location_cache[location_lower] = coords
-                return coords
+        Args:
+            location_names: Iterable de nombres
+        
+        Returns:
+            dict nombre -> (lat, lon) o None si no se encuentra
+        """
+        result = {}
+        pending = []
+        for name in dict.fromkeys(n for n in location_names if n):
+            key = name.lower().strip()
+            if key in self.location_cache:
+                result[name] = self.location_cache[key]
+            else:
+                pending.append(name)
+        
+        # Nomenclátor local y luego resultados remotos ya guardados (sin red)
+        found = self.gazetteer.lookup_many(pending) if pending else {}
+        missing = [name for name in pending if name not in found]
+        if missing:
+            found.update(self.gazetteer.cached_geocodes(missing))
+        
+        for name in pending:
+            if name in found:
+                coords = found[name]
             else:
-                logger.warning(f"No se pudo geocodificar: {location_name}")
-                return None
-                
-        except (GeocoderTimedOut, GeocoderServiceError) as e:
-            logger.error(f"Error de geocodificación: {e}")
-            return None
+                try:
+                    coords = self._geocode_remote(name)
+                except (GeocoderTimedOut, GeocoderServiceError) as e:
+                    # Los errores de red no se guardan: se reintentará en otra ocasión
+                    logger.error(f"Error de geocodificación: {e}")
+                    result[name] = None
+                    continue
+            self.location_cache[name.lower().strip()] = coords
+            result[name] = coords
+        return result
+    
+    def coordinates_for(self, location_names):
+        """
+        Latitudes y longitudes alineadas con una secuencia de nombres
+        
+        Args:
+            location_names: Arreglo de nombres (None = sin ubicación)
+        
+        Returns:
+            Tupla (lat, lon) de arreglos float con NaN donde no hay coordenadas
+        """
+        codes, uniques = pd.factorize(pd.Series(location_names, dtype=object))
+        resolved = self.geocode_locations(uniques)
+        table = np.array([resolved.get(name) or (np.nan, np.nan) for name in uniques] + [(np.nan, np.nan)],
+                         dtype=np.float64).reshape(-1, 2)
+        # El código -1 (sin ubicación) apunta a la última fila, que es NaN
+        coords = table[codes]
+        return coords[:, 0], coords[:, 1]
+    
+    def _geocode_remote(self, location_name):
+        """Consulta Nominatim y guarda el resultado (también los no encontrados) en disco"""
+        # Agregar "Colombia" al final para mejorar precisión
+        search_query = f"{location_name}, Valle del Cauca, Colombia"
+        # Solo las consultas reales a la red esperan turno
+        with _nominatim_lock:
+            wait = _nominatim_bucket.time_until(1)
+            if wait > 0:
+                self._sleep(wait)
+            _nominatim_bucket.consume(1)
+        self.remote_lookups += 1
+        location = self.geolocator.geocode(search_query, timeout=5)
+        
+        coords = (location.latitude, location.longitude) if location else None
+        if coords is None:
+            logger.warning(f"No se pudo geocodificar: {location_name}")
+        self.gazetteer.store_geocode(location_name, coords)
+        return coords
     
     def create_news_map(self, df, center_coords=(3.8008, -76.6413), zoom_start=8):
         """
@@ -121,72 +233,42 @@ class NewsGeoMapper:
         folium.TileLayer('OpenTopoMap', name='Terreno', attr='OpenTopoMap').add_to(m)
         folium.TileLayer('CartoDB positron', name='Limpio', attr='CartoDB').add_to(m)
         
-        # Grupos de marcadores por sentimiento
-        cluster_positivo = plugins.MarkerCluster(name="Noticias Positivas").add_to(m)
-        cluster_negativo = plugins.MarkerCluster(name="Noticias Negativas").add_to(m)
-        cluster_neutro = plugins.MarkerCluster(name="Noticias Neutras").add_to(m)
-        
-        # Contadores
-        geolocalized = 0
-        not_geolocalized = 0
-        
-        # Procesar cada noticia
-        for index, row in df.iterrows():
-            titular = str(row.get('titular', 'Sin Titular'))
-            sentimiento = row.get('sentimiento_ia', 'Neutro')
-            explicacion = row.get('explicacion_ia', 'Sin explicación')
-            fecha = row.get('fecha', 'Sin fecha')
-            
-            # Extraer ubicaciones del texto
-            text_full = f"{titular} {row.get('cuerpo', '')}"
-            locations = self.extract_locations_from_text(text_full)
-            
-            if not locations:
-                # Si no hay ubicaciones específicas, usar Valle del Cauca genérico
-                locations = ["Valle del Cauca"]
+        # Grupos de marcadores por sentimiento (en orden fijo para el control de capas)
+        layers = {name: plugins.MarkerCluster(name=name).add_to(m) for _, _, name in SENTIMENT_STYLES.values()}
+        
+        # Ubicación principal de cada noticia en una sola pasada sobre el corpus;
+        # si no hay ubicaciones específicas, se usa Valle del Cauca genérico
+        locations = pd.Series(self.location_hits(df).primary(), dtype=object).fillna("Valle del Cauca")
+        lat, lon = self.coordinates_for(locations.to_numpy())
+        geolocated = ~np.isnan(lat)
+        geolocalized = int(geolocated.sum())
+        not_geolocalized = len(df) - geolocalized
+        
+        # Un marcador por ubicación y sentimiento (en lugar de uno por noticia)
+        for (location, sentimiento), group in self._marker_groups(df, locations, lat, lon, geolocated):
+            color, icon, layer_name = SENTIMENT_STYLES.get(sentimiento, SENTIMENT_STYLES["Neutro"])
             
-            # Geocodificar primera ubicación detectada
-            coords = self.geocode_location(locations[0])
+            total = len(group)
+            headlines = ''.join(
+                f"<li>{html.escape(str(titular))} <small>({html.escape(str(fecha))})</small></li>"
+                for titular, fecha in zip(group['titular'].head(POPUP_HEADLINES), group['fecha'].head(POPUP_HEADLINES))
+            )
+            more = f"<small>... y {total - POPUP_HEADLINES} más</small>" if total > POPUP_HEADLINES else ""
+            popup_html = f"""
+            <div style="width: 300px;">
+                <h4 style="color: {color};">{sentimiento}: {total} noticia(s)</h4>
+                <ul>{headlines}</ul>{more}
+                <hr>
+                <small>📍 {html.escape(str(location))}</small>
+            </div>
+            """
             
-            if coords:
-                geolocalized += 1
-                
-                # Definir color según sentimiento
-                if sentimiento == "Positivo":
-                    color = "green"
-                    icon = "arrow-up"
-                    cluster = cluster_positivo
-                elif sentimiento == "Negativo":
-                    color = "red"
-                    icon = "arrow-down"
-                    cluster = cluster_negativo
-                else:
-                    color = "gray"
-                    icon = "info-sign"
-                    cluster = cluster_neutro
-                
-                # Crear popup con información
-                popup_html = f"""
-                <div style="width: 300px;">
-                    <h4 style="color: {color};">{sentimiento}</h4>
-                    <p><b>{titular}</b></p>
-                    <p><i>{explicacion[:150]}...</i></p>
-                    <hr>
-                    <small>📍 {locations[0]}<br>📅 {fecha}</small>
-                </div>
-                """
-                
-                # Agregar marcador
-                folium.Marker(
-                    location=coords,
-                    popup=folium.Popup(popup_html, max_width=300),
-                    tooltip=f"{sentimiento}: {titular[:50]}...",
-                    icon=folium.Icon(color=color, icon=icon, prefix='glyphicon')
-                ).add_to(cluster)
-                
-                time.sleep(0.1)  # Pequeña pausa para evitar rate limiting
-            else:
-                not_geolocalized += 1
+            folium.Marker(
+                location=(group['lat'].iat[0], group['lon'].iat[0]),
+                popup=folium.Popup(popup_html, max_width=300),
+                tooltip=f"{sentimiento}: {total} noticia(s) en {location}",
+                icon=folium.Icon(color=color, icon=icon, prefix='glyphicon')
+            ).add_to(layers[layer_name])
         
         # Agregar control de capas
         folium.LayerControl().add_to(m)
@@ -202,6 +284,24 @@ class NewsGeoMapper:
         
         return m
     
+    @staticmethod
+    def _marker_groups(df, locations, lat, lon, geolocated):
+        """Noticias geolocalizadas agrupadas por (ubicación, sentimiento)"""
+        def column(name, default):
+            if name in df.columns:
+                return df[name].fillna(default).astype(str).to_numpy()
+            return np.full(len(df), default, dtype=object)
+        
+        frame = pd.DataFrame({
+            'ubicacion': locations.to_numpy(),
+            'sentimiento': column('sentimiento_ia', 'Neutro'),
+            'titular': column('titular', 'Sin Titular'),
+            'fecha': column('fecha', 'Sin fecha'),
+            'lat': lat,
+            'lon': lon,
+        })[geolocated]
+        return frame.groupby(['ubicacion', 'sentimiento'], sort=True)
+    
     def create_heatmap(self, df):
         """
         Crea mapa de calor basado en intensidad de noticias negativas
@@ -218,21 +318,22 @@ class NewsGeoMapper:
             tiles="CartoDB dark_matter"
         )
         
-        heat_data = []
-        negativas_count = 0
-        
-        for index, row in df.iterrows():
-            if row.get('sentimiento_ia') == 'Negativo':
-                negativas_count += 1
-                text_full = f"{row.get('titular', '')} {row.get('cuerpo', '')}"
-                locations = self.extract_locations_from_text(text_full)
-                
-                if locations:
-                    coords = self.geocode_location(locations[0])
-                    if coords:
-                        # Peso mayor para noticias negativas
-                        heat_data.append([coords[0], coords[1], 1.0])
-                    time.sleep(0.05)  # Reducido para ser más rápido
+        if 'sentimiento_ia' in df.columns:
+            negative = (df['sentimiento_ia'] == 'Negativo').to_numpy()
+        else:
+            negative = np.zeros(len(df), dtype=bool)
+        negativas_count = int(negative.sum())
+        
+        locations = self.location_hits(df).primary()[negative]
+        lat, lon = self.coordinates_for(locations)
+        geolocated = ~np.isnan(lat)
+        geolocalized = int(geolocated.sum())
+        
+        # Un punto por coordenada con peso proporcional a sus noticias negativas
+        points = pd.DataFrame({'lat': lat[geolocated], 'lon': lon[geolocated]})
+        points = points.groupby(['lat', 'lon']).size().reset_index(name='conteo')
+        points['peso'] = points['conteo'] / (points['conteo'].max() if len(points) else 1)
+        heat_data = points[['lat', 'lon', 'peso']].values.tolist()
         
         if heat_data:
             # MEJORADO: Configuración más visible del heatmap
@@ -248,7 +349,7 @@ class NewsGeoMapper:
             # Agregar marcador informativo
             folium.Marker(
                 location=(3.8008, -76.6413),
-                popup=f"Mapa de Calor de Riesgos<br>Noticias Negativas: {negativas_count}<br>Puntos geolocalizados: {len(heat_data)}",
+                popup=f"Mapa de Calor de Riesgos<br>Noticias Negativas: {negativas_count}<br>Noticias geolocalizadas: {geolocalized}",
                 icon=folium.Icon(color='red', icon='info-sign', prefix='glyphicon')
             ).add_to(m)
         else:
@@ -259,7 +360,7 @@ class NewsGeoMapper:
                 icon=folium.Icon(color='gray', icon='info-sign', prefix='glyphicon')
             ).add_to(m)
         
-        logger.info(f"🔥 Mapa de calor: {len(heat_data)} puntos de {negativas_count} noticias negativas")
+        logger.info(f"🔥 Mapa de calor: {geolocalized} de {negativas_count} noticias negativas en {len(heat_data)} puntos")
         
         return m
 
@@ -0,0 +1,130 @@
+"""
+Motor de palabras clave compartido por tendencias y exportaciones
+Tokeniza el corpus una sola vez (CountVectorizer) y responde el top-N de
+cualquier filtro (sentimiento, fechas) con una suma dispersa
+"""
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer
+
+from src.text_es import SPANISH_STOPWORDS
+
+# Palabras frecuentes en prensa que no aportan como palabra clave (además de las stopwords)
+KEYWORD_STOPWORDS = SPANISH_STOPWORDS | frozenset("""
+haber estar tener hacer poder decir ir ver dar saber querer llegar pasar deber poner parecer quedar
+creer hablar llevar dejar seguir encontrar llamar venir pensar salir volver tomar conocer vivir sentir
+este ese otro alguno mismo grande primero tiempo vez ano anos dia dias segun despues ademas donde
+tras cual cuales hace sera seran puede pueden debe deben cada todas estas esos esas sino
+""".split())
+
+# Mismo patrón que usaban los análisis: palabras de 4+ letras en minúscula
+KEYWORD_PATTERN = r'\b[a-záéíóúñ]{4,}\b'
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 8
+
+
+@lru_cache(maxsize=50000)
+def _strip_accents(word):
+    return ''.join(c for c in unicodedata.normalize('NFKD', word) if not unicodedata.combining(c))
+
+
+class KeywordMatrix:
+    """Matriz documento-término de un corpus con su vocabulario"""
+
+    def __init__(self, matrix, vocabulary, key=None):
+        self.matrix = matrix
+        self.vocabulary = vocabulary
+        self.key = key  # Huella del corpus
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def top_keywords(self, mask=None, top_n=15):
+        """
+        Palabras más frecuentes en las filas seleccionadas
+
+        Args:
+            mask: Arreglo booleano por documento (None = todos)
+            top_n: Número de palabras a retornar
+
+        Returns:
+            Lista de tuplas (palabra, frecuencia) de mayor a menor
+        """
+        if not len(self.vocabulary):
+            return []
+        if mask is None:
+            counts = np.asarray(self.matrix.sum(axis=0)).ravel()
+        else:
+            weights = np.asarray(mask, dtype=np.float64)
+            if not weights.any():
+                return []
+            counts = self.matrix.T @ weights
+
+        k = min(top_n, int((counts > 0).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-counts, k - 1)[:k]
+        # Desempate alfabético: resultados estables entre ejecuciones
+        top = sorted(top, key=lambda i: (-counts[i], self.vocabulary[i]))
+        return [(self.vocabulary[i], int(counts[i])) for i in top]
+
+
+def _fingerprint(texts):
+    """Huella del corpus: md5 del texto concatenado (más rápido que hashear fila a fila)"""
+    return hashlib.md5('\x1f'.join(texts).encode('utf-8', 'replace')).hexdigest()
+
+
+def keyword_matrix(texts):
+    """
+    Matriz de palabras clave del corpus, reutilizada mientras el texto no cambie
+
+    Args:
+        texts: Serie de textos (una fila por noticia)
+
+    Returns:
+        KeywordMatrix
+    """
+    texts = pd.Series(texts).fillna('').astype(str).tolist()
+    key = _fingerprint(texts)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    vectorizer = CountVectorizer(lowercase=True, token_pattern=KEYWORD_PATTERN, dtype=np.int32)
+    try:
+        matrix = vectorizer.fit_transform(texts).tocsc()
+        vocabulary = vectorizer.get_feature_names_out()
+    except ValueError:
+        # Corpus sin ninguna palabra válida
+        matrix, vocabulary = None, np.array([], dtype=object)
+
+    if matrix is not None:
+        # Stopwords filtradas sobre el vocabulario (con o sin tilde), no por documento
+        keep = np.array([_strip_accents(w) not in KEYWORD_STOPWORDS for w in vocabulary], dtype=bool)
+        matrix = matrix[:, np.flatnonzero(keep)].tocsr()
+        vocabulary = vocabulary[keep]
+    else:
+        matrix = sp.csr_matrix((len(texts), 0), dtype=np.int32)
+
+    result = KeywordMatrix(matrix, vocabulary, key)
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def top_keywords(texts, mask=None, top_n=15):
+    """Atajo: top-N de palabras clave de un corpus (con filtro opcional)"""
+    return keyword_matrix(texts).top_keywords(mask, top_n)
@@ -0,0 +1,431 @@
+"""
+Enrutador de modelos Gemini con estado de salud persistente
+Envía cada petición al modelo sano más rápido y evita los que ya fallaron (404 / cuota)
+"""
+import google.generativeai as genai
+import json
+import os
+import re
+import threading
+import time
+import logging
+from src.rate_limiter import get_rate_limiter, is_rate_limit_error, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Candidatos por defecto ordenados por COSTO y VELOCIDAD (Flash < Pro)
+DEFAULT_CANDIDATES = [
+    "gemini-2.0-flash-exp",    # Experimental pero más barato (prioridad 1)
+    "gemini-2.0-flash",        # Modelo estable y económico (prioridad 2)
+    "gemini-1.5-flash",        # Fallback flash económico
+    "gemini-1.5-flash-latest", # Última versión flash
+]
+
+# Sufijos que no cambian el comportamiento del modelo base (exp, latest, 001, preview-MM-DD...)
+_FAMILY_SUFFIX_RE = re.compile(r'(-(exp|latest|preview|\d{3,4}|\d{2}-\d{2}))+$')
+
+
+def model_family(model_name):
+    """
+    Familia de un modelo, p. ej. "gemini-2.0-flash-exp" -> "gemini-2.0-flash"
+
+    Los resultados en caché se invalidan al cambiar de familia, no de variante.
+    """
+    if not model_name:
+        return None
+    name = model_name.split("/")[-1]
+    return _FAMILY_SUFFIX_RE.sub("", name)
+
+
+class ModelRouter:
+    def __init__(self, state_path="cache/model_health.json", candidates=None, rate_limiter=None,
+                 not_found_ttl=24 * 3600, models_list_ttl=6 * 3600, models_list_error_ttl=300,
+                 ewma_alpha=0.3, save_interval=5.0, clock=time.time):
+        """
+        Inicializa el enrutador de modelos
+
+        Args:
+            state_path: Archivo JSON donde se persiste la salud de los modelos
+                        (compartido entre reruns de Streamlit y entre procesos)
+            candidates: Lista base de modelos en orden de preferencia
+            rate_limiter: Limitador de tasa (por defecto el compartido del proceso)
+            not_found_ttl: Segundos que un modelo con 404 queda excluido
+            models_list_ttl: Vigencia en segundos de la lista de modelos de list_models
+            models_list_error_ttl: Vigencia en segundos de un list_models fallido
+            ewma_alpha: Peso de la última observación en la media móvil de latencia/errores
+            save_interval: Segundos mínimos entre escrituras del estado a disco
+            clock: Reloj de pared (inyectable para tests)
+        """
+        self.state_path = state_path
+        self.candidates = list(candidates or DEFAULT_CANDIDATES)
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.not_found_ttl = not_found_ttl
+        self.models_list_ttl = models_list_ttl
+        self.models_list_error_ttl = models_list_error_ttl
+        self.ewma_alpha = ewma_alpha
+        self.save_interval = save_interval
+        self.clock = clock
+
+        self._lock = threading.RLock()
+        self._health = {}
+        self._available = {"models": [], "fetched_at": 0.0, "ok": False}
+        self._model_objects = {}
+        self._state_mtime = 0.0
+        self._last_save = 0.0
+
+        if os.path.dirname(state_path):
+            os.makedirs(os.path.dirname(state_path), exist_ok=True)
+        self._load()
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _new_health():
+        return {
+            "latency_ewma": None,
+            "error_rate": 0.0,
+            "successes": 0,
+            "failures": 0,
+            "not_found_until": 0.0,
+            "quota_until": 0.0,
+            "updated_at": 0.0,
+        }
+
+    def _load(self):
+        """Carga el estado desde disco, conservando la entrada más reciente por modelo"""
+        try:
+            mtime = os.path.getmtime(self.state_path)
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        with self._lock:
+            for name, entry in data.get("models", {}).items():
+                current = self._health.get(name)
+                if current is None or entry.get("updated_at", 0) > current["updated_at"]:
+                    merged = self._new_health()
+                    merged.update(entry)
+                    self._health[name] = merged
+
+            available = data.get("available_models")
+            if available and available.get("fetched_at", 0) > self._available["fetched_at"]:
+                self._available = available
+
+            self._state_mtime = mtime
+
+    def _maybe_reload(self):
+        """Recarga el estado si otro proceso lo actualizó"""
+        try:
+            if os.path.getmtime(self.state_path) > self._state_mtime:
+                self._load()
+        except OSError:
+            pass
+
+    def _save(self, force=False):
+        """Escribe el estado a disco de forma atómica (limitado a una vez cada save_interval)"""
+        now = self.clock()
+        if not force and now - self._last_save < self.save_interval:
+            return
+
+        with self._lock:
+            data = {"models": self._health, "available_models": self._available}
+            tmp_path = f"{self.state_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.state_path)
+                self._state_mtime = os.path.getmtime(self.state_path)
+                self._last_save = now
+            except OSError as e:
+                logger.debug(f"No se pudo guardar el estado de modelos: {e}")
+
+    def _entry(self, model_name):
+        """Obtiene (o crea) la entrada de salud de un modelo. Requiere tener el lock."""
+        entry = self._health.get(model_name)
+        if entry is None:
+            entry = self._new_health()
+            self._health[model_name] = entry
+        return entry
+
+    # ------------------------------------------------------------------
+    # Modelos disponibles y objetos construidos
+    # ------------------------------------------------------------------
+    def get_available_models(self, fetcher):
+        """
+        Lista de modelos de la API, cacheada para todo el proceso y entre procesos
+
+        Args:
+            fetcher: Función sin argumentos que consulta genai.list_models y
+                     retorna nombres cortos (solo se llama si la caché venció)
+
+        Returns:
+            Lista de nombres cortos de modelos
+        """
+        self._maybe_reload()
+        with self._lock:
+            ttl = self.models_list_ttl if self._available["ok"] else self.models_list_error_ttl
+            if self.clock() - self._available["fetched_at"] < ttl:
+                return list(self._available["models"])
+
+        models = fetcher() or []
+        with self._lock:
+            self._available = {"models": list(models), "fetched_at": self.clock(), "ok": bool(models)}
+        self._save(force=True)
+        return list(models)
+
+    def get_model(self, model_name, generation_config=None, safety_settings=None):
+        """Retorna un GenerativeModel reutilizable para esta combinación de configuración"""
+        key = (
+            model_name,
+            json.dumps(generation_config or {}, sort_keys=True),
+            repr(sorted((str(k), str(v)) for k, v in (safety_settings or {}).items())),
+        )
+        with self._lock:
+            model = self._model_objects.get(key)
+            if model is None:
+                model = genai.GenerativeModel(
+                    model_name,
+                    generation_config=generation_config,
+                    safety_settings=safety_settings,
+                )
+                self._model_objects[key] = model
+            return model
+
+    # ------------------------------------------------------------------
+    # Ranking y registro de resultados
+    # ------------------------------------------------------------------
+    def _candidate_pool(self, available_models=None):
+        """Candidatos en orden de preferencia, antes de aplicar la salud"""
+        pool = []
+        if available_models:
+            # Modelos detectados que funcionan bien (evitar experimentales con problemas de cuota)
+            preferred = [m for m in available_models
+                         if any(x in m for x in ["gemini-2.5-flash", "gemini-2.0-flash", "gemini-2.5-pro"])
+                         and "exp" not in m.lower()]
+            pool.extend(preferred[:3])
+        pool.extend(self.candidates)
+        if available_models:
+            stable = [m for m in available_models
+                      if not any(x in m.lower() for x in ["exp", "preview", "experimental"])
+                      and any(x in m for x in ["gemini-2.5", "gemini-2.0", "gemini-pro"])]
+            pool.extend(stable[:3])
+        return list(dict.fromkeys(pool))  # Eliminar duplicados conservando el orden
+
+    def candidate_families(self, available_models=None):
+        """
+        Familias de los candidatos existentes (sin 404 vigente) en orden de preferencia
+
+        Cualquiera de ellas puede responder como respaldo, así que sus resultados
+        en caché siguen vigentes; solo quedan obsoletos los de modelos retirados.
+        """
+        self._maybe_reload()
+        now = self.clock()
+        with self._lock:
+            names = [name for name in self._candidate_pool(available_models)
+                     if name not in self._health or self._health[name]["not_found_until"] <= now]
+        return list(dict.fromkeys(model_family(name) for name in names))
+
+    def preferred_family(self, available_models=None):
+        """
+        Familia del primer candidato existente en orden de preferencia
+
+        A diferencia de ranked_candidates no depende de la latencia ni de la cuota,
+        así que solo cambia al desplegar o retirar modelos. Se usa para versionar el caché.
+        """
+        families = self.candidate_families(available_models)
+        return families[0] if families else None
+
+    def ranked_candidates(self, available_models=None):
+        """
+        Modelos en el orden en que deben intentarse
+
+        Los modelos con 404 vigente se excluyen. Los sanos se ordenan por latencia
+        media penalizada por tasa de error; los que no tienen mediciones conservan
+        el orden de preferencia. Los modelos sin cuota van al final.
+
+        Args:
+            available_models: Modelos detectados con list_models (opcional)
+
+        Returns:
+            Lista de nombres de modelos
+        """
+        pool = self._candidate_pool(available_models)
+
+        self._maybe_reload()
+        now = self.clock()
+        healthy = []
+        cooling = []
+
+        with self._lock:
+            for position, name in enumerate(pool):
+                entry = self._health.get(name) or self._new_health()
+                if entry["not_found_until"] > now:
+                    continue
+
+                if entry["quota_until"] > now or not self.rate_limiter.is_available(name):
+                    cooling.append((entry["quota_until"], position, name))
+                    continue
+
+                if entry["latency_ewma"] is None:
+                    # Sin mediciones: prioridad según posición en la lista de preferencia
+                    score = 1.0 + 0.1 * position
+                else:
+                    score = entry["latency_ewma"] * (1 + 4 * entry["error_rate"])
+                healthy.append((score, position, name))
+
+        return [name for _, _, name in sorted(healthy)] + [name for _, _, name in sorted(cooling)]
+
+    def record_success(self, model_name, latency):
+        """Registra una respuesta válida y su latencia en segundos"""
+        with self._lock:
+            entry = self._entry(model_name)
+            a = self.ewma_alpha
+            entry["latency_ewma"] = latency if entry["latency_ewma"] is None else (
+                a * latency + (1 - a) * entry["latency_ewma"])
+            entry["error_rate"] = (1 - a) * entry["error_rate"]
+            entry["successes"] += 1
+            entry["not_found_until"] = 0.0
+            entry["quota_until"] = 0.0
+            entry["updated_at"] = self.clock()
+        self._save()
+
+    def record_failure(self, model_name, kind="error", cooldown=None):
+        """
+        Registra un fallo del modelo
+
+        Args:
+            model_name: Modelo que falló
+            kind: "not_found" (404), "quota" (429 / cuota) o "error" (otros)
+            cooldown: Segundos sin enviar peticiones al modelo (solo para "quota")
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entry(model_name)
+            a = self.ewma_alpha
+            entry["error_rate"] = a + (1 - a) * entry["error_rate"]
+            entry["failures"] += 1
+            if kind == "not_found":
+                entry["not_found_until"] = now + self.not_found_ttl
+            elif kind == "quota":
+                entry["quota_until"] = now + (cooldown if cooldown is not None else 60.0)
+            entry["updated_at"] = now
+        self._save(force=kind in ("not_found", "quota"))
+
+    def get_health(self):
+        """Copia del estado de salud por modelo (para diagnóstico)"""
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._health.items()}
+
+    # ------------------------------------------------------------------
+    # Generación
+    # ------------------------------------------------------------------
+    def generate(self, prompt, generation_config=None, safety_settings=None,
+                 available_models=None, max_wait=15, **generate_kwargs):
+        """
+        Envía el prompt al modelo sano más rápido, pasando al siguiente si falla
+
+        Args:
+            prompt: Prompt completo
+            generation_config: Configuración de generación del modelo
+            safety_settings: Configuración de seguridad del modelo
+            available_models: Modelos detectados con list_models (opcional)
+            max_wait: Segundos máximos esperando cupo en un modelo antes de probar otro
+            **generate_kwargs: Argumentos extra para generate_content
+
+        Returns:
+            Tupla (model_name, response) o (None, None) si todos los modelos fallan.
+            Con stream=True, response es un generador de fragmentos que registra la
+            salud del modelo al terminar de consumirse
+        """
+        tokens = estimate_tokens(prompt)
+
+        for model_name in self.ranked_candidates(available_models):
+            if not self.rate_limiter.acquire(model_name, tokens=tokens, timeout=max_wait):
+                logger.warning(f"⏳ {model_name} sin cupo disponible. Probando siguiente modelo...")
+                continue
+
+            try:
+                model = self.get_model(model_name, generation_config, safety_settings)
+                start = time.monotonic()
+                response = model.generate_content(prompt, **generate_kwargs)
+
+                if generate_kwargs.get("stream"):
+                    # El éxito (y la latencia real) se registra al agotar el stream
+                    return model_name, self._tracked_stream(model_name, response, start)
+
+                if response.parts and response.text:
+                    self.record_success(model_name, time.monotonic() - start)
+                    self.rate_limiter.report_success(model_name)
+                    logger.debug(f"✅ Modelo {model_name} funcionó correctamente")
+                    return model_name, response
+
+                logger.warning(f"⚠️ Modelo {model_name} no retornó contenido válido")
+                self.record_failure(model_name, "error")
+
+            except Exception as e:
+                kind = self._record_exception(model_name, e)
+                if kind == "not_found":
+                    logger.warning(f"⚠️ Modelo {model_name} no encontrado (404). Se excluye por {self.not_found_ttl // 3600}h")
+                elif kind == "quota":
+                    logger.warning(f"⚠️ Cuota agotada en {model_name}. Probando siguiente modelo...")
+                else:
+                    logger.error(f"❌ Error en {model_name}: {str(e)[:200]}")
+
+        return None, None
+
+    def _record_exception(self, model_name, error):
+        """Clasifica un error de la API, actualiza la salud del modelo y devuelve el tipo de fallo"""
+        error_msg = str(error)
+        if "404" in error_msg or "not found" in error_msg.lower():
+            self.record_failure(model_name, "not_found")
+            return "not_found"
+        if is_rate_limit_error(error_msg):
+            # Enfriar solo este modelo (backoff con jitter); los demás siguen disponibles
+            delay = self.rate_limiter.report_rate_limited(model_name)
+            self.record_failure(model_name, "quota", cooldown=delay)
+            return "quota"
+        self.record_failure(model_name, "error")
+        return "error"
+
+    def _tracked_stream(self, model_name, response, start):
+        """
+        Entrega los fragmentos de un stream y registra la salud del modelo al terminar
+
+        La latencia es la de la respuesta completa. Los errores que llegan durante
+        la iteración (429, 5xx) cuentan como fallos del modelo y se propagan; si el
+        consumidor abandona el stream antes del final no se registra nada.
+        """
+        chunks = 0
+        try:
+            for chunk in response:
+                chunks += 1
+                yield chunk
+        except Exception as e:
+            kind = self._record_exception(model_name, e)
+            logger.warning(f"⚠️ Stream de {model_name} interrumpido ({kind}): {str(e)[:200]}")
+            raise
+
+        if chunks:
+            self.record_success(model_name, time.monotonic() - start)
+            self.rate_limiter.report_success(model_name)
+        else:
+            logger.warning(f"⚠️ Modelo {model_name} no retornó contenido en el stream")
+            self.record_failure(model_name, "error")
+
+
+_shared_router = None
+_shared_lock = threading.Lock()
+
+
+def get_model_router():
+    """
+    Enrutador único del proceso. Al vivir a nivel de módulo sobrevive a los reruns
+    de Streamlit; el archivo de estado lo comparte con otros procesos.
+    """
+    global _shared_router
+    with _shared_lock:
+        if _shared_router is None:
+            _shared_router = ModelRouter()
+        return _shared_router
@@ -0,0 +1,528 @@
+"""
+Índice de recuperación incremental y persistente para el chatbot RAG
+Huella del DataFrame para no reconstruir en cada rerun, vectores hash que se
+añaden por bloques con IDF actualizada y matriz dispersa guardada en disco
+como base más segmentos de solo-anexado que se fusionan periódicamente.
+Ranking BM25 sobre listas invertidas con tokens en español, fusionado con
+embeddings locales opcionales servidos por un almacén IVF en disco
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from src.text_es import tokenize
+from src.vector_store import IVFVectorStore, embedder_name, normalize_rows, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+# Columnas que definen una noticia del índice (si cambia alguna, es otro documento)
+DOC_COLUMNS = ['titular', 'cuerpo', 'sentimiento_ia', 'explicacion_ia', 'fecha']
+
+# Espacio de hashing: 2^18 columnas, colisiones despreciables para noticias
+N_FEATURES = 2 ** 18
+
+# Cambiar si cambia el análisis de texto: invalida los índices guardados
+ANALYZER_VERSION = "es-stem-v1"
+
+# Parámetros BM25 estándar
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Constante de Reciprocal Rank Fusion (BM25 + embeddings)
+RRF_K = 60
+
+# Segmentos anexados que se acumulan en disco antes de fusionarlos con la base
+MAX_SEGMENTS = 8
+
+
+def _text_columns(df):
+    """Columnas de DOC_COLUMNS como texto (faltantes = vacías)"""
+    return pd.DataFrame({
+        col: df[col].astype(object).fillna('').astype(str) if col in df.columns else pd.Series('', index=df.index)
+        for col in DOC_COLUMNS
+    })
+
+
+def row_hashes(df):
+    """Hash estable (uint64) por fila sobre DOC_COLUMNS, vectorizado"""
+    return pd.util.hash_pandas_object(_text_columns(df), index=False).to_numpy(dtype=np.uint64)
+
+
+def dataframe_fingerprint(hashes):
+    """Huella del DataFrame completo a partir de los hashes de fila (respeta el orden)"""
+    return hashlib.md5(np.ascontiguousarray(hashes).tobytes()).hexdigest()
+
+
+def _document_frequency(counts):
+    """Documentos que contienen cada término"""
+    return np.diff(counts.tocsc().indptr).astype(np.int32)
+
+
+class IndexView:
+    """Subconjunto del índice correspondiente a un DataFrame concreto (filas activas)"""
+
+    def __init__(self, index, positions, source_ids, fingerprint=None):
+        self.index = index
+        self.positions = positions
+        self.source_ids = source_ids
+        self.fingerprint = fingerprint
+        self._postings = None
+        self._length_norm = None
+        self._row_of = None
+        self._records = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _inverted(self):
+        """
+        Listas invertidas de las filas activas (matriz CSC: una columna por término)
+        y normalización de longitud BM25, construidas una vez por vista
+        """
+        if self._postings is None:
+            counts = self.index.counts[self.positions]
+            lengths = np.asarray(counts.sum(axis=1), dtype=np.float32).ravel()
+            avg_length = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+            self._length_norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths / avg_length)
+            self._postings = counts.tocsc()
+        return self._postings
+
+    def records(self):
+        """Noticias activas como lista de dicts (se construye una vez por vista)"""
+        if self._records is None:
+            docs = self.index.docs.iloc[self.positions]
+            self._records = [
+                {
+                    'id': source_id,
+                    'titular': titular,
+                    'cuerpo': cuerpo,
+                    'sentimiento': sentimiento,
+                    'explicacion': explicacion,
+                    'fecha': fecha,
+                    'text_full': f"{titular} {cuerpo} {explicacion}",
+                }
+                for source_id, titular, cuerpo, sentimiento, explicacion, fecha in zip(
+                    self.source_ids, docs['titular'], docs['cuerpo'], docs['sentimiento_ia'],
+                    docs['explicacion_ia'], docs['fecha']
+                )
+            ]
+        return self._records
+
+    def bm25(self, query):
+        """
+        Puntajes BM25 de la consulta recorriendo solo las listas de sus términos
+
+        Returns:
+            (filas candidatas, puntajes); el costo depende de los postings de la
+            consulta y no del tamaño del corpus
+        """
+        postings = self._inverted()
+        query_terms = np.unique(self.index.vectorize([query]).indices)
+        idf = self.index.idf()
+
+        rows, weights = [], []
+        for term in query_terms:
+            start, end = postings.indptr[term], postings.indptr[term + 1]
+            if start == end:
+                continue
+            term_rows = postings.indices[start:end]
+            tf = postings.data[start:end]
+            rows.append(term_rows)
+            weights.append(idf[term] * tf * (BM25_K1 + 1.0) / (tf + self._length_norm[term_rows]))
+
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        candidates, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        return candidates, np.bincount(inverse, weights=np.concatenate(weights))
+
+    def dense(self, query, k):
+        """
+        Vecinos por embeddings dentro de la vista (búsqueda aproximada en el almacén)
+
+        Returns:
+            (filas de la vista, similitudes) ordenadas de mayor a menor
+        """
+        if self._row_of is None:
+            self._row_of = {}
+            for row, position in enumerate(self.positions.tolist()):
+                self._row_of.setdefault(position, row)
+        # El almacén cubre todo el índice: se piden más vecinos si la vista es un subconjunto
+        overfetch = min(k * -(-self.index.counts.shape[0] // len(self.positions)), 10000)
+        positions, scores = self.index.vector_search(query, overfetch)
+        rows, kept = [], []
+        for position, score in zip(positions.tolist(), scores.tolist()):
+            row = self._row_of.get(position)
+            if row is not None and score > 0:
+                rows.append(row)
+                kept.append(score)
+                if len(rows) == k:
+                    break
+        return rows, kept
+
+    def search(self, query, top_k=3):
+        """
+        BM25 (fusionado por RRF con embeddings si hay modelo local)
+
+        Returns:
+            Lista de (posición en la vista, relevancia en [0, 1]) ordenada de mayor
+            a menor; la relevancia es relativa al mejor resultado
+        """
+        if not len(self.positions):
+            return []
+        candidates, scores = self.bm25(query)
+        pool = max(top_k * 10, 50)
+
+        if self.index.embedder is None:
+            if not len(candidates):
+                return []
+            top = top_k_indices(scores, top_k)
+            best = scores[top[0]]
+            return [(int(candidates[i]), float(scores[i] / best)) for i in top]
+
+        # Reciprocal Rank Fusion: el mejor rango de cada lista suma 1 / (RRF_K + rango)
+        fused = {}
+        for rank, i in enumerate(top_k_indices(scores, pool)):
+            fused[int(candidates[i])] = 1.0 / (RRF_K + rank + 1)
+        dense_rows, _ = self.dense(query, pool)
+        for rank, row in enumerate(dense_rows):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (RRF_K + rank + 1)
+        if not fused:
+            return []
+
+        rows = np.fromiter(fused.keys(), dtype=np.int64, count=len(fused))
+        fused_scores = np.fromiter(fused.values(), dtype=np.float64, count=len(fused))
+        top = top_k_indices(fused_scores, top_k)
+        best = fused_scores[top[0]]
+        return [(int(rows[i]), float(fused_scores[i] / best)) for i in top]
+
+
+class NewsIndex:
+    def __init__(self, index_dir="cache/news_index", max_documents=200000, max_views=8, embedder=None,
+                 vector_store=None):
+        """
+        Inicializa el índice persistente
+
+        Args:
+            index_dir: Carpeta con la matriz dispersa, frecuencias y metadatos
+            max_documents: Al superarlo se reconstruye solo con el DataFrame actual
+            max_views: Vistas (DataFrames distintos) que se mantienen en memoria
+            embedder: Función textos -> matriz (n, d) para la búsqueda híbrida, o None
+            vector_store: Almacén de embeddings (por defecto IVF mmap en index_dir/vectors)
+        """
+        self.index_dir = index_dir
+        self.max_documents = max_documents
+        self.max_views = max_views
+        self.embedder = embedder
+        self.vector_store = vector_store or IVFVectorStore(os.path.join(index_dir, "vectors"))
+        # Tokens en español con stemming (sin tildes ni stopwords) al espacio de hashing
+        self.vectorizer = HashingVectorizer(
+            n_features=N_FEATURES,
+            alternate_sign=False,
+            norm=None,
+            analyzer=tokenize,
+        )
+
+        self._lock = threading.RLock()
+        self._views = OrderedDict()
+        self._loaded_mtime = None
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self.counts = sp.csr_matrix((0, N_FEATURES), dtype=np.float32)
+        self.doc_freq = np.zeros(N_FEATURES, dtype=np.int32)
+        self.docs = pd.DataFrame({col: pd.Series(dtype=str) for col in DOC_COLUMNS})
+        self.hash_to_position = {}
+        self.version = 0
+        self.uid = uuid.uuid4().hex  # Identifica esta construcción del índice (posiciones válidas)
+        self._idf = None
+        self._views.clear()
+        # Segmentos en disco posteriores a la base; tras reconstruir, la base en disco no vale
+        self._segments = []
+        self._base_stale = True
+        self._open_vector_store()
+
+    def _paths(self):
+        return {
+            "meta": os.path.join(self.index_dir, "meta.json"),
+            "counts": os.path.join(self.index_dir, "counts.npz"),
+            "doc_freq": os.path.join(self.index_dir, "doc_freq.npy"),
+            "docs": os.path.join(self.index_dir, "docs.parquet"),
+        }
+
+    def _segment_paths(self, name):
+        return (os.path.join(self.index_dir, f"{name}.npz"),
+                os.path.join(self.index_dir, f"{name}.parquet"))
+
+    def _load(self):
+        """Carga el índice de disco si existe (otro proceso o sesión anterior)"""
+        paths = self._paths()
+        if not os.path.exists(paths["meta"]):
+            return
+        try:
+            with open(paths["meta"], "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("n_features") != N_FEATURES or meta.get("analyzer") != ANALYZER_VERSION:
+                return
+            counts = sp.load_npz(paths["counts"]).tocsr()
+            doc_freq = np.load(paths["doc_freq"])
+            docs = pd.read_parquet(paths["docs"])
+            segments = meta.get("segments", [])
+            if segments:
+                all_counts, all_docs = [counts], [docs]
+                for name in segments:
+                    counts_path, docs_path = self._segment_paths(name)
+                    segment_counts = sp.load_npz(counts_path).tocsr()
+                    doc_freq = doc_freq + _document_frequency(segment_counts)
+                    all_counts.append(segment_counts)
+                    all_docs.append(pd.read_parquet(docs_path))
+                counts = sp.vstack(all_counts, format='csr')
+                docs = pd.concat(all_docs, ignore_index=True)
+            hashes = docs.pop("row_hash").to_numpy(dtype=np.uint64)
+        except Exception as e:
+            logger.warning(f"⚠️ Índice de noticias ilegible, se reconstruirá: {e}")
+            return
+
+        self._reset()
+        self.counts = counts
+        self.doc_freq = doc_freq
+        self.docs = docs
+        self.hash_to_position = {int(h): i for i, h in enumerate(hashes)}
+        self.version = meta.get("version", 0)
+        self.uid = meta.get("uid", self.uid)
+        self._segments = list(segments)
+        self._base_stale = False
+        self._open_vector_store()
+        self._loaded_mtime = os.path.getmtime(paths["meta"])
+        logger.info(f"📚 Índice de noticias cargado de disco: {counts.shape[0]} documentos")
+
+    def _maybe_reload(self):
+        meta_path = self._paths()["meta"]
+        try:
+            mtime = os.path.getmtime(meta_path)
+        except OSError:
+            return
+        if self._loaded_mtime is None or mtime > self._loaded_mtime:
+            self._load()
+
+    def _atomic_write(self, path, writer):
+        fd, tmp_path = tempfile.mkstemp(dir=self.index_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            writer(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _npz_writer(matrix):
+        # save_npz añade extensión si falta: se escribe a un archivo abierto
+        def write(path):
+            with open(path, "wb") as f:
+                sp.save_npz(f, matrix)
+        return write
+
+    def _save(self, new_counts=None, new_docs=None, new_hashes=None):
+        """
+        Persiste el índice: lo añadido se escribe como segmento (solo las filas nuevas)
+        y la base completa se reescribe tras reconstruir o al acumular MAX_SEGMENTS
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        obsolete = []
+        if new_counts is None or self._base_stale or len(self._segments) >= MAX_SEGMENTS:
+            obsolete = self._segments
+            self._write_base()
+            self._segments = []
+            self._base_stale = False
+        else:
+            name = f"seg_{self.uid[:8]}_{self.version:06d}"
+            counts_path, docs_path = self._segment_paths(name)
+            segment_docs = new_docs.reset_index(drop=True).assign(row_hash=np.asarray(new_hashes, dtype=np.uint64))
+            self._atomic_write(counts_path, self._npz_writer(new_counts))
+            self._atomic_write(docs_path, lambda path: segment_docs.to_parquet(path, index=False))
+            self._segments.append(name)
+        self._write_meta()
+
+        # Los segmentos fusionados se borran cuando meta.json ya no los referencia
+        for name in obsolete:
+            for path in self._segment_paths(name):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _write_base(self):
+        paths = self._paths()
+        hashes = np.empty(len(self.hash_to_position), dtype=np.uint64)
+        for h, position in self.hash_to_position.items():
+            hashes[position] = h
+        docs = self.docs.assign(row_hash=hashes)
+
+        def save_doc_freq(path):
+            with open(path, "wb") as f:
+                np.save(f, self.doc_freq)
+
+        self._atomic_write(paths["counts"], self._npz_writer(self.counts))
+        self._atomic_write(paths["doc_freq"], save_doc_freq)
+        self._atomic_write(paths["docs"], lambda path: docs.to_parquet(path, index=False))
+
+    def _write_meta(self):
+        # meta.json al final: marca el índice (base + segmentos) como completo para los lectores
+        paths = self._paths()
+        meta = {
+            "version": self.version,
+            "n_documents": int(self.counts.shape[0]),
+            "n_features": N_FEATURES,
+            "analyzer": ANALYZER_VERSION,
+            "uid": self.uid,
+            "segments": self._segments,
+        }
+
+        def save_meta(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+        self._atomic_write(paths["meta"], save_meta)
+        self._loaded_mtime = os.path.getmtime(paths["meta"])
+
+    def vectorize(self, texts):
+        """Conteos de términos en el espacio de hashing"""
+        return self.vectorizer.transform(texts).astype(np.float32).tocsr()
+
+    def idf(self):
+        """IDF de BM25 (siempre positiva) con las frecuencias de todo el corpus indexado"""
+        if self._idf is None:
+            n_docs = self.counts.shape[0]
+            self._idf = np.log1p((n_docs - self.doc_freq + 0.5) / (self.doc_freq + 0.5)).astype(np.float32)
+        return self._idf
+
+    def _open_vector_store(self):
+        """Los vectores guardados solo valen para el mismo modelo y la misma construcción del índice"""
+        if self.embedder is not None:
+            self.vector_store.open(f"{embedder_name(self.embedder)}:{self.uid}")
+
+    def set_embedder(self, embedder):
+        """Activa (o desactiva con None) la búsqueda híbrida con embeddings"""
+        with self._lock:
+            if embedder is not self.embedder:
+                self.embedder = embedder
+                self._open_vector_store()
+
+    def embed_query(self, query):
+        return normalize_rows(self.embedder([query]))[0]
+
+    def _ensure_vectors(self, chunk_size=1024):
+        """Embebe solo las filas del índice que aún no están en el almacén"""
+        self.vector_store.reload_if_changed()
+        start, n_docs = len(self.vector_store), self.counts.shape[0]
+        if start >= n_docs:
+            return
+        docs = self.docs.iloc[start:n_docs]
+        texts = (docs['titular'] + ' ' + docs['cuerpo'] + ' ' + docs['explicacion_ia']).tolist()
+        vectors = np.vstack([
+            normalize_rows(self.embedder(texts[i:i + chunk_size])) for i in range(0, len(texts), chunk_size)
+        ])
+        self.vector_store.add(vectors)
+        logger.info(f"🧭 Embeddings: +{len(vectors)} noticias (total {len(self.vector_store)})")
+
+    def vector_search(self, query, k):
+        """
+        Vecinos aproximados de la consulta en todo el índice
+
+        Returns:
+            (posiciones del índice, similitudes) ordenadas de mayor a menor
+        """
+        with self._lock:
+            self._ensure_vectors()
+            return self.vector_store.search(self.embed_query(query), k)
+
+    def _append(self, new_docs, new_hashes):
+        """Añade documentos nuevos, actualiza las frecuencias de documento y retorna sus conteos"""
+        texts = (new_docs['titular'] + ' ' + new_docs['cuerpo'] + ' ' + new_docs['explicacion_ia']).tolist()
+        new_counts = self.vectorize(texts)
+
+        self.doc_freq += _document_frequency(new_counts)
+
+        start = self.counts.shape[0]
+        self.counts = sp.vstack([self.counts, new_counts], format='csr')
+        self.docs = pd.concat([self.docs, new_docs.reset_index(drop=True)], ignore_index=True)
+        for offset, h in enumerate(new_hashes):
+            self.hash_to_position[int(h)] = start + offset
+        self.version += 1
+        self._idf = None
+        return new_counts
+
+    def sync(self, df):
+        """
+        Sincroniza el índice con un DataFrame y retorna su vista
+
+        Si la huella coincide con una vista en memoria no se hace ningún trabajo;
+        si hay filas nuevas solo esas se vectorizan y se añaden.
+
+        Args:
+            df: DataFrame con noticias analizadas
+
+        Returns:
+            IndexView con las filas del DataFrame en su orden original
+        """
+        hashes = row_hashes(df)
+        fingerprint = dataframe_fingerprint(hashes)
+
+        with self._lock:
+            self._maybe_reload()
+            view = self._views.get(fingerprint)
+            if view is not None:
+                self._views.move_to_end(fingerprint)
+                return view
+
+            unique_hashes = list(dict.fromkeys(int(h) for h in hashes))
+            new_hashes = [h for h in unique_hashes if h not in self.hash_to_position]
+
+            if self.counts.shape[0] + len(new_hashes) > self.max_documents:
+                logger.info("♻️ Índice de noticias al límite: se reconstruye con el DataFrame actual")
+                self._reset()
+                new_hashes = unique_hashes
+
+            if new_hashes:
+                text_df = _text_columns(df)
+                first_row = {}
+                for row, h in enumerate(hashes):
+                    first_row.setdefault(int(h), row)
+                new_docs = text_df.iloc[[first_row[h] for h in new_hashes]]
+                new_counts = self._append(new_docs, new_hashes)
+                self._save(new_counts, new_docs, new_hashes)
+                logger.info(f"📚 Índice de noticias: +{len(new_hashes)} documentos (total {self.counts.shape[0]})")
+
+            positions = np.fromiter((self.hash_to_position[int(h)] for h in hashes), dtype=np.int64, count=len(hashes))
+            view = IndexView(self, positions, list(df.index), fingerprint)
+            self._views[fingerprint] = view
+            while len(self._views) > self.max_views:
+                self._views.popitem(last=False)
+            return view
+
+
+_shared_index = None
+_shared_lock = threading.Lock()
+
+
+def get_news_index():
+    """
+    Índice único del proceso, compartido por todas las sesiones de Streamlit.
+    Persistido en disco para reutilizarse entre reinicios y procesos.
+    """
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            _shared_index = NewsIndex()
+        return _shared_index
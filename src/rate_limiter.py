@@ -0,0 +1,240 @@
+"""
+Limitador de tasa compartido para todas las llamadas a Gemini
+Token bucket por modelo (RPM/TPM) con backoff y jitter aislado por modelo
+"""
+import time
+import random
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cuotas por modelo (plan gratuito de Gemini). RPM = peticiones/min, TPM = tokens/min
+DEFAULT_MODEL_LIMITS = {
+    "gemini-2.0-flash-exp": {"rpm": 10, "tpm": 250000},
+    "gemini-2.0-flash": {"rpm": 15, "tpm": 1000000},
+    "gemini-1.5-flash": {"rpm": 15, "tpm": 1000000},
+    "gemini-1.5-flash-latest": {"rpm": 15, "tpm": 1000000},
+    "gemini-2.5-flash": {"rpm": 10, "tpm": 250000},
+    "gemini-2.5-pro": {"rpm": 5, "tpm": 250000},
+}
+
+# Cuota para modelos no listados (p. ej. detectados con list_models)
+DEFAULT_LIMITS = {"rpm": 10, "tpm": 250000}
+
+
+class TokenBucket:
+    def __init__(self, capacity, refill_per_second, clock=time.monotonic):
+        """
+        Cubeta de tokens que se rellena de forma continua
+
+        Args:
+            capacity: Máximo de tokens acumulables (ráfaga permitida)
+            refill_per_second: Tokens que se recuperan por segundo
+            clock: Reloj monotónico (inyectable para tests)
+        """
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.last_refill = clock()
+
+    def _refill(self):
+        now = self.clock()
+        elapsed = now - self.last_refill
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.last_refill = now
+
+    def available(self):
+        """Tokens disponibles en este momento"""
+        self._refill()
+        return self.tokens
+
+    def time_until(self, amount):
+        """Segundos hasta que haya `amount` tokens disponibles"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount):
+        """Descuenta tokens (el llamador debe verificar antes con time_until)"""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    def __init__(self, limits=None, default_limits=None, base_backoff=2.0,
+                 max_backoff=60.0, clock=time.monotonic, sleep=time.sleep):
+        """
+        Inicializa el limitador de tasa
+
+        Args:
+            limits: Dict {modelo: {"rpm": int, "tpm": int}} (usa DEFAULT_MODEL_LIMITS si es None)
+            default_limits: Cuota para modelos sin configuración explícita
+            base_backoff: Espera base en segundos tras el primer 429 de un modelo
+            max_backoff: Espera máxima tras errores 429 consecutivos
+            clock: Reloj monotónico (inyectable para tests)
+            sleep: Función de espera (inyectable para tests)
+        """
+        self.limits = dict(DEFAULT_MODEL_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self.default_limits = default_limits or DEFAULT_LIMITS
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.sleep = sleep
+
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def _state(self, model_name):
+        """Obtiene (o crea) el estado del modelo. Requiere tener el lock."""
+        state = self._models.get(model_name)
+        if state is None:
+            cfg = self.limits.get(model_name, self.default_limits)
+            state = {
+                "requests": TokenBucket(cfg["rpm"], cfg["rpm"] / 60.0, self.clock),
+                "tokens": TokenBucket(cfg["tpm"], cfg["tpm"] / 60.0, self.clock),
+                "blocked_until": 0.0,
+                "consecutive_429": 0,
+                "total_429": 0,
+            }
+            self._models[model_name] = state
+        return state
+
+    def _wait_time_locked(self, state, tokens):
+        cooldown = max(0.0, state["blocked_until"] - self.clock())
+        return max(
+            cooldown,
+            state["requests"].time_until(1),
+            state["tokens"].time_until(tokens),
+        )
+
+    def wait_time(self, model_name, tokens=1):
+        """Segundos que habría que esperar para enviar una petición de `tokens` tokens"""
+        with self._lock:
+            return self._wait_time_locked(self._state(model_name), tokens)
+
+    def is_available(self, model_name):
+        """True si el modelo no está en enfriamiento por un 429 reciente"""
+        with self._lock:
+            return self._state(model_name)["blocked_until"] <= self.clock()
+
+    def acquire(self, model_name, tokens=1, timeout=None):
+        """
+        Reserva cupo para una petición, esperando si es necesario
+
+        Args:
+            model_name: Modelo al que se enviará la petición
+            tokens: Tokens estimados de la petición
+            timeout: Espera máxima en segundos (None = sin límite, 0 = no esperar)
+
+        Returns:
+            True si se reservó el cupo, False si se superó el timeout
+        """
+        deadline = None if timeout is None else self.clock() + timeout
+
+        while True:
+            with self._lock:
+                state = self._state(model_name)
+                wait = self._wait_time_locked(state, tokens)
+                if wait <= 0:
+                    state["requests"].consume(1)
+                    state["tokens"].consume(tokens)
+                    return True
+
+            if deadline is not None and self.clock() + wait > deadline:
+                return False
+
+            # Jitter pequeño para que los hilos en espera no despierten a la vez
+            self.sleep(wait + random.uniform(0, 0.1))
+
+    def report_success(self, model_name):
+        """Registra una respuesta exitosa (reinicia el backoff del modelo)"""
+        with self._lock:
+            self._state(model_name)["consecutive_429"] = 0
+
+    def report_rate_limited(self, model_name, retry_after=None):
+        """
+        Registra un 429 / cuota agotada y pone en enfriamiento SOLO ese modelo
+
+        Args:
+            model_name: Modelo que devolvió el error
+            retry_after: Segundos indicados por la API, si se conocen
+
+        Returns:
+            Segundos de enfriamiento aplicados
+        """
+        with self._lock:
+            state = self._state(model_name)
+            state["consecutive_429"] += 1
+            state["total_429"] += 1
+
+            if retry_after is not None:
+                delay = float(retry_after)
+            else:
+                delay = self.base_backoff * (2 ** (state["consecutive_429"] - 1))
+            # Jitter ±50% para evitar reintentos sincronizados (thundering herd)
+            delay = min(self.max_backoff, delay) * random.uniform(0.5, 1.5)
+
+            state["blocked_until"] = max(state["blocked_until"], self.clock() + delay)
+            # Vaciar la cubeta: la API nos dice que no queda cuota en esta ventana
+            state["requests"].tokens = 0.0
+
+            logger.warning(f"⏳ {model_name} en enfriamiento {delay:.1f}s (429 consecutivos: {state['consecutive_429']})")
+        return delay
+
+    def headroom(self, model_name=None):
+        """
+        Cupo disponible por modelo
+
+        Args:
+            model_name: Modelo concreto o None para todos los modelos conocidos
+
+        Returns:
+            dict {modelo: {"rpm_available", "tpm_available", "cooldown_seconds", "total_429"}}
+        """
+        with self._lock:
+            names = [model_name] if model_name else sorted(set(self.limits) | set(self._models))
+            now = self.clock()
+            report = {}
+            for name in names:
+                state = self._state(name)
+                report[name] = {
+                    "rpm_available": int(state["requests"].available()),
+                    "tpm_available": int(state["tokens"].available()),
+                    "cooldown_seconds": round(max(0.0, state["blocked_until"] - now), 1),
+                    "total_429": state["total_429"],
+                }
+            return report
+
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Limitador único del proceso, compartido por el analizador, el chatbot y el radar web.
+    Al vivir a nivel de módulo sobrevive a los reruns de Streamlit.
+    """
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
+
+
+def estimate_tokens(text):
+    """Estimación rápida de tokens de un prompt (~4 caracteres por token)"""
+    return max(1, len(text) // 4)
+
+
+def is_rate_limit_error(error_msg):
+    """Detecta errores de cuota / rate limit en el mensaje de una excepción de Gemini"""
+    error_lower = error_msg.lower()
+    return "429" in error_msg or "quota" in error_lower or "rate limit" in error_lower or "resource_exhausted" in error_lower
@@ -0,0 +1,112 @@
+"""
+Re-validación perezosa del caché de sentimiento
+Tras cambiar el prompt o la familia de modelo se sirve la etiqueta anterior al instante
+y las noticias se re-analizan en segundo plano con un presupuesto acotado
+"""
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from src.rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundRevalidator:
+    def __init__(self, budget_per_hour=120, max_workers=1, clock=time.monotonic):
+        """
+        Inicializa el re-validador
+
+        Args:
+            budget_per_hour: Noticias que se pueden re-analizar por hora (ráfaga máxima igual)
+            max_workers: Hilos en segundo plano (1 = no compite con el análisis interactivo)
+            clock: Reloj monotónico (inyectable para tests)
+        """
+        self.budget = TokenBucket(budget_per_hour, budget_per_hour / 3600.0, clock)
+        self._lock = threading.Lock()
+        self._inflight = set()
+        self._futures = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="revalidator")
+        self.stats = {"scheduled": 0, "revalidated": 0, "skipped": 0, "failed": 0}
+
+    def submit(self, texts, analyze_fn, store_fn):
+        """
+        Programa el re-análisis de noticias servidas con una etiqueta obsoleta
+
+        Args:
+            texts: Textos a re-analizar
+            analyze_fn: Función lista_de_textos -> lista de resultados (None si falló)
+            store_fn: Función que recibe [(texto, resultado)] y los guarda en caché
+
+        Returns:
+            Número de noticias aceptadas (el resto se reintenta en la próxima lectura)
+        """
+        accepted = []
+        with self._lock:
+            for text in dict.fromkeys(texts):
+                if text in self._inflight:
+                    continue
+                if self.budget.available() < 1:
+                    self.stats["skipped"] += 1
+                    continue
+                self.budget.consume(1)
+                self._inflight.add(text)
+                accepted.append(text)
+            self.stats["scheduled"] += len(accepted)
+
+        if accepted:
+            future = self._executor.submit(self._run, accepted, analyze_fn, store_fn)
+            with self._lock:
+                self._futures.add(future)
+            future.add_done_callback(self._discard_future)
+            logger.info(f"🔁 {len(accepted)} noticias obsoletas en re-validación de fondo")
+        return len(accepted)
+
+    def _discard_future(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _run(self, texts, analyze_fn, store_fn):
+        stored = 0
+        try:
+            results = analyze_fn(texts)
+            rows = [(text, result) for text, result in zip(texts, results) if result is not None]
+            if rows:
+                store_fn(rows)
+            stored = len(rows)
+        except Exception as e:
+            logger.warning(f"⚠️ Re-validación de fondo fallida: {e}")
+        finally:
+            with self._lock:
+                self._inflight.difference_update(texts)
+                self.stats["revalidated"] += stored
+                self.stats["failed"] += len(texts) - stored
+
+    def wait_idle(self, timeout=None):
+        """Espera a que terminen las re-validaciones en curso (útil en tests y al cerrar)"""
+        with self._lock:
+            pending = list(self._futures)
+        wait(pending, timeout=timeout)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._inflight)
+            stats["budget_available"] = int(self.budget.available())
+        return stats
+
+
+_shared_revalidator = None
+_shared_lock = threading.Lock()
+
+
+def get_revalidator():
+    """
+    Re-validador único del proceso: el presupuesto se comparte entre sesiones
+    y los hilos de fondo sobreviven a los reruns de Streamlit
+    """
+    global _shared_revalidator
+    with _shared_lock:
+        if _shared_revalidator is None:
+            _shared_revalidator = BackgroundRevalidator()
+        return _shared_revalidator
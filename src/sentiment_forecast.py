@@ -0,0 +1,383 @@
+"""
+Pronóstico de sentimiento sobre los agregados diarios
+Suavizado exponencial de Holt con tendencia amortiguada (numpy), ajustado en
+lote para muchas series (total, fuente, ubicación, cluster) y con estado
+cacheado que se actualiza solo con los días nuevos
+"""
+import itertools
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from src.sentiment_rollups import SENTIMENTS
+
+logger = logging.getLogger(__name__)
+
+# Rejilla de parámetros (alpha, beta, phi) evaluada en paralelo con numpy
+_PARAM_GRID = np.array(list(itertools.product(
+    np.linspace(0.05, 0.95, 10),      # alpha: peso de la observación en el nivel
+    (0.01, 0.05, 0.1, 0.2, 0.3),      # beta: peso del error en la tendencia
+    (0.8, 0.9, 0.98),                 # phi: amortiguamiento de la tendencia
+)))
+
+# Cuantil normal para intervalos al 80, 90 y 95%
+_Z_SCORES = {0.8: 1.2816, 0.9: 1.6449, 0.95: 1.96}
+
+# Cambio de riesgo (puntos porcentuales) a partir del cual la tendencia deja de ser estable
+RISK_CHANGE_THRESHOLD = 10.0
+
+
+def _smooth(y, alpha, beta, phi, level, trend):
+    """
+    Recorre las observaciones con Holt amortiguado (forma de corrección de error)
+
+    La recursión es secuencial en el tiempo, así que el bucle es sobre los días (T);
+    cada paso opera a la vez sobre todas las series y parámetros (S x P). Costo:
+    T operaciones numpy de tamaño S x P. Solo un re-ajuste recorre la historia
+    completa con la rejilla (P = 150); las actualizaciones incrementales recorren
+    los días nuevos con P = 1.
+
+    Args:
+        y: Observaciones (S, T)
+        alpha, beta, phi: Parámetros (S, P) o difundibles a esa forma
+        level, trend: Estado inicial (S, P)
+
+    Returns:
+        (level, trend, sse) tras la última observación
+    """
+    sse = np.zeros(np.broadcast(level, alpha).shape)
+    for t in range(y.shape[1]):
+        obs = y[:, t, None]
+        error = obs - (level + phi * trend)
+        level = level + phi * trend + alpha * error
+        trend = phi * trend + alpha * beta * error
+        sse += error ** 2
+    return level, trend, sse
+
+
+def fit_series(y):
+    """
+    Ajusta Holt amortiguado a varias series a la vez (búsqueda en rejilla vectorizada)
+
+    Args:
+        y: Arreglo (S, T) con T >= 1
+
+    Returns:
+        dict con params (S, 3), level (S,), trend (S,), sse (S,) y n (errores observados)
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n_series, length = y.shape
+    alpha, beta, phi = (_PARAM_GRID[:, i][None, :] for i in range(3))
+    level = np.repeat(y[:, :1], len(_PARAM_GRID), axis=1)
+    trend = np.zeros_like(level)
+
+    level, trend, sse = _smooth(y[:, 1:], alpha, beta, phi, level, trend)
+    best = np.argmin(sse, axis=1)
+    rows = np.arange(n_series)
+    return {
+        'params': _PARAM_GRID[best],
+        'level': level[rows, best],
+        'trend': trend[rows, best],
+        'sse': sse[rows, best],
+        'n': length - 1,
+    }
+
+
+def forecast_paths(params, level, trend, sigma2, horizon, confidence=0.95):
+    """
+    Pronóstico puntual e intervalos de predicción a `horizon` pasos
+
+    La varianza sigue la fórmula cerrada de ETS(A,Ad,N):
+    sigma² (1 + sum_{j<h} alpha² (1 + beta phi_j)²), phi_j = phi + ... + phi^j
+
+    Returns:
+        (media, inferior, superior) de forma (S, horizon), recortados a >= 0
+    """
+    alpha, beta, phi = params[:, 0:1], params[:, 1:2], params[:, 2:3]
+    steps = np.arange(1, horizon + 1)[None, :]
+    damped = np.cumsum(phi ** steps, axis=1)  # phi_h = phi + phi² + ... + phi^h
+    mean = level[:, None] + damped * trend[:, None]
+
+    # phi_j para j = 0..h-1 (phi_0 = 0) y varianza acumulada
+    damped_prev = np.concatenate([np.zeros((len(params), 1)), damped[:, :-1]], axis=1)
+    terms = (alpha * (1 + beta * damped_prev)) ** 2
+    terms[:, 0] = 0.0
+    variance = sigma2[:, None] * (1 + np.cumsum(terms, axis=1))
+
+    z = _Z_SCORES.get(confidence, 1.96)
+    spread = z * np.sqrt(variance)
+    mean = np.clip(mean, 0, None)
+    return mean, np.clip(mean - spread, 0, None), mean + spread
+
+
+def _checksum(y):
+    """Huella barata de un prefijo de series (detecta días históricos modificados)"""
+    weights = np.arange(1, y.shape[1] + 1, dtype=np.float64)
+    return (y @ weights).tolist()
+
+
+class SentimentForecaster:
+    """
+    Pronósticos de conteos diarios por sentimiento y del índice de riesgo
+
+    El estado ajustado de cada serie (parámetros, nivel, tendencia, error) se
+    guarda por clave. Cuando llegan días nuevos solo se recorren esos días con
+    los parámetros ya elegidos; la rejilla completa se re-evalúa si el histórico
+    cambió o creció más de refit_ratio desde el último ajuste.
+    """
+
+    def __init__(self, horizon=7, confidence=0.95, refit_ratio=0.5, min_refit_days=7, state_path=None,
+                 max_states=1000):
+        """
+        Args:
+            horizon: Días a pronosticar
+            confidence: Nivel de los intervalos (0.8, 0.9 o 0.95)
+            refit_ratio: Crecimiento relativo del histórico que fuerza re-ajustar parámetros
+            min_refit_days: Días nuevos mínimos antes de re-ajustar
+            state_path: Archivo JSON donde persistir el estado (None = solo memoria)
+            max_states: Series guardadas como máximo (se descartan las usadas hace más tiempo)
+        """
+        self.horizon = horizon
+        self.confidence = confidence
+        self.refit_ratio = refit_ratio
+        self.min_refit_days = min_refit_days
+        self.state_path = state_path
+        self.max_states = max_states
+        self._lock = threading.RLock()
+        self._states = {}
+        self.stats = {"fits": 0, "updates": 0, "reused": 0}
+        if state_path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self._states = json.load(f)
+        except (OSError, ValueError):
+            self._states = {}
+
+    def _save(self):
+        """Escribe el estado a disco de forma atómica"""
+        if not self.state_path:
+            return
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = f"{self.state_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._states, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.debug(f"No se pudo guardar el estado de pronósticos: {e}")
+
+    def _needs_refit(self, state, y, start):
+        """True si el estado no corresponde al histórico cerrado actual"""
+        if state is None or state['start'] != start:
+            return True
+        length = state['length']
+        if length > y.shape[1] or length == 0:
+            return True
+        if not np.allclose(_checksum(y[:, :length]), state['checksum']):
+            return True
+        grown = y.shape[1] - state['fitted_length']
+        return grown >= self.min_refit_days and grown > self.refit_ratio * state['fitted_length']
+
+    def _fitted_states(self, series, start):
+        """
+        Estado ajustado hasta el penúltimo día de cada serie (el último día puede
+        seguir recibiendo noticias y no se consolida)
+
+        Args:
+            series: dict clave -> arreglo (len(SENTIMENTS), T) sobre la misma rejilla
+            start: Fecha inicial de la rejilla ('YYYY-MM-DD')
+        """
+        closed = {key: y[:, :-1] for key, y in series.items()}
+        refit = [key for key, y in closed.items()
+                 if y.shape[1] > 0 and self._needs_refit(self._states.get(key), y, start)]
+        changed = bool(refit)
+
+        if refit:
+            # Ajuste en lote: todas las series que lo necesitan en una sola pasada
+            stacked = np.vstack([closed[key] for key in refit])
+            fit = fit_series(stacked)
+            rows = len(SENTIMENTS)
+            for i, key in enumerate(refit):
+                part = slice(i * rows, (i + 1) * rows)
+                self._states[key] = {
+                    'start': start,
+                    'params': fit['params'][part].tolist(),
+                    'level': fit['level'][part].tolist(),
+                    'trend': fit['trend'][part].tolist(),
+                    'sse': fit['sse'][part].tolist(),
+                    'n': fit['n'],
+                    'length': closed[key].shape[1],
+                    'fitted_length': closed[key].shape[1],
+                    'checksum': _checksum(closed[key]),
+                }
+            self.stats["fits"] += len(refit)
+
+        for key, y in closed.items():
+            state = self._states.get(key)
+            if key in refit or state is None or y.shape[1] == 0 or state['start'] != start:
+                continue
+            new = y[:, state['length']:]
+            if new.shape[1] == 0:
+                self.stats["reused"] += 1
+                continue
+            # Actualización incremental: solo los días nuevos, parámetros fijos
+            params = np.array(state['params'])
+            level, trend, sse = _smooth(
+                new, params[:, 0:1], params[:, 1:2], params[:, 2:3],
+                np.array(state['level'])[:, None], np.array(state['trend'])[:, None]
+            )
+            state.update({
+                'level': level[:, 0].tolist(),
+                'trend': trend[:, 0].tolist(),
+                'sse': (np.array(state['sse']) + sse[:, 0]).tolist(),
+                'n': state['n'] + new.shape[1],
+                'length': y.shape[1],
+                'checksum': _checksum(y),
+            })
+            self.stats["updates"] += 1
+            changed = True
+
+        # Las claves incluyen la huella de los datos: se conservan las usadas más recientemente
+        for key in closed:
+            if key in self._states:
+                self._states[key] = self._states.pop(key)
+        while len(self._states) > self.max_states:
+            del self._states[next(iter(self._states))]
+            changed = True
+
+        if changed:
+            self._save()
+
+    def forecast_series(self, series, start, horizon=None):
+        """
+        Pronostica un lote de series alineadas en una rejilla diaria común
+
+        Args:
+            series: dict clave -> DataFrame diario (columnas SENTIMENTS) ya reindexado
+            start: Primer día de la rejilla (Timestamp)
+            horizon: Días a pronosticar (None = self.horizon)
+
+        Returns:
+            dict clave -> resultado (ver _result)
+        """
+        horizon = horizon or self.horizon
+        start_key = pd.Timestamp(start).strftime('%Y-%m-%d')
+        arrays = {key: frame[SENTIMENTS].to_numpy(dtype=np.float64).T for key, frame in series.items()}
+
+        with self._lock:
+            self._fitted_states(arrays, start_key)
+            results = {}
+            for key, frame in series.items():
+                y = arrays[key]
+                state = self._states.get(key)
+                if state is None or y.shape[1] == 1:
+                    # Un solo día: nivel = observación, sin tendencia; varianza de Poisson
+                    params = np.tile(_PARAM_GRID[0], (len(SENTIMENTS), 1))
+                    level, trend = y[:, -1], np.zeros(len(SENTIMENTS))
+                    sigma2 = np.maximum(y[:, -1], 1.0)
+                else:
+                    params = np.array(state['params'])
+                    level, trend, sse = _smooth(
+                        y[:, -1:], params[:, 0:1], params[:, 1:2], params[:, 2:3],
+                        np.array(state['level'])[:, None], np.array(state['trend'])[:, None]
+                    )
+                    level, trend = level[:, 0], trend[:, 0]
+                    n = state['n'] + 1
+                    sse_total = np.array(state['sse']) + sse[:, 0]
+                    sigma2 = sse_total / max(n - 1, 1) if n > 1 else np.maximum(y.mean(axis=1), 1.0)
+                mean, lower, upper = forecast_paths(params, level, trend, sigma2, horizon, self.confidence)
+                results[key] = self._result(frame, mean, lower, upper, params, horizon)
+        return results
+
+    def _result(self, history, mean, lower, upper, params, horizon):
+        """Resultado estructurado, listo para graficar"""
+        index = pd.date_range(history.index[-1] + pd.Timedelta(days=1), periods=horizon, freq='D', name='periodo')
+        columns = {}
+        for i, sentiment in enumerate(SENTIMENTS):
+            columns[sentiment] = mean[i]
+            columns[f'{sentiment}_inf'] = lower[i]
+            columns[f'{sentiment}_sup'] = upper[i]
+
+        neg = SENTIMENTS.index('Negativo')
+        total = np.maximum(mean.sum(axis=0), 1e-9)
+        columns['riesgo'] = mean[neg] / total * 100
+        columns['riesgo_inf'] = np.clip(lower[neg] / total * 100, 0, 100)
+        columns['riesgo_sup'] = np.clip(upper[neg] / total * 100, 0, 100)
+        forecast = pd.DataFrame(columns, index=index)
+
+        day_totals = history[SENTIMENTS].sum(axis=1)
+        history = history[SENTIMENTS].assign(riesgo=history['Negativo'] / day_totals.where(day_totals > 0) * 100)
+
+        # Riesgo de referencia: proporción negativa de todo el histórico disponible
+        baseline = float(history['Negativo'].sum() / max(day_totals.sum(), 1) * 100)
+        projected = float(mean[neg].sum() / max(mean.sum(), 1e-9) * 100)
+        return {
+            'history': history,
+            'forecast': forecast,
+            'baseline_risk': round(baseline, 1),
+            'forecast_risk': round(projected, 1),
+            'risk_change': round(projected - baseline, 1),
+            'expected_news': float(mean.sum()),
+            'params': {s: dict(zip(('alpha', 'beta', 'phi'), map(float, params[i])))
+                       for i, s in enumerate(SENTIMENTS)},
+        }
+
+    def forecast(self, rollups, dimension=None, value=None, horizon=None, scope=''):
+        """
+        Pronóstico de una serie de los agregados
+
+        Args:
+            rollups: SentimentRollups
+            dimension: 'fuente', 'ubicacion', 'cluster' o None para el total
+            value: Valor de la dimensión
+            horizon: Días a pronosticar
+            scope: Prefijo de la clave del estado (separa historial de datos cargados)
+
+        Returns:
+            dict con history, forecast, baseline_risk, forecast_risk, risk_change y params, o None
+        """
+        daily = rollups.trend('D', dimension, value)
+        if daily is None:
+            return None
+        grid = pd.date_range(daily.index.min(), daily.index.max(), freq='D', name='periodo')
+        key = f"{scope}|{dimension or ''}|{'' if dimension is None else value}"
+        return self.forecast_series({key: daily.reindex(grid, fill_value=0)}, grid[0], horizon)[key]
+
+    def forecast_groups(self, rollups, dimension, values=None, horizon=None, scope=''):
+        """
+        Pronósticos de todos los valores de una dimensión, ajustados en lote
+
+        Las series se alinean a la rejilla diaria del total (sin noticias = 0).
+
+        Returns:
+            dict valor -> resultado como en forecast()
+        """
+        total = rollups.trend('D')
+        if total is None:
+            return {}
+        grid = pd.date_range(total.index.min(), total.index.max(), freq='D', name='periodo')
+        groups = rollups.trends(dimension, 'D', values)
+        series = {f"{scope}|{dimension}|{value}": frame.reindex(grid, fill_value=0)
+                  for value, frame in groups.items()}
+        results = self.forecast_series(series, grid[0], horizon)
+        return {value: results[f"{scope}|{dimension}|{value}"] for value in groups}
+
+
+_shared_forecaster = None
+_shared_lock = threading.Lock()
+
+
+def get_forecaster(state_path="cache/forecast_state.json"):
+    """Pronosticador único del proceso; su estado ajustado se comparte entre sesiones"""
+    global _shared_forecaster
+    with _shared_lock:
+        if _shared_forecaster is None:
+            _shared_forecaster = SentimentForecaster(state_path=state_path)
+        return _shared_forecaster
@@ -0,0 +1,432 @@
+"""
+Agregados de sentimiento por periodo (diario, semanal, mensual)
+Las noticias se cuentan una sola vez al llegar; gráficos y predicciones
+leen los conteos por periodo en lugar de recorrer todos los artículos
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+SENTIMENTS = ['Positivo', 'Negativo', 'Neutro']
+
+# Granularidades soportadas y cómo se calcula el inicio de cada periodo
+GRANULARITIES = ('D', 'W', 'M')
+
+# Columnas opcionales por las que también se agrega (si existen en el DataFrame)
+DEFAULT_DIMENSIONS = ('fuente', 'ubicacion', 'cluster')
+
+# Límite de parámetros por consulta IN (...) compatible con SQLite antiguo (999)
+_SQL_BATCH_SIZE = 500
+
+# Días (respecto a la noticia más reciente) durante los que se recuerda cada noticia contada
+DEDUPE_DAYS = 180
+
+# Separador de los valores de las dimensiones en el registro de noticias
+_VALUE_SEPARATOR = '\x1f'
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 8
+
+
+def parse_dates(df):
+    """Fechas del DataFrame (reutiliza fecha_parsed si ya se calculó), sin zona horaria"""
+    if 'fecha_parsed' in df.columns:
+        fechas = df['fecha_parsed']
+    elif 'fecha' in df.columns:
+        fechas = pd.to_datetime(df['fecha'], errors='coerce')
+    else:
+        return pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    if getattr(fechas.dt, 'tz', None) is not None:
+        fechas = fechas.dt.tz_localize(None)
+    return fechas
+
+
+def period_start(fechas, granularity):
+    """
+    Inicio del periodo de cada fecha
+
+    Args:
+        fechas: Serie datetime sin nulos
+        granularity: 'D' (día), 'W' (semana, desde el lunes) o 'M' (mes)
+    """
+    days = fechas.dt.normalize()
+    if granularity == 'D':
+        return days
+    if granularity == 'W':
+        return days - pd.to_timedelta(days.dt.dayofweek, unit='D')
+    if granularity == 'M':
+        return days - pd.to_timedelta(days.dt.day - 1, unit='D')
+    raise ValueError(f"Granularidad no soportada: {granularity} (use una de {GRANULARITIES})")
+
+
+def article_keys(df):
+    """Clave estable por noticia (titular + fecha + fuente) para no contarla dos veces"""
+    cols = [c for c in ('titular', 'fecha', 'fuente') if c in df.columns]
+    if not cols:
+        return pd.Series([str(i) for i in df.index], index=df.index)
+    hashed = pd.util.hash_pandas_object(df[cols].astype(str), index=False)
+    return hashed.map('{:016x}'.format)
+
+
+def rollup_counts(df, dimensions=DEFAULT_DIMENSIONS):
+    """
+    Conteos por periodo, sentimiento y dimensión opcional
+
+    Args:
+        df: DataFrame con fecha y sentimiento_ia
+        dimensions: Columnas adicionales por las que agregar (las ausentes se ignoran)
+
+    Returns:
+        DataFrame (granularidad, dimension, valor, periodo, sentimiento, conteo);
+        dimension '' es el total sin desagregar
+    """
+    columns = ['granularidad', 'dimension', 'valor', 'periodo', 'sentimiento', 'conteo']
+    if df is None or len(df) == 0 or 'sentimiento_ia' not in df.columns:
+        return pd.DataFrame(columns=columns)
+
+    fechas = parse_dates(df)
+    valid = fechas.notna().to_numpy()
+    if not valid.any():
+        return pd.DataFrame(columns=columns)
+
+    base = pd.DataFrame({'sentimiento': df['sentimiento_ia'].astype(str).to_numpy()[valid]})
+    dims = [d for d in dimensions if d in df.columns]
+    for dim in dims:
+        base[dim] = df[dim].fillna('').astype(str).to_numpy()[valid]
+
+    fechas = fechas[valid].reset_index(drop=True)
+    parts = []
+    for granularity in GRANULARITIES:
+        base['periodo'] = period_start(fechas, granularity).dt.strftime('%Y-%m-%d').to_numpy()
+        total = base.groupby(['periodo', 'sentimiento'], sort=False).size().reset_index(name='conteo')
+        total['dimension'], total['valor'] = '', ''
+        total['granularidad'] = granularity
+        parts.append(total)
+        for dim in dims:
+            part = base[base[dim] != ''].groupby([dim, 'periodo', 'sentimiento'], sort=False).size()
+            part = part.reset_index(name='conteo').rename(columns={dim: 'valor'})
+            part['dimension'] = dim
+            part['granularidad'] = granularity
+            parts.append(part)
+
+    return pd.concat(parts, ignore_index=True)[columns]
+
+
+def _trend_frame(rows, keys=()):
+    """
+    Filas (*keys, periodo, sentimiento, conteo) a tabla por periodo con una columna por sentimiento
+    """
+    if not rows:
+        return None
+    keys = list(keys)
+    long = pd.DataFrame(rows, columns=keys + ['periodo', 'sentimiento', 'conteo'])
+    long['periodo'] = pd.to_datetime(long['periodo'])
+    trend = long.pivot_table(index=keys + ['periodo'], columns='sentimiento', values='conteo',
+                             aggfunc='sum', fill_value=0)
+    extra = sorted(c for c in trend.columns if c not in SENTIMENTS)
+    trend = trend.reindex(columns=SENTIMENTS + extra, fill_value=0).astype(np.int64)
+    trend.columns.name = None
+    return trend.sort_index()
+
+
+class SentimentRollups:
+    """
+    Conteos de sentimiento por periodo en SQLite
+
+    Con db_path=None los agregados viven en memoria (una corrida); con ruta
+    se persisten y acumulan las corridas sucesivas sin contar dos veces
+    la misma noticia.
+
+    El registro de noticias contadas guarda día, sentimiento y dimensiones de
+    cada una: si una noticia vuelve con otra etiqueta se resta su aporte
+    anterior y se suma el nuevo. Solo se recuerdan las noticias de los últimos
+    dedupe_days días (respecto a la más reciente), así el registro crece con la
+    ventana y no con la historia; una corrida más antigua que la ventana que se
+    vuelva a cargar se contaría de nuevo.
+    """
+
+    def __init__(self, db_path=None, dimensions=DEFAULT_DIMENSIONS, dedupe_days=DEDUPE_DAYS):
+        self.db_path = db_path
+        self.dimensions = tuple(dimensions)
+        self.dedupe_days = dedupe_days
+        self.fingerprint = None  # Huella de los datos de origen (la fija rollups_for)
+        self._lock = threading.RLock()
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+        else:
+            self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self._init_database()
+
+    def _init_database(self):
+        with self._lock:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS sentiment_rollups (
+                    granularidad TEXT NOT NULL,
+                    dimension TEXT NOT NULL,
+                    valor TEXT NOT NULL,
+                    periodo TEXT NOT NULL,
+                    sentimiento TEXT NOT NULL,
+                    conteo INTEGER NOT NULL,
+                    PRIMARY KEY (granularidad, dimension, valor, periodo, sentimiento)
+                ) WITHOUT ROWID
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS rollup_articles (
+                    article_key TEXT PRIMARY KEY,
+                    dia TEXT,
+                    sentimiento TEXT,
+                    valores TEXT
+                ) WITHOUT ROWID
+            ''')
+            # Bases anteriores solo guardaban la clave: sus filas no se podrán reetiquetar
+            columns = {row[1] for row in self.conn.execute('PRAGMA table_info(rollup_articles)')}
+            for column in ('dia', 'sentimiento', 'valores'):
+                if column not in columns:
+                    self.conn.execute(f'ALTER TABLE rollup_articles ADD COLUMN {column} TEXT')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_rollup_articles_dia ON rollup_articles(dia)')
+            self.conn.commit()
+
+    def _known_articles_locked(self, keys):
+        """dict clave -> (día, sentimiento, valores) de las noticias ya contadas"""
+        known = {}
+        for start in range(0, len(keys), _SQL_BATCH_SIZE):
+            batch = keys[start:start + _SQL_BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            rows = self.conn.execute(
+                f'SELECT article_key, dia, sentimiento, valores FROM rollup_articles '
+                f'WHERE article_key IN ({placeholders})', batch
+            ).fetchall()
+            known.update((r[0], r[1:]) for r in rows)
+        return known
+
+    def _article_records(self, df, keys):
+        """Registro por noticia: clave, día, sentimiento y valores de las dimensiones"""
+        fechas = parse_dates(df)
+        dias = fechas.dt.strftime('%Y-%m-%d').astype(object).where(fechas.notna(), None)
+        blank = pd.Series('', index=df.index)
+        sentiments = df['sentimiento_ia'].astype(str) if 'sentimiento_ia' in df.columns else blank
+        dims = [df[d].fillna('').astype(str) if d in df.columns else blank for d in self.dimensions]
+        values = dims[0].str.cat(dims[1:], sep=_VALUE_SEPARATOR) if dims else blank
+        return pd.DataFrame({'article_key': keys.to_numpy(), 'dia': dias.to_numpy(),
+                             'sentimiento': sentiments.to_numpy(), 'valores': values.to_numpy()})
+
+    def _records_frame(self, records):
+        """Registros guardados a DataFrame de noticias (para restar su aporte)"""
+        frame = pd.DataFrame({'fecha': [r[0] for r in records], 'sentimiento_ia': [r[1] for r in records]})
+        values = [(r[2] or '').split(_VALUE_SEPARATOR) for r in records]
+        for i, dim in enumerate(self.dimensions):
+            frame[dim] = [v[i] if i < len(v) else '' for v in values]
+        return frame
+
+    def _add_counts_locked(self, counts, sign=1):
+        if not len(counts):
+            return
+        rows = ((g, d, v, p, s, sign * int(c)) for g, d, v, p, s, c in counts.itertuples(index=False, name=None))
+        self.conn.executemany('''
+            INSERT INTO sentiment_rollups (granularidad, dimension, valor, periodo, sentimiento, conteo)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (granularidad, dimension, valor, periodo, sentimiento)
+            DO UPDATE SET conteo = conteo + excluded.conteo
+        ''', rows)
+        if sign < 0:
+            self.conn.execute('DELETE FROM sentiment_rollups WHERE conteo <= 0')
+
+    def _prune_articles_locked(self):
+        """Olvida las noticias más antiguas que la ventana de deduplicación"""
+        if self.dedupe_days is None:
+            return
+        self.conn.execute(
+            "DELETE FROM rollup_articles WHERE dia < date((SELECT MAX(dia) FROM rollup_articles), ?)",
+            (f'-{int(self.dedupe_days)} days',)
+        )
+
+    def ingest(self, df, dedupe=True):
+        """
+        Suma las noticias de df a los agregados (incremental)
+
+        Args:
+            df: DataFrame analizado (fecha, sentimiento_ia y dimensiones opcionales)
+            dedupe: Si True, se omiten las noticias ya contadas en ingestas anteriores
+                    (las que cambiaron de sentimiento o dimensiones se corrigen)
+
+        Returns:
+            Número de noticias nuevas contadas
+        """
+        if df is None or len(df) == 0:
+            return 0
+
+        with self._lock:
+            if not dedupe:
+                self._add_counts_locked(rollup_counts(df, self.dimensions))
+                self.conn.commit()
+                return len(df)
+
+            keys = article_keys(df)
+            records = self._article_records(df, keys).drop_duplicates('article_key', keep='last')
+            known = self._known_articles_locked(records['article_key'].tolist())
+            is_known = keys.isin(known).to_numpy()
+
+            # Noticias ya contadas que vuelven con otra etiqueta: se resta el aporte anterior
+            stored = records[records['article_key'].isin(known)]
+            changed = [key for key, *current in stored.itertuples(index=False, name=None)
+                       if known[key][1] is not None and tuple(current) != known[key]]
+            if changed:
+                self._add_counts_locked(
+                    rollup_counts(self._records_frame([known[k] for k in changed]), self.dimensions), sign=-1)
+                relabelled = keys.isin(changed).to_numpy() & ~keys.duplicated(keep='last').to_numpy()
+                self._add_counts_locked(rollup_counts(df[relabelled], self.dimensions))
+
+            new_df = df[~is_known]
+            self._add_counts_locked(rollup_counts(new_df, self.dimensions))
+            written = records[~records['article_key'].isin(known) | records['article_key'].isin(changed)]
+            if len(written):
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO rollup_articles (article_key, dia, sentimiento, valores) '
+                    'VALUES (?, ?, ?, ?)', written.itertuples(index=False, name=None))
+            self._prune_articles_locked()
+            self.conn.commit()
+        return len(new_df)
+
+    def trend(self, granularity='D', dimension=None, value=None, start=None, end=None):
+        """
+        Serie de conteos por periodo (una columna por sentimiento)
+
+        Args:
+            granularity: 'D', 'W' o 'M'
+            dimension: Dimensión opcional ('fuente', 'ubicacion') o None para el total
+            value: Valor de la dimensión
+            start: Fecha mínima del periodo (inclusive) o None
+            end: Fecha máxima del periodo (inclusive) o None
+
+        Returns:
+            DataFrame indexado por 'periodo' ordenado, o None si no hay datos
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularidad no soportada: {granularity} (use una de {GRANULARITIES})")
+
+        query = ('SELECT periodo, sentimiento, conteo FROM sentiment_rollups '
+                 'WHERE granularidad = ? AND dimension = ? AND valor = ?')
+        params = [granularity, dimension or '', '' if dimension is None else str(value)]
+        if start is not None:
+            query += ' AND periodo >= ?'
+            params.append(pd.Timestamp(start).strftime('%Y-%m-%d'))
+        if end is not None:
+            query += ' AND periodo <= ?'
+            params.append(pd.Timestamp(end).strftime('%Y-%m-%d'))
+
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return _trend_frame(rows)
+
+    def trends(self, dimension, granularity='D', values=None):
+        """
+        Series de todos los valores de una dimensión en una sola consulta
+
+        Args:
+            dimension: 'fuente', 'ubicacion', 'cluster'...
+            granularity: 'D', 'W' o 'M'
+            values: Subconjunto de valores o None para todos
+
+        Returns:
+            dict valor -> DataFrame como el de trend()
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularidad no soportada: {granularity} (use una de {GRANULARITIES})")
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT valor, periodo, sentimiento, conteo FROM sentiment_rollups '
+                'WHERE granularidad = ? AND dimension = ?', (granularity, dimension)
+            ).fetchall()
+
+        if values is not None:
+            wanted = {str(v) for v in values}
+            rows = [row for row in rows if row[0] in wanted]
+        if not rows:
+            return {}
+
+        # Un solo pivot para todos los valores; luego se separa por valor
+        wide = _trend_frame(rows, keys=['valor'])
+        return {valor: frame.droplevel('valor') for valor, frame in wide.groupby(level='valor', sort=True)}
+
+    def values(self, dimension, granularity='D'):
+        """Valores distintos registrados para una dimensión"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT DISTINCT valor FROM sentiment_rollups WHERE granularidad = ? AND dimension = ? ORDER BY valor',
+                (granularity, dimension)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def clear(self):
+        """Elimina todos los agregados y el registro de noticias contadas"""
+        with self._lock:
+            self.conn.execute('DELETE FROM sentiment_rollups')
+            self.conn.execute('DELETE FROM rollup_articles')
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def _fingerprint(df, dimensions):
+    """Huella de las columnas que determinan los agregados"""
+    cols = [c for c in ('fecha', 'sentimiento_ia') + tuple(dimensions) if c in df.columns]
+    parts = ['\x1f'.join(df[c].astype(str).tolist()) for c in cols]
+    return hashlib.md5('\x1e'.join(cols + parts).encode('utf-8', 'replace')).hexdigest()
+
+
+def rollups_for(df, dimensions=DEFAULT_DIMENSIONS, fingerprint=None):
+    """
+    Agregados en memoria de un DataFrame, reutilizados mientras los datos no cambien
+
+    Args:
+        df: DataFrame analizado
+        fingerprint: Huella de la corrida calculada al ingerirla; evita recorrer
+                     todas las filas en cada llamada
+
+    Returns:
+        SentimentRollups (no persistido)
+    """
+    fingerprint = f"corrida:{fingerprint}" if fingerprint is not None else _fingerprint(df, dimensions)
+    key = (fingerprint, tuple(dimensions))
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    rollups = SentimentRollups(dimensions=dimensions)
+    rollups.ingest(df, dedupe=False)
+    rollups.fingerprint = fingerprint
+
+    with _cache_lock:
+        _cache[key] = rollups
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return rollups
+
+
+_shared_store = None
+_shared_lock = threading.Lock()
+
+
+def get_rollup_store(db_path="cache/sentiment_rollups.db"):
+    """
+    Agregados persistentes del proceso, compartidos por todas las sesiones.
+    Acumulan todas las corridas de análisis para ver la historia completa.
+    """
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = SentimentRollups(db_path)
+        return _shared_store
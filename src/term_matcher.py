@@ -0,0 +1,264 @@
+"""
+Buscador compilado de términos (palabras clave, ubicaciones) sin distinguir tildes
+Una sola expresión regular recorre el corpus una vez y produce una matriz
+dispersa noticia x término que comparten alertas y mapa
+"""
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 16
+
+# Separador de noticias al recorrer el corpus como un solo texto
+_DOC_SEPARATOR = '\x1e'
+
+# Variantes con tilde de cada letra base (el texto solo se pasa a minúsculas)
+_FOLDED_CHARS = {
+    'a': '[aáàâäã]', 'e': '[eéèêë]', 'i': '[iíìîï]', 'o': '[oóòôöõ]', 'u': '[uúùûü]',
+    'n': '[nñ]', 'c': '[cç]',
+}
+
+
+def normalize_text(text):
+    """Minúsculas sin tildes (el mismo criterio para términos y coincidencias)"""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def _folded(alias):
+    """Alias normalizado a regex que acepta cualquier variante con tilde"""
+    return ''.join(_FOLDED_CHARS.get(c, re.escape(c)) for c in alias)
+
+
+def corpus_texts(df):
+    """Titular + cuerpo de cada noticia (cadena vacía si faltan)"""
+    if df is None or len(df) == 0:
+        return pd.Series([], dtype=object)
+    titular, cuerpo = (df[c].fillna('').astype(str) if c in df.columns else pd.Series('', index=df.index)
+                       for c in ('titular', 'cuerpo'))
+    return (titular + ' ' + cuerpo).reset_index(drop=True)
+
+
+class TermHits:
+    """Matriz dispersa de apariciones (noticias x términos) con sus etiquetas"""
+
+    def __init__(self, matrix, labels, groups=None):
+        self.matrix = matrix
+        self.labels = list(labels)
+        self.groups = list(groups) if groups is not None else [''] * len(self.labels)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @classmethod
+    def stack(cls, parts):
+        """Une (por columnas) matrices del mismo corpus producidas por distintos matchers"""
+        parts = list(parts)
+        if len(parts) == 1:
+            return parts[0]
+        return cls(sp.hstack([p.matrix for p in parts], format='csr'),
+                   [label for p in parts for label in p.labels], [g for p in parts for g in p.groups])
+
+    def group(self, name):
+        """Columnas de un grupo de términos (p. ej. 'ubicaciones') como TermHits propio"""
+        cols = [j for j, g in enumerate(self.groups) if g == name]
+        return TermHits(self.matrix[:, cols].tocsr(), [self.labels[j] for j in cols], [name] * len(cols))
+
+    def doc_counts(self, mask=None):
+        """
+        Número de noticias que mencionan cada término
+
+        Args:
+            mask: Arreglo booleano por noticia (None = todas)
+
+        Returns:
+            dict etiqueta -> noticias (solo términos con al menos una)
+        """
+        matrix = self.matrix if mask is None else self.matrix[np.flatnonzero(mask)]
+        counts = np.bincount(matrix.indices, minlength=len(self.labels))
+        return {self.labels[i]: int(counts[i]) for i in np.flatnonzero(counts)}
+
+    def docs_by_term(self, mask=None):
+        """dict etiqueta -> posiciones de las noticias que lo mencionan (filtradas por mask)"""
+        rows = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        csc = self.matrix[rows].tocsc()
+        return {self.labels[j]: rows[csc.indices[csc.indptr[j]:csc.indptr[j + 1]]]
+                for j in range(len(self.labels)) if csc.indptr[j + 1] > csc.indptr[j]}
+
+    def any(self):
+        """Arreglo booleano: la noticia menciona al menos un término"""
+        return np.diff(self.matrix.indptr) > 0
+
+    def primary(self):
+        """
+        Primer término (en el orden declarado) de cada noticia, o None
+
+        Returns:
+            Arreglo de objetos con una etiqueta por noticia
+        """
+        result = np.full(len(self), None, dtype=object)
+        has_hits = self.any()
+        if has_hits.any():
+            starts = self.matrix.indptr[:-1][has_hits]
+            first = np.minimum.reduceat(self.matrix.indices, starts)
+            result[has_hits] = np.asarray(self.labels, dtype=object)[first]
+        return result
+
+
+class TermMatcher:
+    """
+    Términos con alias compilados en una sola regex con límites de palabra.
+    Insensible a mayúsculas y tildes; acepta plurales simples (-s, -es).
+    """
+
+    def __init__(self, terms):
+        """
+        Args:
+            terms: dict etiqueta -> lista de alias, o lista de etiquetas (el alias es la etiqueta)
+        """
+        self._build({'': terms})
+
+    @classmethod
+    def from_groups(cls, vocabularies):
+        """Matcher con varios grupos de términos (dict grupo -> términos) en una sola regex"""
+        matcher = cls.__new__(cls)
+        matcher._build(vocabularies)
+        return matcher
+
+    def _build(self, vocabularies):
+        self.labels, self.groups = [], []
+        self._alias_columns = {}
+        for group, terms in vocabularies.items():
+            if not isinstance(terms, dict):
+                terms = {term: [term] for term in terms}
+            for label, aliases in terms.items():
+                column = len(self.labels)
+                self.labels.append(label)
+                self.groups.append(group)
+                for alias in list(aliases) or [label]:
+                    columns = self._alias_columns.setdefault(normalize_text(alias).strip(), [])
+                    if column not in columns:
+                        columns.append(column)
+
+        # Alias más largos primero: "valle del cauca" gana sobre "valle"
+        aliases = sorted((a for a in self._alias_columns if a), key=len, reverse=True)
+        self.pattern = re.compile(
+            re.escape(_DOC_SEPARATOR) + r'|\b(?:' + '|'.join(_folded(a) for a in aliases) + r')(?:es|s)?\b'
+        ) if aliases else None
+        spec = repr(sorted((a, [(self.groups[c], self.labels[c]) for c in cols])
+                           for a, cols in self._alias_columns.items()))
+        self.key = hashlib.md5(spec.encode('utf-8')).hexdigest()
+
+    def _columns_for(self, match):
+        """Columnas de una coincidencia (quita el plural si el alias no lo incluye)"""
+        normalized = normalize_text(match)
+        for candidate in (normalized, normalized[:-1], normalized[:-2]):
+            if candidate in self._alias_columns:
+                return self._alias_columns[candidate]
+        return []
+
+    def find(self, text):
+        """Etiquetas mencionadas en un texto, en el orden declarado"""
+        if self.pattern is None or not text:
+            return []
+        found = {c for m in self.pattern.findall(str(text).lower()) for c in self._columns_for(m)}
+        return [self.labels[c] for c in sorted(found)]
+
+    def matrix(self, texts):
+        """
+        Matriz de apariciones del corpus, reutilizada mientras el texto no cambie
+
+        Args:
+            texts: Serie de textos (una fila por noticia)
+
+        Returns:
+            TermHits con conteos de aparición por noticia y término
+        """
+        texts = pd.Series(texts).fillna('').astype(str).tolist()
+        joined = _DOC_SEPARATOR.join(texts)
+        key = (self.key, hashlib.md5(joined.encode('utf-8', 'replace')).hexdigest())
+        with _cache_lock:
+            cached = _cache.get(key)
+            if cached is not None:
+                _cache.move_to_end(key)
+                return cached
+
+        n_docs = len(texts)
+        shape = (n_docs, len(self.labels))
+        if self.pattern is None or n_docs == 0:
+            matrix = sp.csr_matrix(shape, dtype=np.int32)
+        else:
+            if joined.count(_DOC_SEPARATOR) != n_docs - 1:
+                joined = _DOC_SEPARATOR.join(t.replace(_DOC_SEPARATOR, ' ') for t in texts)
+            # Un solo recorrido del corpus completo; el separador marca el cambio de noticia
+            found = pd.Series(self.pattern.findall(joined.lower()), dtype=object)
+            is_separator = (found == _DOC_SEPARATOR).to_numpy()
+            docs = np.cumsum(is_separator)[~is_separator]
+            codes, uniques = pd.factorize(found[~is_separator])
+
+            # Cada coincidencia distinta se resuelve una vez (puede alimentar varias columnas)
+            rows, cols = [], []
+            for code, match in enumerate(uniques):
+                columns = self._columns_for(match)
+                if columns:
+                    match_docs = docs[codes == code]
+                    for column in columns:
+                        rows.append(match_docs)
+                        cols.append(np.full(len(match_docs), column, dtype=np.int64))
+            rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+            cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+            matrix = sp.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=shape)
+            matrix.sum_duplicates()
+
+        result = TermHits(matrix, self.labels, self.groups)
+        with _cache_lock:
+            _cache[key] = result
+            while len(_cache) > _CACHE_SIZE:
+                _cache.popitem(last=False)
+        return result
+
+
+# Vocabularios registrados por los módulos (alertas, mapa); se compilan juntos
+_vocabularies = OrderedDict()
+_shared_matcher = None
+_registry_lock = threading.Lock()
+
+
+def register_terms(group, terms):
+    """
+    Registra (o reemplaza) un grupo de términos en el matcher compartido
+
+    Args:
+        group: Nombre del grupo ('alertas', 'ubicaciones'...)
+        terms: dict etiqueta -> alias o lista de etiquetas
+    """
+    global _shared_matcher
+    if not isinstance(terms, dict):
+        terms = {term: [term] for term in terms}
+    terms = {label: list(aliases) for label, aliases in terms.items()}
+    with _registry_lock:
+        if _vocabularies.get(group) != terms:
+            _vocabularies[group] = terms
+            _shared_matcher = None
+
+
+def shared_matcher():
+    """Matcher único con todos los grupos registrados (una regex, un recorrido del corpus)"""
+    global _shared_matcher
+    with _registry_lock:
+        if _shared_matcher is None:
+            _shared_matcher = TermMatcher.from_groups(dict(_vocabularies))
+        return _shared_matcher
+
+
+def shared_hits(texts, group):
+    """Columnas de un grupo en la matriz compartida del corpus"""
+    return shared_matcher().matrix(texts).group(group)
@@ -0,0 +1,124 @@
+"""
+Análisis de texto en español para búsqueda y palabras clave
+Normalización sin tildes, stopwords y un stemmer ligero de sufijos
+(cultivos / cultivo / cultivar comparten raíz)
+"""
+import re
+from functools import lru_cache
+
+from src.minhash import normalize_tokens
+
+# Stopwords sin tildes (el texto se normaliza antes de filtrar)
+SPANISH_STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aquel aquella aquellas aquello aquellos aqui
+asi aun aunque bajo bien cada casi como con contra cual cuales cuando cuanto de del desde donde dos
+durante e el ella ellas ello ellos en entre era eran eres es esa esas ese eso esos esta estaba estaban
+estado estan estar este esto estos fue fueron fui ha habia habian han hasta hay he la las le les lo los
+mas me mi mis mismo mucho muy nada ni no nos nosotros o otra otras otro otros para pero poco por porque
+pues que quien quienes se sea ser si sido siempre sin sobre solo son su sus tambien tan tanto te tiene
+tienen todo todos tras tu tus u un una unas uno unos usted y ya yo
+""".split())
+
+# Negaciones: invierten el sentido de una pregunta, se conservan donde importa (sin stemming)
+NEGATION_WORDS = frozenset("""
+jamas nada nadie ni ningun ninguna ninguno no nunca sin tampoco
+""".split())
+
+# Sufijos derivativos (sustantivos/adjetivos), del más largo al más corto
+_DERIVATIONAL_SUFFIXES = sorted([
+    'amientos', 'imientos', 'amiento', 'imiento', 'aciones', 'uciones', 'adoras', 'adores',
+    'ancias', 'encias', 'idades', 'mente', 'acion', 'ucion', 'adora', 'ador', 'ancia', 'encia',
+    'idad', 'anzas', 'anza', 'ismos', 'ismo', 'istas', 'ista', 'ables', 'able', 'ibles', 'ible',
+    'antes', 'ante', 'osos', 'osas', 'oso', 'osa', 'ivos', 'ivas', 'ivo', 'iva',
+], key=len, reverse=True)
+
+# Terminaciones verbales frecuentes en prensa (participios, gerundios, pretéritos)
+_VERB_SUFFIXES = sorted([
+    'ieron', 'aron', 'iendo', 'ando', 'ados', 'adas', 'idos', 'idas', 'ado', 'ada', 'ido', 'ida',
+    'aban', 'aba', 'aran', 'ara', 'ian', 'ias', 'ia', 'ar', 'er', 'ir', 'an', 'en', 'es', 'as',
+], key=len, reverse=True)
+
+_RESIDUAL_SUFFIXES = ('os', 'a', 'o', 'e')
+
+_VOWELS = frozenset('aeiou')
+
+_NUMBER_RE = re.compile(r'^\d+$')
+
+
+def _region_after_vc(word, start=0):
+    """Inicio de la región tras la primera consonante que sigue a una vocal (R1 de Snowball)"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _rv_start(word):
+    """Inicio de la región RV de Snowball español"""
+    if len(word) < 2:
+        return len(word)
+    if word[1] not in _VOWELS:
+        for i in range(2, len(word)):
+            if word[i] in _VOWELS:
+                return i + 1
+        return len(word)
+    if word[0] in _VOWELS:
+        for i in range(2, len(word)):
+            if word[i] not in _VOWELS:
+                return i + 1
+        return len(word)
+    return 3
+
+
+def _strip_suffix(word, suffixes, region_start):
+    """Quita el sufijo más largo que cae completo dentro de la región"""
+    for suffix in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= region_start:
+            return word[:-len(suffix)]
+    return word
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    """
+    Raíz de una palabra ya normalizada (minúsculas, sin tildes)
+
+    Versión ligera del Snowball español: quita un sufijo derivativo dentro de R2
+    o, si no hay, una terminación verbal dentro de RV, y después la vocal residual.
+    """
+    if len(word) <= 3 or _NUMBER_RE.match(word):
+        return word
+    rv = _rv_start(word)
+    r2 = _region_after_vc(word, _region_after_vc(word))
+
+    stemmed = _strip_suffix(word, _DERIVATIONAL_SUFFIXES, r2)
+    if stemmed == word:
+        stemmed = _strip_suffix(word, _VERB_SUFFIXES, rv)
+    stemmed = _strip_suffix(stemmed, _RESIDUAL_SUFFIXES, rv)
+    # Plural tras vocal fuera de RV (vias -> via)
+    if stemmed == word and len(word) > 3 and word[-1] == 's' and word[-2] in _VOWELS:
+        stemmed = word[:-1]
+    return stemmed
+
+
+def tokenize(text, use_stemming=True, min_length=2, keep_negations=False):
+    """
+    Tokens de búsqueda: normalizados, sin stopwords y opcionalmente con stemming
+
+    Args:
+        text: Texto libre
+        use_stemming: Reducir cada palabra a su raíz
+        min_length: Longitud mínima del token (antes del stemming)
+        keep_negations: Conservar las palabras de NEGATION_WORDS aunque sean stopwords
+
+    Returns:
+        Lista de tokens
+    """
+    tokens = [
+        t for t in normalize_tokens(text)
+        if (keep_negations and t in NEGATION_WORDS)
+        or (len(t) >= min_length and t not in SPANISH_STOPWORDS)
+    ]
+    if use_stemming:
+        return [t if t in NEGATION_WORDS else stem(t) for t in tokens]
+    return tokens
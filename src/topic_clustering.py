@@ -0,0 +1,157 @@
+"""
+Agrupación temática escalable sobre los vectores del motor de palabras clave
+MiniBatchKMeans con k automático (silueta sobre una muestra), modelos cacheados
+para que los temas sean estables entre reruns y asignación incremental
+"""
+import copy
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+from sklearn.metrics import silhouette_score
+
+from src.keyword_engine import KEYWORD_PATTERN
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 8
+
+
+def _fit_kmeans(X, n_clusters, random_state):
+    return MiniBatchKMeans(
+        n_clusters=n_clusters,
+        random_state=random_state,
+        batch_size=2048,
+        n_init=3,
+    ).fit(X)
+
+
+class TopicModel:
+    """Clusters ajustados: centroides sobre el vocabulario del corpus y su IDF"""
+
+    def __init__(self, kmeans, vocabulary, transformer, order):
+        self.kmeans = kmeans
+        self.vocabulary = vocabulary
+        self.transformer = transformer
+        # Clusters renumerados de mayor a menor tamaño (el 0 es el tema dominante)
+        self.order = order
+        self._relabel = np.argsort(order)
+
+    @property
+    def n_clusters(self):
+        return len(self.order)
+
+    def themes(self, top_n=5):
+        """Palabras de mayor peso en cada centroide, en el orden de los clusters"""
+        themes = []
+        for cluster in self.order:
+            centroid = self.kmeans.cluster_centers_[cluster]
+            k = min(top_n, len(centroid))
+            top = np.argpartition(-centroid, k - 1)[:k]
+            top = top[np.argsort(-centroid[top])]
+            themes.append(', '.join(self.vocabulary[i] for i in top))
+        return themes
+
+    def vectorize(self, texts):
+        """TF-IDF de textos nuevos con el vocabulario y la IDF del ajuste"""
+        vectorizer = CountVectorizer(lowercase=True, token_pattern=KEYWORD_PATTERN,
+                                     vocabulary=self.vocabulary, dtype=np.float64)
+        return self.transformer.transform(vectorizer.transform(texts))
+
+    def labels_for(self, X):
+        return self._relabel[self.kmeans.predict(X)]
+
+    def assign(self, texts):
+        """Asigna noticias nuevas a los clusters existentes sin re-entrenar"""
+        return self.labels_for(self.vectorize(texts))
+
+    def copy(self):
+        """Copia con centroides propios (vocabulario e IDF, que no cambian, se comparten)"""
+        return TopicModel(copy.deepcopy(self.kmeans), self.vocabulary, self.transformer, self.order)
+
+    def update(self, texts):
+        """
+        Asigna noticias nuevas y ajusta los centroides con un paso de partial_fit;
+        la numeración de los clusters se conserva. Modifica este modelo: los que
+        retorna fit_topics están en caché y deben copiarse antes (copy())
+        """
+        X = self.vectorize(texts)
+        self.kmeans.partial_fit(X)
+        return self.labels_for(X)
+
+
+def document_vectors(keywords):
+    """
+    TF-IDF (norma L2) de la matriz documento-término cacheada del motor de palabras clave
+
+    Returns:
+        Tupla (matriz dispersa, TfidfTransformer ajustado)
+    """
+    transformer = TfidfTransformer(sublinear_tf=True)
+    return transformer.fit_transform(keywords.matrix.astype(np.float64)), transformer
+
+
+def choose_k(X, k_range=(2, 8), sample_size=2000, random_state=42):
+    """
+    k con mejor silueta, evaluada sobre una muestra para que sea barata
+
+    Args:
+        X: Vectores de los documentos
+        k_range: k mínimo y máximo a probar
+        sample_size: Documentos usados para ajustar y puntuar cada k
+
+    Returns:
+        Mejor k
+    """
+    rng = np.random.default_rng(random_state)
+    n_docs = X.shape[0]
+    sample = X[np.sort(rng.choice(n_docs, min(n_docs, sample_size), replace=False))]
+
+    best_k, best_score = k_range[0], -1.0
+    for k in range(k_range[0], min(k_range[1], sample.shape[0] - 1) + 1):
+        labels = _fit_kmeans(sample, k, random_state).labels_
+        if len(np.unique(labels)) < 2:
+            continue
+        score = silhouette_score(sample, labels, random_state=random_state)
+        if score > best_score:
+            best_k, best_score = k, score
+    return best_k
+
+
+def fit_topics(keywords, n_clusters=None, k_range=(2, 8), random_state=42):
+    """
+    Agrupa el corpus (cacheado por contenido y k: mismo corpus, mismos temas)
+
+    Args:
+        keywords: KeywordMatrix del corpus
+        n_clusters: Número de clusters o None para elegirlo por silueta
+
+    Returns:
+        Tupla (etiqueta por documento, TopicModel). El modelo se comparte entre
+        llamadas con el mismo corpus: no debe modificarse sin copy()
+    """
+    key = (keywords.key, n_clusters, k_range, random_state)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    X, transformer = document_vectors(keywords)
+    if X.nnz == 0:
+        raise ValueError("Las noticias no tienen palabras suficientes para agruparlas")
+    k = n_clusters or choose_k(X, k_range, random_state=random_state)
+    kmeans = _fit_kmeans(X, k, random_state)
+
+    sizes = np.bincount(kmeans.labels_, minlength=k)
+    order = np.argsort(-sizes, kind='stable')
+    model = TopicModel(kmeans, keywords.vocabulary, transformer, order)
+    result = (model._relabel[kmeans.labels_], model)
+
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
@@ -4,61 +4,131 @@ Utiliza machine learning para detectar patrones y generar insights
 """
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
-from collections import Counter
-import re
 from datetime import datetime, timedelta
 import logging
+import threading
+from collections import OrderedDict
+from src.keyword_engine import keyword_matrix
+from src.topic_clustering import fit_topics
+from src.sentiment_rollups import rollups_for
+from src.sentiment_forecast import RISK_CHANGE_THRESHOLD, get_forecaster
 
 logger = logging.getLogger(__name__)
 
+# Fechas ya convertidas por huella de corrida (se reutilizan en cada rerun)
+_dates_cache = OrderedDict()
+_dates_lock = threading.Lock()
+_DATES_CACHE_SIZE = 8
+
+
+def _parsed_dates(fechas, fingerprint=None):
+    """pd.to_datetime de la columna fecha, una sola vez por corrida si se conoce su huella"""
+    if fingerprint is None:
+        return pd.to_datetime(fechas, errors='coerce')
+    with _dates_lock:
+        cached = _dates_cache.get(fingerprint)
+        if cached is not None and len(cached) == len(fechas):
+            _dates_cache.move_to_end(fingerprint)
+            return pd.Series(cached, index=fechas.index, name=fechas.name)
+    parsed = pd.to_datetime(fechas, errors='coerce')
+    with _dates_lock:
+        _dates_cache[fingerprint] = parsed.to_numpy()
+        while len(_dates_cache) > _DATES_CACHE_SIZE:
+            _dates_cache.popitem(last=False)
+    return parsed
+
+
 class TrendAnalyzer:
-    def __init__(self):
-        """Inicializa el analizador de tendencias"""
+    def __init__(self, rollup_store=None, forecaster=None):
+        """
+        Inicializa el analizador de tendencias
+        
+        Args:
+            rollup_store: SentimentRollups persistente opcional; si se indica, tendencias
+                y predicciones leen la historia acumulada en lugar de solo los datos cargados
+            forecaster: SentimentForecaster a usar (None = el compartido del proceso)
+        """
         self.df = None
+        self.fingerprint = None
+        self._keywords = None
+        self._rollups = None
+        self.topic_model = None
+        self._owns_topic_model = False  # fit_topics devuelve modelos compartidos por el caché
+        self.rollup_store = rollup_store
+        self.forecaster = forecaster
     
-    def load_data(self, df):
-        """Carga datos para análisis"""
-        self.df = df.copy()
+    def load_data(self, df, fingerprint=None):
+        """
+        Carga datos para análisis
         
-        # Convertir fechas si es posible
+        Args:
+            df: DataFrame analizado
+            fingerprint: Huella de la corrida calculada al ingerirla (utils.frame_fingerprint);
+                se usa como clave de fechas y agregados para no recorrer las filas en cada rerun
+        """
+        # Copia superficial: solo se agregan columnas, los datos del llamador no se duplican
+        self.df = df.copy(deep=False)
+        self.fingerprint = fingerprint
+        self._keywords = None
+        self._rollups = None
+        
+        # Convertir fechas si es posible (una sola vez: los agregados la reutilizan)
         if 'fecha' in self.df.columns:
             try:
-                self.df['fecha_parsed'] = pd.to_datetime(self.df['fecha'], errors='coerce')
+                self.df['fecha_parsed'] = _parsed_dates(self.df['fecha'], fingerprint)
             except:
                 pass
     
-    def get_sentiment_trend_over_time(self):
-        """
-        Analiza evolución del sentimiento en el tiempo
-        
-        Returns:
-            DataFrame con tendencias temporales
-        """
+    def rollups(self):
+        """Agregados por periodo: el almacén persistente si hay uno, si no los de los datos cargados"""
+        if self.rollup_store is not None:
+            return self.rollup_store
         if self.df is None or 'fecha_parsed' not in self.df.columns:
             return None
-        
-        # Filtrar filas con fecha válida
-        df_with_dates = self.df[self.df['fecha_parsed'].notna()].copy()
-        
-        if len(df_with_dates) == 0:
+        if self._rollups is None:
+            self._rollups = rollups_for(self.df, fingerprint=self._data_key())
+        return self._rollups
+    
+    def _data_key(self):
+        """Huella de los datos cargados incluidos los clusters asignados (None si no se conoce)"""
+        if self.fingerprint is None:
             return None
+        if 'cluster' in self.df.columns and self.topic_model is not None:
+            # fit_topics es determinista para el mismo corpus y número de clusters
+            return f"{self.fingerprint}|clusters={self.topic_model.n_clusters}"
+        return self.fingerprint
+    
+    def get_sentiment_trend_over_time(self, granularity='D', dimension=None, value=None):
+        """
+        Analiza evolución del sentimiento en el tiempo
         
-        # Agrupar por fecha y sentimiento
-        df_with_dates['fecha_only'] = df_with_dates['fecha_parsed'].dt.date
+        Lee los conteos agregados por periodo (O(periodos)), no las noticias.
         
-        trend = df_with_dates.groupby(['fecha_only', 'sentimiento_ia']).size().unstack(fill_value=0)
+        Args:
+            granularity: 'D' (diario), 'W' (semanal) o 'M' (mensual)
+            dimension: 'fuente', 'ubicacion' o None para el total
+            value: Valor de la dimensión a filtrar
         
-        return trend
+        Returns:
+            DataFrame indexado por periodo con una columna por sentimiento, o None
+        """
+        rollups = self.rollups()
+        if rollups is None:
+            return None
+        return rollups.trend(granularity, dimension, value)
     
-    def extract_keywords(self, sentiment_filter=None, top_n=15):
+    def extract_keywords(self, sentiment_filter=None, top_n=15, start_date=None, end_date=None):
         """
         Extrae palabras clave más frecuentes
         
+        El corpus (titular + cuerpo) se tokeniza una sola vez; cada filtro es
+        una suma dispersa sobre la matriz documento-término.
+        
         Args:
             sentiment_filter: "Positivo", "Negativo", "Neutro" o None para todos
             top_n: Número de palabras clave a retornar
+            start_date: Fecha mínima (inclusive) o None
+            end_date: Fecha máxima (inclusive) o None
         
         Returns:
             Lista de tuplas (palabra, frecuencia)
@@ -66,76 +136,78 @@ class TrendAnalyzer:
         if self.df is None:
             return []
         
-        # Filtrar por sentimiento si se especifica
-        df_filtered = self.df if sentiment_filter is None else self.df[self.df['sentimiento_ia'] == sentiment_filter]
-        
-        # Combinar titular y cuerpo
-        texts = df_filtered['titular'].fillna('') + ' ' + df_filtered['cuerpo'].fillna('')
-        
-        # Palabras a excluir (stopwords en español)
-        stopwords_es = set([
-            'el', 'la', 'de', 'que', 'y', 'a', 'en', 'un', 'ser', 'se', 'no', 'haber',
-            'por', 'con', 'su', 'para', 'como', 'estar', 'tener', 'le', 'lo', 'todo',
-            'pero', 'más', 'hacer', 'o', 'poder', 'decir', 'este', 'ir', 'otro', 'ese',
-            'si', 'me', 'ya', 'ver', 'porque', 'dar', 'cuando', 'él', 'muy', 'sin',
-            'vez', 'mucho', 'saber', 'qué', 'sobre', 'mi', 'alguno', 'mismo', 'yo',
-            'también', 'hasta', 'año', 'dos', 'querer', 'entre', 'así', 'primero',
-            'desde', 'grande', 'eso', 'ni', 'nos', 'llegar', 'pasar', 'tiempo', 'ella',
-            'del', 'los', 'las', 'una', 'unos', 'unas', 'al', 'ha', 'han', 'he'
-        ])
-        
-        # Extraer palabras
-        all_words = []
-        for text in texts:
-            words = re.findall(r'\b[a-záéíóúñ]{4,}\b', text.lower())
-            all_words.extend([w for w in words if w not in stopwords_es])
-        
-        # Contar frecuencias
-        word_freq = Counter(all_words).most_common(top_n)
-        
-        return word_freq
+        keywords = self._keyword_matrix()
+        
+        # Filtros vectorizados sobre el DataFrame completo
+        mask = np.ones(len(self.df), dtype=bool)
+        if sentiment_filter is not None:
+            mask &= (self.df['sentimiento_ia'] == sentiment_filter).to_numpy()
+        if (start_date is not None or end_date is not None) and 'fecha_parsed' in self.df.columns:
+            fechas = self.df['fecha_parsed']
+            if start_date is not None:
+                mask &= (fechas >= pd.Timestamp(start_date)).to_numpy()
+            if end_date is not None:
+                mask &= (fechas <= pd.Timestamp(end_date)).to_numpy()
+        
+        return keywords.top_keywords(None if mask.all() else mask, top_n)
+    
+    def _keyword_matrix(self):
+        """Matriz documento-término de titular + cuerpo (compartida con clustering)"""
+        if self._keywords is None:
+            texts = self.df['titular'].fillna('') + ' ' + self.df['cuerpo'].fillna('')
+            self._keywords = keyword_matrix(texts)
+        return self._keywords
     
     def cluster_news(self, n_clusters=3):
         """
         Agrupa noticias por similitud temática
         
+        Reutiliza la matriz de palabras clave cacheada (TF-IDF encima) y
+        MiniBatchKMeans; el mismo corpus devuelve los mismos temas en cada rerun.
+        
         Args:
-            n_clusters: Número de clusters a crear
+            n_clusters: Número de clusters a crear, o None para elegirlo por silueta
         
         Returns:
-            DataFrame con columna 'cluster' agregada
+            DataFrame con columna 'cluster' agregada y lista de temas por cluster
         """
-        if self.df is None or len(self.df) < n_clusters:
+        if self.df is None or len(self.df) < (n_clusters or 3):
             return None
         
-        # Combinar textos
-        texts = self.df['titular'].fillna('') + ' ' + self.df['cuerpo'].fillna('')
-        
-        # Vectorizar
-        vectorizer = TfidfVectorizer(max_features=100, stop_words='english')
-        X = vectorizer.fit_transform(texts)
+        clusters, self.topic_model = fit_topics(self._keyword_matrix(), n_clusters)
+        self._owns_topic_model = False
         
-        # Clustering
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        clusters = kmeans.fit_predict(X)
-        
-        # Agregar a DataFrame
-        df_clustered = self.df.copy()
+        # Agregar a DataFrame (copia superficial: no duplica las columnas existentes)
+        df_clustered = self.df.copy(deep=False)
         df_clustered['cluster'] = clusters
         
-        # Extraer temas principales de cada cluster
-        cluster_themes = []
-        feature_names = vectorizer.get_feature_names_out()
+        # Los agregados (y pronósticos) por cluster quedan disponibles
+        self.df['cluster'] = clusters
+        self._rollups = None
+        
+        return df_clustered, self.topic_model.themes(top_n=5)
+    
+    def assign_clusters(self, df_new, update_centroids=False):
+        """
+        Asigna noticias nuevas a los clusters del último cluster_news sin re-agrupar
         
-        for i in range(n_clusters):
-            # Obtener centroide del cluster
-            centroid = kmeans.cluster_centers_[i]
-            # Top 5 palabras más relevantes
-            top_indices = centroid.argsort()[-5:][::-1]
-            theme_words = [feature_names[idx] for idx in top_indices]
-            cluster_themes.append(', '.join(theme_words))
+        Args:
+            df_new: DataFrame con titular y cuerpo
+            update_centroids: Si True, los centroides se ajustan con las nuevas noticias
         
-        return df_clustered, cluster_themes
+        Returns:
+            Arreglo con el cluster de cada noticia, o None si aún no hay clusters
+        """
+        if self.topic_model is None:
+            return None
+        texts = df_new['titular'].fillna('') + ' ' + df_new['cuerpo'].fillna('')
+        if update_centroids:
+            # Copia antes del primer ajuste: el modelo del caché no debe cambiar para otras sesiones
+            if not self._owns_topic_model:
+                self.topic_model = self.topic_model.copy()
+                self._owns_topic_model = True
+            return self.topic_model.update(texts)
+        return self.topic_model.assign(texts)
     
     def get_risk_score(self):
         """
@@ -261,42 +333,74 @@ class TrendAnalyzer:
         
         return summary
     
-    def predict_sentiment_trend(self):
+    def _forecast_scope(self):
         """
-        Predice tendencia futura del sentimiento (simplificado)
-        
-        Returns:
-            String con predicción
+        Clave del estado de pronóstico: el historial persistente es uno solo; los datos
+        cargados se separan por su huella (otras sesiones u otros archivos no lo pisan)
         """
-        if self.df is None or 'fecha_parsed' not in self.df.columns:
-            return "No hay suficientes datos temporales para predicción."
+        if self.rollup_store is not None:
+            return 'historial'
+        return f"cargados:{self.rollups().fingerprint}"
+    
+    def forecast_sentiment(self, horizon=7, dimension=None, value=None):
+        """
+        Pronostica conteos diarios por sentimiento e índice de riesgo
         
-        df_with_dates = self.df[self.df['fecha_parsed'].notna()].copy()
+        Args:
+            horizon: Días a pronosticar
+            dimension: 'fuente', 'ubicacion', 'cluster' o None para el total
+            value: Valor de la dimensión
         
-        if len(df_with_dates) < 5:
-            return "Se necesitan al menos 5 noticias con fecha para predicción."
+        Returns:
+            dict con 'history' y 'forecast' (DataFrames diarios con intervalos),
+            baseline_risk, forecast_risk y risk_change; None sin fechas
+        """
+        rollups = self.rollups()
+        if rollups is None:
+            return None
+        forecaster = self.forecaster or get_forecaster()
+        return forecaster.forecast(rollups, dimension, value, horizon, scope=self._forecast_scope())
+    
+    def forecast_by(self, dimension, horizon=7, values=None):
+        """
+        Pronósticos de cada valor de una dimensión (ubicación, fuente, cluster), ajustados en lote
         
-        # Ordenar por fecha
-        df_sorted = df_with_dates.sort_values('fecha_parsed')
+        Returns:
+            dict valor -> pronóstico como en forecast_sentiment
+        """
+        rollups = self.rollups()
+        if rollups is None:
+            return {}
+        forecaster = self.forecaster or get_forecaster()
+        return forecaster.forecast_groups(rollups, dimension, values, horizon, scope=self._forecast_scope())
+    
+    def predict_sentiment_trend(self, horizon=7):
+        """
+        Predice tendencia futura del sentimiento
         
-        # Calcular tendencia en últimas vs primeras noticias
-        recent_count = len(df_sorted) // 4  # Último 25%
-        old_count = len(df_sorted) // 4  # Primer 25%
+        Compara el riesgo pronosticado (proporción negativa de los próximos días)
+        con el riesgo observado en el histórico.
         
-        recent_neg = len(df_sorted.tail(recent_count)[df_sorted.tail(recent_count)['sentimiento_ia'] == 'Negativo'])
-        old_neg = len(df_sorted.head(old_count)[df_sorted.head(old_count)['sentimiento_ia'] == 'Negativo'])
+        Returns:
+            String con predicción
+        """
+        if self.rollups() is None:
+            return "No hay suficientes datos temporales para predicción."
         
-        recent_neg_pct = (recent_neg / recent_count) * 100 if recent_count > 0 else 0
-        old_neg_pct = (old_neg / old_count) * 100 if old_count > 0 else 0
+        trend = self.get_sentiment_trend_over_time('D')
+        if trend is None or trend.to_numpy().sum() < 5:
+            return "Se necesitan al menos 5 noticias con fecha para predicción."
         
-        trend_diff = recent_neg_pct - old_neg_pct
+        forecast = self.forecast_sentiment(horizon)
+        trend_diff = forecast['risk_change']
+        detail = (f" Riesgo proyectado a {horizon} días: {forecast['forecast_risk']:.1f}% "
+                  f"(histórico {forecast['baseline_risk']:.1f}%).")
         
-        if trend_diff > 10:
+        if trend_diff > RISK_CHANGE_THRESHOLD:
             prediction = "📉 **TENDENCIA NEGATIVA**: El sentimiento está empeorando. Incremento de noticias negativas."
-        elif trend_diff < -10:
+        elif trend_diff < -RISK_CHANGE_THRESHOLD:
             prediction = "📈 **TENDENCIA POSITIVA**: El sentimiento está mejorando. Reducción de noticias negativas."
         else:
             prediction = "➡️ **TENDENCIA ESTABLE**: El sentimiento se mantiene sin cambios significativos."
         
-        return prediction
-
+        return prediction + detail
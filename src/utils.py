@@ -1,156 +1,388 @@
+import codecs
+import hashlib
+import os
+import tempfile
+from datetime import datetime
 import pandas as pd
 import streamlit as st
-from io import StringIO
 
-def load_and_validate_csv(uploaded_file):
+# Codificaciones a intentar sobre el archivo completo (en orden de preferencia)
+CSV_ENCODINGS = ['utf-8', 'cp1252', 'latin-1']
+
+# Separadores admitidos; en empate gana el primero (punto y coma es el estándar del dataset R9)
+CSV_SEPARATORS = [';', ',', '\t', '|']
+
+# Categorías de sentimiento (columna categórica en el almacenamiento columnar)
+SENTIMENT_CATEGORIES = ['Positivo', 'Negativo', 'Neutro']
+
+# Columnas de texto que deben conservarse como texto al reabrir un archivo Parquet
+NORMALIZED_COLUMNS = ['id_original', 'titular', 'cuerpo', 'fecha', 'texto_completo']
+
+# Carpeta local para las corridas de análisis archivadas
+ANALYSIS_ARCHIVE_DIR = "data/analisis"
+
+# Retención del archivo: corridas máximas y antigüedad máxima en días (None = sin límite)
+ANALYSIS_ARCHIVE_MAX_RUNS = 20
+ANALYSIS_ARCHIVE_MAX_AGE_DAYS = 30
+
+# Mapeo inteligente de columnas: nombre normalizado -> nombres aceptados en el CSV
+REQUIRED_COLUMNS = {
+    'Headline': ['Titular', 'Titular de la Noticia', 'Headline', 'Title'],
+    'Body': ['Cuerpo', 'Cuerpo del Texto (resumen)', 'Body', 'Content', 'Resumen'],
+    'Date': ['Fecha', 'Fecha Publicación', 'Date', 'Fecha Publicacion'],
+    'ID': ['ID', 'id', 'Id']
+}
+
+
+def _detect_encoding(uploaded_file, candidates, block_size=1024 * 1024):
     """
-    Carga y valida el CSV de noticias forzando el separador correcto
-    para el dataset R9.
-    Maneja múltiples codificaciones para evitar errores de caracteres.
+    Primera codificación que decodifica el archivo completo, recorrido por bloques
+    (memoria constante). Un byte inválido descarta la candidata y se prueba la
+    siguiente, en lugar de reemplazar caracteres en silencio.
     """
-    # Lista de codificaciones a intentar (en orden de preferencia)
-    encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1', 'utf-8-sig']
-    
-    df = None
-    encoding_used = None
-    
     try:
-        # 1. Intentar leer con diferentes codificaciones y separadores
-        # Intentar primero con punto y coma (Estándar del archivo R9)
-        for encoding in encodings:
+        for candidate in candidates:
+            decoder = codecs.getincrementaldecoder(candidate)()
+            uploaded_file.seek(0)
             try:
-                uploaded_file.seek(0)  # Reiniciar el archivo
-                # Intentar con punto y coma
-                df = pd.read_csv(
-                    uploaded_file, 
-                    sep=';', 
-                    dtype=str, 
-                    encoding=encoding,
-                    engine='python',  # Usar engine python para mejor manejo de errores
-                    on_bad_lines='skip' if hasattr(pd, '__version__') and pd.__version__ >= '1.3.0' else 'error'
-                )
-                # Verificar que se leyeron columnas válidas
-                if df is not None and len(df.columns) >= 2:
-                    encoding_used = encoding
-                    break  # Si funciona, salir del loop
-            except (UnicodeDecodeError, UnicodeError) as e:
-                continue  # Intentar siguiente codificación
-            except Exception:
-                # Si es otro error, intentar siguiente codificación
+                while True:
+                    block = uploaded_file.read(block_size)
+                    decoder.decode(block, final=not block)
+                    if not block:
+                        return candidate
+            except UnicodeDecodeError:
                 continue
-        
-        # Si aún no funcionó, intentar con coma
-        if df is None or len(df.columns) < 2:
-            for encoding in encodings:
-                try:
-                    uploaded_file.seek(0)
-                    df = pd.read_csv(
-                        uploaded_file, 
-                        sep=',', 
-                        dtype=str, 
-                        encoding=encoding,
-                        engine='python',
-                        on_bad_lines='skip' if hasattr(pd, '__version__') and pd.__version__ >= '1.3.0' else 'error'
-                    )
-                    if df is not None and len(df.columns) >= 2:
-                        encoding_used = encoding
-                        break
-                except (UnicodeDecodeError, UnicodeError):
-                    continue
-                except Exception:
-                    continue
-        
-        # Si aún no funcionó, último intento leyendo como bytes y decodificando manualmente
-        if df is None or len(df.columns) < 2:
-            try:
-                uploaded_file.seek(0)
-                # Leer el archivo como bytes primero
-                file_bytes = uploaded_file.read()
-                
-                # Intentar decodificar con diferentes codificaciones
-                for encoding in encodings:
-                    try:
-                        file_text = file_bytes.decode(encoding, errors='replace')
-                        # Convertir a StringIO para leer con pandas
-                        df = pd.read_csv(StringIO(file_text), sep=';', dtype=str, engine='python')
-                        if df is not None and len(df.columns) >= 2:
-                            encoding_used = f"{encoding} (con reemplazo)"
-                            break
-                    except:
-                        continue
-                
-                # Si aún no funciona con punto y coma, intentar con coma
-                if df is None or len(df.columns) < 2:
-                    for encoding in encodings:
-                        try:
-                            file_text = file_bytes.decode(encoding, errors='replace')
-                            df = pd.read_csv(StringIO(file_text), sep=',', dtype=str, engine='python')
-                            if df is not None and len(df.columns) >= 2:
-                                encoding_used = f"{encoding} (con reemplazo)"
-                                break
-                        except:
-                            continue
-                            
-            except Exception as e:
-                return None, f"Error crítico leyendo el archivo: No se pudo leer con ninguna codificación. Detalles: {str(e)}"
-        
-        if df is None or len(df) == 0:
-            return None, "Error: El archivo está vacío o no se pudo leer correctamente."
-
-        # 2. Limpieza de nombres de columnas (eliminar espacios extra)
-        df.columns = [c.strip() for c in df.columns]
-        
-        # 3. Mapeo inteligente de columnas
-        required_columns = {
-            'Headline': ['Titular', 'Titular de la Noticia', 'Headline', 'Title'],
-            'Body': ['Cuerpo', 'Cuerpo del Texto (resumen)', 'Body', 'Content', 'Resumen'],
-            'Date': ['Fecha', 'Fecha Publicación', 'Date', 'Fecha Publicacion'],
-            'ID': ['ID', 'id', 'Id']
-        }
-        
-        mapped_cols = {}
-        missing = []
-
-        for key, possibilities in required_columns.items():
-            found = False
-            for p in possibilities:
-                if p in df.columns:
-                    mapped_cols[key] = p
-                    found = True
-                    break
-            if not found and key != 'ID': # El ID es opcional, lo podemos generar
-                missing.append(key)
-
-        if missing:
-            return None, f"❌ Faltan columnas: {', '.join(missing)}. Revisa que el CSV use punto y coma (;)."
-
-        # 4. Crear DataFrame limpio
-        df_clean = pd.DataFrame()
-        
-        # Manejo del ID: Si existe, úsalo. Si no, usa el índice + 1.
-        if 'ID' in mapped_cols:
-            df_clean['id_original'] = df[mapped_cols['ID']].astype(str)
+    finally:
+        uploaded_file.seek(0)
+    return candidates[-1]
+
+
+def sniff_csv_format(uploaded_file, sample_size=64 * 1024):
+    """
+    Detecta codificación (validada sobre todo el archivo) y separador (en los primeros KB)
+
+    Args:
+        uploaded_file: Archivo subido (binario) o buffer de texto
+        sample_size: Bytes/caracteres a inspeccionar para el separador
+
+    Returns:
+        (encoding, separador). encoding es None si el buffer ya es texto
+    """
+    uploaded_file.seek(0)
+    sample = uploaded_file.read(sample_size)
+    uploaded_file.seek(0)
+
+    encoding = None
+    if isinstance(sample, bytes):
+        if sample.startswith(codecs.BOM_UTF8):
+            encoding = _detect_encoding(uploaded_file, ['utf-8-sig'] + CSV_ENCODINGS[1:])
         else:
-            df_clean['id_original'] = (df.index + 1).astype(str)
+            encoding = _detect_encoding(uploaded_file, CSV_ENCODINGS)
+        # Solo para localizar el separador: un carácter cortado al final de la muestra no importa
+        text = codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+    else:
+        text = sample
 
-        df_clean['titular'] = df[mapped_cols['Headline']].fillna('Sin Titular')
-        df_clean['cuerpo'] = df[mapped_cols['Body']].fillna('')
-        df_clean['fecha'] = df[mapped_cols['Date']].fillna('')
+    header = text.splitlines()[0] if text else ''
+    sep = max(CSV_SEPARATORS, key=lambda s: (header.count(s), -CSV_SEPARATORS.index(s)))
+    if header.count(sep) == 0:
+        sep = ';'
+    return encoding, sep
 
-        # Crear texto completo para la IA
-        df_clean['texto_completo'] = df_clean['titular'] + ". " + df_clean['cuerpo']
-        
-        # Log de la codificación usada (opcional, solo para debugging)
-        if encoding_used:
-            st.caption(f"✅ Archivo leído correctamente (codificación: {encoding_used})")
-        
-        return df_clean, None
 
-    except Exception as e:
-        error_msg = str(e)
-        # Mensaje más específico para errores de codificación
-        if 'codec' in error_msg or 'decode' in error_msg or 'encoding' in error_msg.lower():
-            return None, f"Error de codificación: El archivo tiene caracteres no válidos. Intenta guardar el CSV con codificación UTF-8. Detalles: {error_msg}"
+def _map_columns(columns):
+    """Retorna (mapeo, faltantes) según REQUIRED_COLUMNS"""
+    mapped_cols = {}
+    missing = []
+
+    for key, possibilities in REQUIRED_COLUMNS.items():
+        found = False
+        for p in possibilities:
+            if p in columns:
+                mapped_cols[key] = p
+                found = True
+                break
+        if not found and key != 'ID':  # El ID es opcional, lo podemos generar
+            missing.append(key)
+    return mapped_cols, missing
+
+
+def _normalize_chunk(chunk, mapped_cols, row_offset):
+    """Convierte un bloque crudo al formato id_original/titular/cuerpo/fecha/texto_completo"""
+    df_clean = pd.DataFrame(index=chunk.index)
+
+    # Manejo del ID: Si existe, úsalo. Si no, usa la posición global + 1.
+    if 'ID' in mapped_cols:
+        df_clean['id_original'] = chunk[mapped_cols['ID']].astype(str)
+    else:
+        df_clean['id_original'] = [str(i) for i in range(row_offset + 1, row_offset + len(chunk) + 1)]
+
+    df_clean['titular'] = chunk[mapped_cols['Headline']].fillna('Sin Titular')
+    df_clean['cuerpo'] = chunk[mapped_cols['Body']].fillna('')
+    df_clean['fecha'] = chunk[mapped_cols['Date']].fillna('')
+
+    # Crear texto completo para la IA
+    df_clean['texto_completo'] = df_clean['titular'] + ". " + df_clean['cuerpo']
+    return df_clean
+
+
+def iter_csv_chunks(uploaded_file, chunksize=5000, csv_format=None):
+    """
+    Lectura en streaming del CSV de noticias: detecta formato una sola vez y
+    parsea por bloques con el motor C, así el análisis puede empezar con el
+    primer bloque y la memoria no crece con el tamaño del archivo.
+
+    Args:
+        uploaded_file: Archivo subido (binario) o buffer de texto
+        chunksize: Filas por bloque
+        csv_format: (encoding, separador) ya detectados con sniff_csv_format; evita
+                    volver a decodificar todo el archivo en cada lectura
+
+    Returns:
+        (generador de DataFrames normalizados, None) o (None, mensaje de error).
+        El generador expone el formato usado en los atributos `encoding` y `sep`.
+    """
+    try:
+        if csv_format is None:
+            encoding, sep = sniff_csv_format(uploaded_file)
         else:
-            return None, f"Error crítico leyendo el archivo: {error_msg}"
+            encoding, sep = csv_format
+            uploaded_file.seek(0)
+        reader = pd.read_csv(
+            uploaded_file,
+            sep=sep,
+            dtype=str,
+            encoding=encoding or 'utf-8',
+            engine='c',
+            on_bad_lines='skip',
+            chunksize=chunksize
+        )
+        first = next(reader, None)
+    except pd.errors.EmptyDataError:
+        return None, "Error: El archivo está vacío o no se pudo leer correctamente."
+    except Exception as e:
+        return None, _read_error_message(e)
+
+    if first is None or len(first) == 0:
+        return None, "Error: El archivo está vacío o no se pudo leer correctamente."
+
+    # Limpieza de nombres de columnas (eliminar espacios extra)
+    columns = [c.strip() for c in first.columns]
+    mapped_cols, missing = _map_columns(columns)
+    if missing:
+        return None, f"❌ Faltan columnas: {', '.join(missing)}. Revisa que el CSV use punto y coma (;)."
+
+    def generate():
+        row_offset = 0
+        for chunk in _chain_first(first, reader):
+            chunk.columns = columns
+            yield _normalize_chunk(chunk, mapped_cols, row_offset)
+            row_offset += len(chunk)
+
+    stream = _CSVStream(generate(), encoding, sep)
+    return stream, None
+
+
+def _chain_first(first, reader):
+    yield first
+    yield from reader
+
+
+class _CSVStream:
+    """Iterador de bloques con la codificación y el separador como metadatos"""
+
+    def __init__(self, chunks, encoding, sep):
+        self._chunks = chunks
+        self.encoding = encoding
+        self.sep = sep
+
+    def __iter__(self):
+        return self._chunks
+
+
+def _read_error_message(e):
+    error_msg = str(e)
+    # Mensaje más específico para errores de codificación
+    if 'codec' in error_msg or 'decode' in error_msg or 'encoding' in error_msg.lower():
+        return f"Error de codificación: El archivo tiene caracteres no válidos. Intenta guardar el CSV con codificación UTF-8. Detalles: {error_msg}"
+    return f"Error crítico leyendo el archivo: {error_msg}"
+
+
+def load_and_validate_csv(uploaded_file):
+    """
+    Carga y valida el CSV de noticias detectando el separador correcto
+    (punto y coma para el dataset R9, coma como alternativa).
+    Maneja múltiples codificaciones para evitar errores de caracteres.
+    """
+    stream, error = iter_csv_chunks(uploaded_file)
+    if error:
+        return None, error
+
+    try:
+        df_clean = pd.concat(list(stream), ignore_index=True)
+    except Exception as e:
+        return None, _read_error_message(e)
+
+    # Log de la codificación usada (opcional, solo para debugging)
+    if stream.encoding:
+        st.caption(f"✅ Archivo leído correctamente (codificación: {stream.encoding})")
+
+    return df_clean, None
+
+
+def to_columnar(df):
+    """
+    Prepara un DataFrame de análisis para almacenamiento columnar:
+    sentimiento como categórica y textos como string
+    """
+    df_out = df.copy()
+    for col in ('sentimiento_ia', 'sentimiento'):
+        if col in df_out.columns:
+            extra = [v for v in pd.unique(df_out[col].dropna()) if v not in SENTIMENT_CATEGORIES]
+            df_out[col] = pd.Categorical(df_out[col], categories=SENTIMENT_CATEGORIES + sorted(map(str, extra)))
+    for col in NORMALIZED_COLUMNS + ['explicacion_ia']:
+        if col in df_out.columns:
+            df_out[col] = df_out[col].astype('string')
+    return df_out
+
+
+def frame_fingerprint(df):
+    """
+    Huella corta del contenido (columnas y valores) de un DataFrame
+
+    Recorre todas las filas: se calcula una vez al ingerir una corrida y se
+    reutiliza como clave de los datos derivados (fechas, agregados, pronósticos)
+    """
+    hashed = pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+    digest = hashlib.md5('\x1e'.join(map(str, df.columns)).encode())
+    digest.update(hashed.tobytes())
+    return digest.hexdigest()[:12]
+
+
+def save_analysis_parquet(df, directory=ANALYSIS_ARCHIVE_DIR, name=None,
+                          max_runs=ANALYSIS_ARCHIVE_MAX_RUNS, max_age_days=ANALYSIS_ARCHIVE_MAX_AGE_DAYS,
+                          fingerprint=None):
+    """
+    Archiva una corrida de análisis como Parquet (escritura atómica)
+
+    Si ya hay una corrida con el mismo contenido se reutiliza (solo se actualiza su
+    fecha) y, tras escribir, se podan las corridas que exceden la retención.
+
+    Args:
+        df: DataFrame analizado
+        directory: Carpeta del archivo
+        name: Nombre del archivo (por defecto analisis_YYYYmmdd_HHMMSS_<huella>.parquet)
+        max_runs: Corridas que se conservan como máximo
+        max_age_days: Días que se conserva una corrida
+        fingerprint: frame_fingerprint(df) si ya se calculó
+
+    Returns:
+        Ruta del archivo escrito o reutilizado
+    """
+    os.makedirs(directory, exist_ok=True)
+    if name is None:
+        fingerprint = fingerprint or frame_fingerprint(df)
+        for existing in list_analysis_runs(directory):
+            if existing.endswith(f"_{fingerprint}.parquet"):
+                os.utime(existing)  # Cuenta como la corrida más reciente para la retención
+                return existing
+        name = f"analisis_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{fingerprint}.parquet"
+    path = os.path.join(directory, name)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        to_columnar(df).to_parquet(tmp_path, engine='pyarrow', index=False, compression='zstd')
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    prune_analysis_runs(directory, max_runs=max_runs, max_age_days=max_age_days, keep=path)
+    return path
+
+
+def prune_analysis_runs(directory=ANALYSIS_ARCHIVE_DIR, max_runs=ANALYSIS_ARCHIVE_MAX_RUNS,
+                        max_age_days=ANALYSIS_ARCHIVE_MAX_AGE_DAYS, keep=None):
+    """
+    Elimina las corridas más antiguas que max_age_days y las que exceden max_runs
+
+    Args:
+        keep: Ruta que nunca se elimina (la corrida recién escrita)
+
+    Returns:
+        Lista de rutas eliminadas
+    """
+    runs = list_analysis_runs(directory)
+    cutoff = datetime.now().timestamp() - max_age_days * 86400 if max_age_days is not None else None
+    removed = []
+    for position, path in enumerate(runs):
+        if path == keep:
+            continue
+        too_many = max_runs is not None and position >= max_runs
+        too_old = cutoff is not None and os.path.getmtime(path) < cutoff
+        if too_many or too_old:
+            try:
+                os.remove(path)
+                removed.append(path)
+            except OSError:
+                pass  # Otro proceso pudo eliminarla primero
+    return removed
+
+
+def load_parquet(path, columns=None):
+    """
+    Lee un archivo Parquet con memory-map (el SO pagina el archivo bajo demanda)
+
+    Args:
+        path: Ruta local del archivo
+        columns: Subconjunto de columnas a leer (None = todas)
+    """
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+def run_fingerprint(path):
+    """Huella guardada en el nombre de una corrida archivada, o None si no la lleva"""
+    stem = os.path.basename(path).rsplit('.', 1)[0]
+    suffix = stem.rsplit('_', 1)[-1]
+    if stem.startswith('analisis_') and len(suffix) == 12 and all(c in '0123456789abcdef' for c in suffix):
+        return suffix
+    return None
+
+
+def list_analysis_runs(directory=ANALYSIS_ARCHIVE_DIR):
+    """Corridas archivadas, de la más reciente a la más antigua"""
+    if not os.path.isdir(directory):
+        return []
+    runs = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.parquet')]
+    return sorted(runs, key=os.path.getmtime, reverse=True)
+
+
+def load_and_validate_parquet(uploaded_file):
+    """
+    Carga un dataset de noticias en Parquet/Arrow con el mismo contrato que load_and_validate_csv.
+    Acepta tanto exportaciones crudas (Titular, Cuerpo, Fecha) como corridas ya normalizadas.
+    """
+    try:
+        df = pd.read_parquet(uploaded_file, engine='pyarrow')
+    except ImportError:
+        return None, "Error: Se requiere pyarrow para leer archivos Parquet (pip install pyarrow)."
+    except Exception as e:
+        return None, f"Error crítico leyendo el archivo: {str(e)}"
+
+    if len(df) == 0:
+        return None, "Error: El archivo está vacío o no se pudo leer correctamente."
+
+    # Corrida archivada por la app: ya está normalizada
+    if all(col in df.columns for col in NORMALIZED_COLUMNS):
+        return df.reset_index(drop=True), None
+
+    df.columns = [str(c).strip() for c in df.columns]
+    mapped_cols, missing = _map_columns(df.columns)
+    if missing:
+        return None, f"❌ Faltan columnas: {', '.join(missing)}."
 
+    raw = df.astype({col: 'string' for col in mapped_cols.values()})
+    return _normalize_chunk(raw.reset_index(drop=True), mapped_cols, 0), None
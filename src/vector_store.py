@@ -0,0 +1,305 @@
+"""
+Almacén de embeddings con búsqueda aproximada (IVF en numpy) para el chatbot RAG
+Vectores en disco como .npy abiertos con mmap: varias sesiones y procesos leen
+los mismos archivos sin copiarlos en memoria
+"""
+import json
+import logging
+import os
+import tempfile
+from functools import lru_cache
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from src.text_es import tokenize
+
+logger = logging.getLogger(__name__)
+
+_ARRAYS = ("vectors", "ids", "offsets", "centroids", "pending_vectors", "pending_ids")
+
+
+def top_k_indices(scores, k):
+    """Índices de los k mayores puntajes, ordenados, sin ordenar todo el arreglo"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def normalize_rows(vectors):
+    """Filas con norma 1 (el producto punto pasa a ser similitud coseno)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def embedder_name(embedder):
+    """Identificador del modelo de embeddings (vectores de otro modelo no son comparables)"""
+    return getattr(embedder, 'name', None) or getattr(embedder, '__name__', None) or type(embedder).__name__
+
+
+class HashingEmbedder:
+    """
+    Embeddings locales sin modelo: hashing firmado de raíces en español.
+    Sustituto ligero de un modelo de sentence-transformers (sin descargas ni GPU)
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+        self.vectorizer = HashingVectorizer(
+            n_features=dim,
+            alternate_sign=True,
+            norm='l2',
+            analyzer=tokenize,
+        )
+
+    def __call__(self, texts):
+        return self.vectorizer.transform(list(texts)).toarray().astype(np.float32)
+
+
+class SentenceTransformerEmbedder:
+    """Embeddings con un modelo local de sentence-transformers"""
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def __call__(self, texts):
+        return self.model.encode(list(texts), batch_size=64, show_progress_bar=False)
+
+
+@lru_cache(maxsize=4)
+def load_local_embedder(model_name):
+    """
+    Embeddings locales (opcional, cargado una vez por proceso)
+
+    Args:
+        model_name: "hashing" para el sustituto sin modelo, o un modelo de sentence-transformers
+
+    Returns:
+        Embedder (textos -> matriz (n, d)), o None si el modelo no está disponible
+    """
+    if model_name == "hashing":
+        return HashingEmbedder()
+    try:
+        return SentenceTransformerEmbedder(model_name)
+    except ImportError:
+        logger.warning("⚠️ sentence-transformers no instalado: búsqueda solo con BM25")
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo cargar el modelo de embeddings {model_name}: {e}")
+    return None
+
+
+class IVFVectorStore:
+    def __init__(self, store_dir, n_probe=8, min_train_size=2048, rebuild_ratio=0.25,
+                 max_train_sample=20000, seed=42):
+        """
+        Inicializa el almacén de vectores
+
+        Los ids son posiciones consecutivas del índice de noticias (0, 1, 2, ...).
+        Hasta min_train_size vectores la búsqueda es exacta; después se entrena un
+        IVF (k-means esférico con ~sqrt(n) listas) y cada consulta solo recorre las
+        n_probe listas más cercanas. Los vectores nuevos quedan en una lista
+        pendiente de búsqueda exacta hasta que superan rebuild_ratio del total.
+
+        Args:
+            store_dir: Carpeta con los .npy y meta.json
+            n_probe: Listas invertidas visitadas por consulta
+            min_train_size: Vectores necesarios para entrenar el IVF
+            rebuild_ratio: Fracción de pendientes que dispara un re-entrenamiento
+            max_train_sample: Vectores usados como muestra para k-means
+            seed: Semilla fija (mismas listas entre procesos)
+        """
+        self.store_dir = store_dir
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.rebuild_ratio = rebuild_ratio
+        self.max_train_sample = max_train_sample
+        self.seed = seed
+        self.identity = None
+        self._loaded_mtime = None
+        self._reset()
+
+    def _reset(self):
+        self.vectors = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.centroids = None
+        self.pending_vectors = None
+        self.pending_ids = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids) + len(self.pending_ids)
+
+    def _path(self, name):
+        return os.path.join(self.store_dir, f"{name}.npy" if name != "meta" else "meta.json")
+
+    def open(self, identity):
+        """
+        Asocia el almacén a un modelo de embeddings e índice concretos y carga
+        los vectores de disco si corresponden a esa identidad
+        """
+        self.identity = identity
+        self._reset()
+        self._loaded_mtime = None
+        self.reload_if_changed()
+
+    def reload_if_changed(self):
+        """Vuelve a abrir los .npy si otro proceso o sesión los reescribió"""
+        meta_path = self._path("meta")
+        try:
+            mtime = os.path.getmtime(meta_path)
+        except OSError:
+            return
+        if self._loaded_mtime is not None and mtime <= self._loaded_mtime:
+            return
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("identity") != self.identity:
+                return
+            # mmap de solo lectura: las páginas se comparten entre sesiones y procesos
+            arrays = {name: np.load(self._path(name), mmap_mode='r') for name in _ARRAYS
+                      if os.path.exists(self._path(name))}
+        except Exception as e:
+            logger.warning(f"⚠️ Almacén de vectores ilegible, se reconstruirá: {e}")
+            return
+
+        self._reset()
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        if self.centroids is not None and not len(self.centroids):
+            self.centroids = None
+        self._loaded_mtime = mtime
+        logger.info(f"🧭 Almacén de vectores cargado de disco: {len(self)} vectores")
+
+    def clear(self):
+        """Descarta los vectores (memoria y disco)"""
+        self._reset()
+        self._loaded_mtime = None
+        for name in _ARRAYS + ("meta",):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+
+    def _atomic_save(self, name, array):
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp_path, self._path(name))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _save(self, names):
+        os.makedirs(self.store_dir, exist_ok=True)
+        for name in names:
+            array = getattr(self, name)
+            self._atomic_save(name, array if array is not None else np.empty((0, 0), dtype=np.float32))
+        # meta.json al final: marca los arreglos como completos para los lectores
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"identity": self.identity, "n_vectors": len(self)}, f)
+        os.replace(tmp_path, self._path("meta"))
+        self.reload_if_changed()
+
+    def add(self, vectors):
+        """
+        Añade vectores con ids consecutivos a partir de len(self)
+
+        Args:
+            vectors: Matriz (n, d); se normaliza a norma 1
+        """
+        vectors = normalize_rows(vectors)
+        if not len(vectors):
+            return
+        start = len(self)
+        new_ids = np.arange(start, start + len(vectors), dtype=np.int64)
+        if self.pending_vectors is not None and len(self.pending_vectors):
+            vectors = np.vstack([self.pending_vectors, vectors])
+            new_ids = np.concatenate([self.pending_ids, new_ids])
+        self.pending_vectors = vectors
+        self.pending_ids = new_ids
+
+        indexed = len(self.ids)
+        if len(self) >= self.min_train_size and len(self.pending_ids) > self.rebuild_ratio * max(indexed, 1):
+            self._rebuild()
+            self._save(_ARRAYS)
+        elif self._loaded_mtime is None:
+            # Primera escritura de esta identidad: no dejar arreglos de otra en disco
+            self._save(_ARRAYS)
+        else:
+            self._save(("pending_vectors", "pending_ids"))
+
+    def _train(self, vectors):
+        """K-means esférico (producto punto) sobre una muestra"""
+        rng = np.random.default_rng(self.seed)
+        n_lists = max(1, int(np.sqrt(len(vectors))))
+        sample_size = min(len(vectors), self.max_train_sample)
+        sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(10):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            membership = sp.csr_matrix(
+                (np.ones(sample_size, dtype=np.float32), (assign, np.arange(sample_size))),
+                shape=(n_lists, sample_size),
+            )
+            sums = np.asarray(membership @ sample)
+            filled = np.linalg.norm(sums, axis=1) > 0
+            centroids[filled] = normalize_rows(sums[filled])
+        return centroids
+
+    def _rebuild(self):
+        """Re-entrena el IVF con todos los vectores y los ordena por lista"""
+        parts = [v for v in (self.vectors, self.pending_vectors) if v is not None and len(v)]
+        vectors = np.vstack(parts).astype(np.float32)
+        ids = np.concatenate([self.ids, self.pending_ids]).astype(np.int64)
+        centroids = self._train(vectors)
+
+        assign = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), 8192):
+            assign[start:start + 8192] = np.argmax(vectors[start:start + 8192] @ centroids.T, axis=1)
+        order = np.argsort(assign, kind='stable')
+
+        self.vectors = vectors[order]
+        self.ids = ids[order]
+        self.offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1)).astype(np.int64)
+        self.centroids = centroids
+        self.pending_vectors = None
+        self.pending_ids = np.empty(0, dtype=np.int64)
+        logger.info(f"🧭 IVF re-entrenado: {len(self.ids)} vectores en {len(centroids)} listas")
+
+    def search(self, query, k=10):
+        """
+        Vecinos aproximados por similitud coseno
+
+        Args:
+            query: Vector de consulta (d,)
+            k: Número de resultados
+
+        Returns:
+            (ids, similitudes) ordenados de mayor a menor
+        """
+        query = normalize_rows(np.asarray(query).reshape(1, -1))[0]
+        candidate_ids, candidate_vectors = [], []
+        if self.centroids is not None:
+            for c in top_k_indices(self.centroids @ query, self.n_probe):
+                start, end = self.offsets[c], self.offsets[c + 1]
+                if start < end:
+                    candidate_ids.append(self.ids[start:end])
+                    candidate_vectors.append(self.vectors[start:end])
+        if self.pending_vectors is not None and len(self.pending_vectors):
+            candidate_ids.append(self.pending_ids)
+            candidate_vectors.append(self.pending_vectors)
+        if not candidate_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate([np.asarray(v) @ query for v in candidate_vectors])
+        top = top_k_indices(scores, k)
+        return ids[top], scores[top]
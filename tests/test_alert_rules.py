@@ -0,0 +1,218 @@
+"""
+Tests para el motor de reglas de alertas declarativo
+"""
+import pytest
+import pandas as pd
+import os
+import sys
+import json
+import tempfile
+import shutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.alert_rules import (
+    DEFAULT_RULES, RuleEngine, parse_rules, load_rules, merge_rules, save_user_rules, user_rules_path
+)
+from src.alert_system import AlertSystem
+from src.term_matcher import shared_matcher
+
+
+def make_df():
+    return pd.DataFrame({
+        'titular': ['Sequía en Tuluá', 'Plaga en Cali', 'Crisis en Tuluá', 'Buen año cafetero', 'Paro en Buga',
+                    'Exportaciones crecen'],
+        'cuerpo': ['Pérdidas', 'Cultivos', 'Tuluá sufre', 'Café', 'Bloqueos', 'Café y caña'],
+        'fuente': ['El País', 'El País', 'El Tiempo', 'El País', 'El País', 'El Tiempo'],
+        'fecha': ['2024-01-01', '2024-01-20', '2024-01-25', '2024-01-26', '2024-01-27', '2024-01-28'],
+        'sentimiento_ia': ['Negativo', 'Negativo', 'Negativo', 'Positivo', 'Negativo', 'Positivo'],
+    })
+
+
+class TestRuleEngine:
+    """Pruebas para RuleEngine"""
+
+    def test_ratio_rules_vectorized(self):
+        """Prueba varias reglas de proporción evaluadas juntas con distintos operadores"""
+        engine = RuleEngine({
+            'neg': {'type': 'ratio', 'sentiment': 'Negativo', 'op': '>=', 'threshold': 0.5, 'severity': 'high'},
+            'pos_low': {'type': 'ratio', 'sentiment': 'Positivo', 'op': '<', 'threshold': 0.2},
+            'neutral': {'type': 'ratio', 'sentiment': 'Neutro', 'op': '>', 'threshold': 0.1},
+        })
+
+        alerts = engine.evaluate(make_df())
+
+        assert [a['type'] for a in alerts] == ['neg']
+        assert '66.7% (4/6)' in alerts[0]['message']
+
+    def test_keyword_rule(self):
+        """Prueba una regla de palabras clave restringida a noticias negativas"""
+        engine = RuleEngine({'kw': {'type': 'keywords', 'keywords': ['sequía', 'café'], 'sentiment': 'Negativo'}})
+
+        alert = engine.evaluate(make_df())[0]
+
+        assert alert['details'] == {'sequía': ['Sequía en Tuluá']}
+        assert alert['message'] == "Se encontraron menciones de: 'sequía' (1 veces)"
+
+    def test_concentration_by_column_and_terms(self):
+        """Prueba la concentración por columna (fuente) y por grupo de términos (ubicaciones)"""
+        engine = RuleEngine({
+            'by_source': {'type': 'concentration', 'by': 'fuente', 'sentiment': 'Negativo', 'threshold': 3},
+            'by_place': {'type': 'concentration', 'by': 'ubicaciones', 'sentiment': 'Negativo', 'threshold': 2},
+        })
+
+        alerts = {a['type']: a for a in engine.evaluate(make_df())}
+
+        assert alerts['by_source']['details'] == {'El País': ['Sequía en Tuluá', 'Plaga en Cali', 'Paro en Buga']}
+        assert alerts['by_place']['details'] == {'Tuluá': ['Sequía en Tuluá', 'Crisis en Tuluá']}
+
+    def test_windowed_rate(self):
+        """Prueba la tasa en una ventana que termina en la última fecha de los datos"""
+        rule = {'type': 'rate', 'sentiment': 'Negativo', 'window_days': 7, 'threshold': 0.5, 'min_count': 2}
+        engine = RuleEngine({'rate': rule})
+
+        alert = engine.evaluate(make_df())[0]
+        assert '(2/4)' in alert['message']
+
+        assert engine.evaluate(make_df(), now='2024-01-10') == []
+
+    def test_disabled_and_invalid_rules(self):
+        """Prueba que las reglas deshabilitadas no se evalúan y las inválidas se rechazan"""
+        engine = RuleEngine({'off': {'type': 'ratio', 'sentiment': 'Negativo', 'threshold': 0, 'enabled': False}})
+        assert engine.evaluate(make_df()) == []
+
+        with pytest.raises(ValueError):
+            RuleEngine({'bad': {'type': 'desconocido'}})
+        with pytest.raises(ValueError):
+            RuleEngine({'bad': {'type': 'ratio', 'sentiment': 'Negativo', 'threshold': 0.1, 'op': '=='}})
+        with pytest.raises(ValueError):
+            RuleEngine({'bad': {'type': 'keywords', 'keywords': []}})
+
+    def test_many_keyword_rules_share_one_scan(self):
+        """Prueba que decenas de reglas de palabras clave usan una sola matriz del corpus"""
+        from src.term_matcher import corpus_texts
+
+        rules = {f'kw{i}': {'type': 'keywords', 'keywords': [f'término{i}', 'sequía']} for i in range(30)}
+        engine = RuleEngine(rules)
+        df = make_df()
+
+        alerts = engine.evaluate(df)
+
+        assert len(alerts) == 30
+        assert engine.matcher.matrix(corpus_texts(df)).matrix.shape[1] == 60
+
+
+class TestRuleFiles:
+    """Pruebas de carga de reglas desde YAML/JSON y por usuario"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_parse_yaml_and_json(self):
+        """Prueba los formatos dict y lista en YAML y JSON"""
+        yaml_text = """
+rules:
+  - id: fuente_negativa
+    type: concentration
+    by: fuente
+    threshold: 2
+"""
+        json_text = json.dumps({'critical_keywords': {'enabled': False}})
+
+        assert parse_rules(yaml_text, 'yaml') == {'fuente_negativa': {'type': 'concentration', 'by': 'fuente',
+                                                                     'threshold': 2}}
+        assert parse_rules(json_text, 'json') == {'critical_keywords': {'enabled': False}}
+        with pytest.raises(ValueError):
+            parse_rules("rules: [{type: ratio}]", 'yaml')
+
+    def test_merge_overrides_defaults(self):
+        """Prueba que el usuario reemplaza campos de las reglas por defecto y agrega nuevas"""
+        merged = merge_rules(DEFAULT_RULES, {'high_negative_ratio': {'threshold': 0.9},
+                                             'nueva': {'type': 'ratio', 'sentiment': 'Neutro', 'threshold': 0.5}})
+
+        assert merged['high_negative_ratio']['threshold'] == 0.9
+        assert merged['high_negative_ratio']['type'] == 'ratio'
+        assert 'nueva' in merged
+        assert DEFAULT_RULES['high_negative_ratio']['threshold'] == 0.4
+
+    def test_user_rules_roundtrip(self):
+        """Prueba guardar reglas de un usuario y cargarlas en AlertSystem"""
+        user = {'id': 'abc/123', 'email': 'ana@example.com'}
+        path = save_user_rules(user, "high_negative_ratio:\n  threshold: 0.9\n", 'yaml', directory=self.temp_dir)
+
+        assert path == user_rules_path(user, self.temp_dir)
+        assert load_rules(path)['high_negative_ratio']['threshold'] == 0.9
+
+        with pytest.raises(ValueError):
+            save_user_rules(user, '{"x": {"type": "nada"}}', 'json', directory=self.temp_dir)
+
+    def test_validation_does_not_register_terms(self):
+        """Prueba que guardar reglas solo valida, sin registrar palabras en el matcher compartido"""
+        user = {'id': 'sin-registro'}
+        save_user_rules(user, "critical_keywords:\n  keywords: [granizo_unico]\n", 'yaml',
+                        directory=self.temp_dir)
+
+        assert not any('granizo_unico' in label for label in shared_matcher().labels)
+
+    def test_bad_placeholder_rejected(self):
+        """Prueba que un texto con un valor que su tipo no entrega se rechaza al validar"""
+        with pytest.raises(ValueError, match='pct'):
+            RuleEngine({'kw': {'type': 'keywords', 'keywords': ['paro'], 'message': '{pct:.1f}% con paro'}})
+        with pytest.raises(ValueError):
+            save_user_rules({'id': 'ana'}, '{"critical_keywords": {"title": "{window_days} días"}}', 'json',
+                            directory=self.temp_dir)
+        with pytest.raises(ValueError):
+            RuleEngine({'neg': {'type': 'ratio', 'sentiment': 'Negativo', 'threshold': 0.5, 'title': '{pct:d'}})
+
+        engine = RuleEngine({'rate': {'type': 'rate', 'sentiment': 'Negativo', 'threshold': 0.1,
+                                      'message': '{name}: {pct:.0f}% en {window_days} días'}})
+        assert engine.evaluate(make_df())[0]['message'] == 'rate: 50% en 7 días'
+
+    def test_numbers_as_text_are_coerced(self):
+        """Prueba que umbrales y conteos escritos como texto se convierten al validar"""
+        rules = parse_rules(json.dumps({
+            'kw': {'type': 'keywords', 'keywords': ['sequía', 'paro'], 'min_count': '1'},
+            'fuente': {'type': 'concentration', 'by': 'fuente', 'sentiment': 'Negativo', 'threshold': '3'},
+            'rate': {'type': 'rate', 'sentiment': 'Negativo', 'threshold': '0.1', 'window_days': '7',
+                     'min_count': '2'},
+        }))
+        engine = RuleEngine(rules)
+
+        assert engine.enabled['fuente']['threshold'] == 3
+        assert engine.enabled['rate']['threshold'] == 0.1
+        assert {a['type'] for a in engine.evaluate(make_df())} == {'kw', 'fuente', 'rate'}
+        with pytest.raises(ValueError):
+            RuleEngine({'fuente': {'type': 'concentration', 'by': 'fuente', 'threshold': '2.5'}})
+        with pytest.raises(ValueError):
+            RuleEngine({'neg': {'type': 'ratio', 'sentiment': 'Negativo', 'threshold': 'alto'}})
+
+    def test_engines_with_different_keywords_do_not_collide(self):
+        """Prueba que las palabras propias de cada motor no se registran en el matcher compartido"""
+        first = RuleEngine({'kw': {'type': 'keywords', 'keywords': ['sequía']}})
+        second = RuleEngine({'kw': {'type': 'keywords', 'keywords': ['paro']}})
+        RuleEngine(DEFAULT_RULES)
+
+        assert 'alertas:kw' not in shared_matcher().groups
+        assert 'alertas:critical_keywords' in shared_matcher().groups
+        assert first.evaluate(make_df())[0]['details'] == {'sequía': ['Sequía en Tuluá']}
+        assert second.evaluate(make_df())[0]['details'] == {'paro': ['Paro en Buga']}
+
+    def test_alert_system_uses_engine(self):
+        """Prueba que AlertSystem recompila cuando cambian sus reglas"""
+        system = AlertSystem(rules={'high_negative_ratio': {'threshold': 0.9}})
+        assert 'high_negative_ratio' not in [a['type'] for a in system.analyze_and_generate_alerts(make_df())]
+
+        system.alert_rules['high_negative_ratio']['threshold'] = 0.5
+        alerts = system.analyze_and_generate_alerts(make_df())
+
+        assert alerts[0]['type'] == 'high_negative_ratio'
+        assert alerts[0]['title'] == '🚨 ALERTA CRÍTICA: Alta Concentración de Noticias Negativas'
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
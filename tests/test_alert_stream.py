@@ -0,0 +1,161 @@
+"""
+Tests para el procesador incremental de alertas
+"""
+import pytest
+import pandas as pd
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.alert_rules import DEFAULT_RULES
+from src.alert_stream import AlertStreamProcessor, _WindowCounter
+from src.alert_system import AlertSystem
+
+
+def make_batch(titulares, sentimientos, fecha, fuente='El País'):
+    return pd.DataFrame({
+        'titular': titulares,
+        'cuerpo': [''] * len(titulares),
+        'fuente': fuente,
+        'fecha': fecha,
+        'sentimiento_ia': sentimientos,
+    })
+
+
+class TestWindowCounter:
+    """Pruebas para el contador de ventana deslizante"""
+
+    def test_add_expire_and_late_arrivals(self):
+        """Prueba sumas por cubeta, llegadas tardías y vencimiento"""
+        counter = _WindowCounter()
+        counter.add(10, 2)
+        counter.add(12, 1)
+        counter.add(11, 3)
+        counter.add(12, 1)
+
+        assert [b for b, _ in counter.buckets] == [10, 11, 12]
+        assert counter.total == 7
+
+        counter.expire(12)
+        assert counter.total == 2
+        assert len(counter.buckets) == 1
+
+
+class TestAlertStreamProcessor:
+    """Pruebas para AlertStreamProcessor"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.processor = AlertStreamProcessor(DEFAULT_RULES, cooldown_minutes=60)
+
+    def test_emits_only_new_alerts(self):
+        """Prueba que un lote repetido o sin cambios no vuelve a emitir alertas"""
+        batch = make_batch(['Sequía en Tuluá', 'Plaga en Cali'], ['Negativo', 'Negativo'], '2024-03-01')
+
+        first = self.processor.process(batch, now='2024-03-01 12:00')
+        again = self.processor.process(batch, now='2024-03-01 13:00')
+
+        assert sorted(a['key'] for a in first) == ['plaga', 'sequía']
+        assert all(a['status'] == 'new' for a in first)
+        assert again == []
+        assert self.processor.stats['duplicates'] == 2
+
+    def test_escalation_and_concentration(self):
+        """Prueba el escalamiento de una clave activa y la concentración por ubicación"""
+        self.processor.process(make_batch(['Sequía en Tuluá'], ['Negativo'], '2024-03-01'), now='2024-03-01 12:00')
+
+        alerts = self.processor.process(
+            make_batch(['Crisis en Tuluá', 'Sequía fuerte en Tuluá', 'Otra sequía', 'Buen día'],
+                       ['Negativo', 'Negativo', 'Negativo', 'Positivo'], '2024-03-02'),
+            now='2024-03-02 12:00'
+        )
+        by_key = {(a['type'], a['key']): a for a in alerts}
+
+        assert by_key[('critical_keywords', 'sequía')]['status'] == 'escalated'
+        assert "'sequía' (3 veces)" in by_key[('critical_keywords', 'sequía')]['message']
+        assert by_key[('geographic_concentration', 'Tuluá')]['status'] == 'new'
+        assert by_key[('high_negative_ratio', None)]['message'].startswith('Se detectó que 80.0% (4/5)')
+
+    def test_window_expiry_and_cooldown(self):
+        """Prueba que la alerta se apaga al salir de la ventana y el enfriamiento evita repetirla"""
+        processor = AlertStreamProcessor(DEFAULT_RULES, cooldown_minutes=24 * 60 * 30)
+        processor.process(make_batch(['Sequía en Tuluá'], ['Negativo'], '2024-03-01'), now='2024-03-01 12:00')
+        assert len(processor.active_alerts()) == 1
+
+        assert processor.process(None, now='2024-03-20') == []
+        assert processor.active_alerts() == []
+
+        again = processor.process(make_batch(['Nueva sequía'], ['Negativo'], '2024-03-21'), now='2024-03-21')
+        assert again == []
+        assert processor.stats['suppressed'] == 1
+
+    def test_old_articles_outside_window_are_ignored(self):
+        """Prueba que las noticias anteriores a la ventana no suman"""
+        alerts = self.processor.process(make_batch(['Sequía en Tuluá'], ['Negativo'], '2023-01-01'),
+                                        now='2024-03-01')
+
+        assert alerts == []
+
+    def test_suppress(self):
+        """Prueba el silencio de una clave concreta y de una regla completa"""
+        self.processor.suppress('critical_keywords', 'plaga', until='2024-04-01')
+        alerts = self.processor.process(make_batch(['Sequía y plaga'], ['Negativo'], '2024-03-01'),
+                                        now='2024-03-01')
+        assert [a['key'] for a in alerts] == ['sequía']
+
+        self.processor.suppress('geographic_concentration', until='2024-04-01')
+        alerts = self.processor.process(
+            make_batch(['Paro en Buga', 'Bloqueo en Buga', 'Crisis en Buga'], ['Negativo'] * 3, '2024-03-02'),
+            now='2024-03-02'
+        )
+        assert 'geographic_concentration' not in [a['type'] for a in alerts]
+
+    def test_concentration_by_column(self):
+        """Prueba la concentración por fuente con la ventana de la regla"""
+        rules = {'by_source': {'type': 'concentration', 'by': 'fuente', 'sentiment': 'Negativo', 'threshold': 2,
+                               'window_days': 1}}
+        processor = AlertStreamProcessor(rules)
+
+        assert processor.process(make_batch(['A'], ['Negativo'], '2024-03-01'), now='2024-03-01 10:00') == []
+        alerts = processor.process(make_batch(['B'], ['Negativo'], '2024-03-01'), now='2024-03-01 11:00')
+
+        assert alerts[0]['key'] == 'El País'
+        assert alerts[0]['details'] == {'El País': ['A', 'B']}
+
+    def test_numbers_as_text(self):
+        """Prueba que umbrales escritos como texto (YAML/JSON) se comparan como números en el flujo"""
+        rules = {'by_source': {'type': 'concentration', 'by': 'fuente', 'sentiment': 'Negativo', 'threshold': '2',
+                               'window_days': '1'},
+                 'kw': {'type': 'keywords', 'keywords': ['paro'], 'min_count': '1'}}
+        processor = AlertStreamProcessor(rules)
+
+        alerts = processor.process(make_batch(['A', 'Paro en Buga'], ['Negativo', 'Negativo'], '2024-03-01'),
+                                   now='2024-03-01 10:00')
+
+        assert sorted(a['type'] for a in alerts) == ['by_source', 'kw']
+
+    def test_memory_is_bounded_by_window(self):
+        """Prueba que las cubetas por clave no crecen con la longitud del flujo"""
+        rules = {'neg': {'type': 'rate', 'sentiment': 'Negativo', 'threshold': 0.9, 'window_days': 1}}
+        processor = AlertStreamProcessor(rules)
+
+        for day in pd.date_range('2024-01-01', periods=30, freq='6h'):
+            processor.process(make_batch([f'Nota {day}'], ['Neutro'], day.isoformat()), now=day)
+
+        assert all(len(c.buckets) <= 24 for c in processor._counters.values())
+        assert len(processor._seen) <= 5
+
+    def test_alert_system_stream(self):
+        """Prueba que AlertSystem crea el procesador con sus reglas actuales"""
+        system = AlertSystem(rules={'critical_keywords': {'enabled': False}})
+        stream = system.create_stream()
+
+        alerts = stream.process(make_batch(['Sequía en Tuluá'], ['Negativo'], '2024-03-01'), now='2024-03-01')
+
+        assert stream.rules_spec == system.rules_spec()
+        assert 'critical_keywords' not in [a['type'] for a in alerts]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
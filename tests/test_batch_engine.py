@@ -0,0 +1,117 @@
+"""
+Tests para el motor de ejecución concurrente por lotes
+"""
+import pytest
+import threading
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.batch_engine import ChunkedBatchEngine
+
+
+class TestChunkedBatchEngine:
+    """Pruebas para ChunkedBatchEngine"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.engine = ChunkedBatchEngine(max_workers=4, retry_backoff=0)
+
+    def test_build_chunks_respects_item_limit(self):
+        """Prueba que ningún lote supera el máximo de noticias por llamada"""
+        texts = [f"Noticia {i}" for i in range(500)]
+        chunks = self.engine.build_chunks(texts)
+
+        assert all(len(c) <= self.engine.max_items_per_chunk for c in chunks)
+        assert sorted(i for c in chunks for i in c) == list(range(500))
+
+    def test_build_chunks_respects_token_budget(self):
+        """Prueba que los textos largos reparten el presupuesto de tokens de entrada"""
+        engine = ChunkedBatchEngine(max_input_tokens=1600, prompt_overhead_tokens=600)
+        texts = ["x" * 2000 for _ in range(20)]  # ~135 tokens cada uno (truncados a 500 chars)
+        chunks = engine.build_chunks(texts)
+
+        assert len(chunks) > 1
+        for chunk in chunks:
+            tokens = sum(engine.estimate_tokens(texts[i][:500]) + 10 for i in chunk)
+            assert tokens <= 1000
+
+    def test_run_preserves_order(self):
+        """Prueba que los resultados quedan alineados con los textos de entrada"""
+        texts = [f"Noticia {i}" for i in range(300)]
+
+        results, stats = self.engine.run(texts, lambda chunk: [t.upper() for t in chunk])
+
+        assert results == [t.upper() for t in texts]
+        assert stats["chunks"] > 1
+        assert stats["failed_items"] == 0
+
+    def test_run_retries_only_failed_chunk(self):
+        """Prueba que solo se reintenta el lote que falla"""
+        texts = [f"Noticia {i}" for i in range(200)]
+        calls = []
+        lock = threading.Lock()
+        failed_once = set()
+
+        def worker(chunk):
+            with lock:
+                calls.append(list(chunk))
+                if "Noticia 0" in chunk and "Noticia 0" not in failed_once:
+                    failed_once.add("Noticia 0")
+                    raise Exception("429 quota")
+            return [t for t in chunk]
+
+        results, stats = self.engine.run(texts, worker)
+
+        assert results == texts
+        assert stats["retries"] == 1
+        # Las noticias de otros lotes se procesan una sola vez
+        processed = [t for call in calls for t in call]
+        assert processed.count("Noticia 199") == 1
+        assert processed.count("Noticia 0") == 2
+
+    def test_run_marks_exhausted_chunks_as_none(self):
+        """Prueba que un lote que agota los reintentos devuelve None"""
+        texts = ["A", "B", "C"]
+
+        def worker(chunk):
+            if "B" in chunk:
+                raise Exception("API Error")
+            return chunk
+
+        results, stats = self.engine.run(texts, worker)
+
+        assert results[1] is None
+        assert results[0] == "A" and results[2] == "C"
+        assert stats["failed_items"] == 1
+
+    def test_run_rejects_incomplete_results(self):
+        """Prueba que una respuesta con menos resultados cuenta como fallo"""
+        texts = ["A", "B"]
+
+        results, stats = self.engine.run(texts, lambda chunk: chunk[:1])
+
+        # Tras partir el lote, cada sublote de 1 noticia sí se completa
+        assert results == ["A", "B"]
+        assert stats["retries"] >= 1
+
+    def test_run_reports_progress(self):
+        """Prueba que el callback de progreso llega al total"""
+        texts = [f"Noticia {i}" for i in range(150)]
+        progress = []
+
+        self.engine.run(texts, lambda chunk: chunk, progress_callback=lambda d, t: progress.append((d, t)))
+
+        assert progress[-1] == (150, 150)
+
+    def test_run_empty(self):
+        """Prueba que una lista vacía no llama al worker"""
+        results, stats = self.engine.run([], lambda chunk: pytest.fail("no debe llamarse"))
+
+        assert results == []
+        assert stats["api_calls"] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -46,8 +46,8 @@ class TestBatchOptimization:
             ]
             
             # Mock del caché para que todas sean nuevas
-            with patch.object(self.analyzer.cache, 'get', return_value=None):
-                with patch.object(self.analyzer.cache, 'set'):
+            with patch.object(self.analyzer.cache, 'get_many', side_effect=lambda texts: [None] * len(texts)):
+                with patch.object(self.analyzer.cache, 'set_many'):
                     sents, expls = self.analyzer.analyze_batch(df, progress_bar=None)
             
             # Verificar que se llamó UNA SOLA VEZ
@@ -70,7 +70,7 @@ class TestBatchOptimization:
             "cache_hits": 1
         }
         
-        with patch.object(self.analyzer.cache, 'get', return_value=cached_result):
+        with patch.object(self.analyzer.cache, 'get_many', side_effect=lambda texts: [cached_result] * len(texts)):
             with patch.object(self.analyzer, '_analyze_session_batch') as mock_batch:
                 sents, expls = self.analyzer.analyze_batch(df, progress_bar=None)
                 
@@ -100,8 +100,8 @@ class TestBatchOptimization:
                 return cached_result
             return None
         
-        with patch.object(self.analyzer.cache, 'get', side_effect=cache_get_side_effect):
-            with patch.object(self.analyzer.cache, 'set'):
+        with patch.object(self.analyzer.cache, 'get_many', side_effect=lambda texts: [cache_get_side_effect(t) for t in texts]):
+            with patch.object(self.analyzer.cache, 'set_many'):
                 with patch.object(self.analyzer, '_analyze_session_batch') as mock_batch:
                     mock_batch.return_value = [
                         {"sentimiento": "Negativo", "explicacion": "Nueva"}
@@ -121,6 +121,34 @@ class TestBatchOptimization:
                     assert sents[1] == "Negativo"   # Nueva
                     assert sents[2] == "Positivo"    # Del caché
     
+    def test_analyze_batch_stale_cache_revalidated_in_background(self):
+        """Prueba que las etiquetas obsoletas se sirven y se re-validan en segundo plano"""
+        df = pd.DataFrame({
+            'titular': ['Obsoleta 1', 'Vigente 1'],
+            'cuerpo': ['Body 1', 'Body 2']
+        })
+        
+        def cache_get_many_side_effect(texts):
+            return [
+                {"sentimiento": "Negativo", "explicacion": "Prompt anterior", "from_cache": True,
+                 "cache_hits": 2, "stale": 'Obsoleta' in text}
+                for text in texts
+            ]
+        
+        self.analyzer.api_key = "test_api_key"
+        with patch.object(self.analyzer.cache, 'get_many', side_effect=cache_get_many_side_effect):
+            with patch.object(self.analyzer.revalidator, 'submit') as mock_submit:
+                with patch.object(self.analyzer, '_analyze_session_batch') as mock_batch:
+                    sents, expls = self.analyzer.analyze_batch(df, progress_bar=None)
+        
+        # Se responde con el caché sin esperar a la API
+        assert mock_batch.call_count == 0
+        assert sents == ["Negativo", "Negativo"]
+        
+        # Solo la obsoleta se re-analiza en segundo plano
+        assert mock_submit.call_count == 1
+        assert mock_submit.call_args[0][0] == ["Obsoleta 1. Body 1"]
+    
     def test_parse_batch_response_format_standard(self):
         """Prueba parsing de respuesta batch con formato estándar"""
         response = """1|Positivo|Inversión positiva en el sector
@@ -159,6 +187,56 @@ NOTICIA 2|Negativo|Crisis"""
         # Los demás deben ser Neutro
         assert all(r["sentimiento"] == "Neutro" for r in results[2:])
     
+    def test_parse_batch_response_strict_raises_on_missing(self):
+        """Prueba que en modo estricto una respuesta incompleta es un error (no se rellena)"""
+        response = """1|Positivo|Test 1
+3|Negativo|Test 3"""
+        
+        with pytest.raises(ValueError):
+            self.analyzer._parse_batch_response(response, 3, strict=True)
+        
+        padded = self.analyzer._parse_batch_response(response, 3)
+        assert padded[2]["error"] is True
+    
+    def test_analyze_batch_retries_incomplete_chunk_and_skips_errors_in_cache(self):
+        """Prueba que un lote con respuesta corta se parte y reintenta, y que nada con error llega al caché"""
+        df = pd.DataFrame({
+            'titular': ['Noticia A', 'Noticia B'],
+            'cuerpo': ['Cuerpo A', 'Cuerpo B']
+        })
+        
+        def fake_generate(prompt, **kwargs):
+            count = prompt.count('--- NOTICIA ')
+            lines = ["1|Positivo|Primera"] if count == 2 else [f"{i}|Negativo|Sola" for i in range(1, count + 1)]
+            return "gemini-2.0-flash", MagicMock(text="\n".join(lines))
+        
+        self.analyzer.api_key = "test_api_key"
+        self.analyzer.batch_engine.retry_backoff = 0
+        with patch.object(self.analyzer.router, 'generate', side_effect=fake_generate) as mock_generate:
+            with patch.object(self.analyzer.cache, 'get_many', side_effect=lambda texts: [None] * len(texts)):
+                with patch.object(self.analyzer.cache, 'set_many') as mock_set_many:
+                    sents, expls = self.analyzer.analyze_batch(df, progress_bar=None)
+        
+        # 1 llamada incompleta + 2 reintentos de una noticia
+        assert mock_generate.call_count == 3
+        assert sents == ["Negativo", "Negativo"]
+        cached_rows = mock_set_many.call_args[0][0]
+        assert [row[1] for row in cached_rows] == ["Negativo", "Negativo"]
+        assert not any(row[2].startswith("Error") for row in cached_rows)
+    
+    def test_analyze_batch_failed_chunk_not_cached(self):
+        """Prueba que los lotes que fallan definitivamente no se guardan en caché"""
+        df = pd.DataFrame({'titular': ['Falla'], 'cuerpo': ['Siempre']})
+        
+        self.analyzer.batch_engine.retry_backoff = 0
+        with patch.object(self.analyzer, '_analyze_session_batch', side_effect=RuntimeError("sin modelos")):
+            with patch.object(self.analyzer.cache, 'get_many', side_effect=lambda texts: [None] * len(texts)):
+                with patch.object(self.analyzer.cache, 'set_many') as mock_set_many:
+                    sents, expls = self.analyzer.analyze_batch(df, progress_bar=None)
+        
+        assert expls == ["Error en procesamiento"]
+        assert mock_set_many.call_args[0][0] == []
+    
     def test_parse_batch_response_normalizes_sentiment(self):
         """Prueba que normaliza sentimientos correctamente"""
         response = """1|positivo|Test
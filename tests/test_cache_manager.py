@@ -10,7 +10,7 @@ import sys
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from src.cache_manager import CacheManager
+from src.cache_manager import CacheManager, ResponseCache
 
 
 class TestCacheManager:
@@ -147,6 +147,309 @@ class TestCacheManager:
             assert result["sentimiento"] == expected_sent
 
 
+    def test_get_many_aligned_with_input(self):
+        """Prueba que get_many retorna resultados en el orden de entrada"""
+        self.cache.set_many([
+            ("Noticia A", "Positivo", "Test A"),
+            ("Noticia C", "Negativo", "Test C")
+        ])
+        
+        results = self.cache.get_many(["Noticia A", "Noticia B", "Noticia C", "Noticia A"])
+        
+        assert len(results) == 4
+        assert results[0]["sentimiento"] == "Positivo"
+        assert results[1] is None
+        assert results[2]["sentimiento"] == "Negativo"
+        assert results[3]["cache_hits"] == 3  # 1 set + 2 gets
+    
+    def test_set_many_single_transaction(self):
+        """Prueba que set_many guarda todas las filas"""
+        rows = [(f"Noticia {i}", "Neutro", f"Test {i}") for i in range(1200)]
+        self.cache.set_many(rows)
+        
+        results = self.cache.get_many([text for text, _, _ in rows])
+        
+        assert all(r is not None for r in results)
+        assert self.cache.get_stats()["total_entries"] == 1200
+    
+    def test_hits_written_behind(self):
+        """Prueba que los hits pendientes se escriben al consultar estadísticas"""
+        cache = CacheManager(db_path=self.cache_path, hits_flush_interval=3600)
+        cache.set("Noticia", "Positivo", "Test")
+        cache.get("Noticia")
+        cache.get("Noticia")
+        
+        # Otra instancia comparte la conexión y los hits pendientes
+        other = CacheManager(db_path=self.cache_path)
+        assert other.get_stats()["total_hits"] == 3
+    
+    def test_wal_mode_enabled(self):
+        """Prueba que la base de datos usa journal WAL"""
+        mode = self.cache._shared.conn.execute('PRAGMA journal_mode').fetchone()[0]
+        assert mode.lower() == "wal"
+
+
+    def test_memory_tier_serves_repeated_reads(self):
+        """Prueba que las lecturas repetidas se sirven desde memoria"""
+        self.cache.set("Noticia caliente", "Positivo", "Test")
+        
+        self.cache.get("Noticia caliente")
+        self.cache.get("Noticia caliente")
+        self.cache.get("Noticia inexistente")
+        
+        tiers = self.cache.get_stats()["tiers"]
+        assert tiers["memory"]["hits"] == 2
+        assert tiers["memory"]["misses"] == 1
+        assert tiers["sqlite"]["hits"] == 0
+        assert tiers["sqlite"]["misses"] == 1
+    
+    def test_memory_tier_shared_and_write_through(self):
+        """Prueba que el LRU se comparte entre instancias y la escritura llega a SQLite"""
+        self.cache.set("Noticia compartida", "Negativo", "Test")
+        
+        other = CacheManager(db_path=self.cache_path)
+        assert other.get("Noticia compartida")["sentimiento"] == "Negativo"
+        assert other.get_stats()["tiers"]["memory"]["hits"] == 1
+        
+        # La fila también está en disco
+        row = other._shared.conn.execute('SELECT sentimiento FROM sentiment_cache').fetchone()
+        assert row[0] == "Negativo"
+    
+    def test_memory_tier_size_cap_and_ttl(self):
+        """Prueba el límite de tamaño y la expiración del LRU"""
+        now = [0.0]
+        memory = self.cache._shared.memory
+        memory.max_entries = 2
+        memory.clock = lambda: now[0]
+        
+        self.cache.set_many([(f"Noticia {i}", "Neutro", "Test") for i in range(3)])
+        assert len(memory) == 2
+        
+        # La más antigua se lee desde SQLite
+        assert self.cache.get("Noticia 0") is not None
+        assert self.cache.get_stats()["tiers"]["sqlite"]["hits"] == 1
+        
+        now[0] += memory.ttl_seconds + 1
+        assert self.cache.get("Noticia 0") is not None
+        assert self.cache.get_stats()["tiers"]["sqlite"]["hits"] == 2
+
+
+    def test_near_duplicate_lookup(self):
+        """Prueba que una noticia sindicada con otra firma reutiliza el análisis"""
+        base = ("Gobernación del Valle anuncia inversión de 20 mil millones para pequeños productores "
+                "de caña panelera en Santander de Quilichao y municipios vecinos del norte del Cauca, "
+                "con créditos a bajo interés y asistencia técnica durante todo el próximo año.")
+        variant = base + " Por Redacción Regional, 3 de abril."
+        cache = CacheManager(db_path=self.cache_path, near_duplicate=True)
+        cache.set(base, "Positivo", "Inversión")
+        
+        result = cache.get(variant)
+        
+        assert result["sentimiento"] == "Positivo"
+        assert result["near_duplicate"] is True
+        assert result["similarity"] >= cache.similarity_threshold
+        assert cache.get_stats()["tiers"]["near_duplicate"]["hits"] == 1
+    
+    def test_near_duplicate_disabled_or_below_threshold(self):
+        """Prueba que sin el modo activo o con umbral alto no hay coincidencia"""
+        base = "Sequía reduce la producción de leche en el Valle del Cauca durante el primer trimestre del año"
+        variant = base + " según reportes de los ganaderos de Cartago y Zarzal"
+        self.cache.set(base, "Negativo", "Sequía")
+        
+        assert self.cache.get(variant) is None
+        strict = CacheManager(db_path=self.cache_path, near_duplicate=True, similarity_threshold=0.99)
+        assert strict.get(variant) is None
+    
+    def test_lsh_index_cleaned_with_old_entries(self):
+        """Prueba que el índice LSH se limpia junto con las entradas"""
+        self.cache.set("Noticia para el índice LSH", "Neutro", "Test")
+        self.cache.clear_old_entries(max_age_days=0)
+        
+        count = self.cache._shared.conn.execute('SELECT COUNT(*) FROM sentiment_lsh').fetchone()[0]
+        assert count == 0
+
+
+    def _backdate(self, cache, text, days):
+        """Mueve el timestamp y el último acceso de una entrada al pasado"""
+        past = (datetime.now() - timedelta(days=days)).isoformat()
+        cache._shared.conn.execute(
+            'UPDATE sentiment_cache SET timestamp = ?, last_access = ? WHERE content_hash = ?',
+            (past, past, cache._generate_hash(text))
+        )
+        cache._shared.conn.commit()
+    
+    def test_lru_eviction_respects_max_entries(self):
+        """Prueba que al superar max_entries se desaloja lo menos usado recientemente"""
+        cache = CacheManager(db_path=self.cache_path, max_entries=10)
+        cache.set_many([(f"Noticia {i}", "Neutro", "Test") for i in range(10)])
+        for i in range(5):
+            self._backdate(cache, f"Noticia {i}", days=5 - i)
+        
+        cache.set("Noticia nueva", "Positivo", "Test")
+        
+        stats = cache.get_stats()
+        assert stats["total_entries"] == 9  # 90% de max_entries
+        assert stats["eviction"]["evicted"] == 2
+        assert cache.get("Noticia 0") is None
+        assert cache.get("Noticia 1") is None
+        assert cache.get("Noticia 2") is not None
+        assert cache.get("Noticia nueva") is not None
+    
+    def test_lfu_eviction_keeps_popular_entries(self):
+        """Prueba que la política LFU conserva las entradas con más hits"""
+        cache = CacheManager(db_path=self.cache_path, max_entries=3, eviction_policy="lfu")
+        cache.set_many([("Popular", "Positivo", "Test"), ("Rara", "Negativo", "Test"), ("Media", "Neutro", "Test")])
+        for _ in range(3):
+            cache.get("Popular")
+        cache.get("Media")
+        cache.flush_hits()
+        
+        cache.set("Nueva", "Neutro", "Test")
+        
+        assert cache.get("Rara") is None
+        assert cache.get("Popular") is not None
+    
+    def test_compaction_expires_old_entries(self):
+        """Prueba que la compactación elimina entradas más antiguas que max_age_days"""
+        cache = CacheManager(db_path=self.cache_path, max_age_days=30)
+        cache.set_many([("Vieja", "Neutro", "Test"), ("Reciente", "Positivo", "Test")])
+        self._backdate(cache, "Vieja", days=45)
+        
+        result = cache.compact()
+        
+        assert result["expired"] == 1
+        assert cache.get_stats()["total_entries"] == 1
+        assert cache.get_stats()["eviction"]["compactions"] >= 1
+    
+    def test_incremental_auto_vacuum_enabled(self):
+        """Prueba que la base de datos usa auto_vacuum incremental"""
+        assert self.cache._shared.conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    
+    def test_row_count_tracked_without_recount(self):
+        """Prueba que el recuento de filas se mantiene en escrituras, reemplazos y desalojos"""
+        cache = CacheManager(db_path=self.cache_path, max_entries=10)
+        cache.set_many([(f"Noticia {i}", "Neutro", "Test") for i in range(8)])
+        cache.set_many([("Noticia 0", "Positivo", "Test"), ("Otra", "Neutro", "Test"), ("Otra", "Neutro", "Test")])
+        cache.set_many([(f"Extra {i}", "Neutro", "Test") for i in range(4)])
+        
+        actual = cache._shared.conn.execute('SELECT COUNT(*) FROM sentiment_cache').fetchone()[0]
+        assert cache._shared.row_count == actual == 9
+    
+    def test_invalid_eviction_policy(self):
+        """Prueba que se rechaza una política desconocida"""
+        with pytest.raises(ValueError):
+            CacheManager(db_path=self.cache_path, eviction_policy="fifo")
+
+
+    def test_prompt_version_change_invalidates(self):
+        """Prueba que las entradas de otra versión de prompt no se sirven como vigentes"""
+        CacheManager(db_path=self.cache_path, prompt_version="v1").set("Noticia versionada", "Positivo", "Test")
+        
+        assert CacheManager(db_path=self.cache_path, prompt_version="v1").get("Noticia versionada") is not None
+        assert CacheManager(db_path=self.cache_path, prompt_version="v2").get("Noticia versionada") is None
+    
+    def test_stale_entries_served_when_enabled(self):
+        """Prueba que con serve_stale se sirve la etiqueta anterior marcada como obsoleta"""
+        CacheManager(db_path=self.cache_path, prompt_version="v1", model_family="gemini-1.5-flash").set(
+            "Noticia obsoleta", "Negativo", "Test")
+        
+        cache = CacheManager(db_path=self.cache_path, prompt_version="v1",
+                             model_family="gemini-2.0-flash", serve_stale=True)
+        result = cache.get("Noticia obsoleta")
+        
+        assert result["sentimiento"] == "Negativo"
+        assert result["stale"] is True
+        assert cache.get_stats()["stale"]["served"] == 1
+        
+        # Tras re-validar con la familia vigente deja de estar obsoleta
+        cache.set("Noticia obsoleta", "Positivo", "Re-validada", model_family="gemini-2.0-flash")
+        assert "stale" not in cache.get("Noticia obsoleta")
+    
+    def test_fallback_family_entries_are_current(self):
+        """Prueba que las respuestas de un modelo de respaldo aceptado no quedan obsoletas"""
+        cache = CacheManager(db_path=self.cache_path, prompt_version="v1", model_family="gemini-2.5-flash",
+                             accepted_families={"gemini-2.5-flash", "gemini-2.0-flash"}, serve_stale=True)
+        cache.set("Noticia de respaldo", "Neutro", "Test", model_family="gemini-2.0-flash")
+        cache.set("Noticia retirada", "Neutro", "Test", model_family="gemini-1.0-pro")
+        
+        assert "stale" not in cache.get("Noticia de respaldo")
+        assert cache.get("Noticia retirada")["stale"] is True
+
+
+class TestResponseCache:
+    """Pruebas para ResponseCache"""
+    
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.temp_dir, "test_cache.db")
+        self.now = datetime(2024, 1, 1, 12, 0)
+        self.cache = ResponseCache(db_path=self.cache_path, clock=lambda: self.now)
+    
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def test_normalized_question_hits(self):
+        """Prueba que mayúsculas, tildes y signos no cambian la clave"""
+        self.cache.set("¿Qué oportunidades hay en el sector?", [1, 2], "kb1", "Respuesta")
+        
+        result = self.cache.get("que oportunidades hay en el SECTOR", [2, 1], "kb1")
+        
+        assert result["response"] == "Respuesta"
+        assert result["fuzzy"] is False
+    
+    def test_negation_changes_key(self):
+        """Prueba que una pregunta negada no reutiliza la respuesta de la afirmativa"""
+        self.cache.set("¿Qué cultivos del Valle del Cauca crecen este año?", [1], "kb1", "Crecen")
+        
+        assert self.cache.get("¿Qué cultivos del Valle del Cauca no crecen este año?", [1], "kb1") is None
+        assert self.cache.get("que cultivos del valle del cauca crecen este ano", [1], "kb1") is not None
+    
+    def test_context_is_part_of_key(self):
+        """Prueba que otras noticias u otra base de conocimiento no reutilizan la respuesta"""
+        self.cache.set("Resúmeme las noticias", [1, 2], "kb1", "Respuesta")
+        
+        assert self.cache.get("Resúmeme las noticias", [1, 3], "kb1") is None
+        assert self.cache.get("Resúmeme las noticias", [1, 2], "kb2") is None
+    
+    def test_fuzzy_match(self):
+        """Prueba que una pregunta casi igual reutiliza la respuesta"""
+        self.cache.set("¿Cuáles son las principales amenazas para el sector agroindustrial?", [1], "kb1", "Amenazas")
+        
+        result = self.cache.get("principales amenazas actuales del sector agroindustrial", [1], "kb1")
+        assert result["response"] == "Amenazas"
+        assert result["fuzzy"] is True
+        assert 0.8 <= result["similarity"] < 1
+        
+        strict = ResponseCache(db_path=self.cache_path, fuzzy=False, clock=lambda: self.now)
+        assert strict.get("principales amenazas actuales del sector agroindustrial", [1], "kb1") is None
+    
+    def test_ttl_expiration(self):
+        """Prueba que las respuestas vencen tras el TTL"""
+        self.cache.set("Resúmeme las noticias", [1], "kb1", "Respuesta")
+        
+        self.now += timedelta(seconds=self.cache.ttl_seconds + 1)
+        assert self.cache.get("Resúmeme las noticias", [1], "kb1") is None
+    
+    def test_lru_eviction(self):
+        """Prueba que se desalojan las respuestas menos usadas"""
+        cache = ResponseCache(db_path=self.cache_path, max_entries=10, clock=lambda: self.now)
+        for i in range(10):
+            self.now += timedelta(seconds=1)
+            cache.set(f"pregunta numero {i}", [i], "kb1", f"Respuesta {i}")
+        self.now += timedelta(seconds=1)
+        cache.get("pregunta numero 0", [0], "kb1")
+        
+        self.now += timedelta(seconds=1)
+        cache.set("pregunta nueva", [99], "kb1", "Nueva")
+        
+        assert cache.get_stats()["total_entries"] <= 10
+        assert cache.get("pregunta numero 0", [0], "kb1") is not None
+        assert cache.get("pregunta numero 1", [1], "kb1") is None
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
 
@@ -0,0 +1,232 @@
+"""
+Tests para el chatbot RAG (respuestas en streaming)
+"""
+import pytest
+import pandas as pd
+import os
+import tempfile
+import shutil
+from unittest.mock import patch, MagicMock
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.chatbot_rag import AgriNewsBot
+from src.cache_manager import ResponseCache
+from src.news_index import NewsIndex
+
+
+def make_chunk(text):
+    chunk = MagicMock()
+    chunk.text = text
+    return chunk
+
+
+class TestAgriNewsBotStreaming:
+    """Pruebas para chat(stream=True)"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.bot = AgriNewsBot("test_api_key")
+        self.bot.index = NewsIndex(index_dir=self.temp_dir)
+        self.bot.response_cache = ResponseCache(db_path=os.path.join(self.temp_dir, "cache.db"))
+        self.bot.load_news_database(pd.DataFrame({
+            'titular': ['Sequía afecta la caña en Palmira', 'Exportaciones de café crecen'],
+            'cuerpo': ['Pérdidas en cultivos', 'Récord en ventas'],
+            'sentimiento_ia': ['Negativo', 'Positivo'],
+            'explicacion_ia': ['Crisis hídrica', 'Crecimiento'],
+            'fecha': ['2024-01-01', '2024-01-02']
+        }))
+
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def test_chunks_yielded_and_history_committed(self):
+        """Prueba que los fragmentos llegan en orden y el texto completo queda en el historial"""
+        stream = [make_chunk("La sequía "), make_chunk("afecta la caña.")]
+
+        with patch.object(self.bot.router, 'generate', return_value=("modelo", iter(stream))) as mock_generate:
+            response = self.bot.chat("¿Qué pasa con la sequía?", stream=True)
+            # La llamada al modelo ocurre al consumir el generador
+            assert mock_generate.call_count == 0
+            assert response['relevant_news'][0]['titular'] == 'Sequía afecta la caña en Palmira'
+
+            chunks = list(response['response'])
+
+        assert chunks == ["La sequía ", "afecta la caña."]
+        assert mock_generate.call_args.kwargs['stream'] is True
+        assert self.bot.conversation_history == [
+            {'user': "¿Qué pasa con la sequía?", 'bot': "La sequía afecta la caña."}
+        ]
+
+    def test_streamed_answer_cached(self):
+        """Prueba que la respuesta transmitida se reutiliza desde el caché"""
+        with patch.object(self.bot.router, 'generate', return_value=("modelo", iter([make_chunk("Café en alza")]))):
+            list(self.bot.chat("exportaciones de café", stream=True)['response'])
+
+        with patch.object(self.bot.router, 'generate') as mock_generate:
+            response = self.bot.chat("exportaciones de café", stream=True)
+            assert list(response['response']) == ["Café en alza"]
+            assert response['from_cache'] is True
+            assert mock_generate.call_count == 0
+
+    def test_stream_tail_does_not_summarize(self):
+        """Prueba que al terminar el stream no se paga el resumen: se difiere al siguiente prompt"""
+        for i in range(self.bot.recent_turns):
+            self.bot._remember(f"pregunta {i}", f"respuesta {i}")
+
+        with patch.object(self.bot.router, 'generate', return_value=("modelo", iter([make_chunk("Café")]))), \
+                patch.object(self.bot, '_summarize', return_value="resumen") as mock_summarize:
+            list(self.bot.chat("exportaciones de café", stream=True)['response'])
+            assert mock_summarize.call_count == 0
+            assert len(self.bot.conversation_history) == self.bot.recent_turns + 1
+
+            self.bot._build_prompt("otra pregunta", "")
+            self.bot.wait_for_summary()
+            assert mock_summarize.call_count == 1
+
+    def test_stream_not_blocked_by_summary(self):
+        """Prueba que chat(stream=True) no llama al modelo antes de iterar, aunque haya turnos por resumir"""
+        import threading
+
+        for i in range(self.bot.recent_turns + 1):
+            self.bot._remember(f"consulta {i}", f"contestación {i}")
+        summary = MagicMock()
+        summary.text = "Resumen del modelo"
+        calls = []
+
+        def generate(prompt, **kwargs):
+            calls.append((threading.current_thread() is threading.main_thread(), kwargs.get('stream', False)))
+            if kwargs.get('stream'):
+                # El prompt lleva el turno plegado (extractivo, o el del modelo si ya terminó)
+                assert "consulta 0" in prompt or "Resumen del modelo" in prompt
+                return "modelo", iter([make_chunk("Café")])
+            return "modelo", summary
+
+        with patch.object(self.bot.router, 'generate', side_effect=generate):
+            response = self.bot.chat("exportaciones de café", stream=True)
+            assert (True, False) not in calls
+            assert (True, True) not in calls
+
+            assert list(response['response']) == ["Café"]
+            self.bot.wait_for_summary()
+
+        assert calls.count((True, True)) == 1
+        assert (False, False) in calls
+        assert self.bot.conversation_summary['text'] == "Resumen del modelo"
+
+    def test_stream_error_not_committed(self):
+        """Prueba que un error se muestra como fragmento y no entra al historial"""
+        with patch.object(self.bot.router, 'generate', side_effect=Exception("500 internal")):
+            chunks = list(self.bot.chat("sequía", stream=True)['response'])
+
+        assert chunks[0].startswith("⚠️ Error")
+        assert self.bot.conversation_history == []
+
+    def test_history_shared_with_session(self):
+        """Prueba que historial y resumen se modifican en los mismos objetos (session_state)"""
+        session_history, session_summary = [], {'text': ''}
+        self.bot.conversation_history = session_history
+        self.bot.conversation_summary = session_summary
+
+        with patch.object(self.bot.router, 'generate', side_effect=Exception("sin cupo")):
+            for turn in ["sequía", "café", "caña", "lluvias", "precios"]:
+                self.bot._remember(f"pregunta sobre {turn}", f"Respuesta sobre {turn}")
+            self.bot._fold_history()
+            self.bot.wait_for_summary()
+
+        assert self.bot.conversation_history is session_history
+        assert len(session_history) == self.bot.recent_turns
+        assert "sequía" in session_summary['text']
+
+        self.bot.reset_conversation()
+        assert session_history == []
+        assert session_summary['text'] == ''
+
+
+class TestAgriNewsBotContext:
+    """Pruebas del contexto acotado del chatbot"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.bot = AgriNewsBot("test_api_key")
+        self.bot.index = NewsIndex(index_dir=self.temp_dir)
+        self.bot.response_cache = ResponseCache(db_path=os.path.join(self.temp_dir, "cache.db"))
+        long_explanation = "Impacto económico relevante para los productores de caña del Valle. " * 40
+        self.bot.load_news_database(pd.DataFrame({
+            'titular': [f'Sequía afecta la caña en municipio {i}' for i in range(10)],
+            'cuerpo': ['Pérdidas en cultivos de caña por sequía'] * 10,
+            'sentimiento_ia': ['Negativo'] * 10,
+            'explicacion_ia': [long_explanation] * 10,
+            'fecha': ['2024-01-01'] * 10
+        }))
+
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def test_prompt_size_bounded(self):
+        """Prueba que el prompt no crece con explicaciones largas ni con la conversación"""
+        response = MagicMock()
+        response.text = "Respuesta larga " * 200
+
+        with patch.object(self.bot.router, 'generate', return_value=("modelo", response)) as mock_generate:
+            for i in range(8):
+                self.bot.chat(f"impacto de la sequía número {'x' * i} en la caña")
+            self.bot.wait_for_summary()
+            prompts = [call.args[0] for call in mock_generate.call_args_list]
+
+        # Las noticias casi idénticas se deduplican
+        assert prompts[0].count("Noticia ") == 1
+        assert max(len(p) for p in prompts) < 4 * 3000
+
+    def test_summary_computed_once_per_turn(self):
+        """Prueba que el resumen de un turno se reutiliza en lugar de volver a pedirse"""
+        summary = MagicMock()
+        summary.text = "Se habló de la sequía"
+        turns = [(f"pregunta {i}", f"respuesta {i}") for i in range(4)]
+
+        with patch.object(self.bot.router, 'generate', return_value=("modelo", summary)) as mock_generate:
+            for user, bot in turns:
+                self.bot._remember(user, bot)
+            self.bot._fold_history()
+            self.bot.wait_for_summary()
+            assert mock_generate.call_count == 1
+
+            # Otra sesión con la misma conversación reutiliza el resumen
+            other = AgriNewsBot("test_api_key")
+            for user, bot in turns:
+                other._remember(user, bot)
+            other._fold_history()
+            other.wait_for_summary()
+            assert mock_generate.call_count == 1
+
+        assert other.conversation_summary['text'] == "Se habló de la sequía"
+
+    def test_cache_hit_does_not_summarize(self):
+        """Prueba que una respuesta del caché no dispara el resumen pagado de turnos antiguos"""
+        for i in range(self.bot.recent_turns):
+            self.bot._remember(f"pregunta {i}", f"respuesta {i}")
+        self.bot.response_cache.set("impacto de la sequía en la caña", [], self.bot.index_view.fingerprint, "x")
+
+        with patch.object(self.bot, 'retrieve_relevant_news', return_value=[]), \
+                patch.object(self.bot, '_summarize') as mock_summarize:
+            response = self.bot.chat("impacto de la sequía en la caña")
+            assert response['from_cache'] is True
+            assert mock_summarize.call_count == 0
+
+            # El turno pendiente se resume al construir el siguiente prompt
+            mock_summarize.return_value = "resumen"
+            self.bot._build_prompt("otra pregunta", "")
+            self.bot.wait_for_summary()
+            assert mock_summarize.call_count == 1
+        assert len(self.bot.conversation_history) == self.bot.recent_turns
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,84 @@
+"""
+Tests para el constructor de contexto con presupuesto de tokens
+"""
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.context_builder import ContextBuilder, truncate_to_tokens
+from src.rate_limiter import estimate_tokens
+
+
+def make_news(titular, explicacion, similarity=1.0):
+    return {'titular': titular, 'sentimiento': 'Negativo', 'explicacion': explicacion,
+            'fecha': '2024-01-01', 'similarity': similarity}
+
+
+class TestContextBuilder:
+    """Pruebas para ContextBuilder"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.builder = ContextBuilder(max_news_tokens=300, max_snippet_tokens=150)
+
+    def test_budget_respected(self):
+        """Prueba que las noticias se empaquetan sin superar el presupuesto"""
+        news = [make_news(f"Titular distinto número {i} sobre tema {i * 7}", "palabra " * 300) for i in range(10)]
+
+        packed, context, used = self.builder.pack_news(news)
+
+        assert 0 < len(packed) < 10
+        assert used <= self.builder.max_news_tokens
+        assert estimate_tokens(context) <= self.builder.max_news_tokens + len(packed)
+
+    def test_highest_ranked_first(self):
+        """Prueba que se respeta el orden de relevancia"""
+        news = [make_news("Café en alza", "Exportaciones récord"), make_news("Sequía en la caña", "Pérdidas")]
+
+        packed, context, _ = self.builder.pack_news(news)
+
+        assert [n['titular'] for n in packed] == ["Café en alza", "Sequía en la caña"]
+        assert context.index("Café") < context.index("Sequía")
+
+    def test_overlapping_news_deduplicated(self):
+        """Prueba que la misma nota publicada por varios medios entra una sola vez"""
+        news = [
+            make_news("Sequía afecta cultivos de caña en Palmira", "Crisis hídrica en el Valle"),
+            make_news("Sequía afecta los cultivos de caña en Palmira", "Crisis hídrica en el Valle."),
+            make_news("Exportaciones de café crecen", "Récord de ventas"),
+        ]
+
+        packed, _, _ = self.builder.pack_news(news)
+
+        assert [n['titular'] for n in packed] == [news[0]['titular'], news[2]['titular']]
+
+    def test_history_with_summary(self):
+        """Prueba que el historial combina resumen y turnos recientes recortados"""
+        text = self.builder.format_history("Se habló de la sequía", [{'user': "¿Y el café?", 'bot': "Bien " * 1000}])
+
+        assert text.startswith("Resumen de la conversación anterior:")
+        assert "Usuario: ¿Y el café?" in text
+        assert estimate_tokens(text) < self.builder.max_turn_tokens + 50
+
+        assert self.builder.format_history("", []) == "(Inicio de conversación)"
+
+    def test_extractive_summary_bounded(self):
+        """Prueba que el resumen extractivo descarta lo más antiguo al llenarse"""
+        summary = ""
+        for i in range(50):
+            summary = self.builder.extend_summary(summary, {'user': f"pregunta {i}", 'bot': f"Respuesta {i}. Detalle"})
+
+        assert estimate_tokens(summary) <= self.builder.max_summary_tokens
+        assert "pregunta 49" in summary
+        assert "pregunta 0 " not in summary
+
+    def test_truncate_to_tokens(self):
+        """Prueba que el recorte no parte palabras"""
+        assert truncate_to_tokens("corto", 10) == "corto"
+        assert truncate_to_tokens("palabra " * 20, 5) == "palabra palabra…"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,177 @@
+"""
+Tests para el nomenclátor y el caché persistente de geocodificación
+"""
+import pytest
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from geopy.geocoders import Nominatim
+
+from src.gazetteer import Gazetteer, place_key
+from src.geo_mapper import NewsGeoMapper, VALLE_LOCATIONS
+
+
+class _NominatimStandIn(BaseHTTPRequestHandler):
+    """Servidor local que responde como /search de Nominatim y cuenta las consultas"""
+
+    places = {'hacienda la esperanza': (3.61, -76.42)}
+    queries = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query).get('q', [''])[0]
+        self.queries.append(query)
+        name = query.split(',')[0].strip().lower()
+        results = []
+        if name in self.places:
+            lat, lon = self.places[name]
+            results = [{'lat': str(lat), 'lon': str(lon), 'display_name': query}]
+        body = json.dumps(results).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestGazetteer:
+    """Pruebas para Gazetteer"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'gazetteer.db')
+
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_normalized_names_and_aliases(self):
+        """Prueba búsquedas sin tildes, con mayúsculas, puntuación y alias"""
+        gazetteer = Gazetteer(self.db_path)
+
+        assert place_key('  Tuluá, ') == 'tulua'
+        assert gazetteer.lookup('TULUA') == gazetteer.lookup('Tuluá') == (4.0840, -76.1952)
+        assert gazetteer.lookup('Santiago de Cali') == gazetteer.lookup('cali')
+        assert gazetteer.lookup('Vereda inexistente') is None
+
+    def test_ambiguous_names_prefer_department(self):
+        """Prueba que los nombres repetidos se resuelven por departamento"""
+        gazetteer = Gazetteer(self.db_path)
+
+        assert gazetteer.lookup('Bolívar') == (4.3383, -76.1856)
+        assert gazetteer.lookup('Bolívar, Bolívar') == (8.67, -74.03)
+
+    def test_bundled_locations_resolve_offline(self):
+        """Prueba que todas las ubicaciones detectadas por el mapa están en el nomenclátor"""
+        gazetteer = Gazetteer(self.db_path)
+
+        assert set(gazetteer.lookup_many(VALLE_LOCATIONS)) == set(VALLE_LOCATIONS)
+
+    def test_add_places_and_rebuild(self):
+        """Prueba agregar veredas y que el índice se conserva al reabrir"""
+        gazetteer = Gazetteer(self.db_path)
+        gazetteer.add_places([{'nombre': 'La Esmeralda', 'tipo': 'vereda', 'departamento': 'Valle del Cauca',
+                               'municipio': 'Buga', 'lat': 3.95, 'lon': -76.2, 'alias': 'esmeralda'}])
+        gazetteer.store_geocode('Finca El Recreo', (3.5, -76.3))
+        size = len(gazetteer)
+        gazetteer.close()
+
+        reopened = Gazetteer(self.db_path)
+        assert len(reopened) == size
+        assert reopened.lookup('esmeralda') == (3.95, -76.2)
+        assert reopened.cached_geocode('finca el recreo') == (True, (3.5, -76.3))
+        assert reopened.cached_geocode('otra finca') == (False, None)
+
+    def test_added_places_survive_csv_change(self):
+        """Prueba que los lugares agregados no se pierden cuando cambia el CSV y se reconstruye el índice"""
+        csv_path = os.path.join(self.temp_dir, 'lugares.csv')
+        header = 'nombre,tipo,departamento,municipio,lat,lon,alias\n'
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            f.write(header + 'Tuluá,municipio,Valle del Cauca,Tuluá,4.0840,-76.1952,\n')
+        gazetteer = Gazetteer(self.db_path, csv_path=csv_path)
+        gazetteer.add_places([{'nombre': 'La Esmeralda', 'tipo': 'vereda', 'departamento': 'Valle del Cauca',
+                               'municipio': 'Buga', 'lat': 3.95, 'lon': -76.2}])
+        gazetteer.close()
+
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            f.write(header + 'Buga,municipio,Valle del Cauca,Buga,3.9000,-76.3000,guadalajara de buga\n')
+        reopened = Gazetteer(self.db_path, csv_path=csv_path)
+
+        assert len(reopened) == 2
+        assert reopened.lookup('Tuluá') is None
+        assert reopened.lookup('La Esmeralda') == (3.95, -76.2)
+        assert reopened.place_terms() == {'Buga': ['buga', 'guadalajara de buga'], 'La Esmeralda': ['la esmeralda']}
+        reopened.close()
+
+    def test_text_locations_come_from_gazetteer(self):
+        """Prueba que el texto se busca con nombres y alias del nomenclátor (corregimientos incluidos)"""
+        mapper = NewsGeoMapper(gazetteer=Gazetteer(self.db_path))
+
+        found = mapper.extract_locations_from_text("Lluvias en Santiago de Cali, Guadalajara de Buga y Pance")
+
+        assert found == ['Cali', 'Buga', 'Pance']
+        assert mapper.extract_locations_from_text("El toro de la feria") == []
+        assert 'Zarzal' in VALLE_LOCATIONS and list(VALLE_LOCATIONS)[-1] == 'Valle del Cauca'
+
+
+class TestGeoMapperGeocoding:
+    """Pruebas de geocodificación de NewsGeoMapper contra un Nominatim local"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'gazetteer.db')
+        _NominatimStandIn.queries = []
+        self.server = HTTPServer(('127.0.0.1', 0), _NominatimStandIn)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def make_mapper(self):
+        geolocator = Nominatim(user_agent='sava_tests', domain=f'127.0.0.1:{self.server.server_port}',
+                               scheme='http')
+        return NewsGeoMapper(gazetteer=Gazetteer(self.db_path), geolocator=geolocator)
+
+    def test_known_places_need_no_network(self):
+        """Prueba que los lugares del nomenclátor no consultan la red"""
+        mapper = self.make_mapper()
+
+        for location in VALLE_LOCATIONS:
+            assert mapper.geocode_location(location) is not None
+
+        assert mapper.remote_lookups == 0
+        assert _NominatimStandIn.queries == []
+
+    def test_remote_results_are_written_through(self):
+        """Prueba que los resultados remotos (y los no encontrados) sobreviven a un nuevo mapeador"""
+        mapper = self.make_mapper()
+        assert mapper.geocode_location('Hacienda La Esperanza') == (3.61, -76.42)
+        assert mapper.geocode_location('Lugar Desconocido') is None
+        assert len(_NominatimStandIn.queries) == 2
+
+        mapper.gazetteer.close()
+        second = self.make_mapper()
+        assert second.geocode_location('hacienda la esperanza') == (3.61, -76.42)
+        assert second.geocode_location('Lugar Desconocido') is None
+
+        assert second.remote_lookups == 0
+        assert len(_NominatimStandIn.queries) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
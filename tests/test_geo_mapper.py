@@ -0,0 +1,93 @@
+"""
+Tests para la construcción de mapas de NewsGeoMapper
+"""
+import pytest
+import pandas as pd
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import folium
+
+from src.gazetteer import Gazetteer
+from src.geo_mapper import NewsGeoMapper
+
+
+class _OfflineGeocoder:
+    """Geocodificador que cuenta las consultas y no encuentra nada"""
+
+    def __init__(self):
+        self.queries = []
+
+    def geocode(self, query, timeout=None):
+        self.queries.append(query)
+        return None
+
+
+class TestNewsMaps:
+    """Pruebas para create_news_map y create_heatmap"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.sleeps = []
+        self.geocoder = _OfflineGeocoder()
+        self.mapper = NewsGeoMapper(gazetteer=Gazetteer(os.path.join(self.temp_dir, 'gazetteer.db')),
+                                    geolocator=self.geocoder, sleep=self.record_sleep)
+        self.df = pd.DataFrame({
+            'titular': ['Sequía en Tuluá', 'Plaga en Tuluá', 'Cosecha en Tuluá', 'Paro en Cali', 'Lluvias'],
+            'cuerpo': ['', '', '', '', 'Sin lugar'],
+            'sentimiento_ia': ['Negativo', 'Negativo', 'Positivo', 'Negativo', 'Neutro'],
+            'fecha': ['2024-01-01'] * 5,
+        })
+
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        self.mapper.gazetteer.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def record_sleep(self, seconds):
+        self.sleeps.append(seconds)
+        time.sleep(seconds)
+
+    @staticmethod
+    def markers(news_map):
+        return [child for layer in news_map._children.values() for child in layer._children.values()
+                if isinstance(child, folium.Marker)]
+
+    def test_markers_aggregated_per_location_and_sentiment(self):
+        """Prueba que hay un marcador por ubicación y sentimiento, sin esperas ni red"""
+        markers = self.markers(self.mapper.create_news_map(self.df))
+
+        tooltips = sorted(m._children[next(k for k in m._children if k.startswith('tooltip'))].text
+                          for m in markers)
+        assert tooltips == ['Negativo: 1 noticia(s) en Cali', 'Negativo: 2 noticia(s) en Tuluá',
+                            'Neutro: 1 noticia(s) en Valle del Cauca', 'Positivo: 1 noticia(s) en Tuluá']
+        assert self.sleeps == []
+        assert self.geocoder.queries == []
+
+    def test_heatmap_weights_by_location(self):
+        """Prueba que el mapa de calor agrega las noticias negativas por coordenada"""
+        heatmap = self.mapper.create_heatmap(self.df)
+
+        layer = next(c for c in heatmap._children.values() if c.__class__.__name__ == 'HeatMap')
+        assert sorted(point[2] for point in layer.data) == [0.5, 1.0]
+
+    def test_only_network_geocodes_are_throttled(self):
+        """Prueba que solo las consultas remotas esperan turno y cada nombre se consulta una vez"""
+        lat, lon = self.mapper.coordinates_for(['Cali', 'Vereda Uno', 'Vereda Dos', 'Vereda Uno', None])
+
+        assert lat[0] == pytest.approx(3.4516)
+        assert pd.isna(lat[1:]).all()
+        assert len(self.geocoder.queries) == 2
+        assert len(self.sleeps) >= 1
+        assert pd.isna(self.mapper.coordinates_for(['Vereda Dos'])[0]).all()
+        assert len(self.geocoder.queries) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
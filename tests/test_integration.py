@@ -47,8 +47,8 @@ Reporte estadístico;Datos del último trimestre;2024-01-03;3"""
                 {"sentimiento": "Neutro", "explicacion": "Informativo"}
             ]
             
-            with patch.object(self.analyzer.cache, 'get', return_value=None):
-                with patch.object(self.analyzer.cache, 'set'):
+            with patch.object(self.analyzer.cache, 'get_many', side_effect=lambda texts: [None] * len(texts)):
+                with patch.object(self.analyzer.cache, 'set_many'):
                     sents, expls = self.analyzer.analyze_batch(df, progress_bar=None)
         
         # 3. Verificar resultados
@@ -76,12 +76,13 @@ Reporte estadístico;Datos del último trimestre;2024-01-03;3"""
                 {"sentimiento": "Neutro", "explicacion": "Test"}
             ]
             
-            with patch.object(self.analyzer.cache, 'get', return_value=None):
-                with patch.object(self.analyzer.cache, 'set') as mock_set:
+            with patch.object(self.analyzer.cache, 'get_many', side_effect=lambda texts: [None] * len(texts)):
+                with patch.object(self.analyzer.cache, 'set_many') as mock_set:
                     sents1, expls1 = self.analyzer.analyze_batch(df, progress_bar=None)
                     
                     # Verificar que se guardó en caché
-                    assert mock_set.call_count == 3
+                    assert mock_set.call_count == 1
+                    assert len(mock_set.call_args[0][0]) == 3
         
         # Segunda ejecución: todas en caché
         cached_result = {
@@ -91,7 +92,7 @@ Reporte estadístico;Datos del último trimestre;2024-01-03;3"""
             "cache_hits": 1
         }
         
-        with patch.object(self.analyzer.cache, 'get', return_value=cached_result):
+        with patch.object(self.analyzer.cache, 'get_many', side_effect=lambda texts: [cached_result] * len(texts)):
             with patch.object(self.analyzer, '_analyze_session_batch') as mock_batch:
                 sents2, expls2 = self.analyzer.analyze_batch(df, progress_bar=None)
                 
@@ -110,7 +111,7 @@ Reporte estadístico;Datos del último trimestre;2024-01-03;3"""
         with patch.object(self.analyzer, '_analyze_session_batch') as mock_batch:
             mock_batch.side_effect = Exception("API Error")
             
-            with patch.object(self.analyzer.cache, 'get', return_value=None):
+            with patch.object(self.analyzer.cache, 'get_many', side_effect=lambda texts: [None] * len(texts)):
                 # Debe manejar el error gracefully
                 try:
                     sents, expls = self.analyzer.analyze_batch(df, progress_bar=None)
@@ -139,8 +140,8 @@ Reporte estadístico;Datos del último trimestre;2024-01-03;3"""
                 return cached_result
             return None
         
-        with patch.object(self.analyzer.cache, 'get', side_effect=cache_get_side_effect):
-            with patch.object(self.analyzer.cache, 'set') as mock_set:
+        with patch.object(self.analyzer.cache, 'get_many', side_effect=lambda texts: [cache_get_side_effect(t) for t in texts]):
+            with patch.object(self.analyzer.cache, 'set_many') as mock_set:
                 with patch.object(self.analyzer, '_analyze_session_batch') as mock_batch:
                     mock_batch.return_value = [
                         {"sentimiento": "Negativo", "explicacion": "Nueva 1"},
@@ -155,7 +156,8 @@ Reporte estadístico;Datos del último trimestre;2024-01-03;3"""
                     assert len(call_args) == 2
                     
                     # Verificar que se guardaron solo las nuevas en caché
-                    assert mock_set.call_count == 2
+                    assert mock_set.call_count == 1
+                    assert len(mock_set.call_args[0][0]) == 2
                     
                     # Verificar resultados finales
                     assert len(sents) == 4
@@ -0,0 +1,78 @@
+"""
+Tests para el motor de palabras clave compartido
+"""
+import pytest
+import pandas as pd
+import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.keyword_engine import keyword_matrix, top_keywords
+from src.trend_analyzer import TrendAnalyzer
+
+
+def make_df():
+    return pd.DataFrame({
+        'titular': ['Sequía golpea cultivos de caña', 'Sequía y plagas en cultivos', 'Café con precios récord',
+                    'Café colombiano también crece'],
+        'cuerpo': ['La sequía afecta', 'Pérdidas para productores', 'Exportaciones de café', None],
+        'sentimiento_ia': ['Negativo', 'Negativo', 'Positivo', 'Positivo'],
+        'fecha': ['2024-01-01', '2024-03-01', '2024-01-15', '2024-03-15']
+    })
+
+
+class TestKeywordEngine:
+    """Pruebas para keyword_matrix / top_keywords"""
+
+    def test_counts_and_stopwords(self):
+        """Prueba el conteo por ocurrencias y que se excluyen stopwords con o sin tilde"""
+        result = dict(top_keywords(pd.Series(["Para la sequía, más sequía", "también sequía para todos"]), top_n=10))
+
+        assert result == {'sequía': 3}
+
+    def test_matrix_cached_by_content(self):
+        """Prueba que el mismo corpus no se vuelve a tokenizar"""
+        texts = pd.Series(["cultivos de caña", "precios del café"])
+
+        assert keyword_matrix(texts) is keyword_matrix(texts.copy())
+        assert keyword_matrix(texts) is not keyword_matrix(pd.Series(["cultivos de caña", "otro texto"]))
+
+    def test_mask_filter(self):
+        """Prueba el top-N sobre un subconjunto con una suma dispersa"""
+        matrix = keyword_matrix(pd.Series(["caña caña café", "café", "plátano"]))
+
+        assert matrix.top_keywords(np.array([False, True, True]), top_n=5) == [('café', 1), ('plátano', 1)]
+        assert matrix.top_keywords(np.array([False, False, False])) == []
+
+    def test_empty_corpus(self):
+        """Prueba que un corpus sin palabras válidas no falla"""
+        assert top_keywords(pd.Series(["", None, "de la"])) == []
+
+
+class TestTrendAnalyzerKeywords:
+    """Pruebas de TrendAnalyzer.extract_keywords sobre el motor compartido"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.analyzer = TrendAnalyzer()
+        self.analyzer.load_data(make_df())
+
+    def test_sentiment_filter(self):
+        """Prueba el filtro por sentimiento"""
+        keywords = dict(self.analyzer.extract_keywords('Negativo'))
+
+        assert keywords['sequía'] == 3
+        assert keywords['cultivos'] == 2
+        assert 'café' not in keywords
+
+    def test_date_filter(self):
+        """Prueba el filtro por rango de fechas"""
+        keywords = dict(self.analyzer.extract_keywords(start_date='2024-03-01', end_date='2024-03-31'))
+
+        assert set(keywords) == {'sequía', 'plagas', 'cultivos', 'pérdidas', 'productores', 'café', 'colombiano', 'crece'}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,60 @@
+"""
+Tests para las firmas MinHash de casi duplicados
+"""
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.minhash import MinHasher, normalize_tokens
+
+
+BASE = ("El precio del café en el Valle del Cauca subió cinco por ciento esta semana según la "
+        "federación de cafeteros, lo que beneficia a los productores locales de Buga, Tuluá y Sevilla "
+        "que esperaban una recuperación tras meses de precios bajos en el mercado internacional.")
+
+
+class TestMinHasher:
+    """Pruebas para MinHasher"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.hasher = MinHasher()
+
+    def test_normalize_tokens(self):
+        """Prueba que se ignoran mayúsculas, tildes y puntuación"""
+        assert normalize_tokens("¡Café, CAÑA y Maíz!") == ["cafe", "cana", "y", "maiz"]
+
+    def test_signature_is_deterministic(self):
+        """Prueba que la firma es estable entre instancias"""
+        assert (self.hasher.signature(BASE) == MinHasher().signature(BASE)).all()
+
+    def test_near_duplicate_scores_high(self):
+        """Prueba que una versión con otra firma y fecha es muy similar"""
+        variant = BASE.replace("café", "cafe") + " Por Redacción Agro, 12 de marzo."
+        score = self.hasher.similarity(self.hasher.signature(BASE), self.hasher.signature(variant))
+        assert score >= 0.8
+
+    def test_different_text_scores_low(self):
+        """Prueba que noticias distintas no se confunden"""
+        other = "Lluvias intensas afectan los cultivos de caña en Palmira y Candelaria durante el fin de semana."
+        score = self.hasher.similarity(self.hasher.signature(BASE), self.hasher.signature(other))
+        assert score < 0.2
+
+    def test_band_keys_shared_by_near_duplicates(self):
+        """Prueba que los casi duplicados comparten alguna banda LSH"""
+        variant = BASE + " Fuente: El País."
+        keys_a = set(self.hasher.band_keys(self.hasher.signature(BASE)))
+        keys_b = set(self.hasher.band_keys(self.hasher.signature(variant)))
+        assert len(keys_a) == self.hasher.bands
+        assert keys_a & keys_b
+
+    def test_invalid_band_configuration(self):
+        """Prueba que num_perm debe ser divisible por bands"""
+        with pytest.raises(ValueError):
+            MinHasher(num_perm=64, bands=10)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
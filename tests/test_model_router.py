@@ -0,0 +1,194 @@
+"""
+Tests para el enrutador de modelos con salud persistente
+"""
+import pytest
+import os
+import tempfile
+import shutil
+from unittest.mock import patch, MagicMock
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.model_router import ModelRouter, model_family
+from src.rate_limiter import RateLimiter
+
+
+class TestModelRouter:
+    """Pruebas para ModelRouter"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.temp_dir, "model_health.json")
+        self.now = 1000.0
+        self.limiter = RateLimiter()
+        self.router = self._new_router()
+
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def _new_router(self):
+        return ModelRouter(
+            state_path=self.state_path,
+            candidates=["modelo-a", "modelo-b", "modelo-c"],
+            rate_limiter=self.limiter,
+            save_interval=0,
+            clock=lambda: self.now,
+        )
+
+    def test_default_order_without_measurements(self):
+        """Prueba que sin mediciones se respeta el orden de preferencia"""
+        assert self.router.ranked_candidates() == ["modelo-a", "modelo-b", "modelo-c"]
+
+    def test_fastest_healthy_model_first(self):
+        """Prueba que el modelo más rápido pasa al inicio"""
+        self.router.record_success("modelo-a", 0.9)
+        self.router.record_success("modelo-c", 0.2)
+
+        assert self.router.ranked_candidates()[0] == "modelo-c"
+
+    def test_not_found_model_excluded(self):
+        """Prueba que un modelo con 404 no se vuelve a intentar"""
+        self.router.record_failure("modelo-a", "not_found")
+
+        assert "modelo-a" not in self.router.ranked_candidates()
+
+        # Tras el TTL vuelve a considerarse
+        self.now += self.router.not_found_ttl + 1
+        assert "modelo-a" in self.router.ranked_candidates()
+
+    def test_quota_model_moved_last(self):
+        """Prueba que un modelo sin cuota se intenta solo al final"""
+        self.router.record_failure("modelo-a", "quota", cooldown=30)
+
+        assert self.router.ranked_candidates()[-1] == "modelo-a"
+
+    def test_state_persists_across_instances(self):
+        """Prueba que la salud se comparte entre instancias (reruns / procesos)"""
+        self.router.record_failure("modelo-b", "not_found")
+        self.router.record_success("modelo-c", 0.1)
+
+        other = self._new_router()
+
+        assert "modelo-b" not in other.ranked_candidates()
+        assert other.ranked_candidates()[0] == "modelo-c"
+
+    def test_available_models_cached(self):
+        """Prueba que list_models solo se consulta una vez mientras la caché es válida"""
+        fetcher = MagicMock(return_value=["gemini-2.5-flash"])
+
+        assert self.router.get_available_models(fetcher) == ["gemini-2.5-flash"]
+        assert self._new_router().get_available_models(fetcher) == ["gemini-2.5-flash"]
+        assert fetcher.call_count == 1
+
+    def test_failed_model_listing_cached_briefly(self):
+        """Prueba que un list_models fallido se reintenta tras su TTL corto"""
+        fetcher = MagicMock(return_value=[])
+
+        self.router.get_available_models(fetcher)
+        self.router.get_available_models(fetcher)
+        assert fetcher.call_count == 1
+
+        self.now += self.router.models_list_error_ttl + 1
+        self.router.get_available_models(fetcher)
+        assert fetcher.call_count == 2
+
+    def test_model_objects_reused(self):
+        """Prueba que los GenerativeModel construidos se reutilizan"""
+        with patch('google.generativeai.GenerativeModel') as mock_model_class:
+            m1 = self.router.get_model("modelo-a", {"temperature": 0.1})
+            m2 = self.router.get_model("modelo-a", {"temperature": 0.1})
+            m3 = self.router.get_model("modelo-a", {"temperature": 0.7})
+
+        assert m1 is m2
+        assert mock_model_class.call_count == 2
+        assert m3 is not None
+
+    def test_generate_fails_over_and_records(self):
+        """Prueba que generate salta modelos fallidos y registra su estado"""
+        ok_response = MagicMock()
+        ok_response.text = "CLASIFICACIÓN: Positivo"
+
+        def build(model_name, **kwargs):
+            model = MagicMock()
+            if model_name == "modelo-a":
+                model.generate_content.side_effect = Exception("404 model not found")
+            elif model_name == "modelo-b":
+                model.generate_content.side_effect = Exception("429 Resource exhausted")
+            else:
+                model.generate_content.return_value = ok_response
+            return model
+
+        with patch('google.generativeai.GenerativeModel', side_effect=build):
+            model_name, response = self.router.generate("prompt", max_wait=0)
+
+        assert model_name == "modelo-c"
+        assert response is ok_response
+
+        health = self.router.get_health()
+        assert health["modelo-a"]["not_found_until"] > self.now
+        assert health["modelo-b"]["quota_until"] > self.now
+        assert health["modelo-c"]["successes"] == 1
+
+        # La siguiente petición va directo al modelo sano
+        assert self.router.ranked_candidates()[0] == "modelo-c"
+
+    def test_stream_health_recorded_after_iteration(self):
+        """Prueba que en streaming la salud se registra al terminar el stream, incluidos los 429 tardíos"""
+        def failing_stream():
+            yield MagicMock(text="Hola")
+            raise Exception("429 Resource exhausted")
+
+        with patch('google.generativeai.GenerativeModel') as mock_model_class:
+            mock_model_class.return_value.generate_content.return_value = failing_stream()
+            model_name, stream = self.router.generate("prompt", max_wait=0, stream=True)
+
+            assert model_name == "modelo-a"
+            assert "modelo-a" not in self.router.get_health()
+            with pytest.raises(Exception, match="429"):
+                list(stream)
+
+        health = self.router.get_health()
+        assert health["modelo-a"]["successes"] == 0
+        assert health["modelo-a"]["quota_until"] > self.now
+        assert self.router.ranked_candidates()[-1] == "modelo-a"
+
+        with patch('google.generativeai.GenerativeModel') as mock_model_class:
+            mock_model_class.return_value.generate_content.return_value = iter([MagicMock(text="Hola")])
+            model_name, stream = self.router.generate("prompt", max_wait=0, stream=True)
+            assert [chunk.text for chunk in stream] == ["Hola"]
+
+        assert self.router.get_health()[model_name]["successes"] == 1
+
+    def test_generate_all_fail(self):
+        """Prueba que retorna (None, None) si ningún modelo responde"""
+        with patch('google.generativeai.GenerativeModel') as mock_model_class:
+            mock_model_class.return_value.generate_content.side_effect = Exception("500 internal")
+            assert self.router.generate("prompt", max_wait=0) == (None, None)
+
+
+    def test_model_family(self):
+        """Prueba que las variantes de un modelo comparten familia"""
+        assert model_family("gemini-2.0-flash-exp") == "gemini-2.0-flash"
+        assert model_family("models/gemini-1.5-flash-latest") == "gemini-1.5-flash"
+        assert model_family("gemini-2.5-pro") == "gemini-2.5-pro"
+
+    def test_preferred_family_ignores_latency(self):
+        """Prueba que la familia preferida solo cambia si el modelo deja de existir"""
+        self.router.record_success("modelo-c", 0.1)
+        assert self.router.preferred_family() == "modelo-a"
+
+        self.router.record_failure("modelo-a", "not_found")
+        assert self.router.preferred_family() == "modelo-b"
+
+    def test_candidate_families_exclude_retired_models(self):
+        """Prueba que las familias vigentes incluyen los respaldos pero no los modelos con 404"""
+        self.router.record_failure("modelo-b", "not_found")
+        assert self.router.candidate_families() == ["modelo-a", "modelo-c"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,217 @@
+"""
+Tests para el índice de recuperación incremental del chatbot
+"""
+import pytest
+import pandas as pd
+import os
+import tempfile
+import shutil
+from unittest.mock import patch, MagicMock
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from src.news_index import NewsIndex, row_hashes, dataframe_fingerprint
+from src.chatbot_rag import AgriNewsBot
+from src.cache_manager import ResponseCache
+
+
+def make_df(n_extra=0):
+    df = pd.DataFrame({
+        'titular': ['Sequía afecta la caña en Palmira', 'Exportaciones de café crecen', 'Paro camionero bloquea vías'],
+        'cuerpo': ['Pérdidas en cultivos', 'Récord en ventas', 'Bloqueos en la vía Panamericana'],
+        'sentimiento_ia': ['Negativo', 'Positivo', 'Negativo'],
+        'explicacion_ia': ['Crisis hídrica', 'Crecimiento', 'Conflicto'],
+        'fecha': ['2024-01-01', '2024-01-02', '2024-01-03']
+    })
+    extra = pd.DataFrame({
+        'titular': [f'Nueva inversión en aguacate {i}' for i in range(n_extra)],
+        'cuerpo': ['Inversión privada'] * n_extra,
+        'sentimiento_ia': ['Positivo'] * n_extra,
+        'explicacion_ia': ['Inversión'] * n_extra,
+        'fecha': ['2024-02-01'] * n_extra
+    })
+    return pd.concat([df, extra], ignore_index=True)
+
+
+class TestNewsIndex:
+    """Pruebas para NewsIndex"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.index = NewsIndex(index_dir=self.temp_dir)
+
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def test_fingerprint_changes_with_content(self):
+        """Prueba que la huella cambia si cambia el análisis de una fila"""
+        df = make_df()
+        changed = df.copy()
+        changed.loc[0, 'sentimiento_ia'] = 'Neutro'
+
+        assert dataframe_fingerprint(row_hashes(df)) == dataframe_fingerprint(row_hashes(df.copy()))
+        assert dataframe_fingerprint(row_hashes(df)) != dataframe_fingerprint(row_hashes(changed))
+
+    def test_unchanged_dataframe_reuses_view(self):
+        """Prueba que un rerun con los mismos datos no reconstruye nada"""
+        view = self.index.sync(make_df())
+
+        with patch.object(self.index, '_append') as mock_append:
+            assert self.index.sync(make_df()) is view
+            assert mock_append.call_count == 0
+
+    def test_incremental_append(self):
+        """Prueba que solo se vectorizan las filas nuevas"""
+        self.index.sync(make_df())
+        version = self.index.version
+
+        view = self.index.sync(make_df(n_extra=2))
+
+        assert self.index.counts.shape[0] == 5
+        assert self.index.version == version + 1
+        assert len(view) == 5
+
+    def test_search_ranks_relevant_first(self):
+        """Prueba la búsqueda BM25 sin tildes ni mayúsculas"""
+        view = self.index.sync(make_df())
+
+        results = view.search("SEQUIA cana", top_k=2)
+
+        assert results[0] == (0, 1.0)
+        assert all(0 < score <= 1 for _, score in results)
+
+    def test_search_matches_inflections(self):
+        """Prueba que el stemming recupera variantes (exportación / exportaciones)"""
+        view = self.index.sync(make_df())
+
+        assert view.search("exportación de cafés")[0][0] == 1
+
+    def test_stopwords_only_query_returns_nothing(self):
+        """Prueba que una consulta de solo stopwords no recupera noticias"""
+        view = self.index.sync(make_df())
+
+        assert view.search("de la en los") == []
+
+    def test_hybrid_search_fuses_embeddings(self):
+        """Prueba que los embeddings recuperan noticias sin términos en común"""
+        vectors = {"Paro": [1.0, 0.0], "movilidad": [1.0, 0.0]}
+
+        def embedder(texts):
+            return np.array([next((v for k, v in vectors.items() if k in t), [0.0, 1.0]) for t in texts])
+
+        self.index.set_embedder(embedder)
+        view = self.index.sync(make_df())
+
+        results = view.search("problemas de movilidad", top_k=1)
+
+        assert results[0][0] == 2
+
+    def test_embeddings_persisted_with_index(self):
+        """Prueba que los embeddings se calculan una vez y se reutilizan desde disco"""
+        calls = []
+
+        def embedder(texts):
+            calls.append(len(texts))
+            return np.ones((len(texts), 4))
+
+        self.index.set_embedder(embedder)
+        self.index.sync(make_df()).search("café")
+        assert calls == [3, 1]
+
+        other = NewsIndex(index_dir=self.temp_dir, embedder=embedder)
+        other.sync(make_df(n_extra=1)).search("café")
+
+        # Solo la noticia nueva y la consulta
+        assert calls == [3, 1, 1, 1]
+        assert len(other.vector_store) == 4
+
+    def test_index_persisted_across_instances(self):
+        """Prueba que el índice se reutiliza desde disco en otra sesión"""
+        self.index.sync(make_df())
+
+        other = NewsIndex(index_dir=self.temp_dir)
+        assert other.counts.shape[0] == 3
+
+        with patch.object(other, '_append') as mock_append:
+            view = other.sync(make_df())
+            assert mock_append.call_count == 0
+        assert view.search("café")[0][0] == 1
+
+    def test_appends_written_as_segments_and_merged(self):
+        """Prueba que cada anexado escribe solo un segmento y que se fusionan al llegar al límite"""
+        self.index.sync(make_df())
+        base_mtime = os.path.getmtime(os.path.join(self.temp_dir, "counts.npz"))
+
+        with patch('src.news_index.MAX_SEGMENTS', 2):
+            self.index.sync(make_df(n_extra=1))
+            self.index.sync(make_df(n_extra=2))
+            assert len(self.index._segments) == 2
+            assert os.path.getmtime(os.path.join(self.temp_dir, "counts.npz")) == base_mtime
+
+            other = NewsIndex(index_dir=self.temp_dir)
+            assert other.counts.shape[0] == 5
+            np.testing.assert_array_equal(other.doc_freq, self.index.doc_freq)
+
+            self.index.sync(make_df(n_extra=3))
+            assert self.index._segments == []
+            assert not [f for f in os.listdir(self.temp_dir) if f.startswith("seg_")]
+
+        merged = NewsIndex(index_dir=self.temp_dir)
+        assert merged.counts.shape[0] == 6
+        assert merged.sync(make_df(n_extra=3)).search("aguacate")
+
+
+class TestAgriNewsBotRetrieval:
+    """Pruebas de recuperación del chatbot sobre el índice"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.bot = AgriNewsBot("test_api_key")
+        self.bot.index = NewsIndex(index_dir=self.temp_dir)
+        self.bot.response_cache = ResponseCache(db_path=os.path.join(self.temp_dir, "cache.db"))
+
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def test_retrieve_relevant_news(self):
+        """Prueba que retorna la noticia relevante con su similitud"""
+        self.bot.load_news_database(make_df())
+
+        news = self.bot.retrieve_relevant_news("paro camionero", top_k=3)
+
+        assert news[0]['titular'] == 'Paro camionero bloquea vías'
+        assert news[0]['sentimiento'] == 'Negativo'
+        assert 0 < news[0]['similarity'] <= 1
+
+    def test_repeated_question_served_from_cache(self):
+        """Prueba que una pregunta repetida no vuelve a llamar al modelo"""
+        self.bot.load_news_database(make_df())
+        response = MagicMock()
+        response.text = "Hay problemas de movilidad"
+
+        with patch.object(self.bot.router, 'generate', return_value=("modelo", response)) as mock_generate:
+            first = self.bot.chat("¿Qué pasa con el paro camionero?")
+            second = self.bot.chat("que pasa con el PARO camionero")
+
+        assert mock_generate.call_count == 1
+        assert second['response'] == first['response']
+        assert second['from_cache'] is True
+        assert len(self.bot.conversation_history) == 2
+
+    def test_quick_stats_from_index(self):
+        """Prueba que las estadísticas usan las noticias cargadas"""
+        self.bot.load_news_database(make_df())
+
+        assert "Total de noticias: 3" in self.bot.get_quick_stats()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,131 @@
+"""
+Tests para el limitador de tasa compartido
+"""
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.rate_limiter import TokenBucket, RateLimiter, get_rate_limiter, is_rate_limit_error
+
+
+class FakeClock:
+    """Reloj controlado manualmente; sleep avanza el tiempo"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestTokenBucket:
+    """Pruebas para TokenBucket"""
+
+    def test_consume_and_refill(self):
+        """Prueba que la cubeta se vacía y se rellena con el tiempo"""
+        clock = FakeClock()
+        bucket = TokenBucket(capacity=10, refill_per_second=1, clock=clock)
+
+        bucket.consume(10)
+        assert bucket.available() == 0
+        assert bucket.time_until(5) == 5
+
+        clock.now += 5
+        assert bucket.available() == 5
+
+    def test_refill_capped_at_capacity(self):
+        """Prueba que no se acumulan más tokens que la capacidad"""
+        clock = FakeClock()
+        bucket = TokenBucket(capacity=10, refill_per_second=1, clock=clock)
+
+        clock.now += 100
+        assert bucket.available() == 10
+
+
+class TestRateLimiter:
+    """Pruebas para RateLimiter"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(
+            limits={"modelo-a": {"rpm": 2, "tpm": 1000}, "modelo-b": {"rpm": 2, "tpm": 1000}},
+            clock=self.clock,
+            sleep=self.clock.sleep,
+        )
+
+    def test_acquire_within_budget(self):
+        """Prueba que se concede cupo sin esperar dentro del presupuesto"""
+        assert self.limiter.acquire("modelo-a", tokens=100, timeout=0)
+        assert self.limiter.acquire("modelo-a", tokens=100, timeout=0)
+
+    def test_acquire_respects_rpm(self):
+        """Prueba que sin timeout no se supera el RPM"""
+        self.limiter.acquire("modelo-a", timeout=0)
+        self.limiter.acquire("modelo-a", timeout=0)
+
+        assert self.limiter.acquire("modelo-a", timeout=0) is False
+
+    def test_acquire_waits_for_refill(self):
+        """Prueba que acquire espera hasta que se recupera la cuota"""
+        self.limiter.acquire("modelo-a", timeout=0)
+        self.limiter.acquire("modelo-a", timeout=0)
+        start = self.clock.now
+
+        assert self.limiter.acquire("modelo-a", timeout=60)
+        assert self.clock.now - start >= 30  # 2 RPM = 1 petición cada 30s
+
+    def test_acquire_respects_tpm(self):
+        """Prueba que el presupuesto de tokens también limita"""
+        assert self.limiter.acquire("modelo-a", tokens=900, timeout=0)
+        assert self.limiter.acquire("modelo-a", tokens=900, timeout=0) is False
+
+    def test_rate_limited_only_affects_model(self):
+        """Prueba que un 429 enfría solo el modelo afectado"""
+        self.limiter.report_rate_limited("modelo-a")
+
+        assert not self.limiter.is_available("modelo-a")
+        assert self.limiter.is_available("modelo-b")
+        assert self.limiter.acquire("modelo-b", timeout=0)
+        assert self.limiter.acquire("modelo-a", timeout=0) is False
+
+    def test_backoff_grows_and_resets(self):
+        """Prueba que el backoff crece con 429 consecutivos y se reinicia con un éxito"""
+        delays = [self.limiter.report_rate_limited("modelo-a") for _ in range(4)]
+        assert delays[-1] > delays[0]
+        assert all(d <= self.limiter.max_backoff * 1.5 for d in delays)
+
+        self.limiter.report_success("modelo-a")
+        self.clock.now += 1000
+        assert self.limiter.report_rate_limited("modelo-a") <= self.limiter.base_backoff * 1.5
+
+    def test_headroom(self):
+        """Prueba el reporte de cupo disponible"""
+        self.limiter.acquire("modelo-a", tokens=300, timeout=0)
+        self.limiter.report_rate_limited("modelo-b", retry_after=10)
+
+        headroom = self.limiter.headroom()
+
+        assert headroom["modelo-a"]["rpm_available"] == 1
+        assert headroom["modelo-a"]["tpm_available"] == 700
+        assert headroom["modelo-b"]["cooldown_seconds"] > 0
+        assert headroom["modelo-b"]["total_429"] == 1
+
+    def test_shared_instance(self):
+        """Prueba que el limitador del proceso es único"""
+        assert get_rate_limiter() is get_rate_limiter()
+
+    def test_is_rate_limit_error(self):
+        """Prueba la detección de errores de cuota"""
+        assert is_rate_limit_error("429 Resource has been exhausted")
+        assert is_rate_limit_error("Quota exceeded for model")
+        assert not is_rate_limit_error("404 model not found")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
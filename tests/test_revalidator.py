@@ -0,0 +1,82 @@
+"""
+Tests para la re-validación perezosa del caché
+"""
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.revalidator import BackgroundRevalidator, get_revalidator
+
+
+class FakeClock:
+    """Reloj controlado manualmente"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestBackgroundRevalidator:
+    """Pruebas para BackgroundRevalidator"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.clock = FakeClock()
+        self.revalidator = BackgroundRevalidator(budget_per_hour=3, clock=self.clock)
+        self.stored = []
+
+    def _analyze(self, texts):
+        return [{"sentimiento": "Positivo", "explicacion": text} for text in texts]
+
+    def test_revalidates_in_background(self):
+        """Prueba que los textos se re-analizan y se guardan"""
+        accepted = self.revalidator.submit(["a", "b"], self._analyze, self.stored.extend)
+        self.revalidator.wait_idle(timeout=5)
+
+        assert accepted == 2
+        assert [text for text, _ in self.stored] == ["a", "b"]
+        assert self.revalidator.get_stats()["revalidated"] == 2
+
+    def test_budget_bounds_work(self):
+        """Prueba que no se supera el presupuesto por hora"""
+        accepted = self.revalidator.submit(["a", "b", "c", "d", "e"], self._analyze, self.stored.extend)
+        self.revalidator.wait_idle(timeout=5)
+
+        assert accepted == 3
+        assert self.revalidator.get_stats()["skipped"] == 2
+
+        # El presupuesto se recupera con el tiempo
+        self.clock.now += 1200
+        assert self.revalidator.submit(["d"], self._analyze, self.stored.extend) == 1
+
+    def test_failed_items_not_stored(self):
+        """Prueba que los resultados fallidos no se guardan"""
+        self.revalidator.submit(["a", "b"], lambda texts: [None, {"sentimiento": "Neutro", "explicacion": ""}],
+                                self.stored.extend)
+        self.revalidator.wait_idle(timeout=5)
+
+        assert [text for text, _ in self.stored] == ["b"]
+        assert self.revalidator.get_stats()["failed"] == 1
+
+    def test_exception_releases_in_flight(self):
+        """Prueba que un error no deja textos bloqueados como en curso"""
+        def broken(texts):
+            raise RuntimeError("API caída")
+
+        self.revalidator.submit(["a"], broken, self.stored.extend)
+        self.revalidator.wait_idle(timeout=5)
+
+        assert self.revalidator.get_stats()["in_flight"] == 0
+        assert self.revalidator.submit(["a"], self._analyze, self.stored.extend) == 1
+
+    def test_shared_instance(self):
+        """Prueba que el re-validador del proceso es único"""
+        assert get_revalidator() is get_revalidator()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,193 @@
+"""
+Tests para el pronóstico de sentimiento sobre los agregados diarios
+"""
+import pytest
+import pandas as pd
+import numpy as np
+import os
+import sys
+import tempfile
+import shutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.sentiment_forecast import SentimentForecaster, fit_series, forecast_paths
+from src.sentiment_rollups import SentimentRollups
+from src.trend_analyzer import TrendAnalyzer
+
+
+def make_df(days=30, rising=True, start='2024-01-01'):
+    """Noticias diarias de dos fuentes; en la segunda mitad sube la proporción negativa"""
+    rows = []
+    for day in range(days):
+        fecha = (pd.Timestamp(start) + pd.Timedelta(days=day)).strftime('%Y-%m-%d')
+        negatives = 3 if rising and day >= days // 2 else 1
+        for i in range(4):
+            rows.append({
+                'titular': f'Noticia {day}-{i}',
+                'fecha': fecha,
+                'fuente': 'El País' if i % 2 == 0 else 'El Tiempo',
+                'sentimiento_ia': 'Negativo' if i < negatives else 'Positivo',
+            })
+    return pd.DataFrame(rows)
+
+
+class TestHoltModel:
+    """Pruebas del modelo de Holt amortiguado"""
+
+    def test_fit_tracks_linear_series(self):
+        """Prueba que una serie lineal se ajusta con tendencia y se extrapola"""
+        y = np.arange(30, dtype=float)[None, :]
+
+        fit = fit_series(y)
+        mean, lower, upper = forecast_paths(fit['params'], fit['level'], fit['trend'],
+                                            np.array([1.0]), horizon=3)
+
+        assert fit['level'][0] == pytest.approx(29, abs=1.5)
+        assert fit['trend'][0] > 0.5
+        assert mean[0, 0] > 29
+        assert np.all(lower <= mean) and np.all(mean <= upper)
+
+    def test_intervals_widen_with_horizon(self):
+        """Prueba que la incertidumbre crece con el horizonte"""
+        rng = np.random.default_rng(0)
+        y = 10 + rng.normal(0, 2, size=(2, 60))
+
+        fit = fit_series(y)
+        sigma2 = fit['sse'] / (fit['n'] - 1)
+        mean, lower, upper = forecast_paths(fit['params'], fit['level'], fit['trend'], sigma2, horizon=7)
+
+        widths = upper - lower
+        assert np.all(np.diff(widths, axis=1) >= -1e-9)
+        assert mean.shape == (2, 7)
+
+
+class TestSentimentForecaster:
+    """Pruebas para SentimentForecaster"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.rollups = SentimentRollups()
+        self.rollups.ingest(make_df())
+
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_structured_forecast(self):
+        """Prueba el resultado: histórico, pronóstico con intervalos y riesgo"""
+        result = SentimentForecaster(horizon=5).forecast(self.rollups)
+
+        assert len(result['history']) == 30
+        assert len(result['forecast']) == 5
+        assert result['forecast'].index[0] == pd.Timestamp('2024-01-31')
+        assert {'Negativo', 'Negativo_inf', 'Negativo_sup', 'riesgo', 'riesgo_inf', 'riesgo_sup'} <= set(
+            result['forecast'].columns)
+        assert result['baseline_risk'] == 50.0
+        assert result['forecast_risk'] > 60
+        assert (result['forecast']['riesgo_inf'] <= result['forecast']['riesgo']).all()
+
+    def test_groups_fitted_in_batch(self):
+        """Prueba el ajuste en lote de todos los valores de una dimensión"""
+        forecaster = SentimentForecaster()
+
+        results = forecaster.forecast_groups(self.rollups, 'fuente')
+
+        assert set(results) == {'El País', 'El Tiempo'}
+        assert forecaster.stats['fits'] == 2
+        assert len(results['El País']['history']) == 30
+
+    def test_incremental_update(self):
+        """Prueba que los días nuevos actualizan el estado sin re-ajustar parámetros"""
+        forecaster = SentimentForecaster()
+        forecaster.forecast(self.rollups)
+        assert forecaster.stats == {'fits': 1, 'updates': 0, 'reused': 0}
+
+        forecaster.forecast(self.rollups)
+        assert forecaster.stats['reused'] == 1
+
+        # Dos días más: solo se recorren los días nuevos
+        self.rollups.ingest(make_df(days=2, rising=False, start='2024-01-31'))
+        result = forecaster.forecast(self.rollups)
+
+        assert forecaster.stats['fits'] == 1
+        assert forecaster.stats['updates'] == 1
+        assert len(result['history']) == 32
+
+    def test_changed_history_refits(self):
+        """Prueba que si cambian días ya consolidados se vuelve a ajustar"""
+        forecaster = SentimentForecaster()
+        forecaster.forecast(self.rollups)
+
+        self.rollups.ingest(pd.DataFrame({'titular': ['Tardía'], 'fecha': ['2024-01-05'],
+                                          'sentimiento_ia': ['Negativo']}))
+        forecaster.forecast(self.rollups)
+
+        assert forecaster.stats['fits'] == 2
+
+    def test_state_persisted(self):
+        """Prueba que el estado ajustado se reutiliza en otra instancia"""
+        state_path = os.path.join(self.temp_dir, 'forecast_state.json')
+        SentimentForecaster(state_path=state_path).forecast(self.rollups, scope='historial')
+
+        reopened = SentimentForecaster(state_path=state_path)
+        reopened.forecast(self.rollups, scope='historial')
+
+        assert reopened.stats == {'fits': 0, 'updates': 0, 'reused': 1}
+
+    def test_state_count_bounded(self):
+        """Prueba que se descartan los estados usados hace más tiempo al superar max_states"""
+        forecaster = SentimentForecaster(max_states=2)
+        for scope in ('a', 'b', 'c'):
+            forecaster.forecast(self.rollups, scope=scope)
+
+        assert sorted(forecaster._states) == ['b||', 'c||']
+
+    def test_single_day(self):
+        """Prueba que un solo día produce un pronóstico plano"""
+        rollups = SentimentRollups()
+        rollups.ingest(make_df(days=1, rising=False))
+
+        result = SentimentForecaster(horizon=3).forecast(rollups)
+
+        assert result['forecast']['Negativo'].tolist() == [1.0, 1.0, 1.0]
+
+
+class TestTrendAnalyzerForecast:
+    """Pruebas de TrendAnalyzer sobre el pronosticador"""
+
+    def test_forecast_and_prediction(self):
+        """Prueba el pronóstico estructurado, por dimensión y el texto de predicción"""
+        analyzer = TrendAnalyzer(forecaster=SentimentForecaster())
+        analyzer.load_data(make_df())
+
+        assert len(analyzer.forecast_sentiment(horizon=3)['forecast']) == 3
+        assert set(analyzer.forecast_by('fuente')) == {'El País', 'El Tiempo'}
+        assert "TENDENCIA NEGATIVA" in analyzer.predict_sentiment_trend()
+
+    def test_state_separated_by_dataset(self):
+        """Prueba que dos conjuntos de datos cargados no comparten ni pisan el estado ajustado"""
+        forecaster = SentimentForecaster()
+        first, second = TrendAnalyzer(forecaster=forecaster), TrendAnalyzer(forecaster=forecaster)
+        first.load_data(make_df())
+        second.load_data(make_df(rising=False))
+
+        first.forecast_sentiment()
+        second.forecast_sentiment()
+        first.forecast_sentiment()
+
+        assert len(forecaster._states) == 2
+        assert forecaster.stats['fits'] == 2
+        assert forecaster.stats['reused'] == 1
+
+    def test_stable_prediction(self):
+        """Prueba que sin cambios en la proporción negativa la tendencia es estable"""
+        analyzer = TrendAnalyzer(forecaster=SentimentForecaster())
+        analyzer.load_data(make_df(rising=False))
+
+        assert "TENDENCIA ESTABLE" in analyzer.predict_sentiment_trend()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,200 @@
+"""
+Tests para los agregados de sentimiento por periodo
+"""
+import pytest
+import pandas as pd
+import os
+import sys
+import tempfile
+import shutil
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.sentiment_rollups import SentimentRollups, rollup_counts, rollups_for
+from src.sentiment_forecast import SentimentForecaster
+from src.trend_analyzer import TrendAnalyzer
+
+
+def make_df():
+    return pd.DataFrame({
+        'titular': ['Sequía en el Valle', 'Plagas en caña', 'Récord de café', 'Lluvias dañan vías', 'Nueva planta'],
+        'fecha': ['2024-01-01', '2024-01-01', '2024-01-03', '2024-01-10', 'sin fecha'],
+        'fuente': ['El País', 'El Tiempo', 'El País', 'El País', 'El Tiempo'],
+        'sentimiento_ia': ['Negativo', 'Negativo', 'Positivo', 'Negativo', 'Positivo'],
+    })
+
+
+class TestRollupCounts:
+    """Pruebas para rollup_counts"""
+
+    def test_daily_weekly_monthly_buckets(self):
+        """Prueba los periodos diario, semanal (lunes) y mensual; sin fecha se ignora"""
+        counts = rollup_counts(make_df())
+        total = counts[counts['dimension'] == '']
+
+        daily = total[total['granularidad'] == 'D'].groupby('periodo')['conteo'].sum().to_dict()
+        weekly = total[total['granularidad'] == 'W'].groupby('periodo')['conteo'].sum().to_dict()
+        monthly = total[total['granularidad'] == 'M'].groupby('periodo')['conteo'].sum().to_dict()
+
+        assert daily == {'2024-01-01': 2, '2024-01-03': 1, '2024-01-10': 1}
+        assert weekly == {'2024-01-01': 3, '2024-01-08': 1}
+        assert monthly == {'2024-01-01': 4}
+
+    def test_dimension_counts(self):
+        """Prueba que las dimensiones presentes se agregan por valor"""
+        counts = rollup_counts(make_df())
+        by_source = counts[(counts['dimension'] == 'fuente') & (counts['granularidad'] == 'M')]
+
+        assert by_source.groupby('valor')['conteo'].sum().to_dict() == {'El País': 3, 'El Tiempo': 1}
+        assert 'ubicacion' not in set(counts['dimension'])
+
+
+class TestSentimentRollups:
+    """Pruebas para SentimentRollups"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'rollups.db')
+
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_trend_frame(self):
+        """Prueba la tabla por periodo con las tres columnas de sentimiento"""
+        rollups = SentimentRollups()
+        rollups.ingest(make_df())
+
+        trend = rollups.trend('D')
+
+        assert list(trend.columns) == ['Positivo', 'Negativo', 'Neutro']
+        assert trend['Negativo'].tolist() == [2, 0, 1]
+        assert trend['Neutro'].sum() == 0
+        assert trend.index[0] == pd.Timestamp('2024-01-01')
+        assert rollups.trend('W', 'fuente', 'El Tiempo')['Negativo'].tolist() == [1]
+        assert rollups.trend('D', start='2024-01-02')['Positivo'].tolist() == [1, 0]
+        assert rollups.trend('D', 'fuente', 'Otra') is None
+
+    def test_incremental_and_deduplicated(self):
+        """Prueba que las ingestas se suman y que una noticia repetida no se cuenta dos veces"""
+        rollups = SentimentRollups(self.db_path)
+        df = make_df()
+
+        assert rollups.ingest(df.iloc[:2]) == 2
+        assert rollups.ingest(df) == 3
+        assert rollups.ingest(df) == 0
+
+        assert rollups.trend('M').loc['2024-01-01'].to_dict() == {'Positivo': 1, 'Negativo': 3, 'Neutro': 0}
+
+    def test_relabelled_article_corrected(self):
+        """Prueba que una noticia reanalizada con otro sentimiento mueve su conteo en lugar de duplicarlo"""
+        rollups = SentimentRollups(self.db_path)
+        df = make_df()
+        rollups.ingest(df)
+
+        df.loc[0, 'sentimiento_ia'] = 'Positivo'
+        assert rollups.ingest(df) == 0
+
+        assert rollups.trend('M').loc['2024-01-01'].to_dict() == {'Positivo': 2, 'Negativo': 2, 'Neutro': 0}
+        assert rollups.trend('D', 'fuente', 'El País')['Negativo'].tolist() == [0, 0, 1]
+
+    def test_dedupe_registry_bounded_by_window(self):
+        """Prueba que el registro de noticias contadas solo guarda la ventana reciente"""
+        rollups = SentimentRollups(self.db_path, dedupe_days=30)
+        old = pd.DataFrame({'titular': ['Vieja'], 'fecha': ['2023-01-01'], 'sentimiento_ia': ['Negativo']})
+        rollups.ingest(old)
+        rollups.ingest(make_df())
+
+        days = [r[0] for r in rollups.conn.execute('SELECT dia FROM rollup_articles').fetchall()]
+
+        assert '2023-01-01' not in days
+        assert len(days) == 5
+        assert rollups.trend('M')['Negativo'].sum() == 4
+
+    def test_persistence(self):
+        """Prueba que los agregados se recuperan al reabrir la base"""
+        SentimentRollups(self.db_path).ingest(make_df())
+
+        reopened = SentimentRollups(self.db_path)
+
+        assert reopened.trend('D')['Negativo'].sum() == 3
+        assert reopened.values('fuente') == ['El País', 'El Tiempo']
+        assert reopened.ingest(make_df()) == 0
+
+    def test_invalid_granularity(self):
+        """Prueba que una granularidad desconocida se rechaza"""
+        with pytest.raises(ValueError):
+            SentimentRollups().trend('Y')
+
+    def test_rollups_cached_by_content(self):
+        """Prueba que los mismos datos reutilizan los agregados en memoria"""
+        df = make_df()
+
+        assert rollups_for(df) is rollups_for(df.copy())
+
+
+class TestTrendAnalyzerRollups:
+    """Pruebas de TrendAnalyzer sobre los agregados"""
+
+    def test_trend_over_time(self):
+        """Prueba que la evolución temporal sale de los agregados"""
+        analyzer = TrendAnalyzer()
+        analyzer.load_data(make_df())
+
+        trend = analyzer.get_sentiment_trend_over_time()
+
+        assert trend.sum().to_dict() == {'Positivo': 1, 'Negativo': 3, 'Neutro': 0}
+        assert len(analyzer.get_sentiment_trend_over_time('M')) == 1
+
+    def test_prediction_from_daily_counts(self):
+        """Prueba que la predicción detecta el aumento de noticias negativas"""
+        fechas = pd.date_range('2024-01-01', periods=20, freq='D').strftime('%Y-%m-%d')
+        df = pd.DataFrame({
+            'titular': [f'Noticia {i}' for i in range(20)],
+            'fecha': fechas,
+            'sentimiento_ia': ['Positivo'] * 10 + ['Negativo'] * 10,
+        })
+        analyzer = TrendAnalyzer(forecaster=SentimentForecaster())
+
+        analyzer.load_data(df)
+        assert "TENDENCIA NEGATIVA" in analyzer.predict_sentiment_trend()
+
+        analyzer.load_data(df.iloc[:4])
+        assert "al menos 5" in analyzer.predict_sentiment_trend()
+
+        analyzer.load_data(df.drop(columns=['fecha']))
+        assert "No hay suficientes" in analyzer.predict_sentiment_trend()
+
+    def test_reruns_keyed_by_run_fingerprint(self):
+        """Prueba que con la huella de la corrida un rerun no vuelve a convertir fechas ni a recorrer filas"""
+        df = make_df()
+        TrendAnalyzer().load_data(df, fingerprint="corrida-a")
+        first = TrendAnalyzer()
+        first.load_data(df, fingerprint="corrida-a")
+        rollups = first.rollups()
+
+        analyzer = TrendAnalyzer()
+        with patch('src.trend_analyzer.pd.to_datetime') as mock_to_datetime, \
+                patch('src.sentiment_rollups._fingerprint') as mock_fingerprint:
+            analyzer.load_data(df, fingerprint="corrida-a")
+            assert analyzer.rollups() is rollups
+            assert mock_to_datetime.call_count == 0
+            assert mock_fingerprint.call_count == 0
+
+        assert analyzer.get_sentiment_trend_over_time().sum().to_dict() == {'Positivo': 1, 'Negativo': 3, 'Neutro': 0}
+
+    def test_history_store(self):
+        """Prueba que con un almacén persistente se lee la historia acumulada"""
+        store = SentimentRollups()
+        store.ingest(make_df())
+        analyzer = TrendAnalyzer(rollup_store=store)
+
+        analyzer.load_data(make_df().iloc[:1])
+
+        assert analyzer.get_sentiment_trend_over_time()['Negativo'].sum() == 3
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
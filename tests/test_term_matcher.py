@@ -0,0 +1,119 @@
+"""
+Tests para el buscador compilado de términos y su uso en alertas y mapa
+"""
+import pytest
+import pandas as pd
+import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.term_matcher import TermMatcher, corpus_texts, normalize_text, shared_matcher
+from src.alert_system import AlertSystem
+from src.geo_mapper import NewsGeoMapper
+
+
+def make_df():
+    return pd.DataFrame({
+        'titular': ['Sequía en Tulua', 'Plagas afectan cultivos en Cali', 'Crisis en Tuluá',
+                    'La calidad del café mejora', 'Paro en Buga'],
+        'cuerpo': ['Pérdidas en el Valle del Cauca', None, 'Perdidas de cosecha', 'Exportaciones en Cali', 'Bloqueos'],
+        'sentimiento_ia': ['Negativo', 'Negativo', 'Negativo', 'Positivo', 'Negativo'],
+    })
+
+
+class TestTermMatcher:
+    """Pruebas para TermMatcher"""
+
+    def test_accent_and_case_insensitive(self):
+        """Prueba que se ignoran tildes y mayúsculas en términos y texto"""
+        matcher = TermMatcher(['sequía', 'pérdida'])
+
+        assert matcher.find("SEQUIA y perdida total") == ['sequía', 'pérdida']
+        assert normalize_text("Jamundí Ñame") == "jamundi name"
+
+    def test_word_boundaries_and_plurals(self):
+        """Prueba los límites de palabra y los plurales simples"""
+        matcher = TermMatcher(['paro', 'plaga', 'Cali'])
+
+        assert matcher.find("disparo en la calidad") == []
+        assert matcher.find("plagas y paros en Cali") == ['paro', 'plaga', 'Cali']
+
+    def test_aliases_longest_first(self):
+        """Prueba que un alias largo gana sobre uno contenido en él"""
+        matcher = TermMatcher({'Valle del Cauca': ['valle del cauca', 'valle'], 'Cauca': ['cauca']})
+
+        assert matcher.find("Valle del Cauca") == ['Valle del Cauca']
+        assert matcher.find("en el valle y el Cauca") == ['Valle del Cauca', 'Cauca']
+
+    def test_sparse_matrix(self):
+        """Prueba la matriz noticia x término con conteos y su caché"""
+        matcher = TermMatcher(['sequía', 'plaga'])
+        texts = pd.Series(['sequía y más sequía', 'plagas', 'nada', None])
+
+        hits = matcher.matrix(texts)
+
+        assert hits.matrix.toarray().tolist() == [[2, 0], [0, 1], [0, 0], [0, 0]]
+        assert hits.doc_counts() == {'sequía': 1, 'plaga': 1}
+        assert hits.doc_counts(np.array([False, True, True, True])) == {'plaga': 1}
+        assert hits.primary().tolist() == ['sequía', 'plaga', None, None]
+        assert matcher.matrix(texts.copy()) is hits
+
+    def test_groups_share_one_pass(self):
+        """Prueba varios grupos en una sola regex, incluso con un alias compartido"""
+        matcher = TermMatcher.from_groups({
+            'alertas': ['valle', 'plaga'],
+            'ubicaciones': {'Valle del Cauca': ['valle del cauca', 'valle']},
+        })
+
+        hits = matcher.matrix(pd.Series(['El valle con plagas', 'Valle del Cauca']))
+
+        assert hits.group('alertas').doc_counts() == {'valle': 1, 'plaga': 1}
+        assert hits.group('ubicaciones').doc_counts() == {'Valle del Cauca': 2}
+
+    def test_corpus_texts(self):
+        """Prueba que el corpus une titular y cuerpo aunque falten valores"""
+        texts = corpus_texts(pd.DataFrame({'titular': ['A', None], 'cuerpo': [None, 'B']}, index=[5, 9]))
+
+        assert texts.tolist() == ['A ', ' B']
+
+
+class TestAlertRulesWithMatcher:
+    """Pruebas de las reglas de alertas sobre la matriz compartida"""
+
+    def test_critical_keywords(self):
+        """Prueba que las palabras clave se detectan solo en negativas, con y sin tilde"""
+        alerts = AlertSystem().analyze_and_generate_alerts(make_df())
+        keyword_alert = next(a for a in alerts if a['type'] == 'critical_keywords')
+
+        assert keyword_alert['details']['pérdida'] == ['Sequía en Tulua', 'Crisis en Tuluá']
+        assert keyword_alert['details']['paro'] == ['Paro en Buga']
+        assert 'conflicto' not in keyword_alert['details']
+
+    def test_geographic_concentration(self):
+        """Prueba la concentración de negativas por ubicación"""
+        system = AlertSystem()
+        system.alert_rules['geographic_concentration']['threshold'] = 2
+
+        alerts = system.analyze_and_generate_alerts(make_df())
+        geo_alert = next(a for a in alerts if a['type'] == 'geographic_concentration')
+
+        assert geo_alert['details'] == {'Tuluá': ['Sequía en Tulua', 'Crisis en Tuluá']}
+
+    def test_geo_mapper_shares_matrix(self):
+        """Prueba que el mapa reutiliza la matriz de ubicaciones de las alertas"""
+        df = make_df()
+        AlertSystem().analyze_and_generate_alerts(df)
+
+        shared = shared_matcher().matrix(corpus_texts(df))
+        hits = NewsGeoMapper().location_hits(df)
+
+        assert {'alertas:critical_keywords', 'ubicaciones'} <= set(shared.groups)
+        assert shared_matcher().matrix(corpus_texts(df)) is shared
+        assert hits.primary().tolist() == ['Tuluá', 'Cali', 'Tuluá', 'Cali', 'Buga']
+        assert NewsGeoMapper().extract_locations_from_text("Cali y el Valle del Cauca") == ['Cali', 'Valle del Cauca']
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
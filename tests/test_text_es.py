@@ -0,0 +1,46 @@
+"""
+Tests para el análisis de texto en español
+"""
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.text_es import tokenize, stem, SPANISH_STOPWORDS
+
+
+class TestTextEs:
+    """Pruebas para tokenize y stem"""
+
+    def test_inflections_share_stem(self):
+        """Prueba que singular, plural y verbo comparten raíz"""
+        assert stem("cultivos") == stem("cultivo") == stem("cultivar")
+        assert stem("exportaciones") == stem("exportacion")
+        assert stem("lluvias") == stem("lluvia")
+
+    def test_accents_and_case_ignored(self):
+        """Prueba que tildes y mayúsculas no cambian los tokens"""
+        assert tokenize("Sequía en la CAÑA") == tokenize("sequia en la cana")
+
+    def test_stopwords_removed(self):
+        """Prueba que se eliminan las stopwords en español"""
+        tokens = tokenize("el precio de los fertilizantes para el campo", use_stemming=False)
+
+        assert tokens == ["precio", "fertilizantes", "campo"]
+        assert not SPANISH_STOPWORDS.intersection(tokens)
+
+    def test_negations_kept_on_request(self):
+        """Prueba que las negaciones se conservan solo si se piden"""
+        assert "no" not in tokenize("cultivos que no crecen")
+        assert "no" in tokenize("cultivos que no crecen", keep_negations=True)
+        assert tokenize("sin lluvias", keep_negations=True) == ["sin", tokenize("lluvias")[0]]
+
+    def test_short_words_and_numbers_kept_intact(self):
+        """Prueba que números y palabras cortas no se recortan"""
+        assert stem("2024") == "2024"
+        assert stem("sol") == "sol"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
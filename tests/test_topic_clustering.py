@@ -0,0 +1,115 @@
+"""
+Tests para la agrupación temática con MiniBatchKMeans
+"""
+import pytest
+import pandas as pd
+import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.keyword_engine import keyword_matrix
+from src.topic_clustering import fit_topics
+from src.trend_analyzer import TrendAnalyzer
+
+TOPICS = [
+    "caña azúcar ingenio cosecha zafra etanol".split(),
+    "café exportaciones precios grano tostado cafeteros".split(),
+    "sequía lluvias inundaciones clima fenómeno invierno".split(),
+]
+
+
+def make_df(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    topics = rng.integers(0, len(TOPICS), n)
+    return pd.DataFrame({
+        'titular': [' '.join(rng.choice(TOPICS[t], 8)) for t in topics],
+        'cuerpo': [''] * n,
+        'sentimiento_ia': ['Neutro'] * n,
+        'fecha': ['2024-01-01'] * n,
+    }), topics
+
+
+class TestTopicClustering:
+    """Pruebas para fit_topics y TrendAnalyzer.cluster_news"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.df, self.topics = make_df()
+        self.analyzer = TrendAnalyzer()
+        self.analyzer.load_data(self.df)
+
+    def test_auto_k_finds_topics(self):
+        """Prueba que la silueta elige el número real de temas y los separa"""
+        df_clustered, themes = self.analyzer.cluster_news(n_clusters=None)
+
+        assert len(themes) == 3
+        # Cada cluster corresponde a un solo tema
+        crosstab = pd.crosstab(df_clustered['cluster'], self.topics)
+        assert ((crosstab > 0).sum(axis=1) == 1).all()
+
+    def test_fixed_k_and_largest_first(self):
+        """Prueba k fijo y que el cluster 0 es el más grande"""
+        df_clustered, themes = self.analyzer.cluster_news(n_clusters=2)
+
+        sizes = df_clustered['cluster'].value_counts()
+        assert len(themes) == 2
+        assert sizes[0] >= sizes[1]
+
+    def test_stable_across_reruns(self):
+        """Prueba que el mismo corpus reutiliza el modelo y los temas"""
+        labels, model = fit_topics(keyword_matrix(self.df['titular']), None)
+        labels_again, model_again = fit_topics(keyword_matrix(self.df['titular'].copy()), None)
+
+        assert model_again is model
+        assert np.array_equal(labels, labels_again)
+
+    def test_assign_new_articles(self):
+        """Prueba que noticias nuevas se asignan al cluster de su tema sin re-agrupar"""
+        df_clustered, themes = self.analyzer.cluster_news(n_clusters=None)
+        new = pd.DataFrame({'titular': ['lluvias e inundaciones por el invierno', 'zafra del ingenio'],
+                            'cuerpo': [None, None]})
+
+        labels = self.analyzer.assign_clusters(new)
+
+        assert 'lluvias' in themes[labels[0]]
+        assert 'zafra' in themes[labels[1]] or 'ingenio' in themes[labels[1]]
+
+    def test_update_does_not_touch_cached_model(self):
+        """Prueba que ajustar centroides no modifica el modelo compartido por el caché"""
+        self.analyzer.cluster_news(n_clusters=None)
+        cached = self.analyzer.topic_model
+        centers = cached.kmeans.cluster_centers_.copy()
+        new = pd.DataFrame({'titular': ['lluvias e inundaciones por el invierno'] * 5, 'cuerpo': [None] * 5})
+
+        self.analyzer.assign_clusters(new, update_centroids=True)
+
+        assert self.analyzer.topic_model is not cached
+        assert np.array_equal(cached.kmeans.cluster_centers_, centers)
+        assert not np.array_equal(self.analyzer.topic_model.kmeans.cluster_centers_, centers)
+
+        # Otra sesión con el mismo corpus recibe el modelo sin los ajustes de esta
+        other = TrendAnalyzer()
+        other.load_data(self.df)
+        other.cluster_news(n_clusters=None)
+        assert other.topic_model is cached
+
+    def test_original_dataframe_untouched(self):
+        """Prueba que el DataFrame del llamador no recibe columnas nuevas"""
+        self.analyzer.cluster_news(n_clusters=None)
+
+        assert 'cluster' not in self.df.columns
+        assert 'fecha_parsed' not in self.df.columns
+
+    def test_too_few_news(self):
+        """Prueba que con menos noticias que clusters retorna None"""
+        analyzer = TrendAnalyzer()
+        analyzer.load_data(self.df.head(2))
+
+        assert analyzer.cluster_news(n_clusters=None) is None
+        assert analyzer.assign_clusters(self.df) is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -9,7 +9,15 @@ import os
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from src.utils import load_and_validate_csv
+import tempfile
+import shutil
+from unittest.mock import patch
+
+from src.utils import (
+    load_and_validate_csv, iter_csv_chunks, sniff_csv_format,
+    save_analysis_parquet, load_parquet, list_analysis_runs, load_and_validate_parquet,
+    prune_analysis_runs, frame_fingerprint, run_fingerprint
+)
 
 
 class TestUtils:
@@ -122,6 +130,171 @@ Inversión agrícola;Se anuncian inversiones;2024-01-01;1"""
         assert all(not col.startswith(' ') and not col.endswith(' ') for col in df.columns)
 
 
+    def test_sniff_latin1_bytes(self):
+        """Prueba que detecta codificación y separador desde la muestra inicial"""
+        content = "Titular;Cuerpo;Fecha\nCaña y café;Pérdidas;2024-01-01\n".encode('latin-1')
+        
+        encoding, sep = sniff_csv_format(io.BytesIO(content))
+        
+        assert encoding == 'cp1252'
+        assert sep == ';'
+    
+    def test_cp1252_after_sample_is_not_replaced(self):
+        """Prueba que los acentos cp1252 después de la muestra inicial no se reemplazan"""
+        rows = "\n".join(f"Noticia {i};Cuerpo {i};2024-01-01" for i in range(3000))
+        content = f"Titular;Cuerpo;Fecha\n{rows}\nCafé y caña;Pérdidas;2024-01-02\n".encode('cp1252')
+        assert len(content) > 64 * 1024
+        
+        df, error = load_and_validate_csv(io.BytesIO(content))
+        
+        assert error is None
+        assert df['titular'].iloc[-1] == 'Café y caña'
+        assert df['cuerpo'].iloc[-1] == 'Pérdidas'
+    
+    def test_load_csv_bytes_with_bom(self):
+        """Prueba carga de un archivo binario UTF-8 con BOM"""
+        content = "Titular,Cuerpo,Fecha\nInversión agrícola,Se anuncian inversiones,2024-01-01\n"
+        
+        df, error = load_and_validate_csv(io.BytesIO(content.encode('utf-8-sig')))
+        
+        assert error is None
+        assert df['titular'].iloc[0] == 'Inversión agrícola'
+    
+    def test_iter_csv_chunks_streams_blocks(self):
+        """Prueba que el archivo se entrega en bloques con IDs continuos"""
+        rows = "\n".join(f"Noticia {i};Cuerpo {i};2024-01-01" for i in range(25))
+        csv_file = io.BytesIO(f"Titular;Cuerpo;Fecha\n{rows}\n".encode('utf-8'))
+        
+        stream, error = iter_csv_chunks(csv_file, chunksize=10)
+        chunks = list(stream)
+        
+        assert error is None
+        assert [len(c) for c in chunks] == [10, 10, 5]
+        assert list(chunks[-1].columns) == ['id_original', 'titular', 'cuerpo', 'fecha', 'texto_completo']
+        assert chunks[2]['id_original'].iloc[0] == '21'
+    
+    def test_iter_csv_chunks_reuses_format(self):
+        """Prueba que con el formato ya detectado no se vuelve a inspeccionar el archivo"""
+        content = "Titular;Cuerpo;Fecha\nCaña y café;Pérdidas;2024-01-01\n".encode('cp1252')
+        csv_format = sniff_csv_format(io.BytesIO(content))
+        csv_file = io.BytesIO(content)
+        csv_file.read()
+        
+        with patch('src.utils.sniff_csv_format') as mock_sniff:
+            stream, error = iter_csv_chunks(csv_file, csv_format=csv_format)
+            chunks = list(stream)
+        
+        assert error is None
+        assert mock_sniff.call_count == 0
+        assert (stream.encoding, stream.sep) == ('cp1252', ';')
+        assert chunks[0]['titular'].iloc[0] == 'Caña y café'
+    
+    def test_load_csv_empty_file(self):
+        """Prueba que un archivo vacío retorna error"""
+        df, error = load_and_validate_csv(io.StringIO(""))
+        
+        assert df is None
+        assert "vacío" in error
+
+
+
+class TestParquetStorage:
+    """Pruebas para el almacenamiento columnar de corridas"""
+    
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.df = pd.DataFrame({
+            'id_original': ['1', '2', '3'],
+            'titular': ['Inversión', 'Sequía', 'Reporte'],
+            'cuerpo': ['Cuerpo 1', 'Cuerpo 2', 'Cuerpo 3'],
+            'fecha': ['2024-01-01', '2024-01-02', '2024-01-03'],
+            'texto_completo': ['Inversión. Cuerpo 1', 'Sequía. Cuerpo 2', 'Reporte. Cuerpo 3'],
+            'sentimiento_ia': ['Positivo', 'Negativo', 'Neutro'],
+            'explicacion_ia': ['a', 'b', 'c']
+        })
+    
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def test_roundtrip_keeps_categorical_sentiment(self):
+        """Prueba que la corrida se archiva y se relee con sentimiento categórico"""
+        path = save_analysis_parquet(self.df, directory=self.temp_dir, name="corrida.parquet")
+        
+        loaded = load_parquet(path)
+        
+        assert isinstance(loaded['sentimiento_ia'].dtype, pd.CategoricalDtype)
+        assert list(loaded['sentimiento_ia'].astype(str)) == ['Positivo', 'Negativo', 'Neutro']
+        assert list(loaded['titular']) == list(self.df['titular'])
+    
+    def test_load_subset_of_columns(self):
+        """Prueba la lectura de solo algunas columnas"""
+        path = save_analysis_parquet(self.df, directory=self.temp_dir)
+        
+        loaded = load_parquet(path, columns=['fecha', 'sentimiento_ia'])
+        
+        assert list(loaded.columns) == ['fecha', 'sentimiento_ia']
+    
+    def test_list_analysis_runs(self):
+        """Prueba el listado de corridas archivadas"""
+        save_analysis_parquet(self.df, directory=self.temp_dir, name="a.parquet")
+        
+        runs = list_analysis_runs(self.temp_dir)
+        
+        assert [os.path.basename(r) for r in runs] == ["a.parquet"]
+        assert list_analysis_runs(os.path.join(self.temp_dir, "no_existe")) == []
+    
+    def test_same_content_reuses_run(self):
+        """Prueba que archivar dos veces el mismo contenido no crea otra corrida"""
+        first = save_analysis_parquet(self.df, directory=self.temp_dir)
+        second = save_analysis_parquet(self.df.copy(), directory=self.temp_dir)
+        
+        assert first == second
+        assert len(list_analysis_runs(self.temp_dir)) == 1
+        
+        changed = self.df.assign(sentimiento_ia=['Negativo', 'Negativo', 'Neutro'])
+        assert save_analysis_parquet(changed, directory=self.temp_dir) != first
+    
+    def test_run_fingerprint_from_archived_name(self):
+        """Prueba que la huella de una corrida archivada se lee del nombre sin abrir el archivo"""
+        path = save_analysis_parquet(self.df, directory=self.temp_dir)
+        
+        assert run_fingerprint(path) == frame_fingerprint(self.df)
+        assert run_fingerprint(os.path.join(self.temp_dir, "corrida.parquet")) is None
+    
+    def test_archive_prunes_by_count_and_age(self):
+        """Prueba que se conservan como máximo max_runs corridas y ninguna vencida"""
+        for i in range(4):
+            path = save_analysis_parquet(self.df, directory=self.temp_dir, name=f"run_{i}.parquet",
+                                         max_runs=None, max_age_days=None)
+            os.utime(path, (1_000_000 + i, 1_000_000 + i))
+        
+        save_analysis_parquet(self.df, directory=self.temp_dir, name="nueva.parquet",
+                              max_runs=3, max_age_days=None)
+        assert [os.path.basename(r) for r in list_analysis_runs(self.temp_dir)] == \
+            ["nueva.parquet", "run_3.parquet", "run_2.parquet"]
+        
+        removed = prune_analysis_runs(self.temp_dir, max_runs=None, max_age_days=30)
+        assert len(removed) == 2
+        assert [os.path.basename(r) for r in list_analysis_runs(self.temp_dir)] == ["nueva.parquet"]
+    
+    def test_load_raw_parquet_upload(self):
+        """Prueba la ingesta de un Parquet crudo con el mapeo de columnas"""
+        raw = pd.DataFrame({'Titular': ['Inversión', None], 'Cuerpo': ['Cuerpo', 'Texto'], 'Fecha': ['2024-01-01', '']})
+        buffer = io.BytesIO()
+        raw.to_parquet(buffer, index=False)
+        buffer.seek(0)
+        
+        df, error = load_and_validate_parquet(buffer)
+        
+        assert error is None
+        assert list(df['id_original']) == ['1', '2']
+        assert df['titular'].iloc[1] == 'Sin Titular'
+        assert df['texto_completo'].iloc[0] == 'Inversión. Cuerpo'
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
 
@@ -0,0 +1,113 @@
+"""
+Tests para el almacén de embeddings con búsqueda aproximada
+"""
+import pytest
+import numpy as np
+import os
+import tempfile
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.vector_store import IVFVectorStore, HashingEmbedder, load_local_embedder, top_k_indices
+
+
+def clustered_vectors(n, dim=32, n_centers=40, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_centers, dim))
+    vectors = centers[rng.integers(0, n_centers, n)] + 0.3 * rng.normal(size=(n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+class TestIVFVectorStore:
+    """Pruebas para IVFVectorStore"""
+
+    def setup_method(self):
+        """Configuración antes de cada test"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = self._new_store()
+
+    def teardown_method(self):
+        """Limpieza después de cada test"""
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def _new_store(self, identity="modelo:indice"):
+        store = IVFVectorStore(self.temp_dir, min_train_size=500)
+        store.open(identity)
+        return store
+
+    def test_exact_search_before_training(self):
+        """Prueba que con pocos vectores la búsqueda es exacta"""
+        vectors = clustered_vectors(100)
+        self.store.add(vectors)
+
+        ids, scores = self.store.search(vectors[7], k=3)
+
+        assert self.store.centroids is None
+        assert ids[0] == 7
+        assert scores[0] == pytest.approx(1.0, abs=1e-5)
+
+    def test_ivf_recall(self):
+        """Prueba que el IVF encuentra casi todos los vecinos exactos"""
+        vectors = clustered_vectors(3000)
+        self.store.add(vectors)
+        assert self.store.centroids is not None
+
+        recall = 0
+        for q in vectors[:50]:
+            ids, _ = self.store.search(q, k=10)
+            exact = top_k_indices(vectors @ q, 10)
+            recall += len(set(ids.tolist()) & set(exact.tolist())) / 10
+
+        assert recall / 50 >= 0.9
+
+    def test_incremental_ids_and_pending(self):
+        """Prueba que los vectores nuevos se buscan sin re-entrenar"""
+        vectors = clustered_vectors(1200)
+        self.store.add(vectors[:1000])
+        self.store.add(vectors[1000:1010])
+
+        assert len(self.store) == 1010
+        assert len(self.store.pending_ids) == 10
+        assert self.store.search(vectors[1005], k=1)[0][0] == 1005
+
+    def test_reopened_from_disk_with_mmap(self):
+        """Prueba que otra sesión abre los vectores con mmap de solo lectura"""
+        vectors = clustered_vectors(1000)
+        self.store.add(vectors)
+
+        other = self._new_store()
+
+        assert len(other) == 1000
+        assert isinstance(other.vectors, np.memmap)
+        assert other.search(vectors[3], k=1)[0][0] == 3
+
+    def test_other_identity_ignored(self):
+        """Prueba que vectores de otro modelo o índice no se reutilizan"""
+        self.store.add(clustered_vectors(50))
+
+        other = self._new_store(identity="otro-modelo:indice")
+        assert len(other) == 0
+
+        other.add(clustered_vectors(5))
+        assert len(self._new_store(identity="otro-modelo:indice")) == 5
+
+
+class TestEmbedders:
+    """Pruebas para los embedders locales"""
+
+    def test_hashing_embedder(self):
+        """Prueba que el sustituto sin modelo comparte raíces y tildes"""
+        embedder = load_local_embedder("hashing")
+        vectors = embedder(["Sequía en cultivos de caña", "sequia cultivo cana", "exportación de café"])
+
+        assert isinstance(embedder, HashingEmbedder)
+        assert vectors.shape == (3, embedder.dim)
+        assert vectors[0] @ vectors[1] == pytest.approx(1.0, abs=1e-5)
+        assert vectors[0] @ vectors[2] < 0.5
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])